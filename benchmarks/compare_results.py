@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение двух прогонов бенчмарка поиска (run_search_benchmark.py)
+
+Для каждого размера корпуса и замера показывает p50/p95 до и после,
+пропускную способность и точность find_answer. Регрессия - рост p95
+или падение запр/с больше --threshold процентов либо падение точности
+больше --accuracy-drop; при регрессиях код выхода 1 (для CI).
+
+Запуск:
+    python benchmarks/compare_results.py benchmarks/results/base.json benchmarks/results/new.json
+    python benchmarks/compare_results.py base.json new.json --threshold 15
+"""
+
+import sys
+import argparse
+import json
+import logging
+from typing import Dict, List, Optional
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def change_percent(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    """Изменение в процентах (None, если сравнивать нечего)"""
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def flatten(size_report: Dict) -> Dict[str, Dict]:
+    """Замеры размера корпуса: {'levels:exact': {...}, 'find_answer:numpy': {...}, ...}"""
+    rows = {}
+    for section in ("levels", "find_answer"):
+        for name, item in size_report.get(section, {}).items():
+            rows[f"{section}:{name}"] = {
+                "p50_ms": item["latency"].get("p50_ms"),
+                "p95_ms": item["latency"].get("p95_ms"),
+                "qps": item.get("qps"),
+                "accuracy": item.get("accuracy")
+            }
+    for name, item in size_report.get("find_answers_batch", {}).items():
+        rows[f"find_answers_batch:{name}"] = {
+            "p50_ms": item.get("per_query_ms"),
+            "p95_ms": None,
+            "qps": item.get("qps"),
+            "accuracy": item.get("accuracy")
+        }
+    return rows
+
+
+def compare(base: Dict, new: Dict, threshold: float, accuracy_drop: float) -> List[str]:
+    """Напечатать сравнение и вернуть список регрессий"""
+    regressions = []
+
+    for size, new_report in new["sizes"].items():
+        base_report = base["sizes"].get(size)
+        if base_report is None:
+            logger.info(f"\n📚 {size} FAQ: нет в базовом прогоне")
+            continue
+
+        logger.info(f"\n📚 {size} FAQ")
+        logger.info(f"   {'замер':<36} {'p50 до':>9} {'p50 после':>10} {'p95 до':>9} {'p95 после':>10} "
+                    f"{'Δp95':>8} {'Δзапр/с':>8} {'точность':>17}")
+
+        base_rows = flatten(base_report)
+        for name, after in flatten(new_report).items():
+            before = base_rows.get(name)
+            if before is None:
+                logger.info(f"   {name:<36} новый замер")
+                continue
+
+            p95_change = change_percent(before["p95_ms"], after["p95_ms"])
+            qps_change = change_percent(before["qps"], after["qps"])
+            accuracy = ""
+            if before["accuracy"] is not None and after["accuracy"] is not None:
+                accuracy = f"{before['accuracy']:.1%} → {after['accuracy']:.1%}"
+
+            def fmt(value, suffix=""):
+                return f"{value:.2f}{suffix}" if value is not None else "-"
+
+            logger.info(
+                f"   {name:<36} {fmt(before['p50_ms']):>9} {fmt(after['p50_ms']):>10} "
+                f"{fmt(before['p95_ms']):>9} {fmt(after['p95_ms']):>10} "
+                f"{fmt(p95_change, '%'):>8} {fmt(qps_change, '%'):>8} {accuracy:>17}"
+            )
+
+            if p95_change is not None and p95_change > threshold:
+                regressions.append(f"{size} FAQ, {name}: p95 +{p95_change:.1f}%")
+            if qps_change is not None and qps_change < -threshold:
+                regressions.append(f"{size} FAQ, {name}: запр/с {qps_change:.1f}%")
+            if accuracy and before["accuracy"] - after["accuracy"] > accuracy_drop:
+                regressions.append(f"{size} FAQ, {name}: точность {accuracy}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение двух прогонов бенчмарка поиска")
+    parser.add_argument("base", help="JSON базового прогона")
+    parser.add_argument("new", help="JSON нового прогона")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="Допустимый рост p95 / падение запр/с, %%")
+    parser.add_argument("--accuracy-drop", type=float, default=0.01,
+                        help="Допустимое падение точности (доля)")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    logger.info("=" * 80)
+    logger.info(f"📊 {base['meta'].get('commit')} ({base['meta'].get('created_at')}) → "
+                f"{new['meta'].get('commit')} ({new['meta'].get('created_at')})")
+    if base["meta"].get("args") != new["meta"].get("args") or base["meta"].get("embedding") != new["meta"].get("embedding"):
+        logger.warning("⚠️ Параметры прогонов различаются - сравнение может быть некорректным")
+    if base["meta"].get("platform") != new["meta"].get("platform") or base["meta"].get("cpu_count") != new["meta"].get("cpu_count"):
+        logger.warning("⚠️ Прогоны выполнены на разных машинах")
+    logger.info("=" * 80)
+
+    regressions = compare(base, new, args.threshold, args.accuracy_drop)
+
+    logger.info("")
+    if regressions:
+        logger.info(f"❌ Регрессии ({len(regressions)}):")
+        for regression in regressions:
+            logger.info(f"   {regression}")
+        sys.exit(1)
+    logger.info("✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
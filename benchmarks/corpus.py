@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Синтетический корпус FAQ и поток запросов для бенчмарков поиска
+
+Вопросы собираются из действий, объектов и контекстов корпоративного FAQ
+(30 x 60 x 30 = 54 000 уникальных комбинаций), поэтому корпус любого
+размера до 54k строится детерминированно по seed.
+
+Запросы к корпусу бывают пяти видов (с ожидаемым faq_id):
+- exact: вопрос FAQ как есть (другой регистр и пунктуация)
+- keyword: 2-3 ключевых слова FAQ
+- paraphrase: другой шаблон вопроса, синонимы с вероятностью paraphrase_rate
+- typo: перефразировка с опечатками (typo_rate - вероятность опечатки в слове)
+- off_topic: вопрос не по теме FAQ (ожидается fallback)
+"""
+
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# (действие, синонимы, ключевое слово)
+ACTIONS = [
+    ("оформить", ["получить", "сделать"], "оформить"),
+    ("продлить", ["продлевать", "увеличить срок"], "продлить"),
+    ("отменить", ["аннулировать", "отозвать"], "отменить"),
+    ("перенести", ["сдвинуть", "поменять дату"], "перенести"),
+    ("согласовать", ["утвердить", "подписать"], "согласовать"),
+    ("заказать", ["запросить", "попросить"], "заказать"),
+    ("оплатить", ["компенсировать", "возместить"], "оплатить"),
+    ("восстановить", ["вернуть", "обновить"], "восстановить"),
+    ("заблокировать", ["закрыть", "приостановить"], "заблокировать"),
+    ("настроить", ["подключить", "наладить"], "настроить"),
+    ("сдать", ["вернуть", "передать"], "сдать"),
+    ("проверить", ["узнать статус", "посмотреть"], "проверить"),
+    ("изменить", ["поменять", "исправить"], "изменить"),
+    ("подать", ["отправить", "направить"], "подать"),
+    ("распечатать", ["напечатать", "вывести на печать"], "распечатать"),
+    ("скачать", ["загрузить", "выгрузить"], "скачать"),
+    ("передать", ["переслать", "отдать"], "передать"),
+    ("зарегистрировать", ["завести", "внести в систему"], "зарегистрировать"),
+    ("обжаловать", ["оспорить", "опротестовать"], "обжаловать"),
+    ("уточнить", ["выяснить", "узнать"], "уточнить"),
+    ("забронировать", ["зарезервировать", "занять"], "забронировать"),
+    ("активировать", ["включить", "запустить"], "активировать"),
+    ("удалить", ["стереть", "убрать"], "удалить"),
+    ("подтвердить", ["удостоверить", "заверить"], "подтвердить"),
+    ("составить", ["подготовить", "написать"], "составить"),
+    ("обменять", ["заменить", "поменять"], "обменять"),
+    ("выдать", ["предоставить", "выписать"], "выдать"),
+    ("рассчитать", ["посчитать", "вычислить"], "рассчитать"),
+    ("получить копию", ["запросить дубликат", "взять копию"], "копия"),
+    ("найти", ["отыскать", "посмотреть где"], "найти"),
+]
+
+# (объект в винительном падеже, синонимы, ключевое слово, категория)
+OBJECTS = [
+    ("отпуск", ["ежегодный отдых", "отпускные дни"], "отпуск", "Отпуск"),
+    ("больничный", ["лист нетрудоспособности", "больничный лист"], "больничный", "Отпуск"),
+    ("отгул", ["выходной за переработку", "день без содержания"], "отгул", "Отпуск"),
+    ("справку 2-НДФЛ", ["справку о доходах", "налоговую справку"], "2-ндфл", "Документы"),
+    ("справку с места работы", ["справку о трудоустройстве", "подтверждение занятости"], "справка", "Документы"),
+    ("копию трудовой книжки", ["выписку из трудовой", "заверенную трудовую"], "трудовая", "Документы"),
+    ("трудовой договор", ["контракт", "договор найма"], "договор", "Документы"),
+    ("доверенность", ["нотариальную доверенность", "право подписи"], "доверенность", "Документы"),
+    ("расчётный лист", ["расчётку", "лист начислений"], "расчётный", "Зарплата"),
+    ("аванс", ["предоплату зарплаты", "первую часть зарплаты"], "аванс", "Зарплата"),
+    ("премию", ["бонус", "квартальную выплату"], "премия", "Зарплата"),
+    ("материальную помощь", ["матпомощь", "единовременную выплату"], "матпомощь", "Зарплата"),
+    ("налоговый вычет", ["возврат НДФЛ", "социальный вычет"], "вычет", "Зарплата"),
+    ("командировку", ["служебную поездку", "выездную работу"], "командировка", "Командировки"),
+    ("авансовый отчёт", ["отчёт о расходах", "отчёт по командировке"], "отчёт", "Командировки"),
+    ("билеты", ["авиабилеты", "ж/д билеты"], "билеты", "Командировки"),
+    ("гостиницу", ["отель", "проживание"], "гостиница", "Командировки"),
+    ("суточные", ["командировочные", "дневные расходы"], "суточные", "Командировки"),
+    ("пропуск", ["бейдж", "карту доступа"], "пропуск", "Офис"),
+    ("гостевой пропуск", ["пропуск для посетителя", "разовый пропуск"], "гостевой", "Офис"),
+    ("парковочное место", ["место на парковке", "стоянку"], "парковка", "Офис"),
+    ("переговорную", ["комнату для встреч", "конференц-зал"], "переговорная", "Офис"),
+    ("рабочее место", ["стол", "место в опенспейсе"], "место", "Офис"),
+    ("канцелярию", ["бумагу и ручки", "офисные принадлежности"], "канцелярия", "Офис"),
+    ("доставку воды", ["кулер", "питьевую воду"], "вода", "Офис"),
+    ("пароль от почты", ["доступ к почте", "пароль Outlook"], "пароль", "IT"),
+    ("VPN", ["удалённый доступ", "подключение из дома"], "vpn", "IT"),
+    ("ноутбук", ["рабочий компьютер", "лэптоп"], "ноутбук", "IT"),
+    ("принтер", ["МФУ", "печать"], "принтер", "IT"),
+    ("монитор", ["второй экран", "дисплей"], "монитор", "IT"),
+    ("лицензию", ["программу", "софт"], "лицензия", "IT"),
+    ("доступ к 1С", ["учётную запись 1С", "права в 1С"], "1с", "IT"),
+    ("корпоративный телефон", ["сим-карту", "рабочий номер"], "телефон", "IT"),
+    ("электронную подпись", ["ЭЦП", "сертификат подписи"], "подпись", "IT"),
+    ("заявку в техподдержку", ["обращение в IT", "тикет"], "техподдержка", "IT"),
+    ("доступ к общему диску", ["сетевую папку", "общий ресурс"], "диск", "IT"),
+    ("учётную запись Битрикс24", ["аккаунт в портале", "профиль Битрикс24"], "битрикс24", "IT"),
+    ("курс обучения", ["тренинг", "онлайн-курс"], "обучение", "Обучение"),
+    ("сертификат о повышении квалификации", ["удостоверение о курсах", "диплом о переподготовке"], "сертификат", "Обучение"),
+    ("наставника", ["ментора", "куратора"], "наставник", "Обучение"),
+    ("аттестацию", ["оценку знаний", "экзамен"], "аттестация", "Обучение"),
+    ("конференцию", ["внешнее мероприятие", "семинар"], "конференция", "Обучение"),
+    ("полис ДМС", ["медицинскую страховку", "добровольное страхование"], "дмс", "Льготы"),
+    ("абонемент в спортзал", ["фитнес", "компенсацию спорта"], "спортзал", "Льготы"),
+    ("компенсацию питания", ["обеды", "талоны на питание"], "питание", "Льготы"),
+    ("детский подарок", ["новогодний подарок ребёнку", "подарок детям"], "подарок", "Льготы"),
+    ("путёвку", ["санаторий", "оздоровление"], "путёвка", "Льготы"),
+    ("корпоративную связь", ["компенсацию мобильной связи", "оплату телефона"], "связь", "Льготы"),
+    ("заявление на увольнение", ["уход из компании", "расторжение договора"], "увольнение", "Кадры"),
+    ("перевод в другой отдел", ["смену должности", "внутренний перевод"], "перевод", "Кадры"),
+    ("график работы", ["режим работы", "расписание смен"], "график", "Кадры"),
+    ("удалённую работу", ["работу из дома", "дистанционный формат"], "удалёнка", "Кадры"),
+    ("декретный отпуск", ["отпуск по уходу за ребёнком", "декрет"], "декрет", "Кадры"),
+    ("персональные данные", ["паспортные данные", "сведения о себе"], "данные", "Кадры"),
+    ("характеристику", ["рекомендательное письмо", "отзыв с работы"], "характеристика", "Кадры"),
+    ("служебную записку", ["докладную", "внутреннюю записку"], "записка", "Кадры"),
+    ("договор с поставщиком", ["контракт с контрагентом", "закупочный договор"], "поставщик", "Закупки"),
+    ("счёт на оплату", ["инвойс", "платёжку"], "счёт", "Закупки"),
+    ("закупку оборудования", ["покупку техники", "заявку на закупку"], "закупка", "Закупки"),
+    ("возврат товара", ["возврат поставщику", "рекламацию"], "возврат", "Закупки"),
+]
+
+CONTEXTS = [
+    "в головном офисе", "в филиале", "на удалёнке", "для нового сотрудника", "в командировке",
+    "во время испытательного срока", "после декрета", "для стажёра", "в выходной день",
+    "в конце года", "при переезде офиса", "без согласования руководителя", "срочно",
+    "через портал", "через Битрикс24", "через отдел кадров", "по почте", "для подрядчика",
+    "для руководителя отдела", "в праздники", "в ночную смену", "задним числом",
+    "на следующий месяц", "с мобильного телефона", "для иностранного сотрудника",
+    "при совместительстве", "после увольнения", "в отпуске", "на больничном", "на период проекта",
+]
+
+TEMPLATES = [
+    "Как {action} {object} {context}?",
+    "Где {action} {object} {context}?",
+    "Можно ли {action} {object} {context}?",
+    "Что нужно, чтобы {action} {object} {context}?",
+    "Подскажите, как {action} {object} {context}",
+    "Кто помогает {action} {object} {context}?",
+]
+
+OFF_TOPIC = [
+    "Какая завтра погода в Новосибирске?",
+    "Посоветуйте хороший фильм на вечер",
+    "Сколько будет дважды два?",
+    "Как приготовить борщ со свёклой?",
+    "Кто выиграл чемпионат мира по футболу?",
+    "Расскажи анекдот про программистов",
+    "Какой курс доллара на сегодня?",
+    "Почему небо голубое?",
+    "Где купить зимние шины недорого?",
+    "Как выучить английский за месяц?",
+]
+
+_ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+
+
+@dataclass
+class BenchmarkQuery:
+    """Запрос потока: текст, вид и ожидаемый FAQ (None - ответа нет)"""
+    text: str
+    kind: str
+    expected_faq_id: Optional[str]
+
+
+def generate_corpus(size: int, seed: int = 42) -> List[Dict]:
+    """
+    Синтетический корпус FAQ
+
+    Args:
+        size: Количество FAQ (не больше 54 000)
+        seed: Seed генератора
+
+    Returns:
+        FAQ в формате database.get_all_faqs() с полями action/object/context/template
+        (индексы словарей - для построения запросов)
+    """
+    total = len(ACTIONS) * len(OBJECTS) * len(CONTEXTS)
+    if size > total:
+        raise ValueError(f"Синтетический корпус ограничен {total} FAQ")
+
+    rng = random.Random(seed)
+    combinations = rng.sample(range(total), size)
+
+    faqs = []
+    for number, combination in enumerate(combinations, 1):
+        action_i, rest = divmod(combination, len(OBJECTS) * len(CONTEXTS))
+        object_i, context_i = divmod(rest, len(CONTEXTS))
+        action, _, action_keyword = ACTIONS[action_i]
+        obj, _, object_keyword, category = OBJECTS[object_i]
+        context = CONTEXTS[context_i]
+
+        template_i = combination % len(TEMPLATES)
+        question = TEMPLATES[template_i].format(action=action, object=obj, context=context)
+        answer = (
+            f"Чтобы {action} {obj} {context}, создайте заявку на портале в разделе «{category}». "
+            f"Срок рассмотрения - {rng.randint(1, 10)} рабочих дней, статус приходит на почту."
+        )
+        faqs.append({
+            "id": f"faq_{number:05d}",
+            "category": category,
+            "question": question,
+            "answer": answer,
+            "keywords": [action_keyword, object_keyword],
+            "action": action_i,
+            "object": object_i,
+            "context": context_i,
+            "template": template_i
+        })
+
+    return faqs
+
+
+def _add_typos(text: str, rate: float, rng: random.Random) -> str:
+    """Опечатка (перестановка, пропуск или замена буквы) в слове с вероятностью rate"""
+    words = text.split()
+    for i, word in enumerate(words):
+        if len(word) < 4 or rng.random() >= rate:
+            continue
+        pos = rng.randint(1, len(word) - 2)
+        kind = rng.randrange(3)
+        if kind == 0:
+            word = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+        elif kind == 1:
+            word = word[:pos] + word[pos + 1:]
+        else:
+            word = word[:pos] + rng.choice(_ALPHABET) + word[pos + 1:]
+        words[i] = word
+    return " ".join(words)
+
+
+def _paraphrase(faq: Dict, rate: float, rng: random.Random) -> str:
+    """Тот же смысл: другой шаблон, синонимы действия и объекта с вероятностью rate"""
+    action, action_synonyms, _ = ACTIONS[faq["action"]]
+    obj, object_synonyms, _, _ = OBJECTS[faq["object"]]
+    if rng.random() < rate:
+        action = rng.choice(action_synonyms)
+    if rng.random() < rate:
+        obj = rng.choice(object_synonyms)
+
+    template = rng.choice([t for i, t in enumerate(TEMPLATES) if i != faq["template"]])
+    return template.format(action=action, object=obj, context=CONTEXTS[faq["context"]])
+
+
+def generate_queries(
+    faqs: List[Dict],
+    count: int,
+    paraphrase_rate: float = 0.5,
+    typo_rate: float = 0.1,
+    mix: Optional[Dict[str, float]] = None,
+    seed: int = 42
+) -> List[BenchmarkQuery]:
+    """
+    Поток запросов к корпусу
+
+    Args:
+        faqs: Корпус из generate_corpus
+        count: Количество запросов
+        paraphrase_rate: Вероятность замены действия/объекта синонимом
+        typo_rate: Вероятность опечатки в слове (для typo запросов)
+        mix: Доли видов запросов (по умолчанию exact 0.2, keyword 0.2,
+             paraphrase 0.3, typo 0.2, off_topic 0.1)
+        seed: Seed генератора
+
+    Returns:
+        Список BenchmarkQuery
+    """
+    mix = mix or {"exact": 0.2, "keyword": 0.2, "paraphrase": 0.3, "typo": 0.2, "off_topic": 0.1}
+    unknown = set(mix) - {"exact", "keyword", "paraphrase", "typo", "off_topic"}
+    if unknown:
+        raise ValueError(f"Неизвестные виды запросов: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+
+    queries = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "off_topic":
+            queries.append(BenchmarkQuery(rng.choice(OFF_TOPIC), kind, None))
+            continue
+
+        faq = rng.choice(faqs)
+        if kind == "exact":
+            text = faq["question"].rstrip("?").lower() if rng.random() < 0.5 else faq["question"]
+        elif kind == "keyword":
+            text = " ".join(faq["keywords"])
+            if rng.random() < 0.5:
+                text += " " + CONTEXTS[faq["context"]].split()[-1]
+        elif kind == "paraphrase":
+            text = _paraphrase(faq, paraphrase_rate, rng)
+        else:
+            text = _add_typos(_paraphrase(faq, paraphrase_rate, rng), typo_rate, rng)
+
+        queries.append(BenchmarkQuery(text, kind, faq["id"]))
+
+    return queries
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Детерминированные эмбеддинги для бенчмарков без модели
+
+Хэширование слов и символьных триграмм в вектор фиксированной длины
+(feature hashing). Качество далеко от sentence-transformers, но векторы
+одинаковы на любой машине, не требуют torch и скачивания модели,
+а триграммы дают устойчивость к опечаткам - этого достаточно, чтобы
+сравнивать производительность бэкендов и уровней поиска между коммитами.
+
+Для замеров с настоящей моделью бенчмарк запускается с --embedding model.
+"""
+
+import zlib
+from typing import Any, Dict, List
+
+_PREFIXES = ("search_query: ", "search_document: ")
+
+
+class HashEmbeddingFunction:
+    """Функция эмбеддингов (интерфейс функции эмбеддингов Chroma) на feature hashing"""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _features(self, text: str):
+        for prefix in _PREFIXES:
+            if text.startswith(prefix):
+                text = text[len(prefix):]
+                break
+        for word in text.lower().split():
+            word = word.strip("?,.!«»\"()")
+            if not word:
+                continue
+            yield word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed(self, text: str):
+        import numpy as np
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def __call__(self, input: List[str]):
+        return [self.embed(text) for text in input]
+
+    def encode(self, sentences: List[str], **kwargs):
+        """Совместимо с SentenceTransformer.encode (numpy массив)"""
+        import numpy as np
+        return np.stack(self(sentences)) if sentences else np.zeros((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark_hash"
+
+    def default_space(self):
+        return "cosine"
+
+    def supported_spaces(self):
+        return ["cosine"]
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction(dim=config.get("dim", 384))
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"dim": self.dim}
@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест обработчиков Bitrix24 и Telegram ботов
+
+Внешние сервисы заменяются локальной заглушкой (один HTTP сервер):
+- Bitrix24 REST (/rest/...): imbot.message.add и остальные методы отвечают {"result": ...}
+- Telegram Bot API (/bot<token>/<method>): sendMessage, editMessageText и т.д.
+- OpenRouter (/v1/chat/completions): фейковая LLM с задержкой --llm-latency-ms
+  (и долей ошибок --llm-error-rate)
+
+Bitrix24: настоящий Flask app бота (b24_bot.app) поднимается на werkzeug
+сервере (как app.run), генератор шлёт на /webhook/bitrix24 события
+ONIMBOTMESSAGEADD в том же формате form-data, что и портал.
+
+Telegram: фейковые Update подаются прямо в bot.search_faq. В боте
+Application собирается без concurrent_updates - обновления обрабатываются
+по одному, поэтому реальная пропускная способность Telegram бота - строка
+с конкурентностью 1; строки выше показывают, что дала бы параллельная обработка.
+
+Данные: временная БД с синтетическим корпусом (benchmarks/corpus.py) и numpy
+индексом, либо копия рабочей БД (--db). Логи запросов пишутся во временную БД.
+
+Нагрузка - замкнутый цикл: на каждом шаге N воркеров шлют запросы один за
+другим --duration секунд. Для каждого шага: запросов в секунду, p50/p95/p99
+и доля ошибок; ёмкость - максимум запросов в секунду среди шагов, где p95
+не больше --slo-ms и ошибок не больше --max-error-rate.
+
+Запуск:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --target b24 --concurrency 1,4,16,64 --duration 20
+    python benchmarks/load_test.py --llm-latency-ms 1500 --slo-ms 3000 --output load.json
+    python benchmarks/load_test.py --db data/faq_database.db --queries-file queries.txt --no-rag
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+from src.core import database
+
+from corpus import OFF_TOPIC, generate_corpus, generate_queries
+from run_search_benchmark import build_backends, create_embedding_function, git_commit, latency_stats, populate_database
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+TELEGRAM_TOKEN = "123456:LOADTEST"
+
+
+# ========== ЗАГЛУШКА BITRIX24 / TELEGRAM / OPENROUTER ==========
+
+class StubServer:
+    """Локальный HTTP сервер, отвечающий за Bitrix24, Telegram и OpenRouter"""
+
+    def __init__(self, llm_latency_ms: float, llm_jitter_ms: float, llm_error_rate: float):
+        self.llm_latency_ms = llm_latency_ms
+        self.llm_jitter_ms = llm_jitter_ms
+        self.llm_error_rate = llm_error_rate
+        self.calls: Dict[str, int] = {}
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, payload = stub.handle(self.path, self.headers.get("Content-Type", ""), body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.server.serve_forever, name="load-test-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    @staticmethod
+    def _params(content_type: str, body: bytes) -> Dict:
+        if not body:
+            return {}
+        if "json" in content_type:
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+    def handle(self, path: str, content_type: str, body: bytes):
+        params = self._params(content_type, body)
+
+        if path.startswith("/rest/"):
+            method = path.rstrip("/").rsplit("/", 1)[-1]
+            self._count(f"bitrix24:{method}")
+            if method == "imbot.message.add":
+                return 200, {"result": next(self._message_ids)}
+            return 200, {"result": True}
+
+        if path.startswith("/bot"):
+            method = path.rsplit("/", 1)[-1]
+            self._count(f"telegram:{method}")
+            if method == "getMe":
+                return 200, {"ok": True, "result": {
+                    "id": 123456, "is_bot": True, "first_name": "FAQ", "username": "faq_loadtest_bot",
+                    "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False
+                }}
+            if method in ("sendMessage", "editMessageText"):
+                chat_id = int(params.get("chat_id") or 0)
+                return 200, {"ok": True, "result": {
+                    "message_id": int(params.get("message_id") or next(self._message_ids)),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": params.get("text", "")
+                }}
+            return 200, {"ok": True, "result": True}
+
+        if path.endswith("/chat/completions"):
+            self._count("llm:chat.completions")
+            return self._llm(params)
+
+        return 404, {"error": "not found"}
+
+    def _llm(self, params: Dict):
+        """Ответ OpenAI-совместимого API после задержки"""
+        with self._lock:
+            delay = self.llm_latency_ms + self._rng.uniform(-self.llm_jitter_ms, self.llm_jitter_ms)
+            failed = self._rng.random() < self.llm_error_rate
+        time.sleep(max(0.0, delay) / 1000)
+
+        if failed:
+            return 500, {"error": {"message": "fake upstream error", "code": 500}}
+
+        prompt = params["messages"][-1]["content"]
+        # Первый ответ из контекста - правдоподобный ответ без лишних токенов
+        answer = prompt.split("Ответ: ", 1)[-1].split("\n", 1)[0] if "Ответ: " in prompt else "Ответ из базы знаний."
+        prompt_tokens = sum(len(message["content"]) for message in params["messages"]) // 4
+        completion_tokens = len(answer) // 4 + 1
+        return 200, {
+            "id": "chatcmpl-loadtest",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": params.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+
+class ErrorCounter(logging.Handler):
+    """Количество ERROR записей в логах обработчиков (ошибки, которые боты проглатывают)"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+# ========== ДАННЫЕ ==========
+
+def prepare_data(args, temp_dir: str):
+    """
+    БД и векторный бэкенд для ботов
+
+    Returns:
+        Tuple (бэкенд, список текстов запросов)
+    """
+    database.DB_FILE = os.path.join(temp_dir, "faq_database.db")
+
+    if args.db:
+        shutil.copy(args.db, database.DB_FILE)
+        database.init_database()
+        faqs = database.get_all_faqs()
+        if args.queries_file:
+            with open(args.queries_file, encoding="utf-8") as f:
+                queries = [line.strip() for line in f if line.strip()]
+        else:
+            queries = [faq["question"] for faq in faqs] + OFF_TOPIC
+    else:
+        database.init_database()
+        faqs = generate_corpus(args.faqs, seed=args.seed)
+        populate_database(faqs)
+        queries = [query.text for query in generate_queries(faqs, 2000, seed=args.seed + 1)]
+
+    if not faqs:
+        raise ValueError("В базе нет FAQ")
+
+    embedding_function = create_embedding_function(args.embedding)
+    backend = build_backends(faqs, ["numpy"], embedding_function, temp_dir)["backends"]["numpy"]
+    random.Random(args.seed).shuffle(queries)
+    logger.info(f"📚 FAQ: {len(faqs)}, запросов в потоке: {len(queries)}")
+    return backend, queries
+
+
+# ========== НАГРУЗКА ==========
+
+def summarize(timings: List[float], errors: int, elapsed: float, logged_errors: int) -> Dict:
+    """Итог шага: запросов в секунду, перцентили, доля ошибок"""
+    total = len(timings)
+    return {
+        "requests": total,
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "logged_errors": logged_errors,
+        "latency": latency_stats(timings)
+    }
+
+
+def run_b24_step(url: str, queries, concurrency: int, duration: float, user_ids) -> Dict:
+    """Шаг нагрузки на вебхук Bitrix24: concurrency потоков в замкнутом цикле"""
+    import requests
+
+    timings, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                text = next(queries)
+                user_id = next(user_ids)
+            payload = {
+                "event": "ONIMBOTMESSAGEADD",
+                "data[PARAMS][MESSAGE]": text,
+                "data[PARAMS][FROM_USER_ID]": str(user_id),
+                "data[PARAMS][DIALOG_ID]": str(user_id),
+                "data[PARAMS][CHAT_TYPE]": "P",
+                "data[PARAMS][MESSAGE_ID]": str(random.randint(1, 10 ** 9)),
+                "data[USER][ID]": str(user_id),
+                "data[USER][FIRST_NAME]": "Нагрузка",
+                "data[USER][LAST_NAME]": f"Тест{user_id}",
+                "data[BOT][1][BOT_ID]": "1",
+                "auth[domain]": "loadtest.bitrix24.ru",
+                "auth[application_token]": "loadtest",
+                "ts": str(int(time.time()))
+            }
+            started = time.perf_counter()
+            try:
+                response = session.post(url, data=payload, timeout=120)
+                ok = response.status_code == 200 and response.json().get("success")
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                timings.append(elapsed)
+                errors[0] += 0 if ok else 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"timings": timings, "errors": errors[0], "elapsed": time.perf_counter() - started}
+
+
+async def run_telegram_step(bot_module, application, queries, concurrency: int, duration: float, user_ids) -> Dict:
+    """Шаг нагрузки на bot.search_faq: concurrency корутин в замкнутом цикле"""
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+    timings, errors = [], [0]
+    deadline = time.perf_counter() + duration
+    update_ids = itertools.count(1)
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            user_id = next(user_ids)
+            update_id = next(update_ids)
+            update = Update.de_json({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "Нагрузка", "username": f"load{user_id}"},
+                    "text": next(queries)
+                }
+            }, application.bot)
+            context = CallbackContext.from_update(update, application)
+            started = time.perf_counter()
+            try:
+                await bot_module.search_faq(update, context)
+                ok = True
+            except Exception:
+                ok = False
+            timings.append((time.perf_counter() - started) * 1000)
+            errors[0] += 0 if ok else 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"timings": timings, "errors": errors[0], "elapsed": time.perf_counter() - started}
+
+
+def capacity(steps: List[Dict], slo_ms: float, max_error_rate: float) -> Optional[Dict]:
+    """Шаг с максимумом запросов в секунду среди укладывающихся в SLO"""
+    passing = [
+        step for step in steps
+        if step["requests"] and step["latency"]["p95_ms"] <= slo_ms and step["error_rate"] <= max_error_rate
+    ]
+    if not passing:
+        return None
+    best = max(passing, key=lambda step: step["rps"])
+    return {"concurrency": best["concurrency"], "rps": best["rps"], "p95_ms": best["latency"]["p95_ms"]}
+
+
+def log_step(target: str, step: Dict):
+    latency = step["latency"]
+    logger.info(
+        f"   {target:<9} x{step['concurrency']:<4} {step['rps']:>8.1f} запр/с   "
+        f"p50 {latency.get('p50_ms', 0):>8.1f}   p95 {latency.get('p95_ms', 0):>8.1f}   "
+        f"p99 {latency.get('p99_ms', 0):>8.1f} мс   ошибки {step['error_rate']:>6.1%} "
+        f"(в логах {step['logged_errors']})"
+    )
+
+
+def run_b24(args, stub: StubServer, backend, queries, error_counter: ErrorCounter) -> List[Dict]:
+    """Нагрузка на Bitrix24 бота через его Flask app"""
+    from werkzeug.serving import make_server
+    from src.bots import b24_bot
+
+    b24_bot.collection = backend
+    server = make_server("127.0.0.1", 0, b24_bot.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-b24", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/webhook/bitrix24"
+
+    query_stream = itertools.cycle(queries)
+    user_ids = itertools.cycle(range(100000, 100000 + args.users))
+
+    steps = []
+    try:
+        for concurrency in args.concurrency:
+            error_counter.count = 0
+            raw = run_b24_step(url, query_stream, concurrency, args.duration, user_ids)
+            step = {"concurrency": concurrency, **summarize(raw["timings"], raw["errors"], raw["elapsed"], error_counter.count)}
+            steps.append(step)
+            log_step("bitrix24", step)
+            if step["error_rate"] > args.stop_error_rate:
+                logger.warning(f"   ⚠️ Ошибок больше {args.stop_error_rate:.0%} - дальше не повышаем")
+                break
+    finally:
+        server.shutdown()
+    return steps
+
+
+def run_telegram(args, stub: StubServer, backend, queries, error_counter: ErrorCounter) -> List[Dict]:
+    """Нагрузка на обработчик сообщений Telegram бота"""
+    from telegram.ext import Application
+    from src.bots import bot as bot_module
+
+    bot_module.collection = backend
+    # Защита от спама бота не должна срабатывать на генераторе
+    bot_module.check_user_rate_limit = lambda user_id, min_interval=0.5: True
+
+    async def run() -> List[Dict]:
+        application = Application.builder().token(TELEGRAM_TOKEN).base_url(f"{stub.url}/bot").build()
+        await application.initialize()
+        query_stream = itertools.cycle(queries)
+        user_ids = itertools.cycle(range(200000, 200000 + args.users))
+
+        steps = []
+        try:
+            for concurrency in args.concurrency:
+                error_counter.count = 0
+                raw = await run_telegram_step(bot_module, application, query_stream, concurrency, args.duration, user_ids)
+                step = {"concurrency": concurrency, **summarize(raw["timings"], raw["errors"], raw["elapsed"], error_counter.count)}
+                steps.append(step)
+                log_step("telegram", step)
+                if step["error_rate"] > args.stop_error_rate:
+                    logger.warning(f"   ⚠️ Ошибок больше {args.stop_error_rate:.0%} - дальше не повышаем")
+                    break
+        finally:
+            await application.shutdown()
+        return steps
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Bitrix24 и Telegram ботов")
+    parser.add_argument("--target", choices=["b24", "telegram", "all"], default="all", help="Какой бот нагружать")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Шаги конкурентности через запятую")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность шага, секунд")
+    parser.add_argument("--users", type=int, default=5000, help="Количество разных пользователей")
+    parser.add_argument("--faqs", type=int, default=1000, help="Размер синтетического корпуса")
+    parser.add_argument("--db", default=None, help="Рабочая БД (используется её копия)")
+    parser.add_argument("--queries-file", default=None, help="Запросы для --db, по одному на строку")
+    parser.add_argument("--embedding", choices=["hash", "model"], default="hash",
+                        help="Эмбеддинги: hash (без модели) или model (MODEL_NAME)")
+    parser.add_argument("--no-rag", action="store_true", help="Отключить RAG (без запросов к LLM)")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Задержка фейковой LLM, мс")
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0, help="Разброс задержки LLM, мс")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Доля ошибок фейковой LLM")
+    parser.add_argument("--slo-ms", type=float, default=3000.0, help="Целевой p95, мс (для оценки ёмкости)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Допустимая доля ошибок для ёмкости")
+    parser.add_argument("--stop-error-rate", type=float, default=0.5, help="Прекратить повышение при такой доле ошибок")
+    parser.add_argument("--seed", type=int, default=42, help="Seed корпуса и запросов")
+    parser.add_argument("--verbose", action="store_true", help="Не приглушать логи ботов")
+    parser.add_argument("--output", default=None, help="JSON с результатом")
+    args = parser.parse_args()
+
+    args.concurrency = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    targets = ["b24", "telegram"] if args.target == "all" else [args.target]
+
+    stub = StubServer(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate).start()
+
+    # Боты читают конфигурацию при импорте - окружение задаётся до него
+    os.environ["BITRIX24_WEBHOOK"] = f"{stub.url}/rest/1/loadtest"
+    os.environ["BITRIX24_BOT_CLIENT_ID"] = "loadtest"
+    os.environ["TELEGRAM_TOKEN"] = TELEGRAM_TOKEN
+    os.environ["OPENROUTER_BASE_URL"] = f"{stub.url}/v1"
+    os.environ["OPENROUTER_API_KEY"] = "loadtest"
+    os.environ["OPENROUTER_RETRY_DELAY"] = "0"
+    os.environ["RAG_ENABLED"] = "false" if args.no_rag else "true"
+
+    temp_dir = tempfile.mkdtemp(prefix="faq_load_test_")
+    error_counter = ErrorCounter()
+    results = {}
+    try:
+        backend, queries = prepare_data(args, temp_dir)
+
+        for target in targets:
+            logger.info("=" * 100)
+            logger.info(f"🚀 {target}: шаги {args.concurrency} по {args.duration:.0f} с, "
+                        f"RAG {'выкл' if args.no_rag else f'вкл ({args.llm_latency_ms:.0f}±{args.llm_jitter_ms:.0f} мс)'}")
+            logger.info("=" * 100)
+
+            # Боты настраивают корневой логгер при импорте - приглушаем после него
+            if not args.verbose:
+                _quiet_after_import(target)
+
+            runner = run_b24 if target == "b24" else run_telegram
+            root = logging.getLogger()
+            root.addHandler(error_counter)
+            try:
+                steps = runner(args, stub, backend, queries, error_counter)
+            finally:
+                root.removeHandler(error_counter)
+
+            results[target] = {
+                "steps": steps,
+                "capacity": capacity(steps, args.slo_ms, args.max_error_rate)
+            }
+    finally:
+        stub.stop()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    logger.info("=" * 100)
+    for target, result in results.items():
+        cap = result["capacity"]
+        if cap:
+            logger.info(f"✅ {target}: ёмкость ~{cap['rps']:.1f} запр/с (x{cap['concurrency']}, p95 {cap['p95_ms']:.0f} мс)")
+        else:
+            logger.info(f"❌ {target}: ни один шаг не уложился в p95 ≤ {args.slo_ms:.0f} мс и ошибки ≤ {args.max_error_rate:.0%}")
+        if target == "telegram":
+            logger.info("   (бот обрабатывает обновления по одному - реальная ёмкость соответствует x1)")
+    logger.info(f"   Вызовы заглушки: {dict(sorted(stub.calls.items()))}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    **git_commit(),
+                    "created_at": datetime.now().isoformat(timespec="seconds"),
+                    "cpu_count": os.cpu_count(),
+                    "args": {key: value for key, value in vars(args).items()}
+                },
+                "results": results,
+                "stub_calls": stub.calls
+            }, f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 Результат: {args.output}")
+
+
+def _quiet_after_import(target: str):
+    """Импортировать модуль бота и приглушить его логирование (DEBUG на каждый запрос)"""
+    if target == "b24":
+        from src.bots import b24_bot  # noqa: F401
+    else:
+        from src.bots import bot  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк анонимизации PII на больших RAG-контекстах
+
+Сравнивает PiiAnonymizer с прежней реализацией (последовательные re.sub
+по BB URL, email и трём паттернам телефонов; деанонимизация - str.replace
+по каждому placeholder'у), воспроизведённой ниже как эталон:
+- результат должен совпадать: текст, плейсхолдеры и маппинг
+- время anonymize и deanonymize на контекстах разного размера
+
+Контекст - синтетические фрагменты FAQ с email, телефонами в разных
+форматах, BB-ссылками Bitrix24 и длинными числами (ИНН, номера заявок).
+
+Запуск:
+    python benchmarks/pii_benchmark.py
+    python benchmarks/pii_benchmark.py --sizes 5000,50000,500000 --repeat 20
+"""
+
+import sys
+import os
+import argparse
+import logging
+import random
+import re
+import time
+from typing import Dict, List, Tuple
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.pii_anonymizer import PiiAnonymizer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Анонимайзер логирует каждый вызов
+logging.getLogger("src.core.pii_anonymizer").setLevel(logging.WARNING)
+
+FILLER = [
+    "Чтобы оформить отпуск, заполните заявление на портале и согласуйте его с руководителем.",
+    "Пропуск для гостя заказывается не позднее чем за сутки до визита.",
+    "Командировочные расходы возмещаются после сдачи авансового отчёта в бухгалтерию.",
+    "Доступ к VPN выдаётся по заявке в службу поддержки, срок - один рабочий день.",
+    "ИНН организации 7812345678901 указывается в счёте, номер заявки 89123.",
+    "Расчётный листок приходит на почту ежемесячно после начисления зарплаты.",
+]
+
+
+def random_pii(rng: random.Random) -> str:
+    """Фрагмент с персональными данными (форматы, которые ловит анонимайзер)"""
+    number = "".join(str(rng.randint(0, 9)) for _ in range(10))
+    name = rng.choice(["ivanov", "petrova", "hr", "support", "buh"])
+    return rng.choice([
+        f"Пишите на {name}@company.ru или {name}.{rng.randint(1, 99)}@mail.example.com.",
+        f"Телефон: +7 ({number[:3]}) {number[3:6]}-{number[6:8]}-{number[8:]}.",
+        f"Звоните 8 {number[:3]} {number[3:6]} {number[6:8]} {number[8:]}.",
+        f"Мобильный +7{number}, резервный 8{number}.",
+        f"Ответственный: [URL=/company/personal/user/{rng.randint(1, 999)}/]Сотрудник {name}[/URL].",
+        f"Внутренний номер 7{number}{rng.randint(0, 9)}.",
+    ])
+
+
+def build_context(size: int, rng: random.Random, pii_rate: float) -> str:
+    """Текст не короче size символов с долей фрагментов PII pii_rate"""
+    parts, length = [], 0
+    while length < size:
+        part = random_pii(rng) if rng.random() < pii_rate else rng.choice(FILLER)
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)
+
+
+# ========== ПРЕЖНЯЯ РЕАЛИЗАЦИЯ (ЭТАЛОН) ==========
+
+def legacy_anonymize(text: str) -> Tuple[str, Dict[str, str]]:
+    """Последовательные re.sub: BB URL → email → три паттерна телефонов"""
+    mapping: Dict[str, str] = {}
+    reverse: Dict[str, str] = {}
+    counters = {'URL': 0, 'EMAIL': 0, 'PHONE': 0}
+
+    def add(entity_type: str, value: str) -> str:
+        if value in reverse:
+            return reverse[value]
+        counters[entity_type] += 1
+        placeholder = f"[{entity_type}_{counters[entity_type]}]"
+        mapping[placeholder] = value
+        reverse[value] = placeholder
+        return placeholder
+
+    result = re.sub(r'\[URL=.*?\].*?\[/URL\]', lambda m: add('URL', m.group(0)), text, flags=re.IGNORECASE)
+    result = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', lambda m: add('EMAIL', m.group(0)), result)
+    for pattern in [
+        r'\+7\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}',
+        r'8\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}',
+        r'[+]?[78]\d{10}',
+    ]:
+        result = re.sub(pattern, lambda m: add('PHONE', m.group(0)), result)
+    return result, mapping
+
+
+def legacy_deanonymize(text: str, mapping: Dict[str, str]) -> str:
+    """str.replace по каждому placeholder'у (длинные первыми)"""
+    result = text
+    for placeholder in sorted(mapping, key=len, reverse=True):
+        result = result.replace(placeholder, mapping[placeholder])
+    return result
+
+
+# ========== ЗАМЕРЫ ==========
+
+def best_ms(func, repeat: int) -> float:
+    """Лучшее время из repeat запусков, мс"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def check_identical(texts: List[str]) -> int:
+    """Количество текстов, где результат отличается от эталона"""
+    anonymizer = PiiAnonymizer()
+    mismatches = 0
+    for text in texts:
+        expected_text, expected_mapping = legacy_anonymize(text)
+        actual_text, actual_mapping = anonymizer.anonymize(text)
+        if (actual_text, actual_mapping) != (expected_text, expected_mapping):
+            mismatches += 1
+        elif actual_mapping and anonymizer.deanonymize(actual_text, actual_mapping) != legacy_deanonymize(expected_text, expected_mapping):
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк анонимизации PII")
+    parser.add_argument("--sizes", default="2000,20000,200000", help="Размеры контекста в символах через запятую")
+    parser.add_argument("--pii-rate", type=float, default=0.3, help="Доля фрагментов с PII")
+    parser.add_argument("--repeat", type=int, default=10, help="Повторов замера (берётся лучшее время)")
+    parser.add_argument("--check", type=int, default=500, help="Случайных текстов для проверки совпадения с эталоном")
+    parser.add_argument("--seed", type=int, default=42, help="Seed генератора")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [int(value) for value in args.sizes.split(",")]
+
+    logger.info("=" * 90)
+    check_texts = [build_context(rng.randint(50, 3000), rng, rng.random()) for _ in range(args.check)]
+    mismatches = check_identical(check_texts)
+    if mismatches:
+        logger.error(f"❌ Результат отличается от прежней реализации: {mismatches} из {len(check_texts)} текстов")
+        sys.exit(1)
+    logger.info(f"✅ Результат совпадает с прежней реализацией ({len(check_texts)} текстов)")
+    logger.info("=" * 90)
+
+    anonymizer = PiiAnonymizer()
+    logger.info(f"{'символов':>10} {'PII':>6} {'anonymize до':>14} {'после':>10} {'ускорение':>10} "
+                f"{'deanonymize до':>16} {'после':>10} {'ускорение':>10}")
+    for size in sizes:
+        context = build_context(size, rng, args.pii_rate)
+        anonymized, mapping = anonymizer.anonymize(context)
+
+        before = best_ms(lambda: legacy_anonymize(context), args.repeat)
+        after = best_ms(lambda: anonymizer.anonymize(context), args.repeat)
+        de_before = best_ms(lambda: legacy_deanonymize(anonymized, mapping), args.repeat)
+        de_after = best_ms(lambda: anonymizer.deanonymize(anonymized, mapping), args.repeat)
+
+        logger.info(
+            f"{len(context):>10} {len(mapping):>6} {before:>11.2f} мс {after:>7.2f} мс {before / after:>9.1f}x "
+            f"{de_before:>13.2f} мс {de_after:>7.2f} мс {de_before / de_after:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Регрессия качества и времени поиска на реальных запросах из логов
+
+export - выгрузка размеченного набора из query_logs/answer_logs/rating_logs
+(и архива логов, если он есть):
+- оценка helpful и выбор варианта при disambiguation - FAQ релевантен запросу
+- оценка not_helpful - показанный FAQ нерелевантен
+Одинаковые запросы (после нормализации) объединяются, при нескольких оценках
+одного FAQ для запроса берётся последняя. Текст запросов проходит через
+PiiAnonymizer (email, телефоны, ссылки заменяются плейсхолдерами),
+пользователи в набор не попадают.
+
+run - прогон набора по сетке настроек: пороги (semantic/keyword) x бэкенды
+(numpy, numpy-int8, numpy-float16, chroma) x модели эмбеддингов. Для каждой
+комбинации:
+- каскад find_answer: точность ответа (FAQ из релевантных), доля
+  нерелевантных ответов, доля fallback, уровни, время на запрос
+- векторный поиск отдельно: hit@1, hit@3, hit@k, MRR и время на запрос
+Так любая оптимизация (квантование, кэши, новый бэкенд) проверяется
+на стоимость в качестве. Результат - JSON.
+
+Запуск:
+    python benchmarks/retrieval_eval.py export --output eval_set.json
+    python benchmarks/retrieval_eval.py run eval_set.json
+    python benchmarks/retrieval_eval.py run eval_set.json --semantic-thresholds 40,45,50 --backends numpy,numpy-int8
+    python benchmarks/retrieval_eval.py run eval_set.json --models deepvk/USER2-base,paraphrase-multilingual-MiniLM-L12-v2
+"""
+
+import sys
+import os
+import argparse
+import itertools
+import json
+import logging
+import tempfile
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+from src.core import database
+from src.core.pii_anonymizer import PiiAnonymizer
+from src.core.search import find_answer, normalize_text
+
+from hash_embeddings import HashEmbeddingFunction
+from run_search_benchmark import BACKENDS, build_backends, git_commit, latency_stats
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Каскад и анонимайзер логируют каждый запрос
+logging.getLogger("src.core.search").setLevel(logging.WARNING)
+logging.getLogger("src.core.vector_backend").setLevel(logging.WARNING)
+logging.getLogger("src.core.pii_anonymizer").setLevel(logging.WARNING)
+
+# Конфигурация
+MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
+
+
+# ========== ВЫГРУЗКА НАБОРА ==========
+
+def load_labels(with_archive: bool) -> List[Dict]:
+    """
+    Оценки и выборы вариантов из логов
+
+    Returns:
+        Строки: query_log_id, query_text, platform, faq_id, label
+        (relevant / rejected), source, timestamp - по возрастанию времени
+    """
+    with database.get_db_connection() as conn:
+        attached = with_archive and database.attach_archive_database(conn)
+        queries = database.period_log_source("query_logs", attached)
+        answers = database.period_log_source("answer_logs", attached)
+        ratings = database.period_log_source("rating_logs", attached)
+
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT q.id AS query_log_id, q.query_text, q.platform, a.faq_id,
+                   CASE WHEN r.rating = 'helpful' THEN 'relevant' ELSE 'rejected' END AS label,
+                   'rating' AS source, r.timestamp AS timestamp
+            FROM {ratings} r
+            JOIN {answers} a ON a.id = r.answer_log_id
+            JOIN {queries} q ON q.id = a.query_log_id
+            WHERE a.faq_id IS NOT NULL AND r.rating IN ('helpful', 'not_helpful')
+
+            UNION ALL
+
+            SELECT q.id, q.query_text, q.platform, a.faq_id, 'relevant', 'disambiguation', a.timestamp
+            FROM {answers} a
+            JOIN {queries} q ON q.id = a.query_log_id
+            WHERE a.search_level = 'disambiguation' AND a.faq_id IS NOT NULL
+
+            ORDER BY timestamp
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def build_eval_set(rows: List[Dict], faq_ids: set) -> Dict:
+    """
+    Объединить оценки по нормализованному тексту запроса и анонимизировать его
+
+    Returns:
+        Словарь items и skipped (причины пропуска)
+    """
+    anonymizer = PiiAnonymizer()
+    items: Dict[str, Dict] = {}
+    skipped = {"deleted_faq": 0, "view_queries": 0, "empty_query": 0}
+
+    for row in rows:
+        text = row["query_text"] or ""
+        # Просмотр FAQ через кнопку - не вопрос пользователя
+        if text.startswith("[Просмотр FAQ]"):
+            skipped["view_queries"] += 1
+            continue
+        if row["faq_id"] not in faq_ids:
+            skipped["deleted_faq"] += 1
+            continue
+        key = normalize_text(text)
+        if not key:
+            skipped["empty_query"] += 1
+            continue
+
+        item = items.get(key)
+        if item is None:
+            anonymized, _ = anonymizer.anonymize(text.strip())
+            item = items[key] = {
+                "query": anonymized,
+                "platform": row["platform"],
+                "labels": {},
+                "sources": {},
+                "query_log_ids": set()
+            }
+        # Более поздняя оценка того же FAQ заменяет раннюю
+        item["labels"][row["faq_id"]] = row["label"]
+        item["sources"][row["source"]] = item["sources"].get(row["source"], 0) + 1
+        item["query_log_ids"].add(row["query_log_id"])
+
+    result = []
+    for number, item in enumerate(items.values(), 1):
+        relevant = sorted(faq_id for faq_id, label in item["labels"].items() if label == "relevant")
+        rejected = sorted(faq_id for faq_id, label in item["labels"].items() if label == "rejected")
+        result.append({
+            "id": number,
+            "query": item["query"],
+            "platform": item["platform"],
+            "relevant": relevant,
+            "rejected": rejected,
+            "sources": item["sources"],
+            "occurrences": len(item["query_log_ids"])
+        })
+
+    return {"items": result, "skipped": skipped}
+
+
+def export_command(args):
+    if args.db:
+        database.DB_FILE = args.db
+
+    rows = load_labels(with_archive=not args.no_archive)
+    faq_ids = {faq["id"] for faq in database.get_all_faqs()}
+    built = build_eval_set(rows, faq_ids)
+    items = built["items"]
+
+    eval_set = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "source_rows": len(rows),
+            "faq_count": len(faq_ids),
+            "skipped": built["skipped"],
+            "with_relevant": sum(1 for item in items if item["relevant"]),
+            "rejected_only": sum(1 for item in items if not item["relevant"])
+        },
+        "items": items
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(eval_set, f, ensure_ascii=False, indent=2)
+
+    logger.info("=" * 80)
+    logger.info(f"📤 Набор: {len(items)} запросов из {len(rows)} оценок/выборов")
+    logger.info(f"   С релевантным FAQ: {eval_set['meta']['with_relevant']}, "
+                f"только отклонённые: {eval_set['meta']['rejected_only']}")
+    logger.info(f"   Пропущено: {built['skipped']}")
+    logger.info(f"💾 {args.output}")
+
+
+# ========== ПРОГОН ==========
+
+def retrieval_metrics(items: List[Dict], backend, k: int) -> Dict:
+    """hit@1/3/k и MRR векторного поиска по запросам с релевантным FAQ"""
+    labeled = [item for item in items if item["relevant"]]
+    hits = {1: 0, 3: 0, k: 0}
+    reciprocal_ranks, timings = [], []
+
+    for item in labeled:
+        started = time.perf_counter()
+        results = backend.query([f"search_query: {item['query']}"], n_results=k)
+        timings.append((time.perf_counter() - started) * 1000)
+
+        ranking = results["ids"][0] if results["ids"] else []
+        relevant = set(item["relevant"])
+        rank = next((i + 1 for i, faq_id in enumerate(ranking) if faq_id in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        for cutoff in hits:
+            hits[cutoff] += 1 if rank and rank <= cutoff else 0
+
+    count = len(labeled)
+    return {
+        "queries": count,
+        **{f"hit@{cutoff}": round(value / count, 4) if count else None for cutoff, value in sorted(hits.items())},
+        "mrr": round(sum(reciprocal_ranks) / count, 4) if count else None,
+        "latency": latency_stats(timings)
+    }
+
+
+def cascade_metrics(items: List[Dict], backend, settings: Dict) -> Dict:
+    """Ответ каскада find_answer: правильный, нерелевантный, fallback, уровни и время"""
+    correct = wrong = fallback = labeled = 0
+    levels, timings = {}, []
+
+    for item in items:
+        started = time.perf_counter()
+        result = find_answer(item["query"], backend, settings)
+        timings.append((time.perf_counter() - started) * 1000)
+
+        level = result.search_level if result.found else "none"
+        levels[level] = levels.get(level, 0) + 1
+        if not result.found:
+            fallback += 1
+        elif result.faq_id in item["rejected"]:
+            wrong += 1
+        if item["relevant"]:
+            labeled += 1
+            correct += 1 if result.found and result.faq_id in item["relevant"] else 0
+
+    total = len(items)
+    return {
+        "queries": total,
+        "accuracy": round(correct / labeled, 4) if labeled else None,
+        "rejected_answer_rate": round(wrong / total, 4) if total else None,
+        "fallback_rate": round(fallback / total, 4) if total else None,
+        "levels": levels,
+        "latency": latency_stats(timings)
+    }
+
+
+def embedding_function_for(model: str):
+    """hash - детерминированные эмбеддинги без модели, иначе модель через EMBEDDING_RUNTIME"""
+    if model == "hash":
+        return HashEmbeddingFunction()
+    from src.core.onnx_embeddings import create_embedding_function
+    return create_embedding_function(model)
+
+
+def run_command(args):
+    if args.db:
+        database.DB_FILE = args.db
+
+    with open(args.eval_set, encoding="utf-8") as f:
+        items = json.load(f)["items"]
+    if args.limit:
+        items = items[:args.limit]
+    if not items:
+        logger.error("❌ Набор пуст")
+        return
+
+    faqs = database.get_all_faqs()
+    base_settings = database.get_bot_settings()
+    semantic_thresholds = [float(value) for value in args.semantic_thresholds.split(",")] if args.semantic_thresholds \
+        else [float(base_settings.get("semantic_match_threshold", 45))]
+    keyword_thresholds = [float(value) for value in args.keyword_thresholds.split(",")] if args.keyword_thresholds \
+        else [float(base_settings.get("keyword_match_threshold", 80))]
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    models = [name.strip() for name in args.models.split(",") if name.strip()]
+
+    logger.info("=" * 100)
+    logger.info(f"🧪 Набор: {len(items)} запросов ({sum(1 for item in items if item['relevant'])} с релевантным FAQ), "
+                f"FAQ: {len(faqs)}")
+    logger.info("=" * 100)
+
+    runs = []
+    temp_dir = tempfile.mkdtemp(prefix="faq_retrieval_eval_")
+    try:
+        for model in models:
+            logger.info(f"\n🧠 Модель: {model}")
+            built = build_backends(faqs, backends, embedding_function_for(model), temp_dir)
+
+            for name, backend in built["backends"].items():
+                retrieval = retrieval_metrics(items, backend, args.k)
+                logger.info(
+                    f"   {name:<14} поиск: hit@1 {retrieval['hit@1']:.1%}  hit@3 {retrieval['hit@3']:.1%}  "
+                    f"hit@{args.k} {retrieval[f'hit@{args.k}']:.1%}  MRR {retrieval['mrr']:.3f}  "
+                    f"p50 {retrieval['latency']['p50_ms']:.1f} мс  p95 {retrieval['latency']['p95_ms']:.1f} мс"
+                    if retrieval["queries"] else f"   {name:<14} поиск: нет запросов с релевантным FAQ"
+                )
+
+                for semantic_threshold, keyword_threshold in itertools.product(semantic_thresholds, keyword_thresholds):
+                    settings = dict(
+                        base_settings,
+                        semantic_match_threshold=str(semantic_threshold),
+                        keyword_match_threshold=str(keyword_threshold)
+                    )
+                    cascade = cascade_metrics(items, backend, settings)
+                    accuracy = f"{cascade['accuracy']:.1%}" if cascade["accuracy"] is not None else "-"
+                    logger.info(
+                        f"   {name:<14} каскад semantic≥{semantic_threshold:g} keyword≥{keyword_threshold:g}: "
+                        f"точность {accuracy}  нерелевантных {cascade['rejected_answer_rate']:.1%}  "
+                        f"fallback {cascade['fallback_rate']:.1%}  "
+                        f"p50 {cascade['latency']['p50_ms']:.1f} мс  p95 {cascade['latency']['p95_ms']:.1f} мс"
+                    )
+                    runs.append({
+                        "model": model,
+                        "backend": name,
+                        "semantic_threshold": semantic_threshold,
+                        "keyword_threshold": keyword_threshold,
+                        "build_seconds": built["build_seconds"].get(name),
+                        "retrieval": retrieval,
+                        "cascade": cascade
+                    })
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    output = args.output or f"retrieval_eval_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                **git_commit(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "eval_set": os.path.abspath(args.eval_set),
+                "queries": len(items),
+                "faq_count": len(faqs),
+                "embedding_runtime": os.getenv("EMBEDDING_RUNTIME", "torch"),
+                "k": args.k
+            },
+            "runs": runs
+        }, f, ensure_ascii=False, indent=2)
+    logger.info(f"\n💾 Результат: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Регрессия качества и времени поиска на запросах из логов")
+    parser.add_argument("--db", default=None, help="Путь к БД (по умолчанию data/faq_database.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Выгрузить размеченный набор из логов")
+    export_parser.add_argument("--output", default="eval_set.json", help="JSON набора")
+    export_parser.add_argument("--no-archive", action="store_true", help="Не использовать архив логов")
+
+    run_parser = subparsers.add_parser("run", help="Прогнать набор по сетке настроек")
+    run_parser.add_argument("eval_set", help="JSON набора (из export)")
+    run_parser.add_argument("--semantic-thresholds", default=None, help="Пороги semantic через запятую (по умолчанию из настроек)")
+    run_parser.add_argument("--keyword-thresholds", default=None, help="Пороги keyword через запятую (по умолчанию из настроек)")
+    run_parser.add_argument("--backends", default="numpy,numpy-int8", help=f"Бэкенды через запятую ({', '.join(BACKENDS)})")
+    run_parser.add_argument("--models", default=MODEL_NAME, help="Модели эмбеддингов через запятую (hash - без модели)")
+    run_parser.add_argument("--k", type=int, default=5, help="Глубина hit@k и MRR")
+    run_parser.add_argument("--limit", type=int, default=0, help="Ограничить количество запросов")
+    run_parser.add_argument("--output", default=None, help="JSON с результатом")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_command(args)
+    else:
+        run_command(args)
+
+
+if __name__ == "__main__":
+    main()
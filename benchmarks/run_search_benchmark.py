@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк каскадного поиска на синтетическом корпусе
+
+Для каждого размера корпуса (по умолчанию 1k/10k/50k FAQ) создаёт временную
+БД и векторные индексы, генерирует поток запросов (benchmarks/corpus.py)
+и замеряет распределение времени и пропускную способность:
+- каждого уровня отдельно: exact, keyword, semantic (по каждому бэкенду)
+- find_answer целиком (по каждому бэкенду) - с точностью и уровнями ответов
+- find_answers_batch (по каждому бэкенду)
+
+Бэкенды: numpy, numpy-int8, numpy-float16 и chroma (если установлен chromadb).
+Эмбеддинги по умолчанию - детерминированный feature hashing
+(benchmarks/hash_embeddings.py), с --embedding model - модель MODEL_NAME
+через EMBEDDING_RUNTIME (torch или onnx).
+
+Результат пишется в JSON (benchmarks/results/) вместе с коммитом и параметрами,
+сравнение двух прогонов - benchmarks/compare_results.py.
+
+Запуск:
+    python benchmarks/run_search_benchmark.py
+    python benchmarks/run_search_benchmark.py --sizes 1000 --queries 200
+    python benchmarks/run_search_benchmark.py --backends numpy,chroma --embedding model
+    python benchmarks/run_search_benchmark.py --paraphrase-rate 0.8 --typo-rate 0.2 --output result.json
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+from src.core import database
+from src.core.chroma_sync import build_faq_document
+from src.core.search import (
+    find_answer, find_answers_batch, find_by_keywords, find_exact_match, find_semantic_match
+)
+from src.core.vector_backend import ChromaBackend, NumpyBackend
+
+from corpus import generate_corpus, generate_queries
+from hash_embeddings import HashEmbeddingFunction
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Каскад логирует каждый запрос - в бенчмарке это только шум и лишнее время
+logging.getLogger("src.core.search").setLevel(logging.WARNING)
+logging.getLogger("src.core.vector_backend").setLevel(logging.WARNING)
+
+# Конфигурация
+MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+BACKENDS = ("numpy", "numpy-int8", "numpy-float16", "chroma")
+
+# Размер батча при кодировании документов и добавлении в Chroma
+EMBED_BATCH_SIZE = 256
+
+
+def latency_stats(values_ms: List[float]) -> Dict:
+    """Среднее, перцентили (nearest rank) и максимум в мс"""
+    if not values_ms:
+        return {"count": 0}
+    ordered = sorted(values_ms)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+
+def git_commit() -> Dict:
+    """Коммит и наличие незакоммиченных изменений (для сравнения прогонов)"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True
+        ).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def create_embedding_function(kind: str):
+    """Функция эмбеддингов бенчмарка: hash или модель MODEL_NAME"""
+    if kind == "hash":
+        return HashEmbeddingFunction()
+    from src.core.onnx_embeddings import create_embedding_function as create_model_function
+    return create_model_function(MODEL_NAME)
+
+
+def populate_database(faqs: List[Dict]):
+    """Записать корпус в таблицу faq временной БД"""
+    with database.get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO faq (id, category, question, answer, keywords) VALUES (?, ?, ?, ?, ?)",
+            [(faq["id"], faq["category"], faq["question"], faq["answer"], ",".join(faq["keywords"])) for faq in faqs]
+        )
+
+
+def build_backends(faqs: List[Dict], names: List[str], embedding_function, directory: str) -> Dict:
+    """
+    Векторные бэкенды по корпусу
+
+    Returns:
+        Словарь {имя: бэкенд} и время построения в build_seconds
+    """
+    import numpy as np
+
+    documents, metadatas = [], []
+    for faq in faqs:
+        document, metadata = build_faq_document(faq)
+        documents.append(document)
+        metadatas.append(metadata)
+    ids = [faq["id"] for faq in faqs]
+
+    started = time.perf_counter()
+    vectors = []
+    for start in range(0, len(documents), EMBED_BATCH_SIZE):
+        vectors.extend(embedding_function(documents[start:start + EMBED_BATCH_SIZE]))
+    matrix = np.asarray(vectors, dtype=np.float32)
+    embed_seconds = time.perf_counter() - started
+    logger.info(f"   Эмбеддинги документов: {len(documents)} за {embed_seconds:.1f} с")
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    normalized = matrix / np.where(norms == 0, 1.0, norms)
+
+    backends, build_seconds = {}, {"embed_documents": round(embed_seconds, 3)}
+    for name in names:
+        started = time.perf_counter()
+        if name.startswith("numpy"):
+            quantization = name.split("-", 1)[1] if "-" in name else "none"
+            backends[name] = NumpyBackend(
+                ids=ids,
+                metadatas=metadatas,
+                documents=documents,
+                matrix=normalized,
+                embedding_function=embedding_function,
+                quantization=quantization
+            )
+        elif name == "chroma":
+            try:
+                import chromadb
+            except ImportError:
+                logger.warning("   ⚠️ chromadb не установлен, бэкенд chroma пропущен")
+                continue
+            client = chromadb.PersistentClient(path=os.path.join(directory, "chroma"))
+            collection = client.create_collection(
+                name=f"benchmark_{len(faqs)}",
+                embedding_function=embedding_function,
+                metadata={"hnsw:space": "cosine"}
+            )
+            for start in range(0, len(ids), EMBED_BATCH_SIZE):
+                end = start + EMBED_BATCH_SIZE
+                collection.add(
+                    ids=ids[start:end],
+                    embeddings=matrix[start:end].tolist(),
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end]
+                )
+            backends[name] = ChromaBackend(collection)
+        else:
+            raise ValueError(f"Неизвестный бэкенд: {name}")
+        build_seconds[name] = round(time.perf_counter() - started, 3)
+
+    return {"backends": backends, "build_seconds": build_seconds}
+
+
+def measure(queries: List, func: Callable, warmup: int) -> Dict:
+    """
+    Время func(query) для каждого запроса
+
+    Returns:
+        latency (перцентили), qps и результаты в порядке запросов
+    """
+    for query in queries[:warmup]:
+        func(query.text)
+
+    results, timings = [], []
+    started = time.perf_counter()
+    for query in queries:
+        query_started = time.perf_counter()
+        results.append(func(query.text))
+        timings.append((time.perf_counter() - query_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "latency": latency_stats(timings),
+        "qps": round(len(queries) / elapsed, 2) if elapsed else None,
+        "results": results
+    }
+
+
+def quality(queries: List, results: List) -> Dict:
+    """Точность (правильный FAQ или fallback для off_topic), уровни ответов, точность по видам запросов"""
+    levels, by_kind = {}, {}
+    correct = 0
+    for query, result in zip(queries, results):
+        level = result.search_level if result.found else "none"
+        levels[level] = levels.get(level, 0) + 1
+
+        ok = result.faq_id == query.expected_faq_id if query.expected_faq_id else not result.found
+        correct += ok
+        kind = by_kind.setdefault(query.kind, {"count": 0, "correct": 0})
+        kind["count"] += 1
+        kind["correct"] += ok
+
+    for kind in by_kind.values():
+        kind["accuracy"] = round(kind["correct"] / kind["count"], 4)
+
+    return {
+        "accuracy": round(correct / len(queries), 4) if queries else None,
+        "levels": levels,
+        "by_kind": by_kind
+    }
+
+
+def found_rate(results: List) -> float:
+    """Доля запросов, на которые уровень вернул ответ"""
+    return round(sum(1 for result in results if result) / len(results), 4) if results else 0.0
+
+
+def run_size(size: int, args, embedding_function) -> Dict:
+    """Бенчмарк одного размера корпуса во временной БД"""
+    logger.info("=" * 80)
+    logger.info(f"📚 КОРПУС {size} FAQ")
+    logger.info("=" * 80)
+
+    temp_dir = tempfile.mkdtemp(prefix="faq_search_benchmark_")
+    original_db_file = database.DB_FILE
+    database.DB_FILE = os.path.join(temp_dir, "faq_database.db")
+
+    try:
+        database.init_database()
+        faqs = generate_corpus(size, seed=args.seed)
+        populate_database(faqs)
+
+        mix = None
+        if args.mix:
+            mix = {kind: float(weight) for kind, weight in (item.split("=") for item in args.mix.split(","))}
+        queries = generate_queries(
+            faqs,
+            args.queries,
+            paraphrase_rate=args.paraphrase_rate,
+            typo_rate=args.typo_rate,
+            mix=mix,
+            seed=args.seed + 1
+        )
+
+        settings = database.get_bot_settings()
+        keyword_threshold = float(settings.get("keyword_match_threshold", 80))
+        keyword_max_words = int(settings.get("keyword_search_max_words", 5))
+        semantic_threshold = float(settings.get("semantic_match_threshold", 45))
+
+        built = build_backends(faqs, args.backends, embedding_function, temp_dir)
+        backends = built["backends"]
+
+        report = {"faqs": size, "queries": len(queries), "build_seconds": built["build_seconds"], "levels": {}}
+
+        def record(section: str, key: str, measured: Dict, extra: Dict):
+            report.setdefault(section, {})[key] = {"latency": measured["latency"], "qps": measured["qps"], **extra}
+            logger.info(
+                f"   {section + ':' + key:<36} p50 {measured['latency']['p50_ms']:>8.2f} мс   "
+                f"p95 {measured['latency']['p95_ms']:>8.2f} мс   {measured['qps']:>9.1f} запр/с"
+            )
+
+        measured = measure(queries, find_exact_match, args.warmup)
+        record("levels", "exact", measured, {"found_rate": found_rate(measured["results"])})
+
+        measured = measure(
+            queries,
+            lambda text: find_by_keywords(text, max_query_words=keyword_max_words, threshold=keyword_threshold),
+            args.warmup
+        )
+        record("levels", "keyword", measured, {"found_rate": found_rate(measured["results"])})
+
+        for name, backend in backends.items():
+            measured = measure(
+                queries,
+                lambda text: find_semantic_match(text, backend, threshold=semantic_threshold),
+                args.warmup
+            )
+            record("levels", f"semantic:{name}", measured, {"found_rate": found_rate(measured["results"])})
+
+        for name, backend in backends.items():
+            measured = measure(queries, lambda text: find_answer(text, backend, settings), args.warmup)
+            record("find_answer", name, measured, quality(queries, measured["results"]))
+
+        for name, backend in backends.items():
+            texts = [query.text for query in queries]
+            started = time.perf_counter()
+            results = find_answers_batch(texts, backend, settings)
+            elapsed = time.perf_counter() - started
+            report.setdefault("find_answers_batch", {})[name] = {
+                "seconds": round(elapsed, 3),
+                "per_query_ms": round(elapsed * 1000 / len(texts), 3),
+                "qps": round(len(texts) / elapsed, 2),
+                **quality(queries, results)
+            }
+            logger.info(
+                f"   {'find_answers_batch:' + name:<36} {elapsed * 1000 / len(texts):>8.2f} мс/запрос "
+                f"{len(texts) / elapsed:>22.1f} запр/с"
+            )
+
+        for name, section in report.get("find_answer", {}).items():
+            logger.info(f"   Точность find_answer ({name}): {section['accuracy']:.1%}, уровни: {section['levels']}")
+
+        return report
+
+    finally:
+        database.DB_FILE = original_db_file
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк каскадного поиска на синтетическом корпусе")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Размеры корпуса через запятую")
+    parser.add_argument("--queries", type=int, default=300, help="Запросов на каждый размер")
+    parser.add_argument("--backends", default="numpy,numpy-int8,chroma",
+                        help=f"Бэкенды через запятую ({', '.join(BACKENDS)})")
+    parser.add_argument("--embedding", choices=["hash", "model"], default="hash",
+                        help="Эмбеддинги: hash (детерминированные, без модели) или model (MODEL_NAME)")
+    parser.add_argument("--paraphrase-rate", type=float, default=0.5, help="Вероятность синонима в перефразировке")
+    parser.add_argument("--typo-rate", type=float, default=0.1, help="Вероятность опечатки в слове")
+    parser.add_argument("--mix", default=None,
+                        help="Доли видов запросов, например exact=0.2,keyword=0.2,paraphrase=0.3,typo=0.2,off_topic=0.1")
+    parser.add_argument("--warmup", type=int, default=10, help="Запросов для прогрева перед замером")
+    parser.add_argument("--seed", type=int, default=42, help="Seed корпуса и запросов")
+    parser.add_argument("--output", default=None, help="JSON с результатом (по умолчанию benchmarks/results/)")
+    args = parser.parse_args()
+
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    args.backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = [name for name in args.backends if name not in BACKENDS]
+    if unknown:
+        parser.error(f"неизвестные бэкенды: {', '.join(unknown)}")
+
+    embedding_function = create_embedding_function(args.embedding)
+    commit = git_commit()
+
+    result = {
+        "meta": {
+            **commit,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding": args.embedding if args.embedding == "hash" else MODEL_NAME,
+            "embedding_runtime": os.getenv("EMBEDDING_RUNTIME", "torch") if args.embedding == "model" else None,
+            "args": {
+                "sizes": args.sizes,
+                "queries": args.queries,
+                "backends": args.backends,
+                "paraphrase_rate": args.paraphrase_rate,
+                "typo_rate": args.typo_rate,
+                "mix": args.mix,
+                "warmup": args.warmup,
+                "seed": args.seed
+            }
+        },
+        "sizes": {}
+    }
+
+    for size in args.sizes:
+        result["sizes"][str(size)] = run_size(size, args, embedding_function)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"search_{stamp}_{commit['commit'] or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    logger.info("=" * 80)
+    logger.info(f"💾 Результат: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Точность и скорость ONNX Runtime эмбеддингов по сравнению с PyTorch
+
+Кодирует вопросы FAQ (как запросы) и документы FAQ обоими движками и показывает:
+- косинусную близость векторов ONNX и torch (мин/среднее)
+- совпадение топ-1 поиска запросов по документам и расхождение confidence
+- задержку одиночного запроса (среднее, p50, p95) и скорость пакетного кодирования
+
+Запуск:
+    python scripts/benchmark_onnx_embeddings.py
+    python scripts/benchmark_onnx_embeddings.py --queries 200 --runs 3 --threads 4
+    python scripts/benchmark_onnx_embeddings.py --no-quantize --force-export
+"""
+
+import sys
+import os
+import argparse
+import logging
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+import numpy as np
+from chromadb.utils import embedding_functions
+
+from src.core.database import get_all_faqs
+from src.core.chroma_sync import build_faq_document
+from src.core.embeddings import configure_torch_threads
+from src.core.onnx_embeddings import OnnxEmbeddingFunction, export_onnx_model
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Конфигурация
+MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
+
+
+def normalize(matrix):
+    """Нормализовать строки матрицы"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def percentile(values, p):
+    """Перцентиль без numpy"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def single_query_latency(embedding_function, queries, runs):
+    """Задержка кодирования одного запроса, мс"""
+    embedding_function(queries[:1])  # прогрев
+    timings = []
+    for _ in range(runs):
+        for query in queries:
+            started = time.perf_counter()
+            embedding_function([query])
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def batch_throughput(embedding_function, documents, runs):
+    """Лучшая скорость пакетного кодирования, док/с"""
+    best = 0.0
+    for _ in range(runs):
+        started = time.perf_counter()
+        embedding_function(documents)
+        elapsed = time.perf_counter() - started
+        best = max(best, len(documents) / elapsed if elapsed else 0.0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение ONNX Runtime и PyTorch эмбеддингов")
+    parser.add_argument("--model", default=MODEL_NAME, help="Модель SentenceTransformer")
+    parser.add_argument("--queries", type=int, default=100, help="Количество запросов")
+    parser.add_argument("--runs", type=int, default=3, help="Повторов замера")
+    parser.add_argument("--threads", type=int, default=0, help="Потоков CPU (0 - все ядра)")
+    parser.add_argument("--no-quantize", action="store_true", help="ONNX без int8 квантования")
+    parser.add_argument("--force-export", action="store_true", help="Экспортировать ONNX модель заново")
+    args = parser.parse_args()
+
+    faqs = get_all_faqs()
+    if not faqs:
+        logger.error("❌ В базе нет FAQ для замера")
+        return
+
+    documents = [build_faq_document(faq)[0] for faq in faqs]
+    questions = []
+    for faq in faqs:
+        questions.append(faq["question"])
+        words = faq["question"].split()
+        if len(words) > 2:
+            questions.append(" ".join(words[:-1]))
+    queries = [f"search_query: {question}" for question in questions[:args.queries]]
+
+    export_onnx_model(args.model, force=args.force_export)
+
+    configure_torch_threads(args.threads)
+    engines = {
+        "torch": embedding_functions.SentenceTransformerEmbeddingFunction(model_name=args.model),
+        "onnx": OnnxEmbeddingFunction(args.model, quantize=not args.no_quantize, num_threads=args.threads)
+    }
+
+    logger.info("=" * 80)
+    logger.info(
+        f"📊 ONNX vs TORCH: {args.model} ({'fp32' if args.no_quantize else 'int8'}), "
+        f"{len(documents)} документов, {len(queries)} запросов, потоков: {args.threads or os.cpu_count()}"
+    )
+    logger.info("=" * 80)
+
+    vectors = {
+        name: (normalize(engine(queries)), normalize(engine(documents)))
+        for name, engine in engines.items()
+    }
+
+    # Близость векторов одного и того же текста
+    similarities = np.concatenate([
+        (vectors["torch"][0] * vectors["onnx"][0]).sum(axis=1),
+        (vectors["torch"][1] * vectors["onnx"][1]).sum(axis=1)
+    ])
+    logger.info("\n🎯 Точность")
+    logger.info(f"   Косинус ONNX/torch:  мин {similarities.min():.4f}, среднее {similarities.mean():.4f}")
+
+    # Поиск запросов по документам каждым движком
+    torch_scores = vectors["torch"][0] @ vectors["torch"][1].T
+    onnx_scores = vectors["onnx"][0] @ vectors["onnx"][1].T
+    torch_top = torch_scores.argmax(axis=1)
+    onnx_top = onnx_scores.argmax(axis=1)
+    same_top1 = int((torch_top == onnx_top).sum())
+    confidence_diff = np.abs(
+        np.maximum(0.0, torch_scores.max(axis=1)) - np.maximum(0.0, onnx_scores.max(axis=1))
+    ) * 100
+    logger.info(f"   Совпадение топ-1:    {same_top1}/{len(queries)}")
+    logger.info(
+        f"   Расхождение confidence топ-1: среднее {confidence_diff.mean():.3f}%, макс {confidence_diff.max():.3f}%"
+    )
+
+    logger.info("\n⏱️  Скорость")
+    for name, engine in engines.items():
+        timings = single_query_latency(engine, queries, args.runs)
+        throughput = batch_throughput(engine, documents, args.runs)
+        logger.info(
+            f"   {name:<6} запрос: среднее {sum(timings) / len(timings):>7.2f} мс, "
+            f"p50 {percentile(timings, 50):>7.2f} мс, p95 {percentile(timings, 95):>7.2f} мс;  "
+            f"пакет: {throughput:>7.1f} док/с"
+        )
+    logger.info("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
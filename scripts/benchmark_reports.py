@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк генерации отчетов
+
+Создаёт временную БД с синтетическим тестовым периодом (по умолчанию 100 000 запросов)
+и замеряет время и пиковую память:
+- расчёта статистики периода (get_period_statistics)
+- Excel отчета по периоду (generate_period_excel_report)
+- Excel документа для актуализации FAQ (generate_review_excel)
+
+Запуск:
+    python scripts/benchmark_reports.py
+    python scripts/benchmark_reports.py --queries 200000 --faqs 10000
+    python scripts/benchmark_reports.py --skip-review
+"""
+
+import sys
+import os
+import argparse
+import logging
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+from src.core import database
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ["Отпуск", "Зарплата", "IT", "Офис", "Документы", "Обучение"]
+QUERY_WORDS = [
+    "как", "оформить", "отпуск", "получить", "справку", "пароль", "сбросить", "зарплата",
+    "когда", "пропуск", "офис", "доступ", "vpn", "принтер", "больничный", "командировка",
+    "обучение", "курс", "заявление", "отпускные", "аванс", "почта", "настроить", "где"
+]
+SEARCH_LEVELS = ["exact", "keyword", "semantic", "semantic", "semantic", "none", "disambiguation_shown"]
+
+
+def random_text(rng: random.Random, min_words: int, max_words: int) -> str:
+    """Случайная фраза из словаря QUERY_WORDS"""
+    return " ".join(rng.choice(QUERY_WORDS) for _ in range(rng.randint(min_words, max_words)))
+
+
+def populate_database(num_queries: int, num_faqs: int, seed: int = 42) -> int:
+    """
+    Заполнить текущую БД синтетическими FAQ и логами одного завершённого периода
+
+    :return: ID тестового периода
+    """
+    import migrate_test_periods
+
+    rng = random.Random(seed)
+
+    database.init_database()
+    migrate_test_periods.migrate()
+
+    faq_ids = [f"faq_{i}" for i in range(num_faqs)]
+
+    with database.get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            "INSERT INTO faq (id, category, question, answer, keywords) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    faq_id,
+                    rng.choice(CATEGORIES),
+                    random_text(rng, 4, 10).capitalize() + "?",
+                    random_text(rng, 30, 120),
+                    ",".join(rng.sample(QUERY_WORDS, 4))
+                )
+                for faq_id in faq_ids
+            ]
+        )
+
+        cursor.execute(
+            "INSERT INTO test_periods (name, description, status) VALUES (?, ?, 'active')",
+            ("Бенчмарк", f"Синтетический период на {num_queries} запросов")
+        )
+        period_id = cursor.lastrowid
+
+        # Популярные запросы повторяются - как в реальных логах
+        popular_queries = [random_text(rng, 2, 6) for _ in range(200)]
+
+        query_rows, answer_rows, rating_rows = [], [], []
+        for query_id in range(1, num_queries + 1):
+            day = rng.randint(1, 28)
+            timestamp = f"2025-02-{day:02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+            query_text = rng.choice(popular_queries) if rng.random() < 0.6 else random_text(rng, 2, 8)
+
+            query_rows.append((
+                query_id, rng.randint(1, 2000), f"user_{query_id % 2000}", query_text,
+                rng.choice(["telegram", "bitrix24"]), timestamp, period_id
+            ))
+
+            level = rng.choice(SEARCH_LEVELS)
+            faq_id = None if level == "none" else rng.choice(faq_ids)
+            answer_rows.append((
+                query_id, query_id, faq_id, round(rng.uniform(20, 100), 2), "ответ", level, timestamp, period_id
+            ))
+
+            if rng.random() < 0.3:
+                rating_rows.append((
+                    query_id, rng.randint(1, 2000), "helpful" if rng.random() < 0.7 else "not_helpful", timestamp, period_id
+                ))
+
+        cursor.executemany(
+            "INSERT INTO query_logs (id, user_id, username, query_text, platform, timestamp, period_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            query_rows
+        )
+        cursor.executemany(
+            "INSERT INTO answer_logs (id, query_log_id, faq_id, similarity_score, answer_shown, search_level, timestamp, period_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            answer_rows
+        )
+        cursor.executemany(
+            "INSERT INTO rating_logs (answer_log_id, user_id, rating, timestamp, period_id) VALUES (?, ?, ?, ?, ?)",
+            rating_rows
+        )
+
+    # Логи записаны напрямую - роллапы статистики периода заполняем как миграция
+    database.rebuild_statistics_rollups()
+    database.end_test_period(period_id)
+    return period_id
+
+
+def measure(label: str, func, *args, **kwargs):
+    """Выполнить функцию и залогировать время и пиковую память"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    logger.info(f"   {label:<40} {elapsed * 1000:>10.1f} мс   пик памяти {peak / 1024 / 1024:>8.1f} МБ")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации отчетов")
+    parser.add_argument("--queries", type=int, default=100000, help="Количество запросов в периоде")
+    parser.add_argument("--faqs", type=int, default=5000, help="Количество FAQ в базе")
+    parser.add_argument("--skip-review", action="store_true", help="Не замерять generate_review_excel (не импортировать web_admin)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="faq_bench_")
+    database.DB_FILE = os.path.join(tmp_dir, "faq_database.db")
+
+    try:
+        logger.info("=" * 80)
+        logger.info(f"📊 БЕНЧМАРК ОТЧЕТОВ: {args.queries} запросов, {args.faqs} FAQ")
+        logger.info("=" * 80)
+
+        started = time.perf_counter()
+        period_id = populate_database(args.queries, args.faqs)
+        logger.info(f"   Синтетические данные созданы за {time.perf_counter() - started:.1f} с\n")
+
+        from src.core import statistics
+        from src.web.report_generator import generate_period_excel_report
+
+        stats = measure("Статистика периода (без кэша)", statistics.compute_period_statistics, period_id)
+        measure("Статистика периода (первый вызов)", database.get_period_statistics, period_id)
+        measure("Статистика периода (из кэша)", database.get_period_statistics, period_id)
+
+        buffer = measure("Excel отчет по периоду", generate_period_excel_report, stats)
+        logger.info(f"   {'Размер отчета':<40} {len(buffer.getvalue()) / 1024:>10.1f} КБ")
+
+        if not args.skip_review:
+            from src.web.web_admin import generate_review_excel
+
+            faqs = database.get_all_faqs()
+            buffer = measure(f"Excel для актуализации ({len(faqs)} FAQ)", generate_review_excel, faqs, "all")
+            logger.info(f"   {'Размер документа':<40} {len(buffer.getvalue()) / 1024:>10.1f} КБ")
+
+        logger.info("=" * 80)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
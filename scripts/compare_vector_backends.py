@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение векторных бэкендов семантического поиска (chroma vs numpy)
+
+Для вопросов FAQ (и их слегка изменённых версий) выполняет поиск в обоих
+бэкендах по активной коллекции и показывает:
+- совпадение топ-k (ids и порядок)
+- максимальное расхождение confidence
+- среднее и p95 время запроса
+
+Запуск:
+    python scripts/compare_vector_backends.py
+    python scripts/compare_vector_backends.py --queries 200 --top-k 5
+"""
+
+import sys
+import os
+import argparse
+import logging
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from src.core.database import get_all_faqs
+from src.core.chroma_sync import get_active_collection_name
+from src.core.vector_backend import ChromaBackend, NumpyBackend
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Конфигурация
+MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
+CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
+
+
+def confidences(results):
+    """Confidence так же, как в find_semantic_match"""
+    return [max(0.0, 1.0 - distance) * 100.0 for distance in results["distances"][0]]
+
+
+def percentile(values, p):
+    """Перцентиль без numpy"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение chroma и numpy бэкендов")
+    parser.add_argument("--queries", type=int, default=100, help="Количество запросов")
+    parser.add_argument("--top-k", type=int, default=5, help="Размер топа")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+    collection = client.get_collection(name=get_active_collection_name(), embedding_function=embedding_func)
+
+    backends = [ChromaBackend(collection), NumpyBackend.from_collection(collection, embedding_func)]
+
+    # Вопросы FAQ как есть и без последнего слова (перефразировка "на минималках")
+    faqs = get_all_faqs()
+    queries = []
+    for faq in faqs:
+        queries.append(faq["question"])
+        words = faq["question"].split()
+        if len(words) > 2:
+            queries.append(" ".join(words[:-1]))
+    queries = queries[:args.queries]
+    if not queries:
+        logger.error("❌ В базе нет FAQ для запросов")
+        return
+
+    logger.info("=" * 80)
+    logger.info(f"📊 СРАВНЕНИЕ БЭКЕНДОВ: {collection.name}, {collection.count()} записей, {len(queries)} запросов")
+    logger.info("=" * 80)
+
+    timings = {backend.name: [] for backend in backends}
+    same_top1 = same_topk = 0
+    max_diff = 0.0
+
+    for query in queries:
+        query_texts = [f"search_query: {query}"]
+        per_backend = []
+        for backend in backends:
+            started = time.perf_counter()
+            results = backend.query(query_texts, n_results=args.top_k)
+            timings[backend.name].append((time.perf_counter() - started) * 1000)
+            per_backend.append(results)
+
+        chroma_results, numpy_results = per_backend
+        if chroma_results["ids"][0][:1] == numpy_results["ids"][0][:1]:
+            same_top1 += 1
+        if chroma_results["ids"][0] == numpy_results["ids"][0]:
+            same_topk += 1
+
+        # Confidence одного и того же FAQ в обоих бэкендах
+        chroma_conf = dict(zip(chroma_results["ids"][0], confidences(chroma_results)))
+        for faq_id, confidence in zip(numpy_results["ids"][0], confidences(numpy_results)):
+            if faq_id in chroma_conf:
+                max_diff = max(max_diff, abs(chroma_conf[faq_id] - confidence))
+
+    logger.info(f"   Совпадение топ-1:           {same_top1}/{len(queries)}")
+    logger.info(f"   Совпадение топ-{args.top_k} (порядок): {same_topk}/{len(queries)}")
+    logger.info(f"   Макс. расхождение confidence: {max_diff:.4f}%")
+    for name, values in timings.items():
+        logger.info(
+            f"   {name:<8} среднее {sum(values) / len(values):>8.2f} мс   p95 {percentile(values, 95):>8.2f} мс"
+        )
+    logger.info("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
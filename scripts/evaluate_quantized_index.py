@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Оценка квантованного индекса numpy бэкенда (int8 / float16 против float32)
+
+Для вопросов FAQ (и их слегка изменённых версий) выполняет поиск
+по активной коллекции в точном float32 индексе и в квантованных и показывает:
+- recall@k относительно float32 (доля общих ids в топ-k)
+- совпадение топ-1
+- максимальное расхождение confidence у общих результатов
+- сколько запросов меняют решение по порогу semantic_match_threshold
+- объём матрицы в памяти и среднее/p95 время запроса
+
+Запуск:
+    python scripts/evaluate_quantized_index.py
+    python scripts/evaluate_quantized_index.py --queries 300 --top-k 10 --rescore-factor 2
+"""
+
+import sys
+import os
+import argparse
+import logging
+import tempfile
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["ANONYMIZED_TELEMETRY"] = "False"
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+from src.core.database import get_all_faqs, get_bot_settings
+from src.core.chroma_sync import get_active_collection_name
+from src.core import vector_backend
+from src.core.vector_backend import NumpyBackend
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Конфигурация
+MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
+CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
+
+
+class CachedEmbeddingFunction:
+    """Эмбеддинги запросов считаются один раз для всех индексов"""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.cache = {}
+
+    def __call__(self, texts):
+        missing = [text for text in texts if text not in self.cache]
+        if missing:
+            for text, vector in zip(missing, self.embedding_function(missing)):
+                self.cache[text] = vector
+        return [self.cache[text] for text in texts]
+
+
+def confidences(results):
+    """Confidence так же, как в find_semantic_match"""
+    return [max(0.0, 1.0 - distance) * 100.0 for distance in results["distances"][0]]
+
+
+def percentile(values, p):
+    """Перцентиль без numpy"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка квантованного numpy индекса")
+    parser.add_argument("--queries", type=int, default=100, help="Количество запросов")
+    parser.add_argument("--top-k", type=int, default=5, help="Размер топа")
+    parser.add_argument(
+        "--rescore-factor",
+        type=int,
+        default=vector_backend.VECTOR_RESCORE_FACTOR,
+        help="Кандидатов на пересчёт в float32 (в n_results раз)"
+    )
+    args = parser.parse_args()
+
+    vector_backend.VECTOR_RESCORE_FACTOR = args.rescore_factor
+    threshold = float(get_bot_settings().get("semantic_match_threshold", 45))
+
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+    collection = client.get_collection(name=get_active_collection_name(), embedding_function=embedding_func)
+    query_func = CachedEmbeddingFunction(embedding_func)
+
+    # Вопросы FAQ как есть и без последнего слова (перефразировка "на минималках")
+    queries = []
+    for faq in get_all_faqs():
+        queries.append(faq["question"])
+        words = faq["question"].split()
+        if len(words) > 2:
+            queries.append(" ".join(words[:-1]))
+    queries = queries[:args.queries]
+    if not queries:
+        logger.error("❌ В базе нет FAQ для запросов")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        backends = {
+            quantization: NumpyBackend.from_collection(collection, query_func, directory, quantization)
+            for quantization in ("none", "int8", "float16")
+        }
+
+        # Прогрев кэша эмбеддингов, чтобы время запроса было временем поиска
+        for query in queries:
+            query_func([f"search_query: {query}"])
+
+        results = {name: [] for name in backends}
+        timings = {name: [] for name in backends}
+        for query in queries:
+            query_texts = [f"search_query: {query}"]
+            for name, backend in backends.items():
+                started = time.perf_counter()
+                results[name].append(backend.query(query_texts, n_results=args.top_k))
+                timings[name].append((time.perf_counter() - started) * 1000)
+
+        logger.info("=" * 80)
+        logger.info(
+            f"📊 КВАНТОВАНИЕ: {collection.name}, {collection.count()} записей, {len(queries)} запросов, "
+            f"top-{args.top_k}, пересчёт x{args.rescore_factor}, порог {threshold:.0f}%"
+        )
+        logger.info("=" * 80)
+
+        for name, backend in backends.items():
+            recall = same_top1 = threshold_flips = 0
+            max_diff = 0.0
+            for reference, candidate in zip(results["none"], results[name]):
+                reference_ids, candidate_ids = reference["ids"][0], candidate["ids"][0]
+                recall += len(set(reference_ids) & set(candidate_ids)) / max(1, len(reference_ids))
+                if reference_ids[:1] == candidate_ids[:1]:
+                    same_top1 += 1
+
+                reference_conf = dict(zip(reference_ids, confidences(reference)))
+                for faq_id, confidence in zip(candidate_ids, confidences(candidate)):
+                    if faq_id in reference_conf:
+                        max_diff = max(max_diff, abs(reference_conf[faq_id] - confidence))
+
+                best_reference = max(confidences(reference), default=0.0)
+                best_candidate = max(confidences(candidate), default=0.0)
+                if (best_reference >= threshold) != (best_candidate >= threshold):
+                    threshold_flips += 1
+
+            values = timings[name]
+            logger.info(f"\n🔹 {name}")
+            logger.info(f"   Память матрицы:          {backend.memory_bytes() / 1024 / 1024:.2f} МБ")
+            logger.info(f"   Recall@{args.top_k} к float32:     {recall / len(queries):.4f}")
+            logger.info(f"   Совпадение топ-1:        {same_top1}/{len(queries)}")
+            logger.info(f"   Макс. расхождение confidence: {max_diff:.4f}%")
+            logger.info(f"   Смена решения по порогу: {threshold_flips}")
+            logger.info(
+                f"   Время запроса: среднее {sum(values) / len(values):.2f} мс, p95 {percentile(values, 95):.2f} мс"
+            )
+
+        logger.info("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Миграция: Добавление роллапов статистики
+
+Добавляет таблицы:
+- stats_rollup - почасовые/дневные счётчики по платформе, уровню поиска, периоду и FAQ
+- stats_query_rollup - счётчики по тексту запроса (топ вопросов)
+- stats_user_rollup - уникальные пользователи
+
+и заполняет их из существующих логов.
+
+Запуск:
+    python scripts/migrate_add_stats_rollups.py            # создать таблицы и пересчитать роллапы
+    python scripts/migrate_add_stats_rollups.py --compact  # только свернуть старые почасовые бакеты (для cron)
+"""
+
+import os
+import sys
+
+# Добавляем путь к корню проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.database import init_database, rebuild_statistics_rollups, compact_statistics_rollups
+
+
+def migrate():
+    """Выполнить миграцию"""
+    print("=" * 50)
+    print("Миграция: Добавление роллапов статистики")
+    print("=" * 50)
+
+    # init_database создаёт недостающие таблицы роллапов (CREATE TABLE IF NOT EXISTS)
+    init_database()
+
+    if not rebuild_statistics_rollups():
+        print("❌ Не удалось заполнить роллапы")
+        sys.exit(1)
+
+    print("✅ Миграция завершена")
+
+
+def compact():
+    """Свернуть старые почасовые бакеты в дневные"""
+    compacted = compact_statistics_rollups()
+    if compacted < 0:
+        sys.exit(1)
+    print(f"✅ Свёрнуто почасовых бакетов: {compacted}")
+
+
+if __name__ == "__main__":
+    if "--compact" in sys.argv:
+        compact()
+    else:
+        migrate()
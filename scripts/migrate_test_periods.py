@@ -70,6 +70,11 @@ def migrate():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_period ON rating_logs(period_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_periods_status ON test_periods(status)")
 
+        # Частичные индексы: архивация и очистка выбирают только записи без period_id
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_unarchived ON query_logs(id) WHERE period_id IS NULL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_unarchived ON answer_logs(id) WHERE period_id IS NULL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_unarchived ON rating_logs(id) WHERE period_id IS NULL")
+
         print("OK: Миграция успешно завершена!")
 
 
@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 """
 Локальное переобучение ChromaDB
+
+Запуск:
+    python scripts/retrain_chromadb_local.py         # переэмбеддить только изменённые FAQ
+    python scripts/retrain_chromadb_local.py --full  # собрать новую версию коллекции и переключиться на неё
+    python scripts/retrain_chromadb_local.py --full --batch-size 64 --threads 8 --verbose
 """
 
 import sys
 import os
+import argparse
 import logging
 
 # Добавляем корневую директорию в путь
@@ -16,8 +22,10 @@ load_dotenv()
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
 import chromadb
-from chromadb.utils import embedding_functions
 from src.core import database
+from src.core import embeddings
+from src.core.chroma_sync import sync_faq_collection, get_faq_collection
+from src.core.onnx_embeddings import EMBEDDING_RUNTIME, create_embedding_function, embedding_model_key
 
 # Настройка логирования
 logging.basicConfig(
@@ -31,37 +39,23 @@ MODEL_NAME = os.getenv("MODEL_NAME", "deepvk/USER2-base")
 CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
 
 
-def retrain_chromadb():
+def retrain_chromadb(full=False):
     """
-    Переобучение ChromaDB на основе данных из базы
+    Синхронизация ChromaDB с базой данных
+
+    По умолчанию переэмбеддятся только изменённые FAQ;
+    full=True - собрать новую версию коллекции (blue/green)
     """
     logger.info("="*80)
-    logger.info("🔄 ПЕРЕОБУЧЕНИЕ CHROMADB")
+    logger.info("🔄 ПЕРЕОБУЧЕНИЕ CHROMADB" + (" (ПОЛНОЕ)" if full else " (ИНКРЕМЕНТАЛЬНОЕ)"))
     logger.info("="*80)
-    logger.info(f"   Модель: {MODEL_NAME}")
+    logger.info(f"   Модель: {MODEL_NAME} ({EMBEDDING_RUNTIME})")
     logger.info(f"   Путь: {CHROMA_PATH}")
 
     try:
         # Инициализируем ChromaDB
         chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-        embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=MODEL_NAME
-        )
-
-        # Удаляем старую коллекцию
-        try:
-            chroma_client.delete_collection(name="faq_collection")
-            logger.info("✅ Старая коллекция удалена")
-        except Exception as e:
-            logger.info(f"⚠️ Коллекции не было или ошибка удаления: {e}")
-
-        # Создаем новую коллекцию
-        collection = chroma_client.create_collection(
-            name="faq_collection",
-            embedding_function=embedding_func,
-            metadata={"hnsw:space": "cosine"}
-        )
-        logger.info("✅ Создана новая коллекция")
+        embedding_func = create_embedding_function(MODEL_NAME)
 
         # Получаем все FAQ из базы
         all_faqs = database.get_all_faqs()
@@ -71,33 +65,36 @@ def retrain_chromadb():
 
         logger.info(f"📥 Загружено {len(all_faqs)} FAQ из базы")
 
-        # Подготавливаем данные для ChromaDB
-        documents, metadatas, ids = [], [], []
-        for faq in all_faqs:
-            # Обрабатываем ключевые слова
-            keywords = faq.get('keywords', [])
-            if isinstance(keywords, list):
-                keywords_str = ' '.join(keywords)
-            elif isinstance(keywords, str):
-                keywords_str = keywords.replace(',', ' ')
-            else:
-                keywords_str = ''
-
-            # Формируем текст документа с префиксом
-            text = f"{faq['question']} {keywords_str}"
-            documents.append(f"search_document: {text}")
-
-            metadatas.append({
-                "category": faq["category"],
-                "question": faq["question"],
-                "answer": faq["answer"]
-            })
-            ids.append(str(faq["id"]))
-
-        # Добавляем в ChromaDB
-        collection.add(documents=documents, metadatas=metadatas, ids=ids)
-
-        logger.info(f"✅ ChromaDB переобучена: {len(all_faqs)} записей")
+        result = sync_faq_collection(
+            chroma_client,
+            embedding_func,
+            model_name=embedding_model_key(MODEL_NAME),
+            faqs=all_faqs,
+            full=full
+        )
+        logger.info(
+            f"✅ Добавлено: {result['added']}, обновлено: {result['updated']}, "
+            f"удалено: {result['deleted']}, без изменений: {result['unchanged']}"
+        )
+
+        stats = result.get("embedding")
+        if stats:
+            logger.info(
+                f"💾 Из хранилища эмбеддингов: {stats.get('cache_hits', 0)}, "
+                f"закодировано моделью: {stats.get('encoded', stats['documents'])}"
+            )
+            batch_seconds = stats["batch_seconds"]
+            if batch_seconds:
+                logger.info(
+                    f"🧮 Эмбеддинги: {stats.get('encoded', stats['documents'])} док. за {stats['seconds']} с, "
+                    f"{stats['docs_per_sec']} док/с (батч {stats['batch_size']}, потоков {stats['threads']})"
+                )
+                logger.info(
+                    f"   Время батча: мин {min(batch_seconds):.2f} с, "
+                    f"среднее {sum(batch_seconds) / len(batch_seconds):.2f} с, макс {max(batch_seconds):.2f} с"
+                )
+
+        collection = get_faq_collection(chroma_client, embedding_func, embedding_model_key(MODEL_NAME))
         logger.info(f"✅ Коллекция содержит {collection.count()} документов")
 
         # Проверяем, что коллекция доступна
@@ -121,7 +118,21 @@ def retrain_chromadb():
 
 def main():
     """Главная функция"""
-    success = retrain_chromadb()
+    parser = argparse.ArgumentParser(description="Локальное переобучение ChromaDB")
+    parser.add_argument("--full", action="store_true", help="Собрать новую версию коллекции со всеми FAQ")
+    parser.add_argument("--batch-size", type=int, help="Размер батча модели (по умолчанию EMBEDDING_BATCH_SIZE)")
+    parser.add_argument("--threads", type=int, help="Количество потоков torch (0 - все ядра)")
+    parser.add_argument("--verbose", action="store_true", help="Время каждого батча")
+    args = parser.parse_args()
+
+    if args.batch_size:
+        embeddings.EMBEDDING_BATCH_SIZE = args.batch_size
+    if args.threads is not None:
+        embeddings.EMBEDDING_THREADS = args.threads
+    if args.verbose:
+        logging.getLogger("src.core.embeddings").setLevel(logging.DEBUG)
+
+    success = retrain_chromadb(full=args.full)
 
     if success:
         logger.info("\n" + "="*80)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Стресс-тест параллельной анонимизации PII
+
+Проверяет, что один PiiAnonymizer и один LLMService безопасно обслуживают
+параллельные запросы (как в многопоточном сервере Bitrix24):
+1. Общий PiiAnonymizer: потоки одновременно анонимизируют тексты со своими
+   email/телефонами, результат сравнивается с однопоточным эталоном,
+   деанонимизация должна вернуть исходный текст
+2. Общий LLMService: потоки одновременно вызывают generate_answer, LLM
+   заменена эхо-клиентом (ответ = анонимизированный промпт), в ответе должны
+   оказаться только PII своего запроса и не остаться placeholder'ов
+
+Запуск:
+    python scripts/test_anonymizer_concurrency.py
+    python scripts/test_anonymizer_concurrency.py --threads 32 --iterations 500
+
+Код возврата 1, если найдено хотя бы одно смешение маппингов.
+"""
+
+import sys
+import os
+import argparse
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Загружаем .env
+load_dotenv()
+
+from src.core.pii_anonymizer import PiiAnonymizer
+
+PLACEHOLDER_PATTERN = re.compile(r'\[[A-Z]+_\d+\]')
+
+
+def print_header(text):
+    """Печать заголовка"""
+    print(f"\n{'=' * 80}\n{text:^80}\n{'=' * 80}\n")
+
+
+def request_pii(worker: int, iteration: int):
+    """PII конкретного запроса: уникальные для потока и итерации email и телефоны"""
+    number = f"{worker:03d}{iteration:07d}"
+    return {
+        'email': f"user{worker}.{iteration}@company.ru",
+        'phone': f"+7 ({number[:3]}) {number[3:6]}-{number[6:8]}-{number[8:]}",
+        'mobile': f"8{number}",
+        'url': f"[URL=/company/personal/user/{worker}{iteration}/]Сотрудник {worker}-{iteration}[/URL]",
+    }
+
+
+def request_text(worker: int, iteration: int) -> str:
+    """Текст запроса с PII потока (повторы проверяют дедупликацию)"""
+    pii = request_pii(worker, iteration)
+    return (
+        f"Ответственный {pii['url']}, почта {pii['email']}, телефон {pii['phone']}. "
+        f"Если не отвечает - мобильный {pii['mobile']} или снова {pii['email']}. "
+        f"Общая почта hr@company.ru."
+    )
+
+
+def run_parallel(threads: int, task):
+    """Запустить task(worker) в threads потоках одновременно, вернуть список ошибок"""
+    barrier = threading.Barrier(threads)
+
+    def worker_task(worker):
+        barrier.wait()
+        return task(worker)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(worker_task, range(threads)))
+    return [error for errors in results for error in errors]
+
+
+def test_shared_anonymizer(threads: int, iterations: int) -> int:
+    """Тест 1: общий PiiAnonymizer"""
+    print_header("ТЕСТ 1: ОБЩИЙ PiiAnonymizer")
+
+    # Однопоточный эталон
+    reference = PiiAnonymizer()
+    expected = {
+        (worker, iteration): reference.anonymize(request_text(worker, iteration))
+        for worker in range(threads)
+        for iteration in range(iterations)
+    }
+
+    shared = PiiAnonymizer()
+
+    def task(worker):
+        errors = []
+        for iteration in range(iterations):
+            text = request_text(worker, iteration)
+            context = shared.anonymize_context(text)
+            if (context.text, dict(context.mapping)) != expected[(worker, iteration)]:
+                errors.append(f"поток {worker}, итерация {iteration}: маппинг отличается от эталона")
+            elif context.deanonymize(context.text) != text:
+                errors.append(f"поток {worker}, итерация {iteration}: деанонимизация не вернула исходный текст")
+        return errors
+
+    started = time.perf_counter()
+    errors = run_parallel(threads, task)
+    elapsed = time.perf_counter() - started
+
+    total = threads * iterations
+    print(f"Потоков: {threads}, запросов: {total}, время: {elapsed:.2f} с")
+    for error in errors[:10]:
+        print(f"[ERROR] {error}")
+    if errors:
+        print(f"[ERROR] Смешение маппингов: {len(errors)} из {total}")
+    else:
+        print("[OK] Все результаты совпали с однопоточным эталоном")
+    return len(errors)
+
+
+class EchoCompletions:
+    """Эхо вместо LLM: ответ - анонимизированный промпт пользователя"""
+
+    def create(self, model, messages, max_tokens, temperature):
+        # Переключение потока между анонимизацией и деанонимизацией
+        time.sleep(0.001)
+        content = messages[-1]['content']
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        )
+
+
+def test_shared_llm_service(threads: int, iterations: int) -> int:
+    """Тест 2: общий LLMService"""
+    print_header("ТЕСТ 2: ОБЩИЙ LLMService")
+
+    from src.core import database
+    from src.core.llm_service import LLMService
+
+    # LLMService читает системный промпт из БД - используем временную БД
+    # с настройками по умолчанию (тест не зависит от рабочей data/faq_database.db)
+    temp_dir = tempfile.mkdtemp(prefix="anonymizer-stress-")
+    original_db_file = database.DB_FILE
+    database.DB_FILE = os.path.join(temp_dir, "faq_database.db")
+    try:
+        database.init_database()
+        service = LLMService(api_key=os.getenv('OPENROUTER_API_KEY') or "stress-test")
+    except Exception as e:
+        print(f"[ERROR] Ошибка инициализации: {e}")
+        return 1
+    finally:
+        database.DB_FILE = original_db_file
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=EchoCompletions()))
+
+    def task(worker):
+        errors = []
+        for iteration in range(iterations):
+            pii = request_pii(worker, iteration)
+            own_values = set(pii.values())
+            chunks = [
+                # Общий FAQ (из кэша анонимизированных чанков) и FAQ запроса
+                {'faq_id': 1, 'question': 'Контакты отдела кадров', 'answer': 'Пишите на hr@company.ru', 'confidence': 90.0},
+                {'question': f'Контакты {worker}', 'answer': request_text(worker, iteration), 'confidence': 85.0},
+            ]
+            question = f"Как связаться с {pii['email']}?"
+            answer, metadata = service.generate_answer(question, chunks)
+
+            if 'error' in metadata:
+                errors.append(f"поток {worker}, итерация {iteration}: {metadata['error']}")
+                continue
+            leftover = PLACEHOLDER_PATTERN.findall(answer)
+            missing = [value for value in own_values if value not in answer]
+            foreign = set(re.findall(r'user\d+\.\d+@company\.ru', answer)) - own_values
+            if leftover or missing or foreign:
+                errors.append(
+                    f"поток {worker}, итерация {iteration}: placeholder'ы {leftover[:3]}, "
+                    f"не восстановлено {missing[:3]}, чужие PII {sorted(foreign)[:3]}"
+                )
+        return errors
+
+    started = time.perf_counter()
+    errors = run_parallel(threads, task)
+    elapsed = time.perf_counter() - started
+
+    total = threads * iterations
+    print(f"Потоков: {threads}, запросов: {total}, время: {elapsed:.2f} с")
+    for error in errors[:10]:
+        print(f"[ERROR] {error}")
+    if errors:
+        print(f"[ERROR] Ответы со смешанными PII: {len(errors)} из {total}")
+    else:
+        print("[OK] Каждый ответ содержит только PII своего запроса")
+    return len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стресс-тест параллельной анонимизации PII")
+    parser.add_argument("--threads", type=int, default=16, help="Количество параллельных потоков")
+    parser.add_argument("--iterations", type=int, default=200, help="Запросов на поток")
+    parser.add_argument("--skip-llm", action="store_true", help="Не проверять LLMService (только анонимайзер)")
+    args = parser.parse_args()
+
+    # Частое переключение потоков, чтобы гонки проявлялись чаще
+    sys.setswitchinterval(1e-6)
+
+    failures = test_shared_anonymizer(args.threads, args.iterations)
+    if not args.skip_llm:
+        failures += test_shared_llm_service(args.threads, args.iterations)
+
+    print_header("ИТОГ")
+    if failures:
+        print(f"[ERROR] Найдено ошибок: {failures}")
+        sys.exit(1)
+    print("[OK] Параллельная анонимизация корректна")
+
+
+if __name__ == "__main__":
+    main()
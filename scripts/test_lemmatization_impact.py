@@ -31,6 +31,7 @@ import chromadb
 from chromadb.utils import embedding_functions
 
 from src.core.database import get_all_faqs
+from src.core.embeddings import get_embedding_model, encode_documents_cached
 from src.core.search import lemmatize_word, lemmatize_text, normalize_text
 
 # Настройка логирования
@@ -128,8 +129,15 @@ def create_collection_with_keywords(
         })
         ids.append(str(faq["id"]))
 
+    # Эмбеддинги неизменённых документов берём из хранилища, модель - только для новых
+    embeddings, _ = encode_documents_cached(
+        lambda: get_embedding_model(embedding_func, MODEL_NAME),
+        MODEL_NAME,
+        documents
+    )
+
     # Добавляем в коллекцию
-    collection.add(documents=documents, metadatas=metadatas, ids=ids)
+    collection.add(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
 
     logger.info(f"✅ Создана коллекция '{collection_name}' с {len(faqs)} FAQ")
     logger.info(f"   Лемматизация ключевых слов: {'Да' if lemmatize_keywords else 'Нет'}")
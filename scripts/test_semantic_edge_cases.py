@@ -27,7 +27,8 @@ import chromadb
 from chromadb.utils import embedding_functions
 
 from src.core.database import get_all_faqs
-from src.core.search import find_answer, lemmatize_word
+from src.core.chroma_sync import get_active_collection_name
+from src.core.search import find_answers_batch, lemmatize_word
 
 # Настройка логирования
 logging.basicConfig(
@@ -119,10 +120,10 @@ def test_real_queries_from_db():
 
     try:
         collection = client.get_collection(
-            name="faq_collection",
+            name=get_active_collection_name(),
             embedding_function=embedding_func
         )
-        logger.info(f"✅ Загружена коллекция 'faq_collection' ({collection.count()} документов)")
+        logger.info(f"✅ Загружена коллекция '{collection.name}' ({collection.count()} документов)")
     except Exception as e:
         logger.error(f"❌ Ошибка загрузки коллекции: {e}")
         logger.error("   Запустите сначала переобучение ChromaDB из веб-админки")
@@ -137,16 +138,16 @@ def test_real_queries_from_db():
     success_count = 0
     wrong_answer_count = 0
 
-    for i, faq in enumerate(sample_faqs, 1):
+    # Поиск всех вопросов одним батчем
+    results = find_answers_batch([faq['question'] for faq in sample_faqs], collection)
+
+    for i, (faq, result) in enumerate(zip(sample_faqs, results), 1):
         question = faq['question']
         expected_id = str(faq['id'])
 
         logger.info(f"\n{'─'*80}")
         logger.info(f"Тест {i}/{ len(sample_faqs)}: {question}")
 
-        # Делаем поиск
-        result = find_answer(question, collection, settings=None)
-
         if result.found:
             logger.info(f"   Найдено: {result.question}")
             logger.info(f"   Confidence: {result.confidence:.1f}%")
@@ -197,7 +198,7 @@ def test_word_form_variations():
 
     try:
         collection = client.get_collection(
-            name="faq_collection",
+            name=get_active_collection_name(),
             embedding_function=embedding_func
         )
     except Exception as e:
@@ -248,13 +249,10 @@ def test_word_form_variations():
         elif target_word == 'сотрудник':
             variations = ['сотрудника', 'сотруднику', 'сотрудником', 'сотрудники']
 
-        # Тестируем каждую вариацию
+        # Тестируем все вариации одним батчем
+        modified_queries = [original.lower().replace(target_word, variation) for variation in variations]
         match_count = 0
-        for variation in variations:
-            modified_query = original.lower().replace(target_word, variation)
-
-            result = find_answer(modified_query, collection, settings=None)
-
+        for result in find_answers_batch(modified_queries, collection):
             if result.found and result.faq_id == faq_id:
                 match_count += 1
 
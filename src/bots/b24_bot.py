@@ -11,8 +11,6 @@ import time
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
-import chromadb
-from chromadb.utils import embedding_functions
 
 # Добавляем корневую директорию проекта в PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -21,7 +19,12 @@ from src.core import database
 from src.core import logging_config
 from src.api.b24_api import Bitrix24API, Bitrix24Event
 from src.core.search import find_answer, SearchResult
-from src.core.llm_service import LLMService
+from src.core.latency import track_latency, stage, save_latency
+from src.core.metrics import register_flask_metrics
+from src.core.llm_service import LLMService, warm_faq_chunk_cache
+from src.core.chroma_sync import get_active_collection_name
+from src.core.vector_backend import get_vector_backend
+from src.core.warmup import ModelWarmup
 
 # Загрузка конфигурации
 load_dotenv()
@@ -63,12 +66,10 @@ if not BITRIX24_WEBHOOK:
 
 # ========== ИНИЦИАЛИЗАЦИЯ ==========
 
-# ChromaDB
+# ChromaDB (клиент, модель и коллекция загружаются в фоне, см. load_search_models)
 CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name=MODEL_NAME
-)
+chroma_client = None
+embedding_func = None
 collection = None  # Загрузится при старте
 
 # Bitrix24 API
@@ -226,16 +227,21 @@ def init_chromadb():
 
     try:
         collection = chroma_client.get_collection(
-            name="faq_collection",
+            name=get_active_collection_name(),
             embedding_function=embedding_func
         )
         logger.info(f"✅ ChromaDB загружена: {collection.count()} записей")
+        # Numpy бэкенд строит матрицу сразу, а не на первом запросе
+        get_vector_backend(collection, embedding_func)
+        # Ответы FAQ для RAG анонимизируются при загрузке индекса, а не на запросе
+        if RAG_ENABLED:
+            warm_faq_chunk_cache()
     except Exception as e:
         logger.warning(f"ChromaDB коллекция не найдена, создаем новую: {e}")
         # Создадим коллекцию если её нет
         try:
             collection = chroma_client.create_collection(
-                name="faq_collection",
+                name=get_active_collection_name(),
                 embedding_function=embedding_func
             )
             logger.info("✅ Создана новая ChromaDB коллекция")
@@ -281,15 +287,43 @@ def init_demo_data():
         logger.error(f"❌ Ошибка при инициализации данных: {e}", exc_info=True)
 
 
+def load_search_models():
+    """Загрузка ChromaDB, модели эмбеддингов и коллекции (в фоновом потоке)"""
+    global chroma_client, embedding_func
+    import chromadb
+    from src.core.onnx_embeddings import create_embedding_function
+
+    chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    embedding_func = create_embedding_function(MODEL_NAME)
+    # Первый вызов загружает ленивые модели (ONNX) и прогревает их
+    embedding_func(["search_query: прогрев"])
+
+    init_chromadb()
+    if collection is None:
+        raise RuntimeError("Не удалось загрузить коллекцию ChromaDB")
+    return collection
+
+
+model_warmup = ModelWarmup("b24-bot", load_search_models)
+
+
 def reload_chromadb():
     """Перезагрузка ChromaDB (для горячего обновления)"""
     global collection
+    if chroma_client is None:
+        # Ещё идёт прогрев - он загрузит актуальную коллекцию сам
+        logger.info("⏳ Модель ещё загружается, коллекция будет загружена после прогрева")
+        return True
     try:
         collection = chroma_client.get_collection(
-            name="faq_collection",
+            name=get_active_collection_name(),
             embedding_function=embedding_func
         )
-        logger.info(f"🔄 ChromaDB перезагружена: {collection.count()} записей")
+        logger.info(f"🔄 ChromaDB перезагружена ({collection.name}): {collection.count()} записей")
+        get_vector_backend(collection, embedding_func)
+        # Ответы FAQ для RAG анонимизируются при загрузке индекса, а не на запросе
+        if RAG_ENABLED:
+            warm_faq_chunk_cache()
         return True
     except Exception as e:
         logger.error(f"Ошибка перезагрузки ChromaDB: {e}")
@@ -591,30 +625,41 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
     """
     Поиск ответа на вопрос пользователя через каскадную систему
 
+    Время этапов (поиск, RAG, запись логов, отправка) сохраняется
+    в latency_logs вместе с ответом.
+
     Args:
         event: Событие от Bitrix24
         api: API клиент
         is_faq_view: True если это просмотр FAQ через кнопку
     """
+    with track_latency():
+        _search_faq(event, api, is_faq_view)
+
+
+def _search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool):
+    """Каскадный поиск и отправка ответа (см. handle_search_faq)"""
     query_text = event.message_text
     user_id = event.user_id
 
     # Показываем индикатор печатания
-    api.send_typing(event.dialog_id)
+    with stage("send"):
+        api.send_typing(event.dialog_id)
 
     # Текст для логирования
     log_query_text = f"[Просмотр FAQ] {query_text}" if is_faq_view else query_text
 
     # Логирование запроса
-    query_log_id = database.add_query_log(
-        user_id=user_id,
-        username=event.username,
-        query_text=log_query_text,
-        platform='bitrix24'
-    )
+    with stage("log_write"):
+        query_log_id = database.add_query_log(
+            user_id=user_id,
+            username=event.username,
+            query_text=log_query_text,
+            platform='bitrix24'
+        )
 
     # === КАСКАДНЫЙ ПОИСК ===
-    result = find_answer(query_text, collection)
+    result = find_answer(query_text, collection, warmup=model_warmup)
 
     if result.found:
         # Проверяем на неоднозначность (disambiguation)
@@ -625,15 +670,18 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
 
             # Логируем показ вариантов (с процентами confidence)
             questions_shown = "\n".join([f"- [{alt['confidence']:.1f}%] {alt['question']}" for alt in result.alternatives])
-            database.add_answer_log(
-                query_log_id=query_log_id,
-                faq_id=None,  # Конкретный FAQ еще не выбран
-                similarity_score=result.confidence,
-                answer_shown=f"Показаны варианты для выбора ({len(result.alternatives)} шт.):\n{questions_shown}",
-                search_level='disambiguation_shown'
-            )
-
-            send_disambiguation(event, api, result.alternatives, query_log_id)
+            with stage("log_write"):
+                answer_log_id = database.add_answer_log(
+                    query_log_id=query_log_id,
+                    faq_id=None,  # Конкретный FAQ еще не выбран
+                    similarity_score=result.confidence,
+                    answer_shown=f"Показаны варианты для выбора ({len(result.alternatives)} шт.):\n{questions_shown}",
+                    search_level='disambiguation_shown'
+                )
+
+            with stage("send"):
+                send_disambiguation(event, api, result.alternatives, query_log_id)
+            save_latency(answer_log_id)
             return
         elif result.ambiguous and result.alternatives and RAG_ENABLED:
             logger.info(f"⚠️ Неоднозначность обнаружена, но RAG включен - используем лучший результат + контекст из {len(result.alternatives)} альтернатив")
@@ -663,6 +711,7 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
                             for alt in result.alternatives[:RAG_MAX_CHUNKS]:  # Берем ВСЕ альтернативы (до max)
                                 if alt['confidence'] >= RAG_MIN_RELEVANCE_SCORE:
                                     db_chunks.append({
+                                        'faq_id': alt.get('faq_id'),
                                         'question': alt['question'],
                                         'answer': alt['answer'],
                                         'confidence': alt['confidence']
@@ -679,6 +728,7 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
                     else:
                         # Если alternatives нет - добавляем только основной результат
                         db_chunks.append({
+                            'faq_id': result.faq_id,
                             'question': result.question,
                             'answer': result.answer,
                             'confidence': result.confidence
@@ -698,14 +748,17 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
                                 sim = max(0.0, 1.0 - dist) * 100.0
                                 if sim >= RAG_MIN_RELEVANCE_SCORE:
                                     metadata = result.all_results["metadatas"][0][i]
+                                    # ID FAQ - это ID документа ChromaDB (в метаданных его нет)
+                                    faq_id = result.all_results["ids"][0][i]
                                     db_chunks.append({
+                                        'faq_id': faq_id,
                                         'question': metadata["question"],
                                         'answer': metadata["answer"],
                                         'confidence': sim
                                     })
                                     # Сохраняем для логирования
                                     llm_chunks_data.append({
-                                        'faq_id': metadata.get("id"),
+                                        'faq_id': faq_id,
                                         'question': metadata["question"],
                                         'confidence': sim
                                     })
@@ -791,50 +844,57 @@ def handle_search_faq(event: Bitrix24Event, api: Bitrix24API, is_faq_view: bool
             all_results=result.all_results,
             message=result.message,
             ambiguous=result.ambiguous,
-            alternatives=result.alternatives
+            alternatives=result.alternatives,
+            timings=result.timings
         )
 
         # Логируем показанный ответ (реальный ответ, который будет показан пользователю)
-        answer_log_id = database.add_answer_log(
-            query_log_id=query_log_id,
-            faq_id=result.faq_id,
-            similarity_score=result.confidence,
-            answer_shown=final_answer,  # Логируем финальный ответ (RAG или обычный)
-            search_level=result.search_level
-        )
-
-        # Логируем RAG метаданные (если были)
-        if answer_log_id and rag_metadata and is_rag_generated:
-            database.add_llm_generation_log(
-                answer_log_id=answer_log_id,
-                model=rag_metadata.get('model', 'unknown'),
-                chunks_used=rag_metadata.get('chunks_used', 0),
-                chunks_data=rag_metadata.get('chunks_data', []),
-                pii_detected=rag_metadata.get('pii_found', 0),
-                tokens_prompt=rag_metadata.get('tokens_used', {}).get('prompt', 0),
-                tokens_completion=rag_metadata.get('tokens_used', {}).get('completion', 0),
-                tokens_total=rag_metadata.get('tokens_used', {}).get('total', 0),
-                finish_reason=rag_metadata.get('finish_reason', 'unknown'),
-                generation_time_ms=rag_metadata.get('generation_time_ms', 0),
-                error_message=rag_metadata.get('error')
+        with stage("log_write"):
+            answer_log_id = database.add_answer_log(
+                query_log_id=query_log_id,
+                faq_id=result.faq_id,
+                similarity_score=result.confidence,
+                answer_shown=final_answer,  # Логируем финальный ответ (RAG или обычный)
+                search_level=result.search_level
             )
 
+            # Логируем RAG метаданные (если были)
+            if answer_log_id and rag_metadata and is_rag_generated:
+                database.add_llm_generation_log(
+                    answer_log_id=answer_log_id,
+                    model=rag_metadata.get('model', 'unknown'),
+                    chunks_used=rag_metadata.get('chunks_used', 0),
+                    chunks_data=rag_metadata.get('chunks_data', []),
+                    pii_detected=rag_metadata.get('pii_found', 0),
+                    tokens_prompt=rag_metadata.get('tokens_used', {}).get('prompt', 0),
+                    tokens_completion=rag_metadata.get('tokens_used', {}).get('completion', 0),
+                    tokens_total=rag_metadata.get('tokens_used', {}).get('total', 0),
+                    finish_reason=rag_metadata.get('finish_reason', 'unknown'),
+                    generation_time_ms=rag_metadata.get('generation_time_ms', 0),
+                    error_message=rag_metadata.get('error')
+                )
+
         # Отправляем ответ
-        send_answer(event, api, final_result, answer_log_id, is_rag_generated)
+        with stage("send"):
+            send_answer(event, api, final_result, answer_log_id, is_rag_generated)
+        save_latency(answer_log_id)
 
     else:
         # Ответ не найден
         logger.warning(f"❌ Ответ не найден для запроса: '{query_text}'")
 
-        database.add_answer_log(
-            query_log_id=query_log_id,
-            faq_id=None,
-            similarity_score=0.0,
-            answer_shown=result.message or "Ответ не найден",
-            search_level='none'
-        )
+        with stage("log_write"):
+            answer_log_id = database.add_answer_log(
+                query_log_id=query_log_id,
+                faq_id=None,
+                similarity_score=0.0,
+                answer_shown=result.message or "Ответ не найден",
+                search_level='none'
+            )
 
-        send_no_answer(event, api, result.message)
+        with stage("send"):
+            send_no_answer(event, api, result.message)
+        save_latency(answer_log_id)
 
 
 def send_disambiguation(event: Bitrix24Event, api: Bitrix24API, alternatives: List[Dict], query_log_id: int):
@@ -1265,6 +1325,10 @@ def handle_command_event(event: Bitrix24Event, api: Bitrix24API):
 @app.route('/api/reload-chromadb', methods=['POST'])
 def reload_chromadb_endpoint():
     """Endpoint для перезагрузки ChromaDB (вызывается из web_admin.py)"""
+    if model_warmup.state == "failed":
+        # Прогрев завершился ошибкой - пробуем загрузить модель заново
+        model_warmup.start()
+        return jsonify({'success': True})
     success = reload_chromadb()
     return jsonify({'success': success})
 
@@ -1326,6 +1390,7 @@ def index():
     return jsonify({
         'bot': 'FAQ Bot for Bitrix24',
         'status': 'running',
+        'model': model_warmup.state,
         'webhook_path': '/ или /webhook/bitrix24',
         'health_check': '/health',
         'chromadb_records': collection.count() if collection else 0
@@ -1334,12 +1399,18 @@ def index():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (warming - модель ещё загружается)"""
+    warmup = model_warmup.status()
     return jsonify({
-        'status': 'ok',
+        'status': warmup['state'] if warmup['state'] != 'pending' else 'warming',
+        'warmup': warmup,
         'chromadb_records': collection.count() if collection else 0,
         'webhook_configured': bool(BITRIX24_WEBHOOK)
-    })
+    }), 503 if warmup['state'] == 'failed' else 200
+
+
+# /metrics и метрики HTTP запросов (вебхуки Bitrix24)
+register_flask_metrics(app, 'bitrix24_bot')
 
 
 # ========== ЗАПУСК ==========
@@ -1354,8 +1425,8 @@ if __name__ == '__main__':
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
 
-    # Инициализация ChromaDB
-    init_chromadb()
+    # Модель и ChromaDB загружаются в фоне: сервер и exact/keyword поиск доступны сразу
+    model_warmup.start()
 
     # Загрузка настроек бота
     reload_bot_settings()
@@ -1373,6 +1444,7 @@ if __name__ == '__main__':
     logger.info(f"📡 Сервер запускается на {host}:{port}")
     logger.info(f"📍 Webhook URL: http://your-server.com:{port}/webhook/bitrix24")
     logger.info(f"📊 Health check: http://your-server.com:{port}/health")
+    logger.info(f"📈 Метрики: http://your-server.com:{port}/metrics")
     logger.info("=" * 60)
 
     app.run(host=host, port=port, debug=False)
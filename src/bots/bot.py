@@ -8,9 +8,6 @@ from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQu
 from telegram.error import TimedOut, NetworkError, TelegramError, RetryAfter
 import httpx
 import httpcore
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.utils import embedding_functions
 from flask import Flask, request, jsonify
 import threading
 import sys
@@ -24,7 +21,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from src.core import database
 from src.core import logging_config
 from src.core.search import find_answer
-from src.core.llm_service import LLMService
+from src.core.latency import track_latency, stage, save_latency
+from src.core.metrics import QUEUE_DEPTH, register_flask_metrics
+from src.core.llm_service import LLMService, warm_faq_chunk_cache
+from src.core.chroma_sync import get_active_collection_name
+from src.core.vector_backend import get_vector_backend
+from src.core.warmup import ModelWarmup, WARMUP_WAIT_TIMEOUT
 
 # Загружаем переменные окружения из .env
 load_dotenv()
@@ -82,6 +84,8 @@ async def safe_send_message(func, *args, max_retries=3, user_id=None, **kwargs):
     """
     Обертка для безопасной отправки сообщений с повторными попытками при ошибках
 
+    Время отправки (вместе с повторами) пишется этапом send в замер запроса.
+
     Args:
         func: async функция отправки сообщения (reply_text, edit_message_text и т.д.)
         max_retries: максимальное количество попыток
@@ -91,6 +95,12 @@ async def safe_send_message(func, *args, max_retries=3, user_id=None, **kwargs):
     Returns:
         Result of func or None if all retries failed
     """
+    with stage("send"):
+        return await _send_with_retries(func, *args, max_retries=max_retries, user_id=user_id, **kwargs)
+
+
+async def _send_with_retries(func, *args, max_retries=3, user_id=None, **kwargs):
+    """Отправка с повторными попытками (см. safe_send_message)"""
     for attempt in range(max_retries):
         try:
             return await func(*args, **kwargs)
@@ -176,16 +186,16 @@ RELOAD_SERVER_PORT = 5001
 # Если не указан в .env, используется 45%
 SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "45.0"))
 
-# ---------- МОДЕЛЬ ----------
-print("Загрузка модели эмбеддингов...")
-model = SentenceTransformer(MODEL_NAME)
-print("Модель загружена!")
 print(f"⚙️  Порог схожести для показа ответа: {SIMILARITY_THRESHOLD}%")
 
 # ---------- Chroma ----------
+# Клиент, модель и коллекция загружаются в фоне после старта (см. load_search_models)
 CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+chroma_client = None
+embedding_func = None
+
+# Ответ, если коллекция нужна сразу, а прогрев не закончился за WARMUP_WAIT_TIMEOUT
+MODEL_LOADING_MESSAGE = "⏳ База знаний ещё загружается, попробуйте через минуту."
 
 # Глобальные переменные
 collection = None
@@ -300,15 +310,27 @@ def reload_bot_settings():
 def reload_collection():
     """Перезагружает коллекцию ChromaDB"""
     global collection
+    if chroma_client is None:
+        # Ещё идёт прогрев - он загрузит актуальную коллекцию сам
+        logger.info("⏳ Модель ещё загружается, коллекция будет загружена после прогрева")
+        return True
     try:
-        collection = chroma_client.get_collection(name="faq_collection")
-        logger.info(f"✅ Коллекция перезагружена! Записей: {collection.count()}")
+        collection = chroma_client.get_collection(
+            name=get_active_collection_name(),
+            embedding_function=embedding_func
+        )
+        logger.info(f"✅ Коллекция {collection.name} перезагружена! Записей: {collection.count()}")
+        # Numpy бэкенд строит матрицу сразу, а не на первом запросе
+        get_vector_backend(collection, embedding_func)
+        # Ответы FAQ для RAG анонимизируются при загрузке индекса, а не на запросе
+        if RAG_ENABLED:
+            warm_faq_chunk_cache()
         return True
     except Exception as e:
         logger.error(f"❌ Ошибка при перезагрузке коллекции: {e}")
         try:
             collection = chroma_client.create_collection(
-                name="faq_collection",
+                name=get_active_collection_name(),
                 embedding_function=embedding_func,
                 metadata={"hnsw:space": "cosine"}
             )
@@ -318,8 +340,25 @@ def reload_collection():
             logger.error(f"❌ Не удалось создать коллекцию: {e2}")
             return False
 
-# Инициализация коллекции и настроек при старте
-reload_collection()
+def load_search_models():
+    """Загрузка ChromaDB, модели эмбеддингов и коллекции (в фоновом потоке)"""
+    global chroma_client, embedding_func
+    import chromadb
+    from src.core.onnx_embeddings import create_embedding_function
+
+    chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    embedding_func = create_embedding_function(MODEL_NAME)
+    # Первый вызов загружает ленивые модели (ONNX) и прогревает их
+    embedding_func(["search_query: прогрев"])
+
+    if not reload_collection():
+        raise RuntimeError("Не удалось загрузить коллекцию ChromaDB")
+    init_demo_data()
+    return collection
+
+model_warmup = ModelWarmup("telegram-bot", load_search_models)
+
+# Инициализация настроек при старте (коллекция загружается в фоне из main)
 reload_bot_settings()
 
 # ---------- FLASK СЕРВЕР ДЛЯ ПРИЁМА КОМАНД ----------
@@ -329,6 +368,10 @@ flask_app = Flask(__name__)
 def handle_reload():
     """Эндпоинт для перезагрузки коллекции"""
     logger.info("📡 Получен запрос на перезагрузку коллекции")
+    if model_warmup.state == "failed":
+        # Прогрев завершился ошибкой - пробуем загрузить модель заново
+        model_warmup.start()
+        return jsonify({"status": "ok", "message": "Повторная загрузка модели запущена"}), 200
     success = reload_collection()
     if success:
         return jsonify({"status": "ok", "message": "Коллекция перезагружена"}), 200
@@ -347,11 +390,16 @@ def handle_reload_settings():
 
 @flask_app.route('/health', methods=['GET'])
 def health_check():
-    """Проверка работоспособности"""
+    """Проверка работоспособности (warming - модель ещё загружается)"""
+    warmup = model_warmup.status()
     return jsonify({
-        "status": "ok",
+        "status": warmup["state"] if warmup["state"] != "pending" else "warming",
+        "warmup": warmup,
         "collection_count": collection.count() if collection else 0
-    }), 200
+    }), 503 if warmup["state"] == "failed" else 200
+
+# /metrics и метрики HTTP запросов сервера перезагрузки
+register_flask_metrics(flask_app, "telegram_bot")
 
 def run_flask():
     """Запуск Flask-сервера в отдельном потоке"""
@@ -520,6 +568,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error("Не удалось отправить приветственное сообщение пользователю")
 
 async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск ответа на вопрос пользователя через каскадную систему (с замером этапов)"""
+    with track_latency():
+        await _search_faq(update, context)
+
+
+async def _search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Поиск ответа на вопрос пользователя через каскадную систему"""
     # Проверяем, не спит ли бот
     if not check_if_bot_awake():
@@ -541,16 +595,21 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await safe_send_message(update.message.reply_text, "🔍 Ищу ответ...")
 
     # Логирование запроса
-    query_log_id = database.add_query_log(
-        user_id=user.id,
-        username=user.username or user.first_name,
-        query_text=query,
-        platform='telegram'
-    )
+    with stage("log_write"):
+        query_log_id = database.add_query_log(
+            user_id=user.id,
+            username=user.username or user.first_name,
+            query_text=query,
+            platform='telegram'
+        )
 
     try:
         # === КАСКАДНЫЙ ПОИСК ===
-        result = find_answer(query, collection)
+        if collection is None:
+            # Модель ещё загружается: семантический уровень ждёт прогрева вне event loop
+            result = await asyncio.to_thread(find_answer, query, collection, None, model_warmup)
+        else:
+            result = find_answer(query, collection)
 
         if result.found:
             # Проверяем на неоднозначность (disambiguation)
@@ -561,13 +620,14 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
                 # Логируем показ вариантов (с процентами confidence)
                 questions_shown = "\n".join([f"- [{alt['confidence']:.1f}%] {alt['question']}" for alt in result.alternatives])
-                database.add_answer_log(
-                    query_log_id=query_log_id,
-                    faq_id=None,  # Конкретный FAQ еще не выбран
-                    similarity_score=result.confidence,
-                    answer_shown=f"Показаны варианты для выбора ({len(result.alternatives)} шт.):\n{questions_shown}",
-                    search_level='disambiguation_shown'
-                )
+                with stage("log_write"):
+                    answer_log_id = database.add_answer_log(
+                        query_log_id=query_log_id,
+                        faq_id=None,  # Конкретный FAQ еще не выбран
+                        similarity_score=result.confidence,
+                        answer_shown=f"Показаны варианты для выбора ({len(result.alternatives)} шт.):\n{questions_shown}",
+                        search_level='disambiguation_shown'
+                    )
 
                 # Показываем уточняющий вопрос с кнопками выбора
                 response = "Найдено несколько подходящих вопросов. Выберите нужный:"
@@ -590,6 +650,7 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     parse_mode='HTML',
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
+                save_latency(answer_log_id)
                 return
             elif result.ambiguous and result.alternatives and RAG_ENABLED:
                 logger.info(f"⚠️ Неоднозначность обнаружена, но RAG включен - используем лучший результат + контекст из {len(result.alternatives)} альтернатив")
@@ -619,6 +680,7 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                 for alt in result.alternatives[:RAG_MAX_CHUNKS]:  # Берем ВСЕ альтернативы (до max)
                                     if alt['confidence'] >= RAG_MIN_RELEVANCE_SCORE:
                                         db_chunks.append({
+                                            'faq_id': alt.get('faq_id'),
                                             'question': alt['question'],
                                             'answer': alt['answer'],
                                             'confidence': alt['confidence']
@@ -635,6 +697,7 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         else:
                             # Если alternatives нет - добавляем только основной результат
                             db_chunks.append({
+                                'faq_id': result.faq_id,
                                 'question': result.question,
                                 'answer': result.answer,
                                 'confidence': result.confidence
@@ -654,14 +717,17 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                     sim = max(0.0, 1.0 - dist) * 100.0
                                     if sim >= RAG_MIN_RELEVANCE_SCORE:
                                         metadata = result.all_results["metadatas"][0][i]
+                                        # ID FAQ - это ID документа ChromaDB (в метаданных его нет)
+                                        faq_id = result.all_results["ids"][0][i]
                                         db_chunks.append({
+                                            'faq_id': faq_id,
                                             'question': metadata["question"],
                                             'answer': metadata["answer"],
                                             'confidence': sim
                                         })
                                         # Сохраняем для логирования
                                         llm_chunks_data.append({
-                                            'faq_id': metadata.get("id"),
+                                            'faq_id': faq_id,
                                             'question': metadata["question"],
                                             'confidence': sim
                                         })
@@ -741,30 +807,31 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Логируем показанный ответ (реальный ответ, который будет показан пользователю)
             answer_log_id = None
             if query_log_id:
-                answer_log_id = database.add_answer_log(
-                    query_log_id=query_log_id,
-                    faq_id=result.faq_id,
-                    similarity_score=result.confidence,
-                    answer_shown=final_answer,  # Логируем финальный ответ (RAG или обычный)
-                    search_level=result.search_level
-                )
-
-                # Логируем RAG метаданные (если были)
-                if answer_log_id and rag_metadata and is_rag_generated:
-                    database.add_llm_generation_log(
-                        answer_log_id=answer_log_id,
-                        model=rag_metadata.get('model', 'unknown'),
-                        chunks_used=rag_metadata.get('chunks_used', 0),
-                        chunks_data=rag_metadata.get('chunks_data', []),
-                        pii_detected=rag_metadata.get('pii_found', 0),
-                        tokens_prompt=rag_metadata.get('tokens_used', {}).get('prompt', 0),
-                        tokens_completion=rag_metadata.get('tokens_used', {}).get('completion', 0),
-                        tokens_total=rag_metadata.get('tokens_used', {}).get('total', 0),
-                        finish_reason=rag_metadata.get('finish_reason', 'unknown'),
-                        generation_time_ms=rag_metadata.get('generation_time_ms', 0),
-                        error_message=rag_metadata.get('error')
+                with stage("log_write"):
+                    answer_log_id = database.add_answer_log(
+                        query_log_id=query_log_id,
+                        faq_id=result.faq_id,
+                        similarity_score=result.confidence,
+                        answer_shown=final_answer,  # Логируем финальный ответ (RAG или обычный)
+                        search_level=result.search_level
                     )
 
+                    # Логируем RAG метаданные (если были)
+                    if answer_log_id and rag_metadata and is_rag_generated:
+                        database.add_llm_generation_log(
+                            answer_log_id=answer_log_id,
+                            model=rag_metadata.get('model', 'unknown'),
+                            chunks_used=rag_metadata.get('chunks_used', 0),
+                            chunks_data=rag_metadata.get('chunks_data', []),
+                            pii_detected=rag_metadata.get('pii_found', 0),
+                            tokens_prompt=rag_metadata.get('tokens_used', {}).get('prompt', 0),
+                            tokens_completion=rag_metadata.get('tokens_used', {}).get('completion', 0),
+                            tokens_total=rag_metadata.get('tokens_used', {}).get('total', 0),
+                            finish_reason=rag_metadata.get('finish_reason', 'unknown'),
+                            generation_time_ms=rag_metadata.get('generation_time_ms', 0),
+                            error_message=rag_metadata.get('error')
+                        )
+
             # Формируем ответ
             # При RAG генерации не показываем заголовок одного FAQ (ответ объединенный из нескольких)
             if is_rag_generated:
@@ -821,26 +888,30 @@ async def search_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode='HTML',
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            save_latency(answer_log_id)
 
         else:
             # Ответ не найден - используем fallback
             logger.warning(f"❌ Ответ не найден для запроса: '{query}' от пользователя {user.id}")
 
             # Логируем отсутствие ответа
+            answer_log_id = None
             if query_log_id:
-                database.add_answer_log(
-                    query_log_id=query_log_id,
-                    faq_id=None,
-                    similarity_score=0.0,
-                    answer_shown=result.message or "Ответ не найден",
-                    search_level='none'
-                )
+                with stage("log_write"):
+                    answer_log_id = database.add_answer_log(
+                        query_log_id=query_log_id,
+                        faq_id=None,
+                        similarity_score=0.0,
+                        answer_shown=result.message or "Ответ не найден",
+                        search_level='none'
+                    )
 
             await safe_send_message(
                 update.message.reply_text,
                 result.message,
                 reply_markup=get_categories_keyboard()
             )
+            save_latency(answer_log_id)
 
     except Exception as e:
         logger.error(f"Ошибка при поиске: {e}")
@@ -990,6 +1061,18 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data.startswith("show_"):
         faq_id = data.replace("show_", "")
         try:
+            if collection is None:
+                await asyncio.to_thread(model_warmup.wait, WARMUP_WAIT_TIMEOUT)
+            if collection is None:
+                # Прогрев не уложился в таймаут или завершился ошибкой
+                logger.warning(f"Просмотр FAQ {faq_id}: коллекция ещё не загружена ({model_warmup.state})")
+                await safe_send_message(
+                    query.edit_message_text,
+                    MODEL_LOADING_MESSAGE,
+                    parse_mode='HTML',
+                    user_id=user.id
+                )
+                return
             result = collection.get(ids=[faq_id], include=["metadatas", "documents"])
             if result and result.get("metadatas"):
                 metadata = result["metadatas"][0]
@@ -1206,12 +1289,14 @@ def get_categories_keyboard():
 def main():
     # Инициализируем БД
     database.init_database()
-    init_demo_data()
     
     # Запускаем Flask-сервер в отдельном потоке
     flask_thread = threading.Thread(target=run_flask, daemon=True)
     flask_thread.start()
     print(f"🔄 Сервер перезагрузки запущен на http://127.0.0.1:{RELOAD_SERVER_PORT}")
+
+    # Модель и коллекция загружаются в фоне: exact/keyword поиск работает сразу
+    model_warmup.start()
     
     # Запускаем бота с увеличенными таймаутами и улучшенной обработкой ошибок
     app = (
@@ -1228,6 +1313,9 @@ def main():
         .build()
     )
 
+    # Необработанные обновления Telegram в очереди приложения
+    QUEUE_DEPTH.set_function(app.update_queue.qsize, queue="telegram_updates")
+
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", start))
     app.add_handler(CallbackQueryHandler(button_callback))
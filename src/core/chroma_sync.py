@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Инкрементальная синхронизация ChromaDB с таблицей FAQ
+
+Вместо удаления коллекции и пересчёта эмбеддингов всех FAQ сравниваются
+хэши содержимого из БД с хэшами в метаданных коллекции: через upsert
+переэмбеддятся только изменённые записи, удалённые FAQ удаляются по id.
+Коллекция не пересоздаётся, поэтому ботам не нужно ловить момент,
+когда её нет.
+
+Полная пересборка (смена модели, full=True) идёт по схеме blue/green:
+новая версия строится в faq_collection_v{n}, проверяется контрольными
+запросами и только потом становится активной - имя активной коллекции
+хранится в bot_settings. Старые версии удаляются не сразу, а при следующей
+пересборке, чтобы боты успели перечитать указатель.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Имя коллекции FAQ в ChromaDB (до первой blue/green пересборки)
+COLLECTION_NAME = "faq_collection"
+
+# Версионированные коллекции: faq_collection_v1, faq_collection_v2, ...
+_VERSION_PATTERN = re.compile(rf"^{COLLECTION_NAME}_v(\d+)$")
+
+# Сколько записей с готовыми эмбеддингами передавать в один вызов upsert
+CHROMA_SYNC_BATCH_SIZE = int(os.getenv("CHROMA_SYNC_BATCH_SIZE", "500"))
+
+# Сколько FAQ проверять контрольными запросами перед переключением
+CHROMA_SMOKE_QUERIES = int(os.getenv("CHROMA_SMOKE_QUERIES", "20"))
+
+# Минимальная доля контрольных запросов, нашедших свой FAQ в топ-3
+CHROMA_SMOKE_MIN_HIT_RATE = float(os.getenv("CHROMA_SMOKE_MIN_HIT_RATE", "0.8"))
+
+# Сколько предыдущих версий коллекции оставлять (для ботов, ещё не перечитавших указатель)
+CHROMA_KEEP_VERSIONS = int(os.getenv("CHROMA_KEEP_VERSIONS", "1"))
+
+# Синхронизации из разных потоков (роуты админки) не должны пересекаться
+_sync_lock = threading.Lock()
+
+
+def build_faq_document(faq: Dict) -> Tuple[str, Dict]:
+    """
+    Подготовить документ и метаданные FAQ для ChromaDB
+
+    Args:
+        faq: FAQ в формате database.get_all_faqs()
+
+    Returns:
+        Tuple (document, metadata); в metadata есть content_hash для сравнения
+    """
+    keywords = faq.get("keywords", [])
+    if isinstance(keywords, list):
+        keywords_str = " ".join(keywords)
+    elif isinstance(keywords, str):
+        keywords_str = keywords.replace(",", " ")
+    else:
+        keywords_str = ""
+
+    document = f"search_document: {faq['question']} {keywords_str}"
+    metadata = {
+        "category": faq["category"],
+        "question": faq["question"],
+        "answer": faq["answer"]
+    }
+
+    # Хэш по всему, что попадает в коллекцию: изменение ответа тоже требует upsert
+    content = "\x1f".join([document, metadata["category"], metadata["question"], metadata["answer"]])
+    metadata["content_hash"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    metadata["updated_at"] = str(faq.get("updated_at") or "")
+
+    return document, metadata
+
+
+def get_active_collection_name() -> str:
+    """Имя активной коллекции FAQ (указатель в bot_settings)"""
+    from src.core.database import get_bot_setting, ACTIVE_COLLECTION_SETTING
+
+    return get_bot_setting(ACTIVE_COLLECTION_SETTING) or COLLECTION_NAME
+
+
+def set_active_collection_name(name: str) -> bool:
+    """Переключить указатель активной коллекции (одна запись в bot_settings)"""
+    from src.core.database import update_bot_setting, ACTIVE_COLLECTION_SETTING
+
+    return update_bot_setting(ACTIVE_COLLECTION_SETTING, name)
+
+
+def _collection_version(name: str) -> Optional[int]:
+    """Номер версии коллекции FAQ (0 - исходная faq_collection, None - чужая коллекция)"""
+    if name == COLLECTION_NAME:
+        return 0
+    match = _VERSION_PATTERN.match(name)
+    return int(match.group(1)) if match else None
+
+
+def _list_faq_collections(client) -> Dict[str, int]:
+    """Все коллекции FAQ в хранилище: имя -> версия"""
+    versions = {}
+    for item in client.list_collections():
+        # Новые версии chromadb возвращают имена, старые - объекты коллекций
+        name = getattr(item, "name", item)
+        version = _collection_version(name)
+        if version is not None:
+            versions[name] = version
+    return versions
+
+
+def get_faq_collection(client, embedding_function, model_name: Optional[str] = None, name: Optional[str] = None):
+    """
+    Получить коллекцию FAQ, создав её при отсутствии
+
+    Args:
+        client: chromadb клиент
+        embedding_function: Функция эмбеддингов
+        model_name: Имя модели эмбеддингов (сохраняется в метаданных новой коллекции)
+        name: Имя коллекции (None - активная)
+    """
+    metadata = {"hnsw:space": "cosine"}
+    if model_name:
+        metadata["embedding_model"] = model_name
+
+    return client.get_or_create_collection(
+        name=name or get_active_collection_name(),
+        embedding_function=embedding_function,
+        metadata=metadata
+    )
+
+
+def _upsert_faqs(
+    collection,
+    faqs: List[Dict],
+    batch_size: int,
+    embedding_function=None,
+    model_name: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Загрузить FAQ в коллекцию порциями
+
+    Эмбеддинги считаются заранее пакетным пайплайном (src.core.embeddings),
+    векторы неизменённых текстов берутся из хранилища эмбеддингов;
+    если модель недоступна, их считает embedding_function коллекции.
+
+    Returns:
+        Статистика расчёта эмбеддингов или None
+    """
+    from src.core.embeddings import get_embedding_model, encode_documents, encode_documents_cached
+
+    documents, metadatas, ids = [], [], []
+    for faq in faqs:
+        document, metadata = build_faq_document(faq)
+        documents.append(document)
+        metadatas.append(metadata)
+        ids.append(str(faq["id"]))
+
+    if not ids:
+        return None
+
+    embeddings, stats = None, None
+    try:
+        if model_name:
+            embeddings, stats = encode_documents_cached(
+                lambda: get_embedding_model(embedding_function, model_name),
+                model_name,
+                documents
+            )
+        else:
+            model = get_embedding_model(embedding_function)
+            if model is not None:
+                embeddings, stats = encode_documents(model, documents)
+    except Exception as e:
+        logger.warning(f"Пакетный расчёт эмбеддингов недоступен, используется функция коллекции: {e}")
+        embeddings, stats = None, None
+
+    for start in range(0, len(ids), batch_size):
+        collection.upsert(
+            documents=documents[start:start + batch_size],
+            embeddings=embeddings[start:start + batch_size] if embeddings is not None else None,
+            metadatas=metadatas[start:start + batch_size],
+            ids=ids[start:start + batch_size]
+        )
+
+    return stats
+
+
+def validate_collection(collection, faqs: List[Dict], sample_size: int = CHROMA_SMOKE_QUERIES) -> Tuple[bool, str]:
+    """
+    Проверить новую коллекцию контрольными запросами
+
+    Количество записей должно совпадать с числом FAQ, а вопросы выборки FAQ
+    должны находить свой FAQ в топ-3 (с долей не ниже CHROMA_SMOKE_MIN_HIT_RATE).
+
+    Returns:
+        Tuple (ok, описание результата)
+    """
+    count = collection.count()
+    if count != len(faqs):
+        return False, f"в коллекции {count} записей вместо {len(faqs)}"
+
+    if not faqs:
+        return True, "коллекция пуста"
+
+    # Равномерная детерминированная выборка по списку FAQ
+    step = max(1, len(faqs) // max(1, sample_size))
+    sample = faqs[::step][:sample_size]
+
+    results = collection.query(
+        query_texts=[f"search_query: {faq['question']}" for faq in sample],
+        n_results=min(3, count)
+    )
+
+    hits = sum(
+        1 for faq, found_ids in zip(sample, results["ids"])
+        if str(faq["id"]) in found_ids
+    )
+    hit_rate = hits / len(sample)
+    description = f"контрольные запросы: {hits}/{len(sample)}"
+
+    if hit_rate < CHROMA_SMOKE_MIN_HIT_RATE:
+        return False, description
+    return True, description
+
+
+def garbage_collect_collections(client, keep: int = CHROMA_KEEP_VERSIONS) -> List[str]:
+    """
+    Удалить старые версии коллекции FAQ
+
+    Активная коллекция и keep последних предыдущих версий сохраняются.
+
+    Returns:
+        Список удалённых коллекций
+    """
+    active = get_active_collection_name()
+    versions = _list_faq_collections(client)
+    active_version = versions.get(active, 0)
+
+    previous = sorted(
+        (name for name, version in versions.items() if name != active and version < active_version),
+        key=lambda name: versions[name],
+        reverse=True
+    )
+
+    removed = []
+    for name in previous[keep:]:
+        try:
+            client.delete_collection(name=name)
+            removed.append(name)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить коллекцию {name}: {e}")
+
+    if removed:
+        logger.info(f"🗑️ Удалены старые версии коллекции: {', '.join(removed)}")
+    return removed
+
+
+def rebuild_faq_collection(
+    client,
+    embedding_function,
+    model_name: Optional[str] = None,
+    faqs: Optional[List[Dict]] = None,
+    batch_size: int = CHROMA_SYNC_BATCH_SIZE
+) -> Dict:
+    """
+    Пересобрать коллекцию FAQ в новой версии и переключить на неё указатель
+
+    Активная коллекция не трогается, пока новая не построена и не проверена.
+    При неудачной проверке новая версия удаляется, а исключение пробрасывается.
+
+    Returns:
+        Словарь: collection - имя новой активной коллекции, embedding - статистика эмбеддингов
+    """
+    from src.core import database
+
+    if faqs is None:
+        faqs = database.get_all_faqs()
+
+    versions = _list_faq_collections(client)
+    new_name = f"{COLLECTION_NAME}_v{max(versions.values(), default=0) + 1}"
+
+    logger.info(f"🔨 Сборка новой версии коллекции {new_name} ({len(faqs)} FAQ)")
+    collection = get_faq_collection(client, embedding_function, model_name, name=new_name)
+
+    try:
+        embedding_stats = _upsert_faqs(collection, faqs, batch_size, embedding_function, model_name)
+        ok, description = validate_collection(collection, faqs)
+    except Exception:
+        client.delete_collection(name=new_name)
+        raise
+
+    if not ok:
+        client.delete_collection(name=new_name)
+        raise RuntimeError(f"Новая версия коллекции {new_name} не прошла проверку: {description}")
+
+    if not set_active_collection_name(new_name):
+        client.delete_collection(name=new_name)
+        raise RuntimeError(f"Не удалось переключить указатель на {new_name}")
+
+    logger.info(f"✅ Активная коллекция: {new_name} ({description})")
+
+    garbage_collect_collections(client)
+    return {"collection": new_name, "embedding": embedding_stats}
+
+
+def sync_faq_collection(
+    client,
+    embedding_function,
+    model_name: Optional[str] = None,
+    faqs: Optional[List[Dict]] = None,
+    full: bool = False,
+    batch_size: int = CHROMA_SYNC_BATCH_SIZE
+) -> Dict:
+    """
+    Синхронизировать коллекцию FAQ с базой данных
+
+    Args:
+        client: chromadb клиент
+        embedding_function: Функция эмбеддингов
+        model_name: Имя модели эмбеддингов; если коллекция построена другой
+                    моделью, она пересобирается в новой версии
+        faqs: Список FAQ (None - загрузить из БД)
+        full: Пересобрать коллекцию в новой версии (blue/green)
+        batch_size: Размер порции для upsert
+
+    Returns:
+        Словарь со счётчиками: added, updated, deleted, unchanged, total, rebuilt
+        и именем активной коллекции (collection)
+    """
+    from src.core import database
+
+    with _sync_lock:
+        if faqs is None:
+            faqs = database.get_all_faqs()
+
+        collection = get_faq_collection(client, embedding_function, model_name)
+
+        collection_model = (collection.metadata or {}).get("embedding_model")
+        rebuilt = full or bool(model_name and collection_model and collection_model != model_name)
+        if rebuilt:
+            if not full:
+                logger.info(f"Коллекция построена моделью {collection_model}, пересобираем для {model_name}")
+            rebuild = rebuild_faq_collection(client, embedding_function, model_name, faqs, batch_size)
+            return {
+                "added": len(faqs),
+                "updated": 0,
+                "deleted": 0,
+                "unchanged": 0,
+                "total": len(faqs),
+                "rebuilt": True,
+                "collection": rebuild["collection"],
+                "embedding": rebuild["embedding"]
+            }
+
+        # Хэши содержимого, сохранённые в коллекции
+        existing = collection.get(include=["metadatas"])
+        stored_hashes = {
+            faq_id: (metadata or {}).get("content_hash")
+            for faq_id, metadata in zip(existing["ids"], existing["metadatas"])
+        }
+
+        changed = []
+        added = updated = 0
+        for faq in faqs:
+            faq_id = str(faq["id"])
+            _, metadata = build_faq_document(faq)
+
+            if faq_id not in stored_hashes:
+                added += 1
+            elif stored_hashes[faq_id] != metadata["content_hash"]:
+                updated += 1
+            else:
+                continue
+            changed.append(faq)
+
+        embedding_stats = _upsert_faqs(collection, changed, batch_size, embedding_function, model_name)
+
+        current_ids = {str(faq["id"]) for faq in faqs}
+        removed_ids = [faq_id for faq_id in stored_hashes if faq_id not in current_ids]
+        if removed_ids:
+            collection.delete(ids=removed_ids)
+
+        result = {
+            "added": added,
+            "updated": updated,
+            "deleted": len(removed_ids),
+            "unchanged": len(faqs) - added - updated,
+            "total": len(faqs),
+            "rebuilt": False,
+            "collection": collection.name,
+            "embedding": embedding_stats
+        }
+
+    logger.info(
+        f"✅ ChromaDB синхронизирована: +{result['added']} ~{result['updated']} "
+        f"-{result['deleted']} (без изменений: {result['unchanged']})"
+    )
+    return result
@@ -5,12 +5,15 @@
 """
 
 import sqlite3
-from typing import List, Dict, Optional
+import time
+from typing import List, Dict, Optional, Iterator
 from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 import os
 from dotenv import load_dotenv
 
+from src.core.metrics import SQLITE_CONNECTION_DURATION, SQLITE_LOCK_ERRORS, SQLITE_WRITE_LOCK_WAIT
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -19,6 +22,9 @@ DB_FILE = "data/faq_database.db"
 # Порог схожести для фильтрации (в процентах)
 SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "45.0"))
 
+# Сколько последних ответов учитывать в перцентилях времени этапов
+LATENCY_STATS_LIMIT = int(os.getenv("LATENCY_STATS_LIMIT", "5000"))
+
 # Часовой пояс UTC+7
 UTC7_TZ = timezone(timedelta(hours=7))
 
@@ -48,23 +54,40 @@ def convert_utc_to_utc7(utc_timestamp_str: Optional[str]) -> Optional[str]:
 
 
 @contextmanager
-def get_db_connection():
-    """Контекстный менеджер для работы с БД"""
+def get_db_connection(write: bool = False):
+    """
+    Контекстный менеджер для работы с БД
+
+    :param write: Транзакция записи: блокировка записи берётся сразу (BEGIN IMMEDIATE),
+                  время её ожидания (включая busy timeout) пишется в метрику
+                  faq_sqlite_write_lock_wait_seconds
+    """
     # Создаём директорию для БД, если её нет
     db_dir = os.path.dirname(DB_FILE)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
 
+    started = time.perf_counter()
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     try:
+        if write:
+            lock_started = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            finally:
+                SQLITE_WRITE_LOCK_WAIT.observe(time.perf_counter() - lock_started)
         yield conn
         conn.commit()
     except Exception as e:
+        if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+            SQLITE_LOCK_ERRORS.inc()
         conn.rollback()
         raise e
     finally:
         conn.close()
+        # Время удержания соединения (не ожидание блокировки - см. write)
+        SQLITE_CONNECTION_DURATION.observe(time.perf_counter() - started)
 
 
 def init_database():
@@ -187,6 +210,18 @@ def init_database():
             )
         """)
 
+        # Время этапов обработки запроса (водопад в логах, перцентили по этапам)
+        # stages - JSON список {"stage", "start_ms", "ms"}, см. src.core.latency
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS latency_logs (
+                answer_log_id INTEGER PRIMARY KEY,
+                total_ms REAL NOT NULL,
+                stages TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (answer_log_id) REFERENCES answer_logs(id)
+            )
+        """)
+
         # Таблица прав доступа для Bitrix24
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS bitrix24_permissions (
@@ -232,11 +267,58 @@ def init_database():
             )
         """)
 
+        # Роллапы статистики (почасовые/дневные агрегаты для дашбордов)
+        # period_key = 0 - неархивированные логи, иначе ID тестового периода
+        # Пустая строка в измерениях вместо NULL, чтобы работал PRIMARY KEY
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_rollup (
+                granularity TEXT NOT NULL CHECK(granularity IN ('hour', 'day')),
+                bucket TEXT NOT NULL,
+                period_key INTEGER NOT NULL DEFAULT 0,
+                platform TEXT NOT NULL DEFAULT '',
+                search_level TEXT NOT NULL DEFAULT '',
+                faq_id TEXT NOT NULL DEFAULT '',
+                queries INTEGER NOT NULL DEFAULT 0,
+                answers INTEGER NOT NULL DEFAULT 0,
+                similarity_sum REAL NOT NULL DEFAULT 0,
+                similarity_count INTEGER NOT NULL DEFAULT 0,
+                no_answer INTEGER NOT NULL DEFAULT 0,
+                helpful INTEGER NOT NULL DEFAULT 0,
+                not_helpful INTEGER NOT NULL DEFAULT 0,
+                rag_count INTEGER NOT NULL DEFAULT 0,
+                rag_tokens INTEGER NOT NULL DEFAULT 0,
+                rag_errors INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, bucket, period_key, platform, search_level, faq_id)
+            )
+        """)
+
+        # Счётчики по тексту запроса (для топа популярных вопросов)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_query_rollup (
+                period_key INTEGER NOT NULL DEFAULT 0,
+                query_text TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_key, query_text)
+            )
+        """)
+
+        # Множество пользователей (для подсчёта уникальных)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_user_rollup (
+                period_key INTEGER NOT NULL DEFAULT 0,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (period_key, user_id)
+            ) WITHOUT ROWID
+        """)
+
         # Индексы для оптимизации
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_rollup_period ON stats_rollup(period_key, search_level)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_query_rollup_count ON stats_query_rollup(period_key, count DESC)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_timestamp ON query_logs(timestamp DESC)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_user ON query_logs(user_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_platform ON query_logs(platform)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_faq ON answer_logs(faq_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_query ON answer_logs(query_log_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_rating ON rating_logs(rating)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_generations_answer_log ON llm_generations(answer_log_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_generations_model ON llm_generations(model)")
@@ -247,11 +329,29 @@ def init_database():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_logs_broadcast ON broadcast_logs(broadcast_id)")
 
+        # Частичные индексы для архивации/очистки (period_id добавляется миграцией тестовых периодов)
+        try:
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_unarchived ON query_logs(id) WHERE period_id IS NULL")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_unarchived ON answer_logs(id) WHERE period_id IS NULL")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_unarchived ON rating_logs(id) WHERE period_id IS NULL")
+        except sqlite3.OperationalError:
+            # Миграция migrate_test_periods.py ещё не выполнена
+            pass
+
         print("OK: База данных инициализирована")
 
+        # Роллапы пустые, а логи уже есть - БД обновлена с версии без роллапов
+        cursor.execute("SELECT 1 FROM stats_rollup LIMIT 1")
+        rollups_empty = cursor.fetchone() is None
+        cursor.execute("SELECT 1 FROM query_logs LIMIT 1")
+        has_logs = cursor.fetchone() is not None
+
     # Инициализируем настройки бота
     init_bot_settings()
 
+    if rollups_empty and has_logs:
+        rebuild_statistics_rollups()
+
 
 def get_all_faqs() -> List[Dict]:
     """Получить все FAQ из БД"""
@@ -267,7 +367,8 @@ def get_all_faqs() -> List[Dict]:
                 "category": row["category"],
                 "question": row["question"],
                 "answer": row["answer"],
-                "keywords": row["keywords"].split(",") if row["keywords"] else []
+                "keywords": row["keywords"].split(",") if row["keywords"] else [],
+                "updated_at": row["updated_at"]
             })
         return faqs
 
@@ -526,6 +627,10 @@ DEFAULT_BOT_SETTINGS = {
 5. Если совсем ничего не понятно — извинись и скажи, что не знаешь.""",
 }
 
+# Служебные настройки в bot_settings: не показываются в админке и не сбрасываются
+ACTIVE_COLLECTION_SETTING = "active_chroma_collection"
+SYSTEM_BOT_SETTINGS = (ACTIVE_COLLECTION_SETTING,)
+
 
 def init_bot_settings():
     """Инициализация настроек бота значениями по умолчанию"""
@@ -559,6 +664,8 @@ def get_bot_settings() -> Dict[str, str]:
 
         settings = {}
         for row in rows:
+            if row["key"] in SYSTEM_BOT_SETTINGS:
+                continue
             settings[row["key"]] = row["value"]
 
         # Добавляем недостающие настройки из дефолтных
@@ -619,7 +726,8 @@ def reset_bot_settings() -> bool:
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM bot_settings")
+            placeholders = ", ".join("?" for _ in SYSTEM_BOT_SETTINGS)
+            cursor.execute(f"DELETE FROM bot_settings WHERE key NOT IN ({placeholders})", SYSTEM_BOT_SETTINGS)
             for key, value in DEFAULT_BOT_SETTINGS.items():
                 cursor.execute(
                     "INSERT INTO bot_settings (key, value) VALUES (?, ?)",
@@ -632,6 +740,440 @@ def reset_bot_settings() -> bool:
         return False
 
 
+# ========== РОЛЛАПЫ СТАТИСТИКИ ==========
+
+# Уровни поиска, которые не считаются "запросом без ответа" (это уточнения, а не ошибки)
+NO_ANSWER_EXCLUDED_LEVELS = ('disambiguation_shown', 'disambiguation', 'clarification', 'direct')
+
+# Счётчики таблицы stats_rollup
+ROLLUP_COUNTERS = (
+    "queries", "answers", "similarity_sum", "similarity_count", "no_answer",
+    "helpful", "not_helpful", "rag_count", "rag_tokens", "rag_errors"
+)
+
+# Сколько часов храним почасовые бакеты, прежде чем свернуть их в дневные
+ROLLUP_HOURLY_RETENTION_HOURS = int(os.getenv("STATS_ROLLUP_HOURLY_RETENTION_HOURS", "48"))
+
+_ROLLUP_DIMENSIONS = "granularity, bucket, period_key, platform, search_level, faq_id"
+_ROLLUP_UPSERT_SET = ", ".join(f"{c} = {c} + excluded.{c}" for c in ROLLUP_COUNTERS)
+
+
+def _is_no_answer(faq_id: Optional[str], similarity_score: Optional[float], search_level: Optional[str]) -> bool:
+    """Ответ считается "без ответа" по тем же правилам, что и фильтр no_answer в get_logs"""
+    if search_level in NO_ANSWER_EXCLUDED_LEVELS:
+        return False
+    return faq_id is None or (similarity_score is not None and similarity_score < SIMILARITY_THRESHOLD)
+
+
+def _no_answer_sql(alias: str = "al") -> str:
+    """SQL-условие _is_no_answer для строки answer_logs"""
+    excluded = ", ".join(f"'{level}'" for level in NO_ANSWER_EXCLUDED_LEVELS)
+    return (
+        f"COALESCE({alias}.search_level, '') NOT IN ({excluded}) "
+        f"AND ({alias}.faq_id IS NULL OR {alias}.similarity_score < {SIMILARITY_THRESHOLD})"
+    )
+
+
+def _no_answer_delta(cursor, query_log_id: int, answer_log_id: int, is_no_answer: bool) -> int:
+    """
+    Изменение счётчика запросов без ответа после добавления ответа
+
+    Счётчик no_answer считает запросы, а не ответы (как COUNT(DISTINCT ql.id)
+    в get_period_statistics): запрос без ответа, если у него нет ни одной
+    записи answer_logs или хотя бы одна из них "без ответа". Запрос
+    засчитывается при логировании (ответов ещё нет), ответы только
+    корректируют это значение.
+    """
+    cursor.execute(f"""
+        SELECT COUNT(*) as answers,
+               COALESCE(SUM(CASE WHEN {_no_answer_sql()} THEN 1 ELSE 0 END), 0) as no_answers
+        FROM answer_logs al
+        WHERE al.query_log_id = ? AND al.id != ?
+    """, (query_log_id, answer_log_id))
+    row = cursor.fetchone()
+    was_no_answer = row["answers"] == 0 or row["no_answers"] > 0
+    if row["answers"] == 0:
+        is_now_no_answer = is_no_answer
+    else:
+        is_now_no_answer = was_no_answer or is_no_answer
+    return int(is_now_no_answer) - int(was_no_answer)
+
+
+def _rollup_increment(
+    cursor,
+    platform: Optional[str] = None,
+    search_level: Optional[str] = None,
+    faq_id: Optional[str] = None,
+    **counters
+):
+    """
+    Увеличить счётчики текущего часового бакета (в той же транзакции, что и запись лога)
+
+    Новые логи всегда неархивированные, поэтому period_key = 0.
+
+    :param cursor: Курсор открытого соединения
+    :param platform: Платформа запроса
+    :param search_level: Уровень поиска ответа
+    :param faq_id: ID FAQ ответа
+    :param counters: Приращения счётчиков из ROLLUP_COUNTERS
+    """
+    columns = [name for name in ROLLUP_COUNTERS if counters.get(name)]
+    if not columns:
+        return
+
+    cursor.execute(f"""
+        INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, {", ".join(columns)})
+        VALUES ('hour', strftime('%Y-%m-%d %H:00:00', 'now'), 0, ?, ?, ?, {", ".join("?" for _ in columns)})
+        ON CONFLICT({_ROLLUP_DIMENSIONS})
+        DO UPDATE SET {", ".join(f"{c} = {c} + excluded.{c}" for c in columns)}
+    """, (platform or '', search_level or '', faq_id or '', *[counters[c] for c in columns]))
+
+
+def _rollup_answer_dimensions(cursor, answer_log_id: int) -> tuple:
+    """Получить (platform, search_level, faq_id) ответа для атрибуции оценок и RAG"""
+    cursor.execute("""
+        SELECT ql.platform, al.search_level, al.faq_id
+        FROM answer_logs al
+        LEFT JOIN query_logs ql ON ql.id = al.query_log_id
+        WHERE al.id = ?
+    """, (answer_log_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None, None, None
+    return row["platform"], row["search_level"], row["faq_id"]
+
+
+def _rollup_move_to_period(cursor, period_id: int):
+    """Перенести роллапы неархивированных логов в тестовый период (при архивации)"""
+    counters = ", ".join(ROLLUP_COUNTERS)
+    cursor.execute(f"""
+        INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, {counters})
+        SELECT granularity, bucket, ?, platform, search_level, faq_id, {counters}
+        FROM stats_rollup
+        WHERE period_key = 0
+        ON CONFLICT({_ROLLUP_DIMENSIONS})
+        DO UPDATE SET {_ROLLUP_UPSERT_SET}
+    """, (period_id,))
+    cursor.execute("DELETE FROM stats_rollup WHERE period_key = 0")
+
+    cursor.execute("""
+        INSERT INTO stats_query_rollup (period_key, query_text, count)
+        SELECT ?, query_text, count
+        FROM stats_query_rollup
+        WHERE period_key = 0
+        ON CONFLICT(period_key, query_text) DO UPDATE SET count = count + excluded.count
+    """, (period_id,))
+    cursor.execute("DELETE FROM stats_query_rollup WHERE period_key = 0")
+
+    cursor.execute("""
+        INSERT OR IGNORE INTO stats_user_rollup (period_key, user_id)
+        SELECT ?, user_id FROM stats_user_rollup WHERE period_key = 0
+    """, (period_id,))
+    cursor.execute("DELETE FROM stats_user_rollup WHERE period_key = 0")
+
+
+def _rollup_clear_current(cursor):
+    """Удалить роллапы неархивированных логов (при очистке логов)"""
+    cursor.execute("DELETE FROM stats_rollup WHERE period_key = 0")
+    cursor.execute("DELETE FROM stats_query_rollup WHERE period_key = 0")
+    cursor.execute("DELETE FROM stats_user_rollup WHERE period_key = 0")
+
+
+def compact_statistics_rollups(retention_hours: int = ROLLUP_HOURLY_RETENTION_HOURS) -> int:
+    """
+    Свернуть старые почасовые бакеты в дневные
+
+    Почасовые бакеты нужны только для свежих данных, дальше хватает дневных -
+    так размер роллапов растёт по дням, а не по часам.
+
+    :param retention_hours: Сколько часов оставлять почасовую детализацию
+    :return: Количество свёрнутых почасовых бакетов (-1 при ошибке)
+    """
+    try:
+        with get_db_connection(write=True) as conn:
+            cursor = conn.cursor()
+            cutoff = f"-{int(retention_hours)} hours"
+            sums = ", ".join(f"SUM({c})" for c in ROLLUP_COUNTERS)
+
+            cursor.execute(f"""
+                INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, {", ".join(ROLLUP_COUNTERS)})
+                SELECT 'day', substr(bucket, 1, 10) || ' 00:00:00', period_key, platform, search_level, faq_id, {sums}
+                FROM stats_rollup
+                WHERE granularity = 'hour' AND bucket < strftime('%Y-%m-%d %H:00:00', 'now', ?)
+                GROUP BY substr(bucket, 1, 10), period_key, platform, search_level, faq_id
+                ON CONFLICT({_ROLLUP_DIMENSIONS})
+                DO UPDATE SET {_ROLLUP_UPSERT_SET}
+            """, (cutoff,))
+
+            cursor.execute(
+                "DELETE FROM stats_rollup WHERE granularity = 'hour' AND bucket < strftime('%Y-%m-%d %H:00:00', 'now', ?)",
+                (cutoff,)
+            )
+            return cursor.rowcount
+    except Exception as e:
+        print(f"Ошибка при свёртке роллапов статистики: {e}")
+        return -1
+
+
+def rebuild_statistics_rollups() -> bool:
+    """
+    Полностью пересчитать роллапы статистики из сырых логов
+
+    Используется для первичного заполнения (миграция) и для исправления расхождений.
+    Логи периодов, перенесённых в файл архива (move_period_logs_to_archive_db),
+    тоже учитываются - иначе пересчёт стёр бы роллапы этих периодов.
+
+    :return: True если успешно, False при ошибке
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # period_id добавляется миграцией тестовых периодов - без неё все логи неархивированные
+            cursor.execute("PRAGMA table_info(query_logs)")
+            has_periods = any(column["name"] == "period_id" for column in cursor.fetchall())
+            period = "COALESCE({}.period_id, 0)" if has_periods else "0"
+
+            # ATTACH - до первой записи (вне транзакции)
+            with_archive = has_periods and attach_archive_database(conn)
+            query_logs = period_log_source("query_logs", with_archive)
+            answer_logs = period_log_source("answer_logs", with_archive)
+            rating_logs = period_log_source("rating_logs", with_archive)
+            llm_generations = period_log_source("llm_generations", with_archive)
+
+            cursor.execute("DELETE FROM stats_rollup")
+            cursor.execute("DELETE FROM stats_query_rollup")
+            cursor.execute("DELETE FROM stats_user_rollup")
+
+            hour = "strftime('%Y-%m-%d %H:00:00', {})"
+            upsert = f"ON CONFLICT({_ROLLUP_DIMENSIONS}) DO UPDATE SET {_ROLLUP_UPSERT_SET}"
+
+            # Запросы (без ответа - нет записей answer_logs или хотя бы одна "без ответа")
+            cursor.execute(f"""
+                INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, queries, no_answer)
+                SELECT 'hour', {hour.format('ql.timestamp')}, {period.format('ql')},
+                       COALESCE(ql.platform, ''), '', '', COUNT(*),
+                       SUM(COALESCE(na.no_answer, 1))
+                FROM {query_logs} ql
+                LEFT JOIN (
+                    SELECT al.query_log_id, MAX(CASE WHEN {_no_answer_sql()} THEN 1 ELSE 0 END) AS no_answer
+                    FROM {answer_logs} al
+                    GROUP BY al.query_log_id
+                ) na ON na.query_log_id = ql.id
+                WHERE 1=1
+                GROUP BY 2, 3, 4
+                {upsert}
+            """)
+
+            # Ответы
+            cursor.execute(f"""
+                INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, answers, similarity_sum, similarity_count)
+                SELECT 'hour', {hour.format('al.timestamp')}, {period.format('al')},
+                       COALESCE(ql.platform, ''), COALESCE(al.search_level, ''), COALESCE(al.faq_id, ''),
+                       COUNT(*),
+                       COALESCE(SUM(al.similarity_score), 0),
+                       COUNT(al.similarity_score)
+                FROM {answer_logs} al
+                LEFT JOIN {query_logs} ql ON ql.id = al.query_log_id
+                WHERE 1=1
+                GROUP BY 2, 3, 4, 5, 6
+                {upsert}
+            """)
+
+            # Оценки (атрибутируются FAQ и уровню поиска ответа)
+            cursor.execute(f"""
+                INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, helpful, not_helpful)
+                SELECT 'hour', {hour.format('rl.timestamp')}, {period.format('rl')},
+                       COALESCE(ql.platform, ''), COALESCE(al.search_level, ''), COALESCE(al.faq_id, ''),
+                       SUM(CASE WHEN rl.rating = 'helpful' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN rl.rating = 'not_helpful' THEN 1 ELSE 0 END)
+                FROM {rating_logs} rl
+                LEFT JOIN {answer_logs} al ON al.id = rl.answer_log_id
+                LEFT JOIN {query_logs} ql ON ql.id = al.query_log_id
+                WHERE 1=1
+                GROUP BY 2, 3, 4, 5, 6
+                {upsert}
+            """)
+
+            # RAG генерации (период берём из answer_logs, как и в get_statistics)
+            cursor.execute(f"""
+                INSERT INTO stats_rollup ({_ROLLUP_DIMENSIONS}, rag_count, rag_tokens, rag_errors)
+                SELECT 'hour', {hour.format('lg.created_at')}, {period.format('al')},
+                       COALESCE(ql.platform, ''), COALESCE(al.search_level, ''), COALESCE(al.faq_id, ''),
+                       COUNT(*),
+                       COALESCE(SUM(lg.tokens_total), 0),
+                       COUNT(lg.error_message)
+                FROM {llm_generations} lg
+                JOIN {answer_logs} al ON al.id = lg.answer_log_id
+                LEFT JOIN {query_logs} ql ON ql.id = al.query_log_id
+                WHERE 1=1
+                GROUP BY 2, 3, 4, 5, 6
+                {upsert}
+            """)
+
+            cursor.execute(f"""
+                INSERT INTO stats_query_rollup (period_key, query_text, count)
+                SELECT {period.format('ql')}, ql.query_text, COUNT(*)
+                FROM {query_logs} ql
+                GROUP BY 1, 2
+            """)
+
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO stats_user_rollup (period_key, user_id)
+                SELECT DISTINCT {period.format('ql')}, ql.user_id
+                FROM {query_logs} ql
+            """)
+
+        print("OK: Роллапы статистики пересчитаны")
+        compact_statistics_rollups()
+        return True
+    except Exception as e:
+        print(f"Ошибка при пересчёте роллапов статистики: {e}")
+        return False
+
+
+def _get_rollup_statistics(cursor, period_key: int, top_limit: int, faq_tops: bool = True) -> Dict:
+    """
+    Собрать статистику из роллапов (время не зависит от объёма истории логов)
+
+    :param cursor: Курсор открытого соединения
+    :param period_key: 0 - неархивированные логи, иначе ID тестового периода
+    :param top_limit: Размер топов (запросы, полезные FAQ, FAQ на доработку)
+    :param faq_tops: Считать топы FAQ по оценкам (для периодов их считает src.core.statistics по логам)
+    :return: Словарь со статистикой
+    """
+    stats = {}
+
+    cursor.execute("""
+        SELECT
+            SUM(queries) as queries,
+            SUM(answers) as answers,
+            SUM(similarity_sum) as similarity_sum,
+            SUM(similarity_count) as similarity_count,
+            SUM(no_answer) as no_answer,
+            SUM(helpful) as helpful,
+            SUM(not_helpful) as not_helpful,
+            SUM(rag_count) as rag_count,
+            SUM(rag_tokens) as rag_tokens,
+            SUM(rag_errors) as rag_errors
+        FROM stats_rollup
+        WHERE period_key = ?
+    """, (period_key,))
+    totals = cursor.fetchone()
+
+    stats["total_queries"] = totals["queries"] or 0
+    stats["total_answers"] = totals["answers"] or 0
+    stats["avg_similarity"] = round(totals["similarity_sum"] / totals["similarity_count"], 2) if totals["similarity_count"] else 0
+    stats["helpful_count"] = totals["helpful"] or 0
+    stats["not_helpful_count"] = totals["not_helpful"] or 0
+
+    total_ratings = stats["helpful_count"] + stats["not_helpful_count"]
+    if total_ratings > 0:
+        stats["helpful_percentage"] = round((stats["helpful_count"] / total_ratings) * 100, 2)
+    else:
+        stats["helpful_percentage"] = 0
+
+    stats["no_answer_count"] = totals["no_answer"] or 0
+
+    stats["rag_answers"] = totals["rag_count"] or 0
+    stats["rag_avg_tokens"] = round(totals["rag_tokens"] / totals["rag_count"], 1) if totals["rag_count"] else 0
+    stats["rag_total_tokens"] = totals["rag_tokens"] or 0
+    stats["rag_errors"] = totals["rag_errors"] or 0
+
+    # Распределение по уровням поиска
+    cursor.execute("""
+        SELECT
+            search_level,
+            SUM(answers) as count,
+            SUM(similarity_sum) as similarity_sum,
+            SUM(similarity_count) as similarity_count
+        FROM stats_rollup
+        WHERE period_key = ? AND search_level != ''
+        GROUP BY search_level
+        HAVING SUM(answers) > 0
+    """, (period_key,))
+    stats["search_levels"] = {
+        row["search_level"]: {
+            "count": row["count"],
+            "avg_confidence": round(row["similarity_sum"] / row["similarity_count"], 2) if row["similarity_count"] else 0
+        }
+        for row in cursor.fetchall()
+    }
+
+    # Топ запросов
+    cursor.execute("""
+        SELECT query_text, count
+        FROM stats_query_rollup
+        WHERE period_key = ?
+        ORDER BY count DESC
+        LIMIT ?
+    """, (period_key, top_limit))
+    stats["top_queries"] = [
+        {"query": row["query_text"], "count": row["count"]}
+        for row in cursor.fetchall()
+    ]
+
+    # Топ полезных FAQ и FAQ, требующие улучшения
+    if faq_tops:
+        for key, counter in (("top_helpful_faqs", "helpful"), ("need_improvement_faqs", "not_helpful")):
+            cursor.execute(f"""
+                SELECT
+                    f.id,
+                    f.question,
+                    f.category,
+                    SUM(r.{counter}) as total
+                FROM stats_rollup r
+                JOIN faq f ON r.faq_id = f.id
+                WHERE r.period_key = ?
+                GROUP BY f.id
+                HAVING SUM(r.{counter}) > 0
+                ORDER BY total DESC
+                LIMIT ?
+            """, (period_key, top_limit))
+            stats[key] = [
+                {
+                    "faq_id": row["id"],
+                    "question": row["question"],
+                    "category": row["category"],
+                    f"{counter}_count": row["total"]
+                }
+                for row in cursor.fetchall()
+            ]
+
+    # Распределение по платформам
+    cursor.execute("""
+        SELECT platform, SUM(queries) as count
+        FROM stats_rollup
+        WHERE period_key = ?
+        GROUP BY platform
+        HAVING SUM(queries) > 0
+    """, (period_key,))
+    stats["platforms"] = {
+        row["platform"] or None: row["count"]
+        for row in cursor.fetchall()
+    }
+
+    # Динамика по дням
+    cursor.execute("""
+        SELECT substr(bucket, 1, 10) as date, SUM(queries) as queries_count
+        FROM stats_rollup
+        WHERE period_key = ?
+        GROUP BY substr(bucket, 1, 10)
+        HAVING SUM(queries) > 0
+        ORDER BY date
+    """, (period_key,))
+    stats["daily_dynamics"] = [
+        {"date": row["date"], "count": row["queries_count"]}
+        for row in cursor.fetchall()
+    ]
+
+    # Уникальные пользователи
+    cursor.execute("SELECT COUNT(*) as total FROM stats_user_rollup WHERE period_key = ?", (period_key,))
+    stats["unique_users"] = cursor.fetchone()["total"]
+
+    return stats
+
+
 # ========== ЛОГИРОВАНИЕ ВЗАИМОДЕЙСТВИЙ ==========
 
 def add_query_log(user_id: int, username: str, query_text: str, platform: str = 'telegram') -> Optional[int]:
@@ -645,13 +1187,27 @@ def add_query_log(user_id: int, username: str, query_text: str, platform: str =
     :return: ID созданного лога или None при ошибке
     """
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO query_logs (user_id, username, query_text, platform) VALUES (?, ?, ?, ?)",
                 (user_id, username, query_text, platform)
             )
-            return cursor.lastrowid
+            query_log_id = cursor.lastrowid
+
+            # Обновляем роллапы статистики в той же транзакции
+            # (пока ответов нет, запрос считается запросом без ответа)
+            _rollup_increment(cursor, platform=platform, queries=1, no_answer=1)
+            cursor.execute("""
+                INSERT INTO stats_query_rollup (period_key, query_text, count) VALUES (0, ?, 1)
+                ON CONFLICT(period_key, query_text) DO UPDATE SET count = count + 1
+            """, (query_text,))
+            cursor.execute(
+                "INSERT OR IGNORE INTO stats_user_rollup (period_key, user_id) VALUES (0, ?)",
+                (user_id,)
+            )
+
+            return query_log_id
     except Exception as e:
         print(f"Ошибка при логировании запроса: {e}")
         return None
@@ -669,13 +1225,32 @@ def add_answer_log(query_log_id: int, faq_id: Optional[str], similarity_score: f
     :return: ID созданного лога или None при ошибке
     """
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO answer_logs (query_log_id, faq_id, similarity_score, answer_shown, search_level) VALUES (?, ?, ?, ?, ?)",
                 (query_log_id, faq_id, similarity_score, answer_shown, search_level)
             )
-            return cursor.lastrowid
+            answer_log_id = cursor.lastrowid
+
+            # Обновляем роллапы статистики в той же транзакции
+            cursor.execute("SELECT platform FROM query_logs WHERE id = ?", (query_log_id,))
+            query_row = cursor.fetchone()
+            _rollup_increment(
+                cursor,
+                platform=query_row["platform"] if query_row else None,
+                search_level=search_level,
+                faq_id=faq_id,
+                answers=1,
+                similarity_sum=similarity_score or 0,
+                similarity_count=1 if similarity_score is not None else 0,
+                no_answer=_no_answer_delta(
+                    cursor, query_log_id, answer_log_id,
+                    _is_no_answer(faq_id, similarity_score, search_level)
+                )
+            )
+
+            return answer_log_id
     except Exception as e:
         print(f"Ошибка при логировании ответа: {e}")
         return None
@@ -691,12 +1266,24 @@ def add_rating_log(answer_log_id: int, user_id: int, rating: str) -> bool:
     :return: True если успешно, False при ошибке
     """
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO rating_logs (answer_log_id, user_id, rating) VALUES (?, ?, ?)",
                 (answer_log_id, user_id, rating)
             )
+
+            # Обновляем роллапы статистики в той же транзакции
+            platform, search_level, faq_id = _rollup_answer_dimensions(cursor, answer_log_id)
+            _rollup_increment(
+                cursor,
+                platform=platform,
+                search_level=search_level,
+                faq_id=faq_id,
+                helpful=1 if rating == 'helpful' else 0,
+                not_helpful=1 if rating == 'not_helpful' else 0
+            )
+
             return True
     except Exception as e:
         print(f"Ошибка при логировании оценки: {e}")
@@ -738,7 +1325,7 @@ def add_llm_generation_log(
         # Сериализуем chunks_data в JSON
         chunks_json = json.dumps(chunks_data, ensure_ascii=False)
 
-        with get_db_connection() as conn:
+        with get_db_connection(write=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO llm_generations (
@@ -751,13 +1338,225 @@ def add_llm_generation_log(
                 pii_detected, tokens_prompt, tokens_completion, tokens_total,
                 finish_reason, generation_time_ms, error_message
             ))
+            generation_id = cursor.lastrowid
+
+            # Обновляем роллапы статистики в той же транзакции
+            platform, search_level, faq_id = _rollup_answer_dimensions(cursor, answer_log_id)
+            _rollup_increment(
+                cursor,
+                platform=platform,
+                search_level=search_level,
+                faq_id=faq_id,
+                rag_count=1,
+                rag_tokens=tokens_total or 0,
+                rag_errors=1 if error_message is not None else 0
+            )
+
             conn.commit()
-            return cursor.lastrowid
+            return generation_id
     except Exception as e:
         logger.error(f"Ошибка добавления LLM generation log: {e}", exc_info=True)
         return None
 
 
+def add_latency_log(answer_log_id: int, timings: Dict) -> bool:
+    """
+    Сохранить время этапов обработки запроса
+
+    :param answer_log_id: ID записи из answer_logs
+    :param timings: Снимок замера {"total_ms": ..., "stages": [...]} (LatencyTimer.as_dict)
+    :return: True если успешно, False при ошибке
+    """
+    try:
+        import json
+
+        with get_db_connection(write=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO latency_logs (answer_log_id, total_ms, stages) VALUES (?, ?, ?)",
+                (answer_log_id, timings["total_ms"], json.dumps(timings["stages"], ensure_ascii=False))
+            )
+            return True
+    except Exception as e:
+        print(f"Ошибка при логировании времени этапов: {e}")
+        return False
+
+
+def get_answer_query_log_id(answer_log_id: int) -> Optional[int]:
+    """
+    ID запроса (query_logs), к которому относится ответ
+
+    :param answer_log_id: ID записи из answer_logs
+    :return: query_log_id или None
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT query_log_id FROM answer_logs WHERE id = ?", (answer_log_id,))
+            row = cursor.fetchone()
+            return row["query_log_id"] if row else None
+    except Exception as e:
+        print(f"Ошибка при получении запроса ответа: {e}")
+        return None
+
+
+def _build_logs_query(
+    user_id: Optional[int] = None,
+    faq_id: Optional[str] = None,
+    rating_filter: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    search_text: Optional[str] = None,
+    no_answer: bool = False,
+    platform: Optional[str] = None,
+    show_archived: bool = False
+) -> tuple[str, List]:
+    """
+    Собрать запрос логов с фильтрами (без сортировки и пагинации)
+
+    Параметры - как у get_logs().
+
+    :return: (SQL запрос, параметры)
+    """
+    # Базовый запрос с JOIN
+    query = """
+        SELECT
+            ql.id as query_id,
+            ql.user_id,
+            ql.username,
+            ql.query_text,
+            ql.platform,
+            ql.timestamp as query_timestamp,
+            al.id as answer_id,
+            al.faq_id,
+            al.similarity_score,
+            al.answer_shown,
+            al.search_level,
+            al.timestamp as answer_timestamp,
+            rl.rating,
+            rl.timestamp as rating_timestamp,
+            f.category,
+            f.question as faq_question,
+            lg.id as llm_gen_id,
+            lg.model as llm_model,
+            lg.chunks_used as llm_chunks_used,
+            lg.chunks_data as llm_chunks_data,
+            lg.pii_detected as llm_pii_detected,
+            lg.tokens_prompt as llm_tokens_prompt,
+            lg.tokens_completion as llm_tokens_completion,
+            lg.tokens_total as llm_tokens_total,
+            lg.finish_reason as llm_finish_reason,
+            lg.generation_time_ms as llm_generation_time_ms,
+            lg.error_message as llm_error_message,
+            lt.total_ms as latency_total_ms,
+            lt.stages as latency_stages
+        FROM query_logs ql
+        LEFT JOIN answer_logs al ON ql.id = al.query_log_id
+        LEFT JOIN rating_logs rl ON al.id = rl.answer_log_id
+        LEFT JOIN llm_generations lg ON al.id = lg.answer_log_id
+        LEFT JOIN latency_logs lt ON al.id = lt.answer_log_id
+        LEFT JOIN faq f ON al.faq_id = f.id
+        WHERE 1=1
+    """
+
+    params = []
+
+    # Фильтры
+    if user_id is not None:
+        query += " AND ql.user_id = ?"
+        params.append(user_id)
+
+    if faq_id is not None:
+        query += " AND al.faq_id = ?"
+        params.append(faq_id)
+
+    if rating_filter:
+        if rating_filter == 'no_rating':
+            query += " AND rl.rating IS NULL"
+        else:
+            query += " AND rl.rating = ?"
+            params.append(rating_filter)
+
+    if date_from:
+        query += " AND ql.timestamp >= ?"
+        params.append(date_from)
+
+    if date_to:
+        query += " AND ql.timestamp <= ?"
+        params.append(date_to)
+
+    if search_text:
+        query += " AND ql.query_text LIKE ?"
+        params.append(f"%{search_text}%")
+
+    if no_answer:
+        # Показываем только запросы где не нашелся ответ (faq_id IS NULL или совпадение < порога)
+        # Исключаем disambiguation и clarification - это не ошибки, а уточнения
+        query += f" AND (al.faq_id IS NULL OR al.similarity_score < {SIMILARITY_THRESHOLD}) AND al.search_level NOT IN ('disambiguation_shown', 'disambiguation', 'clarification', 'direct')"
+
+    if platform:
+        query += " AND ql.platform = ?"
+        params.append(platform)
+
+    # Фильтр архивированных логов (по умолчанию показываем только неархивированные)
+    if not show_archived:
+        query += " AND ql.period_id IS NULL"
+
+    return query, params
+
+
+def _log_row_to_dict(row) -> Dict:
+    """Преобразовать строку запроса логов в словарь (время в UTC+7)"""
+    import json
+
+    # Формируем llm_metadata если есть данные
+    llm_metadata = None
+    if row["llm_gen_id"]:
+        llm_metadata = {
+            'id': row['llm_gen_id'],
+            'model': row['llm_model'],
+            'chunks_used': row['llm_chunks_used'],
+            'chunks_data': json.loads(row['llm_chunks_data']) if row['llm_chunks_data'] else None,
+            'pii_detected': row['llm_pii_detected'],
+            'tokens': {
+                'prompt': row['llm_tokens_prompt'],
+                'completion': row['llm_tokens_completion'],
+                'total': row['llm_tokens_total']
+            },
+            'finish_reason': row['llm_finish_reason'],
+            'generation_time_ms': row['llm_generation_time_ms'],
+            'error_message': row['llm_error_message']
+        }
+
+    latency = None
+    if row["latency_stages"]:
+        latency = {
+            'total_ms': row['latency_total_ms'],
+            'stages': json.loads(row['latency_stages'])
+        }
+
+    return {
+        "query_id": row["query_id"],
+        "user_id": row["user_id"],
+        "username": row["username"],
+        "query_text": row["query_text"],
+        "platform": row["platform"],
+        "query_timestamp": convert_utc_to_utc7(row["query_timestamp"]),
+        "answer_id": row["answer_id"],
+        "faq_id": row["faq_id"],
+        "similarity_score": row["similarity_score"],
+        "answer_shown": row["answer_shown"],
+        "search_level": row["search_level"],
+        "answer_timestamp": convert_utc_to_utc7(row["answer_timestamp"]),
+        "rating": row["rating"],
+        "rating_timestamp": convert_utc_to_utc7(row["rating_timestamp"]),
+        "category": row["category"],
+        "faq_question": row["faq_question"],
+        "llm_metadata": llm_metadata,
+        "latency": latency
+    }
+
+
 def get_logs(
     limit: int = 50,
     offset: int = 0,
@@ -791,86 +1590,17 @@ def get_logs(
         with get_db_connection() as conn:
             cursor = conn.cursor()
 
-            # Базовый запрос с JOIN
-            query = """
-                SELECT
-                    ql.id as query_id,
-                    ql.user_id,
-                    ql.username,
-                    ql.query_text,
-                    ql.platform,
-                    ql.timestamp as query_timestamp,
-                    al.id as answer_id,
-                    al.faq_id,
-                    al.similarity_score,
-                    al.answer_shown,
-                    al.search_level,
-                    al.timestamp as answer_timestamp,
-                    rl.rating,
-                    rl.timestamp as rating_timestamp,
-                    f.category,
-                    f.question as faq_question,
-                    lg.id as llm_gen_id,
-                    lg.model as llm_model,
-                    lg.chunks_used as llm_chunks_used,
-                    lg.chunks_data as llm_chunks_data,
-                    lg.pii_detected as llm_pii_detected,
-                    lg.tokens_prompt as llm_tokens_prompt,
-                    lg.tokens_completion as llm_tokens_completion,
-                    lg.tokens_total as llm_tokens_total,
-                    lg.finish_reason as llm_finish_reason,
-                    lg.generation_time_ms as llm_generation_time_ms,
-                    lg.error_message as llm_error_message
-                FROM query_logs ql
-                LEFT JOIN answer_logs al ON ql.id = al.query_log_id
-                LEFT JOIN rating_logs rl ON al.id = rl.answer_log_id
-                LEFT JOIN llm_generations lg ON al.id = lg.answer_log_id
-                LEFT JOIN faq f ON al.faq_id = f.id
-                WHERE 1=1
-            """
-
-            params = []
-
-            # Фильтры
-            if user_id is not None:
-                query += " AND ql.user_id = ?"
-                params.append(user_id)
-
-            if faq_id is not None:
-                query += " AND al.faq_id = ?"
-                params.append(faq_id)
-
-            if rating_filter:
-                if rating_filter == 'no_rating':
-                    query += " AND rl.rating IS NULL"
-                else:
-                    query += " AND rl.rating = ?"
-                    params.append(rating_filter)
-
-            if date_from:
-                query += " AND ql.timestamp >= ?"
-                params.append(date_from)
-
-            if date_to:
-                query += " AND ql.timestamp <= ?"
-                params.append(date_to)
-
-            if search_text:
-                query += " AND ql.query_text LIKE ?"
-                params.append(f"%{search_text}%")
-
-            if no_answer:
-                # Показываем только запросы где не нашелся ответ (faq_id IS NULL или совпадение < порога)
-                # Исключаем disambiguation и clarification - это не ошибки, а уточнения
-                query += f" AND (al.faq_id IS NULL OR al.similarity_score < {SIMILARITY_THRESHOLD}) AND al.search_level NOT IN ('disambiguation_shown', 'disambiguation', 'clarification', 'direct')"
-
-            if platform:
-                query += " AND ql.platform = ?"
-                params.append(platform)
-
-            # Фильтр архивированных логов (по умолчанию показываем только неархивированные)
-            if not show_archived:
-                query += " AND ql.period_id IS NULL"
+            query, params = _build_logs_query(
+                user_id=user_id,
+                faq_id=faq_id,
+                rating_filter=rating_filter,
+                date_from=date_from,
+                date_to=date_to,
+                search_text=search_text,
+                no_answer=no_answer,
+                platform=platform,
+                show_archived=show_archived
+            )
 
             # Подсчет общего количества
             count_query = f"SELECT COUNT(*) as total FROM ({query})"
@@ -882,50 +1612,7 @@ def get_logs(
             params.extend([limit, offset])
 
             cursor.execute(query, params)
-            rows = cursor.fetchall()
-
-            logs = []
-            for row in rows:
-                import json
-
-                # Формируем llm_metadata если есть данные
-                llm_metadata = None
-                if row["llm_gen_id"]:
-                    llm_metadata = {
-                        'id': row['llm_gen_id'],
-                        'model': row['llm_model'],
-                        'chunks_used': row['llm_chunks_used'],
-                        'chunks_data': json.loads(row['llm_chunks_data']) if row['llm_chunks_data'] else None,
-                        'pii_detected': row['llm_pii_detected'],
-                        'tokens': {
-                            'prompt': row['llm_tokens_prompt'],
-                            'completion': row['llm_tokens_completion'],
-                            'total': row['llm_tokens_total']
-                        },
-                        'finish_reason': row['llm_finish_reason'],
-                        'generation_time_ms': row['llm_generation_time_ms'],
-                        'error_message': row['llm_error_message']
-                    }
-
-                logs.append({
-                    "query_id": row["query_id"],
-                    "user_id": row["user_id"],
-                    "username": row["username"],
-                    "query_text": row["query_text"],
-                    "platform": row["platform"],
-                    "query_timestamp": convert_utc_to_utc7(row["query_timestamp"]),
-                    "answer_id": row["answer_id"],
-                    "faq_id": row["faq_id"],
-                    "similarity_score": row["similarity_score"],
-                    "answer_shown": row["answer_shown"],
-                    "search_level": row["search_level"],
-                    "answer_timestamp": convert_utc_to_utc7(row["answer_timestamp"]),
-                    "rating": row["rating"],
-                    "rating_timestamp": convert_utc_to_utc7(row["rating_timestamp"]),
-                    "category": row["category"],
-                    "faq_question": row["faq_question"],
-                    "llm_metadata": llm_metadata
-                })
+            logs = [_log_row_to_dict(row) for row in cursor.fetchall()]
 
             return logs, total
     except Exception as e:
@@ -933,165 +1620,97 @@ def get_logs(
         return [], 0
 
 
+def iter_logs(chunk_size: int = 1000, **filters) -> Iterator[List[Dict]]:
+    """
+    Итерировать логи порциями без ограничения на количество записей (для потокового экспорта)
+
+    Каждая порция читается отдельным коротким запросом с keyset-пагинацией по ql.id,
+    поэтому долгий экспорт не держит блокировку чтения SQLite и не мешает записи логов ботами.
+    Порядок - от новых запросов к старым (ql.id DESC), как в get_logs.
+
+    :param chunk_size: Количество строк в порции
+    :param filters: Фильтры как у get_logs() (user_id, faq_id, rating_filter, ...)
+    :return: Генератор списков логов
+    """
+    query, params = _build_logs_query(**filters)
+    last_query_id = None
+
+    while True:
+        chunk_query = query
+        chunk_params = list(params)
+        if last_query_id is not None:
+            chunk_query += " AND ql.id <= ?"
+            chunk_params.append(last_query_id)
+        chunk_query += " ORDER BY ql.id DESC, al.id, rl.id, lg.id LIMIT ?"
+        chunk_params.append(chunk_size)
+
+        with get_db_connection() as conn:
+            rows = conn.execute(chunk_query, chunk_params).fetchall()
+
+        if not rows:
+            return
+
+        if len(rows) < chunk_size:
+            yield [_log_row_to_dict(row) for row in rows]
+            return
+
+        # Строки последнего запроса в порции могут быть неполными (JOIN ответов/оценок) -
+        # откладываем их до следующей порции, которая начнётся с этого же ql.id
+        boundary_id = rows[-1]["query_id"]
+        complete = [row for row in rows if row["query_id"] != boundary_id]
+
+        if complete:
+            yield [_log_row_to_dict(row) for row in complete]
+            last_query_id = boundary_id
+        else:
+            # Вся порция - один запрос (много ответов/оценок): дочитываем все его строки
+            # без LIMIT, чтобы ничего не потерять, и идём дальше
+            with get_db_connection() as conn:
+                rows = conn.execute(
+                    query + " AND ql.id = ? ORDER BY al.id, rl.id, lg.id",
+                    list(params) + [boundary_id]
+                ).fetchall()
+            yield [_log_row_to_dict(row) for row in rows]
+            last_query_id = boundary_id - 1
+
+
 def get_statistics() -> Dict:
     """
     Получить статистику по логам (только неархивированные)
 
+    Читает роллапы статистики, а не сырые логи.
+
     :return: Словарь со статистикой
     """
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            return _get_rollup_statistics(cursor, period_key=0, top_limit=3)
+    except Exception as e:
+        print(f"Ошибка при получении статистики: {e}")
+        return {}
 
-            stats = {}
-
-            # Всего запросов (только неархивированные)
-            cursor.execute("SELECT COUNT(*) as total FROM query_logs WHERE period_id IS NULL")
-            stats["total_queries"] = cursor.fetchone()["total"]
-
-            # Всего ответов (только неархивированные)
-            cursor.execute("SELECT COUNT(*) as total FROM answer_logs WHERE period_id IS NULL")
-            stats["total_answers"] = cursor.fetchone()["total"]
-
-            # Средняя оценка схожести (только неархивированные)
-            cursor.execute("SELECT AVG(similarity_score) as avg_score FROM answer_logs WHERE period_id IS NULL AND similarity_score IS NOT NULL")
-            result = cursor.fetchone()
-            stats["avg_similarity"] = round(result["avg_score"], 2) if result["avg_score"] else 0
-
-            # Оценки (только неархивированные)
-            cursor.execute("SELECT COUNT(*) as total FROM rating_logs WHERE period_id IS NULL AND rating = 'helpful'")
-            stats["helpful_count"] = cursor.fetchone()["total"]
 
-            cursor.execute("SELECT COUNT(*) as total FROM rating_logs WHERE period_id IS NULL AND rating = 'not_helpful'")
-            stats["not_helpful_count"] = cursor.fetchone()["total"]
+def get_search_level_statistics() -> Dict:
+    """
+    Получить статистику по уровням поиска (только неархивированные)
 
-            # Процент полезных ответов
-            total_ratings = stats["helpful_count"] + stats["not_helpful_count"]
-            if total_ratings > 0:
-                stats["helpful_percentage"] = round((stats["helpful_count"] / total_ratings) * 100, 2)
-            else:
-                stats["helpful_percentage"] = 0
-
-            # Запросы без ответа (faq_id IS NULL или совпадение < порога) - только неархивированные
-            # Считаем уникальные запросы, а не записи в answer_logs
-            # Исключаем disambiguation - это не ошибка, а уточнение
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT ql.id) as total
-                FROM query_logs ql
-                LEFT JOIN answer_logs al ON ql.id = al.query_log_id
-                WHERE ql.period_id IS NULL
-                  AND (al.faq_id IS NULL OR al.similarity_score < {SIMILARITY_THRESHOLD})
-                  AND (al.search_level IS NULL OR al.search_level NOT IN ('disambiguation_shown', 'disambiguation', 'clarification', 'direct'))
-            """)
-            stats["no_answer_count"] = cursor.fetchone()["total"]
-
-            # Топ-3 самых частых вопроса (только неархивированные)
-            cursor.execute("""
-                SELECT query_text, COUNT(*) as count
-                FROM query_logs
-                WHERE period_id IS NULL
-                GROUP BY query_text
-                ORDER BY count DESC
-                LIMIT 3
-            """)
-            stats["top_queries"] = [
-                {"query": row["query_text"], "count": row["count"]}
-                for row in cursor.fetchall()
-            ]
-
-            # Топ-3 самых полезных FAQ (по количеству положительных оценок) - только неархивированные
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.question,
-                    f.category,
-                    COUNT(*) as helpful_count
-                FROM rating_logs rl
-                JOIN answer_logs al ON rl.answer_log_id = al.id
-                JOIN faq f ON al.faq_id = f.id
-                WHERE rl.period_id IS NULL AND rl.rating = 'helpful'
-                GROUP BY f.id
-                ORDER BY helpful_count DESC
-                LIMIT 3
-            """)
-            stats["top_helpful_faqs"] = [
-                {
-                    "faq_id": row["id"],
-                    "question": row["question"],
-                    "category": row["category"],
-                    "helpful_count": row["helpful_count"]
-                }
-                for row in cursor.fetchall()
-            ]
-
-            # FAQ с низкими оценками (требуют улучшения) - только неархивированные
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.question,
-                    f.category,
-                    COUNT(*) as not_helpful_count
-                FROM rating_logs rl
-                JOIN answer_logs al ON rl.answer_log_id = al.id
-                JOIN faq f ON al.faq_id = f.id
-                WHERE rl.period_id IS NULL AND rl.rating = 'not_helpful'
-                GROUP BY f.id
-                ORDER BY not_helpful_count DESC
-                LIMIT 3
-            """)
-            stats["need_improvement_faqs"] = [
-                {
-                    "faq_id": row["id"],
-                    "question": row["question"],
-                    "category": row["category"],
-                    "not_helpful_count": row["not_helpful_count"]
-                }
-                for row in cursor.fetchall()
-            ]
-
-            # RAG Statistics (только неархивированные)
-            cursor.execute("""
-                SELECT
-                    COUNT(*) as rag_count,
-                    AVG(lg.tokens_total) as avg_tokens,
-                    SUM(lg.tokens_total) as total_tokens,
-                    COUNT(CASE WHEN lg.error_message IS NOT NULL THEN 1 END) as rag_errors
-                FROM answer_logs al
-                LEFT JOIN llm_generations lg ON al.id = lg.answer_log_id
-                WHERE al.period_id IS NULL
-                  AND lg.id IS NOT NULL
-            """)
-            rag_stats = cursor.fetchone()
-
-            stats['rag_answers'] = rag_stats['rag_count'] or 0
-            stats['rag_avg_tokens'] = round(rag_stats['avg_tokens'] or 0, 1)
-            stats['rag_total_tokens'] = rag_stats['total_tokens'] or 0
-            stats['rag_errors'] = rag_stats['rag_errors'] or 0
-
-            return stats
-    except Exception as e:
-        print(f"Ошибка при получении статистики: {e}")
-        return {}
-
-
-def get_search_level_statistics() -> Dict:
-    """
-    Получить статистику по уровням поиска (только неархивированные)
-
-    :return: Словарь с количеством использований каждого уровня и средней уверенностью
-    """
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
+    :return: Словарь с количеством использований каждого уровня и средней уверенностью
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
             cursor.execute("""
                 SELECT
                     search_level,
-                    COUNT(*) as count,
-                    AVG(similarity_score) as avg_confidence
-                FROM answer_logs
-                WHERE period_id IS NULL AND search_level IS NOT NULL
+                    SUM(answers) as count,
+                    SUM(similarity_sum) as similarity_sum,
+                    SUM(similarity_count) as similarity_count
+                FROM stats_rollup
+                WHERE period_key = 0 AND search_level != ''
                 GROUP BY search_level
+                HAVING SUM(answers) > 0
                 ORDER BY
                     CASE search_level
                         WHEN 'exact' THEN 1
@@ -1109,7 +1728,7 @@ def get_search_level_statistics() -> Dict:
             for row in cursor.fetchall():
                 stats[row['search_level']] = {
                     'count': row['count'],
-                    'avg_confidence': round(row['avg_confidence'], 2) if row['avg_confidence'] else 0
+                    'avg_confidence': round(row['similarity_sum'] / row['similarity_count'], 2) if row['similarity_count'] else 0
                 }
 
             return stats
@@ -1119,6 +1738,104 @@ def get_search_level_statistics() -> Dict:
         return {}
 
 
+def _percentiles(values: List[float]) -> Dict:
+    """p50/p95/p99 и среднее (метод ближайшего ранга)"""
+    ordered = sorted(values)
+    n = len(ordered)
+
+    def rank(p):
+        return ordered[min(n - 1, max(0, -(-n * p // 100) - 1))]
+
+    return {
+        'count': n,
+        'avg': round(sum(ordered) / n, 2),
+        'p50': round(rank(50), 2),
+        'p95': round(rank(95), 2),
+        'p99': round(rank(99), 2)
+    }
+
+
+def get_latency_statistics(limit: int = LATENCY_STATS_LIMIT) -> Dict:
+    """
+    Перцентили времени этапов обработки (только неархивированные)
+
+    Учитываются последние limit ответов с замером. Повторы этапа в одном
+    запросе (например, две анонимизации) складываются.
+
+    :param limit: Количество последних ответов
+    :return: {"count", "total": {...}, "stages": {этап: {...}}, "by_level": {уровень: {...}}}
+    """
+    try:
+        import json
+        from src.core.latency import LATENCY_STAGES, stage_totals
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT lt.total_ms, lt.stages, al.search_level
+                FROM latency_logs lt
+                JOIN answer_logs al ON al.id = lt.answer_log_id
+                WHERE al.period_id IS NULL
+                ORDER BY lt.answer_log_id DESC
+                LIMIT ?
+            """, (limit,))
+            rows = cursor.fetchall()
+
+        totals = []
+        per_stage: Dict[str, List[float]] = {}
+        per_level: Dict[str, List[float]] = {}
+        for row in rows:
+            totals.append(row["total_ms"])
+            per_level.setdefault(row["search_level"] or 'none', []).append(row["total_ms"])
+            for name, ms in stage_totals(json.loads(row["stages"])).items():
+                per_stage.setdefault(name, []).append(ms)
+
+        # Этапы в порядке выполнения, неизвестные - в конце
+        order = list(LATENCY_STAGES) + sorted(set(per_stage) - set(LATENCY_STAGES))
+        stages = {}
+        for name in order:
+            if name in per_stage:
+                stages[name] = dict(_percentiles(per_stage[name]), label=LATENCY_STAGES.get(name, name))
+
+        return {
+            'count': len(rows),
+            'total': _percentiles(totals) if totals else None,
+            'stages': stages,
+            'by_level': {level: _percentiles(values) for level, values in per_level.items()}
+        }
+
+    except Exception as e:
+        print(f"Ошибка при получении статистики времени этапов: {e}")
+        return {'count': 0, 'total': None, 'stages': {}, 'by_level': {}}
+
+
+def get_slowest_requests(limit: int = 50) -> List[Dict]:
+    """
+    Самые медленные запросы по общему времени обработки (только неархивированные)
+
+    :param limit: Количество запросов
+    :return: Список {query_log_id, answer_log_id, query_text, platform, search_level, total_ms, timestamp}
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT ql.id AS query_log_id, al.id AS answer_log_id, ql.query_text, ql.platform,
+                       al.search_level, lt.total_ms, ql.timestamp
+                FROM latency_logs lt
+                JOIN answer_logs al ON al.id = lt.answer_log_id
+                JOIN query_logs ql ON ql.id = al.query_log_id
+                WHERE al.period_id IS NULL
+                ORDER BY lt.total_ms DESC
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    except Exception as e:
+        print(f"Ошибка при получении медленных запросов: {e}")
+        return []
+
+
 # ============================================
 # Функции для работы с правами Битрикс24
 # ============================================
@@ -1483,13 +2200,71 @@ def get_active_test_period() -> Optional[Dict]:
         return None
 
 
-def archive_current_logs(period_id: int) -> Dict[str, int]:
+# Размер порции при архивации/очистке логов: каждая порция - отдельная короткая транзакция,
+# чтобы не блокировать общую БД для ботов на время всей операции
+LOG_MAINTENANCE_BATCH_SIZE = int(os.getenv("LOG_MAINTENANCE_BATCH_SIZE", "500"))
+
+# Отдельный файл БД для переноса логов завершённых периодов (держит горячие таблицы маленькими)
+ARCHIVE_DB_FILE = os.getenv("LOG_ARCHIVE_DB_FILE", "data/faq_archive.db")
+
+# Колонки таблиц логов, которые переносятся в файл архива
+ARCHIVE_TABLE_COLUMNS = {
+    "query_logs": ("id", "user_id", "username", "query_text", "platform", "timestamp", "period_id"),
+    "answer_logs": ("id", "query_log_id", "faq_id", "similarity_score", "answer_shown", "search_level", "timestamp", "period_id"),
+    "rating_logs": ("id", "answer_log_id", "user_id", "rating", "timestamp", "period_id"),
+    "llm_generations": (
+        "id", "answer_log_id", "model", "chunks_used", "chunks_data", "pii_detected",
+        "tokens_prompt", "tokens_completion", "tokens_total", "finish_reason",
+        "generation_time_ms", "error_message", "created_at"
+    ),
+    "latency_logs": ("answer_log_id", "total_ms", "stages", "created_at"),
+}
+
+# Таблицы логов с period_id в порядке обработки
+_PERIOD_LOG_TABLES = (("queries", "query_logs"), ("answers", "answer_logs"), ("ratings", "rating_logs"))
+
+
+def _report_progress(progress_callback, stage: str, processed: int, total: int):
+    """Передать прогресс операции (если задан callback)"""
+    if progress_callback:
+        try:
+            progress_callback(stage, processed, total)
+        except Exception as e:
+            print(f"Ошибка в обработчике прогресса: {e}")
+
+
+def _count_unarchived(cursor) -> Dict[str, int]:
+    """Количество неархивированных записей по таблицам (через частичные индексы)"""
+    counts = {}
+    for key, table in _PERIOD_LOG_TABLES:
+        cursor.execute(f"SELECT COUNT(*) as total FROM {table} WHERE period_id IS NULL")
+        counts[key] = cursor.fetchone()["total"]
+    return counts
+
+
+def archive_current_logs(
+    period_id: int,
+    progress_callback=None,
+    batch_size: int = LOG_MAINTENANCE_BATCH_SIZE
+) -> Dict:
     """
     Архивировать текущие логи (привязать к тестовому периоду)
 
+    Записи обрабатываются порциями по batch_size в коротких транзакциях.
+    Последняя транзакция дописывает поступившие за время архивации логи
+    и переносит роллапы статистики - так счётчики остаются согласованными.
+    Она выполняется и после сбоя порции (дописывает оставшиеся записи);
+    если не удалась и она, роллапы пересчитываются из логов. Повторный
+    запуск с тем же period_id продолжает прерванную архивацию.
+
     :param period_id: ID тестового периода
+    :param progress_callback: Функция (stage, processed, total) для отображения прогресса
+    :param batch_size: Размер порции
     :return: Словарь с количеством заархивированных записей
+             (и ключом "error" при сбое - счётчики тогда частичные)
     """
+    result = {"queries": 0, "answers": 0, "ratings": 0}
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -1498,271 +2273,354 @@ def archive_current_logs(period_id: int) -> Dict[str, int]:
             cursor.execute("SELECT id FROM test_periods WHERE id = ?", (period_id,))
             if not cursor.fetchone():
                 print(f"Ошибка: тестовый период с ID {period_id} не найден")
-                return {"queries": 0, "answers": 0, "ratings": 0}
-
-            # Архивируем query_logs (только те, что без period_id)
-            cursor.execute(
-                "UPDATE query_logs SET period_id = ? WHERE period_id IS NULL",
-                (period_id,)
-            )
-            queries_count = cursor.rowcount
+                return {**result, "error": f"Тестовый период с ID {period_id} не найден"}
 
-            # Архивируем answer_logs (только те, что без period_id)
-            cursor.execute(
-                "UPDATE answer_logs SET period_id = ? WHERE period_id IS NULL",
-                (period_id,)
-            )
-            answers_count = cursor.rowcount
+            totals = _count_unarchived(cursor)
+    except Exception as e:
+        print(f"Ошибка при архивации логов: {e}")
+        return {**result, "error": str(e)}
 
-            # Архивируем rating_logs (только те, что без period_id)
-            cursor.execute(
-                "UPDATE rating_logs SET period_id = ? WHERE period_id IS NULL",
-                (period_id,)
-            )
-            ratings_count = cursor.rowcount
+    try:
+        # Архивируем порциями (только записи без period_id)
+        for key, table in _PERIOD_LOG_TABLES:
+            while True:
+                with get_db_connection(write=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(f"""
+                        UPDATE {table} SET period_id = ?
+                        WHERE id IN (SELECT id FROM {table} WHERE period_id IS NULL LIMIT ?)
+                    """, (period_id, batch_size))
+                    updated = cursor.rowcount
+
+                result[key] += updated
+                _report_progress(progress_callback, key, result[key], max(totals[key], result[key]))
+
+                if updated < batch_size:
+                    break
+    except Exception as e:
+        # Оставшиеся записи допишет финальная транзакция
+        print(f"Ошибка при архивации порции логов: {e}")
 
-            print(f"✅ Заархивировано: {queries_count} запросов, {answers_count} ответов, {ratings_count} оценок")
+    error = None
+    try:
+        # Финальная транзакция: логи, записанные во время архивации
+        # (или не заархивированные из-за сбоя порции), и роллапы
+        with get_db_connection(write=True) as conn:
+            cursor = conn.cursor()
+            for key, table in _PERIOD_LOG_TABLES:
+                cursor.execute(f"UPDATE {table} SET period_id = ? WHERE period_id IS NULL", (period_id,))
+                result[key] += cursor.rowcount
 
-            return {
-                "queries": queries_count,
-                "answers": answers_count,
-                "ratings": ratings_count
-            }
+            # Переносим роллапы статистики в период
+            _rollup_move_to_period(cursor, period_id)
 
+        print(f"✅ Заархивировано: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок")
     except Exception as e:
+        error = str(e)
         print(f"Ошибка при архивации логов: {e}")
-        return {"queries": 0, "answers": 0, "ratings": 0}
+        # Часть записей уже привязана к периоду, а роллапы остались в текущих логах
+        if any(result.values()):
+            rebuild_statistics_rollups()
+
+    # Статистика периода изменилась - сбрасываем кэш (после коммита)
+    try:
+        from src.core import statistics
+        statistics.invalidate_period_statistics(period_id)
+    except Exception as e:
+        print(f"Ошибка при сбросе кэша статистики периода: {e}")
 
+    if error:
+        result["error"] = error
+    return result
 
-def clear_unarchived_logs() -> Dict[str, int]:
+
+def clear_unarchived_logs(
+    progress_callback=None,
+    batch_size: int = LOG_MAINTENANCE_BATCH_SIZE
+) -> Dict:
     """
     Удалить неархивированные логи (логи без period_id)
 
+    Удаление идёт порциями по batch_size в коротких транзакциях:
+    сначала оценки, затем ответы, затем запросы. Финальная транзакция
+    выполняется и после сбоя порции; если не удалась и она, роллапы
+    пересчитываются из оставшихся логов.
+
+    :param progress_callback: Функция (stage, processed, total) для отображения прогресса
+    :param batch_size: Размер порции
     :return: Словарь с количеством удалённых записей
+             (и ключом "error" при сбое - счётчики тогда частичные)
     """
+    result = {"queries": 0, "answers": 0, "ratings": 0}
+
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-
-            # Удаляем rating_logs без period_id
-            cursor.execute("DELETE FROM rating_logs WHERE period_id IS NULL")
-            ratings_count = cursor.rowcount
+            totals = _count_unarchived(conn.cursor())
+    except Exception as e:
+        print(f"Ошибка при очистке логов: {e}")
+        return {**result, "error": str(e)}
 
-            # Удаляем answer_logs без period_id
-            cursor.execute("DELETE FROM answer_logs WHERE period_id IS NULL")
-            answers_count = cursor.rowcount
+    try:
+        for key, table in reversed(_PERIOD_LOG_TABLES):
+            while True:
+                with get_db_connection(write=True) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute(f"""
+                        DELETE FROM {table}
+                        WHERE id IN (SELECT id FROM {table} WHERE period_id IS NULL LIMIT ?)
+                    """, (batch_size,))
+                    deleted = cursor.rowcount
+
+                result[key] += deleted
+                _report_progress(progress_callback, key, result[key], max(totals[key], result[key]))
+
+                if deleted < batch_size:
+                    break
+    except Exception as e:
+        # Оставшиеся записи удалит финальная транзакция
+        print(f"Ошибка при удалении порции логов: {e}")
 
-            # Удаляем query_logs без period_id
-            cursor.execute("DELETE FROM query_logs WHERE period_id IS NULL")
-            queries_count = cursor.rowcount
+    error = None
+    try:
+        # Финальная транзакция: логи, записанные во время очистки
+        # (или не удалённые из-за сбоя порции), и роллапы
+        with get_db_connection(write=True) as conn:
+            cursor = conn.cursor()
+            for key, table in reversed(_PERIOD_LOG_TABLES):
+                cursor.execute(f"DELETE FROM {table} WHERE period_id IS NULL")
+                result[key] += cursor.rowcount
 
-            print(f"✅ Удалено: {queries_count} запросов, {answers_count} ответов, {ratings_count} оценок")
+            # Время этапов удалённых ответов
+            cursor.execute("DELETE FROM latency_logs WHERE answer_log_id NOT IN (SELECT id FROM answer_logs)")
 
-            return {
-                "queries": queries_count,
-                "answers": answers_count,
-                "ratings": ratings_count
-            }
+            _rollup_clear_current(cursor)
 
+        print(f"✅ Удалено: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок")
     except Exception as e:
+        error = str(e)
         print(f"Ошибка при очистке логов: {e}")
-        return {"queries": 0, "answers": 0, "ratings": 0}
+        # Часть логов уже удалена, а роллапы их ещё учитывают
+        if any(result.values()):
+            rebuild_statistics_rollups()
 
+    if error:
+        result["error"] = error
+    return result
 
-def get_period_statistics(period_id: int) -> Dict:
-    """
-    Получить подробную статистику по тестовому периоду
 
-    :param period_id: ID тестового периода
-    :return: Словарь со статистикой
-    """
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-
-            stats = {}
-
-            # Информация о периоде
-            period = get_test_period(period_id)
-            if not period:
-                return {}
-            stats["period"] = period
+def init_archive_database():
+    """Создать таблицы логов в файле архива (если их нет)"""
+    archive_dir = os.path.dirname(ARCHIVE_DB_FILE)
+    if archive_dir and not os.path.exists(archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
 
-            # Всего запросов в периоде
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM query_logs WHERE period_id = ?",
-                (period_id,)
+    conn = sqlite3.connect(ARCHIVE_DB_FILE)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS query_logs (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                username TEXT,
+                query_text TEXT NOT NULL,
+                platform TEXT,
+                timestamp TIMESTAMP,
+                period_id INTEGER
             )
-            stats["total_queries"] = cursor.fetchone()["total"]
-
-            # Всего ответов
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM answer_logs WHERE period_id = ?",
-                (period_id,)
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS answer_logs (
+                id INTEGER PRIMARY KEY,
+                query_log_id INTEGER,
+                faq_id TEXT,
+                similarity_score REAL,
+                answer_shown TEXT,
+                search_level TEXT,
+                timestamp TIMESTAMP,
+                period_id INTEGER
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rating_logs (
+                id INTEGER PRIMARY KEY,
+                answer_log_id INTEGER,
+                user_id INTEGER NOT NULL,
+                rating TEXT NOT NULL,
+                timestamp TIMESTAMP,
+                period_id INTEGER
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_generations (
+                id INTEGER PRIMARY KEY,
+                answer_log_id INTEGER NOT NULL,
+                model TEXT,
+                chunks_used INTEGER,
+                chunks_data TEXT,
+                pii_detected INTEGER,
+                tokens_prompt INTEGER,
+                tokens_completion INTEGER,
+                tokens_total INTEGER,
+                finish_reason TEXT,
+                generation_time_ms INTEGER,
+                error_message TEXT,
+                created_at TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS latency_logs (
+                answer_log_id INTEGER PRIMARY KEY,
+                total_ms REAL NOT NULL,
+                stages TEXT NOT NULL,
+                created_at TIMESTAMP
             )
-            stats["total_answers"] = cursor.fetchone()["total"]
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_period ON query_logs(period_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_period ON answer_logs(period_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_answer_logs_query ON answer_logs(query_log_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_period ON rating_logs(period_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rating_logs_answer ON rating_logs(answer_log_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_generations_answer_log ON llm_generations(answer_log_id)")
+        conn.commit()
+    finally:
+        conn.close()
 
-            # Распределение по уровням поиска
-            cursor.execute("""
-                SELECT
-                    search_level,
-                    COUNT(*) as count,
-                    AVG(similarity_score) as avg_confidence
-                FROM answer_logs
-                WHERE period_id = ? AND search_level IS NOT NULL
-                GROUP BY search_level
-            """, (period_id,))
 
-            search_levels = {}
-            for row in cursor.fetchall():
-                search_levels[row['search_level']] = {
-                    'count': row['count'],
-                    'avg_confidence': round(row['avg_confidence'], 2) if row['avg_confidence'] else 0
-                }
-            stats["search_levels"] = search_levels
+def attach_archive_database(conn) -> bool:
+    """
+    Подключить файл архива к соединению как схему archive_db
 
-            # Средняя схожесть
-            cursor.execute(
-                "SELECT AVG(similarity_score) as avg_score FROM answer_logs WHERE period_id = ? AND similarity_score IS NOT NULL",
-                (period_id,)
-            )
-            result = cursor.fetchone()
-            stats["avg_similarity"] = round(result["avg_score"], 2) if result["avg_score"] else 0
+    :param conn: Соединение с основной БД (вне транзакции)
+    :return: True если файл архива существует и подключен
+    """
+    if not os.path.exists(ARCHIVE_DB_FILE):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive_db", (ARCHIVE_DB_FILE,))
+    return True
 
-            # Оценки
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM rating_logs WHERE period_id = ? AND rating = 'helpful'",
-                (period_id,)
-            )
-            stats["helpful_count"] = cursor.fetchone()["total"]
 
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM rating_logs WHERE period_id = ? AND rating = 'not_helpful'",
-                (period_id,)
-            )
-            stats["not_helpful_count"] = cursor.fetchone()["total"]
+def period_log_source(table: str, with_archive: bool) -> str:
+    """
+    Источник строк таблицы логов для запросов по периодам
 
-            # Процент полезных ответов
-            total_ratings = stats["helpful_count"] + stats["not_helpful_count"]
-            if total_ratings > 0:
-                stats["helpful_percentage"] = round((stats["helpful_count"] / total_ratings) * 100, 2)
-            else:
-                stats["helpful_percentage"] = 0
+    :param table: Имя таблицы логов из ARCHIVE_TABLE_COLUMNS
+    :param with_archive: Подключен ли archive_db (тогда строки объединяются с архивом)
+    :return: Имя таблицы или подзапрос UNION ALL
+    """
+    if not with_archive:
+        return table
+    columns = ", ".join(ARCHIVE_TABLE_COLUMNS[table])
+    return f"(SELECT {columns} FROM main.{table} UNION ALL SELECT {columns} FROM archive_db.{table})"
 
-            # Запросы без ответа
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT ql.id) as total
-                FROM query_logs ql
-                LEFT JOIN answer_logs al ON ql.id = al.query_log_id
-                WHERE ql.period_id = ?
-                  AND (al.faq_id IS NULL OR al.similarity_score < {SIMILARITY_THRESHOLD})
-                  AND (al.search_level IS NULL OR al.search_level NOT IN ('disambiguation_shown', 'disambiguation', 'clarification', 'direct'))
-            """, (period_id,))
-            stats["no_answer_count"] = cursor.fetchone()["total"]
 
-            # Топ-10 популярных запросов
-            cursor.execute("""
-                SELECT query_text, COUNT(*) as count
-                FROM query_logs
-                WHERE period_id = ?
-                GROUP BY query_text
-                ORDER BY count DESC
-                LIMIT 10
-            """, (period_id,))
-            stats["top_queries"] = [
-                {"query": row["query_text"], "count": row["count"]}
-                for row in cursor.fetchall()
-            ]
+def move_period_logs_to_archive_db(
+    period_id: int,
+    progress_callback=None,
+    batch_size: int = LOG_MAINTENANCE_BATCH_SIZE
+) -> Dict:
+    """
+    Перенести логи завершённого периода в отдельный файл архива (ARCHIVE_DB_FILE)
 
-            # Топ-10 FAQ с лучшими рейтингами
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.question,
-                    f.category,
-                    COUNT(*) as helpful_count
-                FROM rating_logs rl
-                JOIN answer_logs al ON rl.answer_log_id = al.id
-                JOIN faq f ON al.faq_id = f.id
-                WHERE rl.period_id = ? AND rl.rating = 'helpful'
-                GROUP BY f.id
-                ORDER BY helpful_count DESC
-                LIMIT 10
-            """, (period_id,))
-            stats["top_helpful_faqs"] = [
-                {
-                    "faq_id": row["id"],
-                    "question": row["question"],
-                    "category": row["category"],
-                    "helpful_count": row["helpful_count"]
-                }
-                for row in cursor.fetchall()
-            ]
+    Статистика и неудачные запросы периода продолжают читаться (с учётом архива),
+    но в списке логов админки перенесённые записи больше не показываются.
 
-            # FAQ с низкими оценками
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.question,
-                    f.category,
-                    COUNT(*) as not_helpful_count
-                FROM rating_logs rl
-                JOIN answer_logs al ON rl.answer_log_id = al.id
-                JOIN faq f ON al.faq_id = f.id
-                WHERE rl.period_id = ? AND rl.rating = 'not_helpful'
-                GROUP BY f.id
-                ORDER BY not_helpful_count DESC
-                LIMIT 10
-            """, (period_id,))
-            stats["need_improvement_faqs"] = [
-                {
-                    "faq_id": row["id"],
-                    "question": row["question"],
-                    "category": row["category"],
-                    "not_helpful_count": row["not_helpful_count"]
-                }
-                for row in cursor.fetchall()
-            ]
+    :param period_id: ID завершённого тестового периода
+    :param progress_callback: Функция (stage, processed, total) для отображения прогресса
+    :param batch_size: Размер порции
+    :return: Словарь с количеством перенесённых записей
+             (и ключом "error" при сбое - счётчики тогда частичные)
+    """
+    result = {"queries": 0, "answers": 0, "ratings": 0, "llm_generations": 0, "latency_logs": 0}
 
-            # Распределение по платформам
-            cursor.execute("""
-                SELECT platform, COUNT(*) as count
-                FROM query_logs
-                WHERE period_id = ?
-                GROUP BY platform
-            """, (period_id,))
-            stats["platforms"] = {
-                row["platform"]: row["count"]
-                for row in cursor.fetchall()
-            }
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-            # Динамика по дням
-            cursor.execute("""
-                SELECT
-                    DATE(timestamp) as date,
-                    COUNT(*) as queries_count
-                FROM query_logs
-                WHERE period_id = ?
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            """, (period_id,))
-            stats["daily_dynamics"] = [
-                {"date": row["date"], "count": row["queries_count"]}
-                for row in cursor.fetchall()
-            ]
+            cursor.execute("SELECT status FROM test_periods WHERE id = ?", (period_id,))
+            period = cursor.fetchone()
+            if not period:
+                print(f"Ошибка: тестовый период с ID {period_id} не найден")
+                return {**result, "error": f"Тестовый период с ID {period_id} не найден"}
+            if period["status"] != "completed":
+                print(f"Ошибка: переносить в архив можно только завершённый период (ID: {period_id})")
+                return {**result, "error": "Переносить в архив можно только завершённый период"}
+
+            totals = {}
+            for key, table in _PERIOD_LOG_TABLES:
+                cursor.execute(f"SELECT COUNT(*) as total FROM {table} WHERE period_id = ?", (period_id,))
+                totals[key] = cursor.fetchone()["total"]
+
+        init_archive_database()
+
+        for key, table in _PERIOD_LOG_TABLES:
+            columns = ", ".join(ARCHIVE_TABLE_COLUMNS[table])
+
+            while True:
+                with get_db_connection() as conn:
+                    # ATTACH нельзя выполнить внутри транзакции - подключаем до первой записи
+                    conn.execute("ATTACH DATABASE ? AS archive_db", (ARCHIVE_DB_FILE,))
+                    cursor = conn.cursor()
+
+                    cursor.execute(f"SELECT id FROM main.{table} WHERE period_id = ? LIMIT ?", (period_id, batch_size))
+                    ids = [row["id"] for row in cursor.fetchall()]
+                    if not ids:
+                        break
+
+                    placeholders = ", ".join("?" for _ in ids)
+
+                    # Вместе с ответами переносим метаданные RAG генерации
+                    if table == "answer_logs":
+                        llm_columns = ", ".join(ARCHIVE_TABLE_COLUMNS["llm_generations"])
+                        cursor.execute(f"""
+                            INSERT OR REPLACE INTO archive_db.llm_generations ({llm_columns})
+                            SELECT {llm_columns} FROM main.llm_generations WHERE answer_log_id IN ({placeholders})
+                        """, ids)
+                        cursor.execute(f"DELETE FROM main.llm_generations WHERE answer_log_id IN ({placeholders})", ids)
+                        result["llm_generations"] += cursor.rowcount
+
+                        latency_columns = ", ".join(ARCHIVE_TABLE_COLUMNS["latency_logs"])
+                        cursor.execute(f"""
+                            INSERT OR REPLACE INTO archive_db.latency_logs ({latency_columns})
+                            SELECT {latency_columns} FROM main.latency_logs WHERE answer_log_id IN ({placeholders})
+                        """, ids)
+                        cursor.execute(f"DELETE FROM main.latency_logs WHERE answer_log_id IN ({placeholders})", ids)
+                        result["latency_logs"] += cursor.rowcount
+
+                    cursor.execute(f"""
+                        INSERT OR REPLACE INTO archive_db.{table} ({columns})
+                        SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})
+                    """, ids)
+                    cursor.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+                    result[key] += cursor.rowcount
+
+                _report_progress(progress_callback, key, result[key], max(totals[key], result[key]))
+
+        print(
+            f"✅ Перенесено в архив {ARCHIVE_DB_FILE}: {result['queries']} запросов, "
+            f"{result['answers']} ответов, {result['ratings']} оценок"
+        )
+        return result
 
-            # Уникальные пользователи
-            cursor.execute(
-                "SELECT COUNT(DISTINCT user_id) as total FROM query_logs WHERE period_id = ?",
-                (period_id,)
-            )
-            stats["unique_users"] = cursor.fetchone()["total"]
+    except Exception as e:
+        print(f"Ошибка при переносе логов в файл архива: {e}")
+        result["error"] = str(e)
+        return result
 
-            # Неудачные запросы (для Excel отчета)
-            stats["failed_queries"] = get_failed_queries_for_period(period_id, limit=200)
 
-            return stats
+def get_period_statistics(period_id: int) -> Dict:
+    """
+    Получить подробную статистику по тестовому периоду
+
+    Счётчики берутся из роллапов периода, топы FAQ по оценкам и неудачные
+    запросы - из логов (src.core.statistics), для завершённых периодов
+    результат кэшируется.
 
+    :param period_id: ID тестового периода
+    :return: Словарь со статистикой
+    """
+    try:
+        from src.core import statistics
+        return statistics.get_period_statistics(period_id)
     except Exception as e:
         print(f"Ошибка при получении статистики периода: {e}")
         return {}
@@ -1778,6 +2636,7 @@ def get_failed_queries_for_period(period_id: int, limit: int = 100) -> List[Dict
     """
     try:
         with get_db_connection() as conn:
+            with_archive = attach_archive_database(conn)
             cursor = conn.cursor()
 
             cursor.execute(f"""
@@ -1791,10 +2650,10 @@ def get_failed_queries_for_period(period_id: int, limit: int = 100) -> List[Dict
                     al.faq_id,
                     f.question as faq_question,
                     rl.rating
-                FROM query_logs ql
-                LEFT JOIN answer_logs al ON ql.id = al.query_log_id
+                FROM {period_log_source("query_logs", with_archive)} ql
+                LEFT JOIN {period_log_source("answer_logs", with_archive)} al ON ql.id = al.query_log_id
                 LEFT JOIN faq f ON al.faq_id = f.id
-                LEFT JOIN rating_logs rl ON al.id = rl.answer_log_id
+                LEFT JOIN {period_log_source("rating_logs", with_archive)} rl ON al.id = rl.answer_log_id
                 WHERE ql.period_id = ?
                   AND (al.faq_id IS NULL OR al.similarity_score < {SIMILARITY_THRESHOLD} OR rl.rating = 'not_helpful')
                   AND (al.search_level IS NULL OR al.search_level NOT IN ('disambiguation_shown', 'disambiguation', 'clarification', 'direct'))
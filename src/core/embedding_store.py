@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Постоянное хранилище эмбеддингов документов
+
+Векторы хранятся вне ChromaDB: по одному файлу float32 на модель
+(читается через numpy.memmap) и SQLite индекс
+(model_name, sha256(текст)) -> номер строки в файле. При переобучении,
+в тестовых и бенчмарк-скриптах модель запускается только для новых
+или изменённых текстов.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Каталог хранилища (индекс и файлы векторов)
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "data/embeddings")
+
+_INDEX_FILE = "index.db"
+
+
+def text_hash(text: str) -> str:
+    """sha256 текста документа"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Хранилище эмбеддингов: memmap-файл float32 на модель + SQLite индекс
+
+    Файл векторов только дописывается; запись и обновление индекса идут
+    под BEGIN IMMEDIATE, поэтому несколько процессов (админка и скрипты)
+    не перепутают номера строк.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: Каталог хранилища (None - EMBEDDING_STORE_DIR)
+        """
+        self.directory = directory or EMBEDDING_STORE_DIR
+        self.index_path = os.path.join(self.directory, _INDEX_FILE)
+        self._lock = threading.Lock()
+        self._init_index()
+
+    @contextmanager
+    def _connect(self):
+        """Соединение с индексом (autocommit, транзакции открываются явно)"""
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_index(self):
+        """Создать каталог и таблицы индекса"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_files (
+                    model_name TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    rows INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model_name TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    PRIMARY KEY (model_name, text_hash)
+                ) WITHOUT ROWID
+            """)
+
+    def _vectors_path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def count(self, model_name: str) -> int:
+        """Количество сохранённых векторов модели"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT rows FROM embedding_files WHERE model_name = ?", (model_name,)
+            ).fetchone()
+            return row["rows"] if row else 0
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Получить сохранённые векторы
+
+        Args:
+            model_name: Имя модели эмбеддингов
+            texts: Тексты документов
+
+        Returns:
+            Список векторов в порядке texts (None для отсутствующих)
+        """
+        import numpy as np
+
+        result: List[Optional[List[float]]] = [None] * len(texts)
+        if not texts:
+            return result
+
+        hashes = [text_hash(text) for text in texts]
+
+        with self._connect() as conn:
+            info = conn.execute(
+                "SELECT file_name, dim, rows FROM embedding_files WHERE model_name = ?", (model_name,)
+            ).fetchone()
+            if not info or not info["rows"]:
+                return result
+
+            rows: Dict[str, int] = {}
+            unique = list(dict.fromkeys(hashes))
+            # Порциями, чтобы не упереться в лимит параметров SQLite
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                for row in conn.execute(
+                    f"SELECT text_hash, row_index FROM embeddings WHERE model_name = ? AND text_hash IN ({placeholders})",
+                    [model_name, *chunk]
+                ):
+                    rows[row["text_hash"]] = row["row_index"]
+
+        if not rows:
+            return result
+
+        vectors = np.memmap(
+            self._vectors_path(info["file_name"]),
+            dtype=np.float32,
+            mode="r",
+            shape=(info["rows"], info["dim"])
+        )
+        for i, hash_value in enumerate(hashes):
+            row_index = rows.get(hash_value)
+            if row_index is not None:
+                result[i] = vectors[row_index].tolist()
+        del vectors
+
+        return result
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> int:
+        """
+        Сохранить векторы (уже сохранённые тексты пропускаются)
+
+        Args:
+            model_name: Имя модели эмбеддингов
+            texts: Тексты документов
+            vectors: Векторы в порядке texts
+
+        Returns:
+            Количество добавленных векторов
+        """
+        import numpy as np
+
+        if not texts:
+            return 0
+
+        pending: Dict[str, Sequence[float]] = {}
+        for text, vector in zip(texts, vectors):
+            pending.setdefault(text_hash(text), vector)
+
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                hashes = list(pending)
+                for start in range(0, len(hashes), 500):
+                    chunk = hashes[start:start + 500]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    for row in conn.execute(
+                        f"SELECT text_hash FROM embeddings WHERE model_name = ? AND text_hash IN ({placeholders})",
+                        [model_name, *chunk]
+                    ):
+                        pending.pop(row["text_hash"], None)
+
+                if not pending:
+                    conn.execute("COMMIT")
+                    return 0
+
+                matrix = np.asarray(list(pending.values()), dtype=np.float32)
+                dim = matrix.shape[1]
+
+                info = conn.execute(
+                    "SELECT file_name, dim, rows FROM embedding_files WHERE model_name = ?", (model_name,)
+                ).fetchone()
+                if info:
+                    if info["dim"] != dim:
+                        raise ValueError(f"Размерность {dim} не совпадает с сохранённой ({info['dim']}) для {model_name}")
+                    file_name, rows = info["file_name"], info["rows"]
+                else:
+                    file_name, rows = f"{text_hash(model_name)[:16]}.f32", 0
+                    conn.execute(
+                        "INSERT INTO embedding_files (model_name, file_name, dim, rows) VALUES (?, ?, ?, 0)",
+                        (model_name, file_name, dim)
+                    )
+
+                # Хвост от прерванной записи (файл дописан, индекс не закоммичен) отрезаем
+                with open(self._vectors_path(file_name), "ab") as f:
+                    f.truncate(rows * dim * 4)
+                    f.write(matrix.tobytes())
+
+                conn.executemany(
+                    "INSERT INTO embeddings (model_name, text_hash, row_index) VALUES (?, ?, ?)",
+                    [(model_name, hash_value, rows + i) for i, hash_value in enumerate(pending)]
+                )
+                conn.execute(
+                    "UPDATE embedding_files SET rows = ? WHERE model_name = ?",
+                    (rows + len(pending), model_name)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        logger.debug(f"В хранилище эмбеддингов добавлено {len(pending)} векторов ({model_name})")
+        return len(pending)
+
+
+_store: Optional[EmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """Общий экземпляр хранилища в EMBEDDING_STORE_DIR"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EmbeddingStore()
+        return _store
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетный расчёт эмбеддингов для переобучения ChromaDB
+
+Вместо передачи всех документов в collection.add (эмбеддинг внутри Chroma
+с батчингом по умолчанию) документы кодируются явными батчами настраиваемого
+размера на всех ядрах CPU (intra-op потоки torch). Документы сортируются по
+длине, чтобы в батче было меньше паддинга. Готовые эмбеддинги передаются
+в Chroma через параметр embeddings.
+
+encode_documents_cached дополнительно берёт векторы неизменённых текстов
+из постоянного хранилища (src.core.embedding_store) и загружает модель,
+только если есть что кодировать.
+"""
+
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Размер батча модели при переобучении
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# Количество потоков torch (0 - все ядра)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Загруженные модели: model_name -> SentenceTransformer
+_models: Dict[str, object] = {}
+
+
+def configure_torch_threads(num_threads: int = EMBEDDING_THREADS) -> int:
+    """
+    Настроить число intra-op потоков torch
+
+    Args:
+        num_threads: Количество потоков (0 - все ядра)
+
+    Returns:
+        Установленное количество потоков
+    """
+    import torch
+
+    num_threads = num_threads or os.cpu_count() or 1
+    if torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+    return num_threads
+
+
+def get_embedding_model(embedding_function=None, model_name: Optional[str] = None):
+    """
+    Получить модель SentenceTransformer для пакетного кодирования
+
+    Если embedding_function Chroma уже загрузила модель, используется она
+    (чтобы не держать в памяти вторую копию), иначе модель загружается по имени.
+    OnnxEmbeddingFunction сама умеет encode и возвращается как есть.
+
+    Returns:
+        SentenceTransformer (или совместимый объект) или None, если модель получить не удалось
+    """
+    from src.core.onnx_embeddings import OnnxEmbeddingFunction
+
+    if isinstance(embedding_function, OnnxEmbeddingFunction):
+        return embedding_function
+
+    model = getattr(embedding_function, "_model", None)
+    if model is not None and hasattr(model, "encode"):
+        return model
+
+    if not model_name:
+        return None
+
+    if model_name not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[model_name] = SentenceTransformer(model_name)
+    return _models[model_name]
+
+
+def encode_documents(
+    model,
+    documents: List[str],
+    batch_size: Optional[int] = None,
+    num_threads: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> Tuple[List[List[float]], Dict]:
+    """
+    Закодировать документы батчами
+
+    Эмбеддинги совпадают с SentenceTransformerEmbeddingFunction
+    (без нормализации), поэтому запросы через коллекцию остаются совместимыми.
+
+    Args:
+        model: SentenceTransformer
+        documents: Тексты документов (с префиксом search_document:)
+        batch_size: Размер батча (None - EMBEDDING_BATCH_SIZE)
+        num_threads: Количество потоков torch (None - EMBEDDING_THREADS, 0 - все ядра)
+        progress_callback: Функция (processed, total) после каждого батча
+
+    Returns:
+        Tuple (embeddings, stats), embeddings в порядке documents;
+        stats: documents, batches, threads, batch_size, seconds, docs_per_sec, batch_seconds
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    threads = configure_torch_threads(EMBEDDING_THREADS if num_threads is None else num_threads)
+
+    # Близкие по длине документы в одном батче - меньше паддинга
+    order = sorted(range(len(documents)), key=lambda i: len(documents[i]))
+    embeddings: List[Optional[List[float]]] = [None] * len(documents)
+    batch_seconds = []
+
+    started = time.perf_counter()
+    total_batches = (len(order) + batch_size - 1) // batch_size
+
+    for batch_number, start in enumerate(range(0, len(order), batch_size), 1):
+        indices = order[start:start + batch_size]
+
+        batch_started = time.perf_counter()
+        vectors = model.encode(
+            [documents[i] for i in indices],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        elapsed = time.perf_counter() - batch_started
+        batch_seconds.append(round(elapsed, 4))
+
+        for i, vector in zip(indices, vectors):
+            embeddings[i] = vector.tolist()
+
+        logger.debug(
+            f"Батч {batch_number}/{total_batches}: {len(indices)} док. за {elapsed:.2f} с "
+            f"({len(indices) / elapsed if elapsed else 0:.1f} док/с)"
+        )
+        if progress_callback:
+            progress_callback(min(start + batch_size, len(order)), len(order))
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "documents": len(documents),
+        "batches": total_batches,
+        "threads": threads,
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "docs_per_sec": round(len(documents) / seconds, 1) if seconds else 0.0,
+        "batch_seconds": batch_seconds
+    }
+
+    if documents:
+        logger.info(
+            f"🧮 Эмбеддинги: {stats['documents']} док. за {stats['seconds']} с "
+            f"({stats['docs_per_sec']} док/с, батчей: {stats['batches']}, потоков: {threads})"
+        )
+    return embeddings, stats
+
+
+def encode_documents_cached(
+    model_loader: Callable[[], object],
+    model_name: str,
+    documents: List[str],
+    batch_size: Optional[int] = None,
+    num_threads: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    store=None
+) -> Tuple[List[List[float]], Dict]:
+    """
+    Закодировать документы, переиспользуя сохранённые векторы
+
+    Args:
+        model_loader: Функция без аргументов, возвращающая SentenceTransformer
+                      (вызывается, только если есть новые тексты)
+        model_name: Имя модели - часть ключа хранилища
+        documents: Тексты документов
+        batch_size: Размер батча (None - EMBEDDING_BATCH_SIZE)
+        num_threads: Количество потоков torch (None - EMBEDDING_THREADS)
+        progress_callback: Функция (processed, total) после каждого батча
+        store: EmbeddingStore (None - общий экземпляр)
+
+    Returns:
+        Tuple (embeddings, stats) как у encode_documents;
+        в stats дополнительно cache_hits и encoded
+    """
+    from src.core.embedding_store import get_embedding_store
+
+    try:
+        store = store or get_embedding_store()
+        embeddings = store.get_many(model_name, documents)
+    except Exception as e:
+        logger.warning(f"Хранилище эмбеддингов недоступно: {e}")
+        store = None
+        embeddings = [None] * len(documents)
+
+    missing = [i for i, vector in enumerate(embeddings) if vector is None]
+
+    if missing:
+        # Одинаковые тексты кодируем один раз
+        missing_documents = list(dict.fromkeys(documents[i] for i in missing))
+        vectors, stats = encode_documents(
+            model_loader(),
+            missing_documents,
+            batch_size=batch_size,
+            num_threads=num_threads,
+            progress_callback=progress_callback
+        )
+        encoded = dict(zip(missing_documents, vectors))
+        for i in missing:
+            embeddings[i] = encoded[documents[i]]
+
+        if store is not None:
+            try:
+                store.put_many(model_name, missing_documents, vectors)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить эмбеддинги в хранилище: {e}")
+    else:
+        stats = {
+            "documents": 0,
+            "batches": 0,
+            "threads": 0,
+            "batch_size": batch_size or EMBEDDING_BATCH_SIZE,
+            "seconds": 0.0,
+            "docs_per_sec": 0.0,
+            "batch_seconds": []
+        }
+
+    stats["encoded"] = len(missing)
+    stats["cache_hits"] = len(documents) - len(missing)
+    stats["documents"] = len(documents)
+    CACHE_REQUESTS.inc(stats["cache_hits"], cache="embedding_store", result="hit")
+    CACHE_REQUESTS.inc(len(missing), cache="embedding_store", result="miss")
+
+    if documents:
+        logger.info(f"💾 Эмбеддинги из хранилища: {stats['cache_hits']}/{len(documents)}")
+    return embeddings, stats
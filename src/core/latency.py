@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Замер времени этапов обработки запроса
+
+Обработчик бота открывает замер (track_latency), а функции поиска, RAG
+и логирования отмечают свои этапы через stage(имя). Текущий замер хранится
+в contextvars, поэтому его не нужно передавать через все функции: он виден
+и в asyncio.to_thread (контекст копируется в поток). Вне замера stage()
+ничего не делает.
+
+Результат - список этапов со сдвигом от начала запроса и длительностью;
+save_latency сохраняет его в latency_logs рядом с answer_logs, по нему
+строится водопад в логах админки и перцентили по этапам.
+
+При PROFILING_ENABLED=true замер ещё и собирает сэмплы стеков запроса
+(src/core/profiler.py): save_latency сохраняет профиль, если запрос
+не уложился в бюджет PROFILE_BUDGET_MS.
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from src.core.metrics import REQUEST_DURATION, STAGE_DURATION
+from src.core.profiler import (
+    PROFILE_BUDGET_MS, RequestProfile, profile_thread, save_profile, start_profile, stop_profile
+)
+
+# Этапы в порядке выполнения и их названия для админки
+LATENCY_STAGES = {
+    "normalize": "Нормализация",
+    "exact": "Точное совпадение",
+    "lemmatize": "Лемматизация",
+    "keyword_sql": "SQL по ключевым словам",
+    "warmup_wait": "Ожидание прогрева",
+    "embedding": "Эмбеддинг запроса",
+    "vector_query": "Векторный поиск",
+    "anonymize": "Анонимизация (RAG)",
+    "llm": "Запрос к LLM",
+    "deanonymize": "Деанонимизация",
+    "log_write": "Запись логов",
+    "send": "Отправка сообщения",
+}
+
+
+class LatencyTimer:
+    """Этапы одного запроса: имя, сдвиг от начала и длительность в мс"""
+
+    def __init__(self, profile: Optional[RequestProfile] = None):
+        self.started = time.perf_counter()
+        self.stages: List[Dict] = []
+        self.profile = profile
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замерить этап (повторяющиеся этапы записываются отдельно)"""
+        started = time.perf_counter()
+        try:
+            with profile_thread(self.profile):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages.append({
+                "stage": name,
+                "start_ms": round((started - self.started) * 1000, 2),
+                "ms": round(elapsed * 1000, 2)
+            })
+            STAGE_DURATION.observe(elapsed, stage=name)
+
+    def total_ms(self) -> float:
+        """Время с начала замера"""
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def as_dict(self) -> Dict:
+        """Снимок замера: total_ms и список этапов"""
+        return {"total_ms": self.total_ms(), "stages": list(self.stages)}
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+_current_timer: ContextVar[Optional[LatencyTimer]] = ContextVar("latency_timer", default=None)
+
+
+def current_timer() -> Optional[LatencyTimer]:
+    """Активный замер (None - вне track_latency)"""
+    return _current_timer.get()
+
+
+@contextmanager
+def track_latency():
+    """
+    Открыть замер запроса
+
+    Если замер уже открыт (например, find_answer внутри обработчика бота),
+    этапы пишутся в него, а не в новый.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        yield timer
+        return
+
+    timer = LatencyTimer(start_profile())
+    token = _current_timer.set(timer)
+    # Синхронный обработчик целиком работает на запрос, поток цикла событий - только в этапах
+    thread_id = threading.get_ident() if timer.profile is not None and not _in_event_loop() else None
+    if thread_id is not None:
+        timer.profile.attach(thread_id)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        if thread_id is not None:
+            timer.profile.detach(thread_id)
+        stop_profile(timer.profile)
+        REQUEST_DURATION.observe(time.perf_counter() - timer.started)
+
+
+@contextmanager
+def stage(name: str):
+    """Отметить этап в активном замере (без замера - ничего не делает)"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def stage_totals(stages: List[Dict]) -> Dict[str, float]:
+    """Суммарное время по этапам (повторы одного этапа складываются)"""
+    totals: Dict[str, float] = {}
+    for item in stages:
+        totals[item["stage"]] = round(totals.get(item["stage"], 0) + item["ms"], 2)
+    return totals
+
+
+def save_latency(answer_log_id: Optional[int]) -> bool:
+    """
+    Сохранить активный замер к записи answer_logs
+
+    Вызывается обработчиком после отправки ответа, чтобы в замер
+    попали запись логов и отправка сообщения. Медленный запрос при
+    включённом профилировании получает профиль по query_log_id.
+    """
+    timer = _current_timer.get()
+    if timer is None or not answer_log_id:
+        return False
+
+    from src.core.database import add_latency_log, get_answer_query_log_id
+    timings = timer.as_dict()
+    saved = add_latency_log(answer_log_id, timings)
+    if timer.profile is not None and timings["total_ms"] >= PROFILE_BUDGET_MS:
+        save_profile(timer.profile, get_answer_query_log_id(answer_log_id), timings["total_ms"])
+    return saved
@@ -6,6 +6,10 @@
 - Анонимизацию персональных данных перед отправкой в LLM
 - Генерацию ответов через OpenRouter API
 - Деанонимизацию ответов
+
+Ответы FAQ для контекста анонимизируются заранее при индексации
+(warm_faq_chunk_cache) и берутся из кэша по ID FAQ и хэшу содержимого,
+так что на запросе анонимизируется только вопрос пользователя.
 """
 
 import logging
@@ -15,10 +19,55 @@ from typing import List, Dict, Optional, Tuple
 from openai import OpenAI
 from datetime import datetime
 
-from src.core.pii_anonymizer import PiiAnonymizer
+from src.core.latency import stage
+from src.core.metrics import LLM_DURATION, LLM_REQUESTS, LLM_TOKENS
+from src.core.pii_anonymizer import (
+    PII_NER_INDEX_ENABLED,
+    PII_NER_QUERY_BUDGET_MS,
+    PII_NER_QUERY_ENABLED,
+    AnonymizedChunkCache,
+    PiiAnonymizer,
+    merge_anonymized,
+)
 
 logger = logging.getLogger(__name__)
 
+# Анонимизированные тексты FAQ для RAG-контекста (общие для всех LLMService процесса),
+# с PII_NER_INDEX_ENABLED дополнительно размечаются NER в фоне
+FAQ_CHUNK_CACHE = AnonymizedChunkCache("pii_faq_chunks", ner=PII_NER_INDEX_ENABLED)
+
+
+def faq_chunk_text(question: str, answer: str) -> str:
+    """Текст FAQ в контексте LLM (анонимизируется и кэшируется целиком)"""
+    return f"Вопрос: {question}\nОтвет: {answer}\n"
+
+
+def warm_faq_chunk_cache(faqs: Optional[List[Dict]] = None) -> int:
+    """
+    Анонимизировать ответы FAQ заранее (при загрузке или перезагрузке индекса)
+
+    Args:
+        faqs: Список FAQ (None - загрузить из БД)
+
+    Returns:
+        Количество заново анонимизированных FAQ
+    """
+    try:
+        if faqs is None:
+            from src.core.database import get_all_faqs
+            faqs = get_all_faqs()
+
+        started = time.perf_counter()
+        anonymized = FAQ_CHUNK_CACHE.warm(
+            (str(faq["id"]), faq_chunk_text(faq["question"], faq["answer"])) for faq in faqs
+        )
+        logger.info(f"✅ Кэш анонимизированных FAQ: {len(FAQ_CHUNK_CACHE)} записей, "
+                    f"обновлено {anonymized} за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return anonymized
+    except Exception as e:
+        logger.error(f"❌ Ошибка подготовки кэша анонимизированных FAQ: {e}", exc_info=True)
+        return 0
+
 
 class LLMService:
     """
@@ -31,7 +80,7 @@ class LLMService:
         self,
         api_key: Optional[str] = None,
         model: Optional[str] = None,
-        base_url: str = "https://openrouter.ai/api/v1"
+        base_url: Optional[str] = None
     ):
         """
         Инициализация LLM сервиса
@@ -39,7 +88,7 @@ class LLMService:
         Args:
             api_key: OpenRouter API ключ (если None - берется из OPENROUTER_API_KEY)
             model: Название модели (если None - берется из OPENROUTER_MODEL или используется дефолт)
-            base_url: Base URL для OpenRouter API
+            base_url: Base URL для OpenRouter API (если None - берется из OPENROUTER_BASE_URL)
         """
         # API ключ
         self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
@@ -59,11 +108,14 @@ class LLMService:
         # Инициализируем OpenAI клиент (совместим с OpenRouter)
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url=base_url
+            base_url=base_url or os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
         )
 
         # Анонимайзер
         self.anonymizer = PiiAnonymizer()
+        if PII_NER_QUERY_ENABLED:
+            # Модель NER загружается в фоне, до загрузки вопросы идут без NER
+            self.anonymizer.load_ner_async()
 
         # Кэш системного промпта (загружается при старте и обновляется через reload_prompt)
         self._system_prompt_cache = None
@@ -92,12 +144,13 @@ class LLMService:
             self.reload_prompt()
         return self._system_prompt_cache
 
-    def _prepare_context(self, chunks: List[Dict]) -> str:
+    def _prepare_context(self, chunks: List[Dict], texts: List[str]) -> str:
         """
         Подготовка контекста из найденных чанков
 
         Args:
             chunks: Список словарей с полями: question, answer, confidence
+            texts: Анонимизированные тексты чанков (faq_chunk_text) в том же порядке
 
         Returns:
             Объединенный контекст для LLM
@@ -107,17 +160,11 @@ class LLMService:
 
         context_parts = []
 
-        for i, chunk in enumerate(chunks, 1):
-            question = chunk.get('question', '')
-            answer = chunk.get('answer', '')
+        for i, (chunk, text) in enumerate(zip(chunks, texts), 1):
             confidence = chunk.get('confidence', 0)
 
             # Форматируем каждый чанк
-            context_parts.append(
-                f"Документ {i} (релевантность: {confidence:.1f}%):\n"
-                f"Вопрос: {question}\n"
-                f"Ответ: {answer}\n"
-            )
+            context_parts.append(f"Документ {i} (релевантность: {confidence:.1f}%):\n{text}")
 
         context = "\n---\n".join(context_parts)
 
@@ -136,8 +183,8 @@ class LLMService:
         Генерация ответа через LLM с анонимизацией PII
 
         Процесс:
-        1. Подготовка контекста из чанков
-        2. Анонимизация контекста и вопроса
+        1. Анонимизация: чанки FAQ из кэша, вопрос - на запросе
+        2. Подготовка контекста из чанков
         3. Запрос к LLM
         4. Деанонимизация ответа
 
@@ -153,6 +200,7 @@ class LLMService:
             - answer: Сгенерированный ответ (деанонимизированный)
             - metadata: Метаданные генерации (модель, токены, анонимизация и т.д.)
         """
+        started = time.perf_counter()
         try:
             logger.info(f"🤖 RAG генерация ответа для вопроса: '{user_question}'")
             logger.debug(f"Получено {len(db_chunks)} чанков из базы данных")
@@ -166,30 +214,39 @@ class LLMService:
             # Собираем финальный промпт с датой
             full_system_prompt = f"СЕГОДНЯШНЯЯ ДАТА: {current_date_str}\n\n{system_prompt}"
 
-            # Шаг 1: Подготовка контекста
-            context = self._prepare_context(db_chunks)
-
-            if not context:
+            if not db_chunks:
                 logger.warning("Контекст пуст! Возвращаем fallback ответ.")
+                LLM_REQUESTS.inc(model=self.model, status="empty_context")
                 return (
                     "К сожалению, я не нашел информации по этому вопросу в базе знаний.",
                     {"error": "empty_context"}
                 )
 
-            # Шаг 2: Анонимизация контекста
-            logger.debug("Анонимизация контекста...")
-            anonymized_context, context_mapping = self.anonymizer.anonymize(context)
-
-            # Шаг 3: Анонимизация вопроса
-            logger.debug("Анонимизация вопроса...")
-            anonymized_question, question_mapping = self.anonymizer.anonymize(user_question)
-
-            # Объединяем маппинги
-            combined_mapping = {**context_mapping, **question_mapping}
+            # Шаг 1: Анонимизация - чанки FAQ из кэша (анонимизированы при индексации),
+            # вопрос - на запросе (NER - только в пределах бюджета);
+            # placeholder'ы перенумеровываются в общий маппинг
+            logger.debug("Анонимизация контекста и вопроса...")
+            with stage("anonymize"):
+                parts = [
+                    FAQ_CHUNK_CACHE.get(
+                        str(chunk['faq_id']) if chunk.get('faq_id') else None,
+                        faq_chunk_text(chunk.get('question', ''), chunk.get('answer', ''))
+                    )
+                    for chunk in db_chunks
+                ]
+                question_entities = None
+                if PII_NER_QUERY_ENABLED:
+                    question_entities = self.anonymizer.find_entities_within(user_question, PII_NER_QUERY_BUDGET_MS)
+                parts.append(self.anonymizer.anonymize_context(user_question, question_entities))
+                texts, combined_mapping = merge_anonymized(parts)
+
+            # Шаг 2: Подготовка контекста
+            anonymized_context = self._prepare_context(db_chunks, texts[:-1])
+            anonymized_question = texts[-1]
 
             logger.info(f"Анонимизация завершена. Найдено PII: {len(combined_mapping)} сущностей")
 
-            # Шаг 4: Формируем запрос к LLM
+            # Шаг 3: Формируем запрос к LLM
             messages = [
                 {"role": "system", "content": full_system_prompt}, 
                 {"role": "user", "content": f"КОНТЕКСТ:\n{anonymized_context}\n\nВОПРОС: {anonymized_question}"}
@@ -197,19 +254,20 @@ class LLMService:
 
             logger.debug(f"Запрос к LLM модели: {self.model}")
 
-            # Шаг 5: Запрос к OpenRouter с retry механизмом
+            # Шаг 4: Запрос к OpenRouter с retry механизмом
             retry_delay = self.retry_delay  # начальная задержка
 
             for attempt in range(1, self.max_retries + 1):
                 try:
                     logger.debug(f"Попытка {attempt}/{self.max_retries} подключения к OpenRouter...")
 
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=max_tokens,
-                        temperature=temperature
-                    )
+                    with stage("llm"):
+                        response = self.client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            temperature=temperature
+                        )
 
                     logger.debug(f"✅ Успешное подключение на попытке {attempt}")
                     break  # Успех, выходим из цикла
@@ -233,9 +291,10 @@ class LLMService:
 
             logger.debug(f"Получен ответ от LLM (длина: {len(anonymized_answer)} символов)")
 
-            # Шаг 6: Деанонимизация ответа
+            # Шаг 5: Деанонимизация ответа
             logger.debug("Деанонимизация ответа...")
-            final_answer = self.anonymizer.deanonymize(anonymized_answer, combined_mapping)
+            with stage("deanonymize"):
+                final_answer = self.anonymizer.deanonymize(anonymized_answer, combined_mapping)
 
             # Метаданные
             metadata = {
@@ -252,10 +311,18 @@ class LLMService:
 
             logger.info(f"✅ RAG генерация успешна. Токенов: {metadata['tokens_used']['total']}, PII: {metadata['pii_found']}")
 
+            LLM_REQUESTS.inc(model=self.model, status="success")
+            LLM_DURATION.observe(time.perf_counter() - started, model=self.model)
+            for kind in ("prompt", "completion"):
+                if metadata["tokens_used"][kind] is not None:
+                    LLM_TOKENS.observe(metadata["tokens_used"][kind], kind=kind)
+
             return final_answer, metadata
 
         except Exception as e:
             logger.error(f"Ошибка RAG генерации: {e}", exc_info=True)
+            LLM_REQUESTS.inc(model=self.model, status="error")
+            LLM_DURATION.observe(time.perf_counter() - started, model=self.model)
             return (
                 "😔 Извините, произошла ошибка при генерации ответа. Попробуйте позже.",
                 {"error": str(e)}
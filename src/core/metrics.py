@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики сервисов в формате Prometheus
+
+Лёгкий реестр в памяти процесса (без prometheus_client): счётчики, gauge
+и гистограммы с метками. Каждый сервис - веб-админка, Bitrix24 бот и
+Flask сервер Telegram бота - отдаёт метрики своего процесса на /metrics
+(текстовый формат 0.0.4), подключение - register_flask_metrics(app).
+
+Общие метрики объявлены здесь и пишутся из модулей, где происходит
+событие: поиск, этапы запроса (src.core.latency), LLM, кэши, SQLite,
+прогрев модели. Значения, которые дешевле прочитать в момент запроса
+(глубина очередей), задаются функцией через Gauge.set_function.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Отдавать /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Границы гистограмм времени (секунды) и токенов
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """Строки метрики: (имя, метки, значение)"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонный счётчик"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение (или функция, которая его вычисляет при выгрузке)"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[tuple, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """Вычислять значение при каждой выгрузке метрик"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, func in functions.items():
+            try:
+                values[key] = float(func())
+            except Exception:
+                # Источник недоступен (например, приложение ещё не запущено)
+                values.pop(key, None)
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными корзинами, суммой и количеством"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items())
+
+        result = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                result.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.labelnames + ("le",), key + ("+Inf",))
+            result.append((f"{self.name}_bucket", labels, state["count"]))
+            plain = _format_labels(self.labelnames, key)
+            result.append((f"{self.name}_sum", plain, state["sum"]))
+            result.append((f"{self.name}_count", plain, state["count"]))
+        return result
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса; повторное объявление возвращает ту же метрику"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Tuple[str, ...], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Метрика {name} уже объявлена с другим типом или метками")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ---------- Общие метрики ----------
+
+SEARCH_REQUESTS = REGISTRY.counter(
+    "faq_search_requests_total", "Запросы каскадного поиска по уровню ответа", ("search_level",)
+)
+SEARCH_DURATION = REGISTRY.histogram(
+    "faq_search_duration_seconds", "Время каскадного поиска по уровню ответа", ("search_level",)
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "faq_request_duration_seconds", "Полное время обработки сообщения пользователя"
+)
+STAGE_DURATION = REGISTRY.histogram(
+    "faq_request_stage_duration_seconds", "Время этапов обработки запроса", ("stage",)
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "faq_llm_requests_total", "RAG генерации по модели и результату", ("model", "status")
+)
+LLM_DURATION = REGISTRY.histogram(
+    "faq_llm_duration_seconds", "Время RAG генерации (анонимизация, LLM, деанонимизация)", ("model",)
+)
+LLM_TOKENS = REGISTRY.histogram(
+    "faq_llm_tokens", "Токены на одну RAG генерацию", ("kind",), buckets=TOKEN_BUCKETS
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "faq_cache_requests_total", "Обращения к кэшам (hit/miss)", ("cache", "result")
+)
+PII_NER_REQUESTS = REGISTRY.counter(
+    "faq_pii_ner_total", "NER анонимизация текстов по источнику (index/query) и результату", ("source", "status")
+)
+SQLITE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQLITE_CONNECTION_DURATION = REGISTRY.histogram(
+    "faq_sqlite_connection_seconds",
+    "Время удержания соединения с SQLite от открытия до commit (включая чтения и работу Python внутри)",
+    buckets=SQLITE_BUCKETS
+)
+SQLITE_WRITE_LOCK_WAIT = REGISTRY.histogram(
+    "faq_sqlite_write_lock_wait_seconds",
+    "Ожидание блокировки записи SQLite (BEGIN IMMEDIATE в транзакциях записи логов и обслуживания логов)",
+    buckets=SQLITE_BUCKETS
+)
+SQLITE_LOCK_ERRORS = REGISTRY.counter(
+    "faq_sqlite_lock_errors_total", "Ошибки 'database is locked' после истечения busy timeout"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "faq_queue_depth", "Глубина очередей обработки", ("queue",)
+)
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    "faq_model_load_seconds", "Время загрузки модели эмбеддингов и коллекции", ("name",)
+)
+MODEL_READY = REGISTRY.gauge(
+    "faq_model_ready", "Модель загружена (1) или нет (0)", ("name",)
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "faq_http_requests_total", "HTTP запросы к сервису", ("method", "endpoint", "status")
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "faq_http_request_duration_seconds", "Время обработки HTTP запросов", ("endpoint",)
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Отметить попадание или промах кэша"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def register_flask_metrics(app, service: str, queue_depths: Optional[Dict[str, Callable[[], float]]] = None):
+    """
+    Подключить метрики HTTP запросов и маршрут /metrics к Flask приложению
+
+    Args:
+        app: Flask приложение
+        service: Имя сервиса (метка faq_service_info)
+        queue_depths: Функции глубины очередей {имя очереди: функция}
+    """
+    from flask import Response, g, request
+
+    REGISTRY.gauge("faq_service_info", "Сервис, отдающий метрики", ("service",)).set(1, service=service)
+    REGISTRY.gauge("faq_process_start_time_seconds", "Время запуска процесса (unix time)").set(time.time())
+
+    in_flight = REGISTRY.gauge("faq_http_requests_in_flight", "HTTP запросы в обработке")
+    QUEUE_DEPTH.set_function(lambda: in_flight.value(), queue="http_in_flight")
+    for queue, func in (queue_depths or {}).items():
+        QUEUE_DEPTH.set_function(func, queue=queue)
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_started = time.perf_counter()
+        in_flight.inc()
+
+    @app.after_request
+    def _metrics_finish(response):
+        started = g.pop("_metrics_started", None)
+        if started is not None:
+            in_flight.dec()
+            # Шаблон маршрута, а не путь - ограниченное число меток
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            if endpoint != "/metrics":
+                HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+                HTTP_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        # after_request не вызывается при необработанном исключении
+        if g.pop("_metrics_started", None) is not None:
+            in_flight.dec()
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+            HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=500)
+
+    if METRICS_ENABLED:
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            """Метрики процесса в формате Prometheus"""
+            return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime путь для эмбеддингов sentence-transformers
+
+Контейнеры работают только на CPU, и каждый запрос - полный проход PyTorch
+модели. При EMBEDDING_RUNTIME=onnx трансформер модели экспортируется в ONNX
+(один раз, в ONNX_MODEL_DIR), веса динамически квантуются в int8, а запросы
+и документы кодируются через onnxruntime. Пулинг (mean/cls) и нормализация
+берутся из конфигурации SentenceTransformer, поэтому векторы совпадают
+с torch путём с точностью до квантования.
+
+OnnxEmbeddingFunction реализует тот же интерфейс функции эмбеддингов Chroma,
+что и SentenceTransformerEmbeddingFunction, и подставляется вместо неё
+через create_embedding_function.
+
+Зависимости: onnxruntime (ставится вместе с chromadb), для экспорта
+и квантования - onnx, torch и sentence-transformers.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Движок эмбеддингов: torch (SentenceTransformer) | onnx (onnxruntime)
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch").lower()
+
+EMBEDDING_RUNTIMES = ("torch", "onnx")
+
+# Каталог экспортированных ONNX моделей
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "data/onnx_models")
+
+# Динамическое int8 квантование весов ONNX модели
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"
+
+# Размер батча onnxruntime при кодировании
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+_CONFIG_FILE = "onnx_config.json"
+_FLOAT_MODEL_FILE = "model.onnx"
+_INT8_MODEL_FILE = "model_int8.onnx"
+
+if EMBEDDING_RUNTIME not in EMBEDDING_RUNTIMES:
+    logger.warning(f"Неизвестный EMBEDDING_RUNTIME={EMBEDDING_RUNTIME}, используется torch")
+    EMBEDDING_RUNTIME = "torch"
+
+_export_lock = threading.Lock()
+
+
+def onnx_model_path(model_name: str, directory: Optional[str] = None) -> str:
+    """Каталог экспортированной модели"""
+    return os.path.join(directory or ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, directory: Optional[str] = None, force: bool = False) -> str:
+    """
+    Экспортировать трансформер модели в ONNX и квантовать в int8
+
+    Поддерживаются модели из Transformer + Pooling (mean или cls)
+    + необязательный Normalize - как paraphrase-multilingual-MiniLM-L12-v2
+    и deepvk/USER2-base.
+
+    Args:
+        model_name: Имя модели SentenceTransformer
+        directory: Каталог моделей (None - ONNX_MODEL_DIR)
+        force: Экспортировать заново, даже если модель уже есть
+
+    Returns:
+        Каталог экспортированной модели
+    """
+    target = onnx_model_path(model_name, directory)
+    config_path = os.path.join(target, _CONFIG_FILE)
+
+    with _export_lock:
+        if os.path.exists(config_path) and not force:
+            return target
+
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        started = time.perf_counter()
+        logger.info(f"📦 Экспорт {model_name} в ONNX...")
+
+        model = SentenceTransformer(model_name, device="cpu")
+        modules = [type(module).__name__ for module in model]
+        unsupported = [name for name in modules if name not in ("Transformer", "Pooling", "Normalize")]
+        if unsupported:
+            raise ValueError(f"Модули {', '.join(unsupported)} не поддерживаются ONNX экспортом")
+
+        transformer = model[0]
+        pooling = next((module for module in model if type(module).__name__ == "Pooling"), None)
+        if pooling is None or pooling.pooling_mode_mean_tokens:
+            pooling_mode = "mean"
+        elif pooling.pooling_mode_cls_token:
+            pooling_mode = "cls"
+        else:
+            raise ValueError(f"Пулинг {pooling.get_pooling_mode_str()} не поддерживается ONNX экспортом")
+
+        tokenizer = transformer.tokenizer
+        sample = tokenizer(["search_query: пример запроса"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _HiddenStates(torch.nn.Module):
+            """Трансформер с позиционными входами и last_hidden_state на выходе"""
+
+            def __init__(self, auto_model):
+                super().__init__()
+                self.auto_model = auto_model
+
+            def forward(self, *inputs):
+                return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+        os.makedirs(target, exist_ok=True)
+        float_path = os.path.join(target, _FLOAT_MODEL_FILE)
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        wrapper = _HiddenStates(transformer.auto_model).eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                wrapper,
+                tuple(sample[name] for name in input_names),
+                float_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(float_path, os.path.join(target, _INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+
+        tokenizer.save_pretrained(target)
+
+        # Конфигурация пишется последней - по ней определяется, что экспорт завершён
+        config = {
+            "model_name": model_name,
+            "input_names": input_names,
+            "pooling": pooling_mode,
+            "normalize": "Normalize" in modules,
+            "max_seq_length": model.max_seq_length
+        }
+        tmp_path = f"{config_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, config_path)
+
+        logger.info(f"✅ ONNX модель {model_name} экспортирована за {time.perf_counter() - started:.1f} с: {target}")
+        return target
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Функция эмбеддингов Chroma на onnxruntime
+
+    Называется так же, как SentenceTransformerEmbeddingFunction, и отдаёт
+    ту же конфигурацию: модель и пространство векторов те же, поэтому
+    коллекции, созданные с torch функцией, открываются без конфликта,
+    а без onnxruntime Chroma восстановит обычную функцию по конфигурации.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        directory: Optional[str] = None,
+        quantize: bool = ONNX_QUANTIZE,
+        num_threads: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ):
+        """
+        Args:
+            model_name: Имя модели SentenceTransformer
+            directory: Каталог моделей (None - ONNX_MODEL_DIR)
+            quantize: Использовать int8 модель
+            num_threads: Потоки onnxruntime (None - EMBEDDING_THREADS, 0 - все ядра)
+            batch_size: Размер батча (None - ONNX_BATCH_SIZE)
+        """
+        self.model_name = model_name
+        self.directory = directory
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.batch_size = batch_size or ONNX_BATCH_SIZE
+        self._session = None
+        self._tokenizer = None
+        self._config: Dict[str, Any] = {}
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        """Экспортировать (при необходимости) и загрузить модель"""
+        with self._load_lock:
+            if self._session is not None:
+                return
+
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+            from src.core.embeddings import EMBEDDING_THREADS
+
+            target = export_onnx_model(self.model_name, self.directory)
+            with open(os.path.join(target, _CONFIG_FILE), encoding="utf-8") as f:
+                config = json.load(f)
+
+            num_threads = EMBEDDING_THREADS if self.num_threads is None else self.num_threads
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = num_threads or os.cpu_count() or 1
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+            model_file = _INT8_MODEL_FILE if self.quantize else _FLOAT_MODEL_FILE
+            self._tokenizer = AutoTokenizer.from_pretrained(target)
+            self._config = config
+            self._session = ort.InferenceSession(
+                os.path.join(target, model_file),
+                sess_options=options,
+                providers=["CPUExecutionProvider"]
+            )
+            logger.info(f"✅ ONNX модель загружена: {self.model_name} ({model_file}, потоков: {options.intra_op_num_threads})")
+
+    def _encode_batch(self, texts: List[str]):
+        """Закодировать один батч: токенизация, трансформер, пулинг"""
+        import numpy as np
+
+        encoded = self._tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self._config["max_seq_length"],
+            return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in self._config["input_names"]}
+        hidden = self._session.run(None, inputs)[0]
+
+        if self._config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self._config["normalize"]:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.clip(norms, 1e-12, None)
+
+        return vectors.astype(np.float32)
+
+    def encode(self, sentences: List[str], batch_size: Optional[int] = None, **kwargs):
+        """
+        Закодировать тексты (совместимо с SentenceTransformer.encode)
+
+        Используется пакетным пайплайном переобучения (src.core.embeddings);
+        остальные аргументы SentenceTransformer.encode игнорируются.
+
+        Returns:
+            numpy массив (len(sentences), dim)
+        """
+        import numpy as np
+
+        if self._session is None:
+            self._load()
+
+        batch_size = batch_size or self.batch_size
+        # Близкие по длине тексты в одном батче - меньше паддинга
+        order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+        result = [None] * len(sentences)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            for i, vector in zip(indices, self._encode_batch([sentences[i] for i in indices])):
+                result[i] = vector
+
+        return np.stack(result) if result else np.zeros((0, 0), dtype=np.float32)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return list(self.encode(list(input)))
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def default_space(self):
+        return "cosine"
+
+    def supported_spaces(self):
+        return ["cosine", "l2", "ip"]
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "OnnxEmbeddingFunction":
+        return OnnxEmbeddingFunction(model_name=config["model_name"])
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "device": "cpu",
+            "normalize_embeddings": False,
+            "kwargs": {}
+        }
+
+
+def create_embedding_function(model_name: str):
+    """
+    Функция эмбеддингов для коллекций согласно EMBEDDING_RUNTIME
+
+    Returns:
+        OnnxEmbeddingFunction или SentenceTransformerEmbeddingFunction
+    """
+    if EMBEDDING_RUNTIME == "onnx":
+        return OnnxEmbeddingFunction(model_name=model_name)
+
+    from chromadb.utils import embedding_functions
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
+
+
+def embedding_model_key(model_name: str) -> str:
+    """
+    Идентификатор векторов модели с учётом движка
+
+    Используется как ключ хранилища эмбеддингов и метаданные embedding_model
+    коллекции: int8 векторы не смешиваются с float32, а смена движка
+    пересобирает коллекцию.
+    """
+    if EMBEDDING_RUNTIME == "onnx":
+        return f"{model_name}@onnx{'-int8' if ONNX_QUANTIZE else ''}"
+    return model_name
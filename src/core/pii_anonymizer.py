@@ -6,43 +6,209 @@
 1. Regex: Email и Телефоны
 2. NER (natasha): Имена (PER), Локации (LOC), Организации (ORG)
 
+NER медленный и загружает модель navec, поэтому на горячем пути не
+выполняется: сущности FAQ находит фоновый поток при индексации
+(PII_NER_INDEX_ENABLED, кэш по хэшу содержимого), а вопрос пользователя
+проходит NER только в пределах бюджета PII_NER_QUERY_BUDGET_MS
+(PII_NER_QUERY_ENABLED). Не уложились - остаётся regex-анонимизация.
+
 Поддерживает деанонимизацию ответов от LLM.
+
+Анонимизатор не хранит состояние вызова: anonymize_context возвращает
+неизменяемый AnonymizationContext (текст и маппинг), поэтому один
+PiiAnonymizer можно использовать из нескольких потоков одновременно.
+
+Неизменные тексты (ответы FAQ для RAG-контекста) анонимизируются один раз:
+AnonymizedChunkCache хранит их с локальными маппингами по ключу и хэшу
+содержимого, а merge_anonymized собирает запрос из нескольких частей,
+перенумеровывая placeholder'ы в общий маппинг.
 """
 
+import os
 import re
+import queue
+import hashlib
 import logging
-from typing import Dict, Tuple, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from src.core.metrics import PII_NER_REQUESTS, record_cache
 
 logger = logging.getLogger(__name__)
 
+# NER вне горячего пути
+PII_NER_INDEX_ENABLED = os.getenv("PII_NER_INDEX_ENABLED", "false").lower() == "true"
+PII_NER_QUERY_ENABLED = os.getenv("PII_NER_QUERY_ENABLED", "false").lower() == "true"
+PII_NER_QUERY_BUDGET_MS = float(os.getenv("PII_NER_QUERY_BUDGET_MS", "150"))
 
-class PiiAnonymizer:
+# Сущность NER: (start, stop, тип) в исходном тексте
+Entity = Tuple[int, int, str]
+
+# Типы natasha, которые анонимизируются
+_NER_TYPES = frozenset({'PER', 'LOC', 'ORG'})
+
+# NER вопросов в пределах бюджета: не больше _NER_QUERY_SLOTS одновременно,
+# остальные запросы обходятся regex (вызов NER нельзя прервать по таймауту)
+_NER_QUERY_SLOTS = 2
+_ner_executor = ThreadPoolExecutor(max_workers=_NER_QUERY_SLOTS, thread_name_prefix="pii-ner")
+_ner_slots = threading.BoundedSemaphore(_NER_QUERY_SLOTS)
+
+# Email (упрощенный, но покрывает большинство случаев)
+_EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+_EMAIL_LOCAL_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._%+-")
+_EMAIL_DOMAIN_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.-|")
+
+
+def _find_emails(text: str, pos: int, endpos: int):
     """
-    Класс для анонимизации и деанонимизации персональных данных
+    Email в text[pos:endpos] - то же, что _EMAIL_PATTERN.finditer
 
-    Privacy First подход: маскирование PII перед отправкой в облачную LLM
+    Regex проверяется только в окрестности каждого '@' (локальная часть
+    до него и домен после), а не с каждой позиции текста: в каждом email
+    ровно один '@', и совпадение не выходит за эти границы.
     """
+    at = text.find('@', pos, endpos)
+    while at != -1:
+        # Как и finditer, следующее совпадение ищется после предыдущего
+        start = at
+        while start > pos and text[start - 1] in _EMAIL_LOCAL_CHARS:
+            start -= 1
+        end = at + 1
+        while end < endpos and text[end] in _EMAIL_DOMAIN_CHARS:
+            end += 1
+        # Символ после домена нужен для проверки \b
+        match = _EMAIL_PATTERN.search(text, start, min(end + 1, endpos))
+        if match:
+            yield match
+            pos = match.end()
+        at = text.find('@', at + 1, endpos)
+
+
+# Паттерны PII в порядке приоритета: (тип, поиск совпадений, быстрая проверка текста)
+# Поиск вызывается как finditer(text, pos, endpos), быстрая проверка пропускает
+# паттерн, если в тексте заведомо нет совпадений
+_PII_PATTERNS = [
+    # BB-код URL: [URL=...]...[/URL] (non-greedy, чтобы не захватить несколько тегов сразу).
+    # Защищает ссылки на профили сотрудников, имена в тексте ссылки и внутренние URL
+    ('URL', re.compile(r'\[URL=.*?\].*?\[/URL\]', re.IGNORECASE).finditer, lambda text: '[' in text),
+    ('EMAIL', _find_emails, None),
+    # Российские телефоны:
+    # +7 (999) 123-45-67 или +7 999 123-45-67
+    ('PHONE', re.compile(r'\+7\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}').finditer, lambda text: '+7' in text),
+    # 8 (999) 123-45-67 или 8 999 123-45-67
+    ('PHONE', re.compile(r'8\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}').finditer, lambda text: '8' in text),
+    # +79991234567 или 89991234567 (= [+]?[78]\d{10}, но без необязательного
+    # первого символа regex быстрее находит начало совпадения)
+    ('PHONE', re.compile(r'(?:\+[78]|[78])\d{10}').finditer, None),
+]
+
+# Placeholder вида [EMAIL_1] (деанонимизация одним проходом)
+_PLACEHOLDER_PATTERN = re.compile(r'\[[A-Z]+_\d+\]')
+
+
+def _deanonymize(text: str, mapping: Mapping[str, str]) -> str:
+    """Заменить placeholder'ы реальными значениями"""
+    # Все placeholder'ы [TYPE_N] заменяются одним проходом regex
+    # (незнакомые оставляются как есть)
+    result = _PLACEHOLDER_PATTERN.sub(lambda match: mapping.get(match.group(0), match.group(0)), text)
+
+    # Ключи не в формате [TYPE_N] (маппинг снаружи) - прямой заменой,
+    # длинные первыми, чтобы избежать частичных замен
+    other_placeholders = [key for key in mapping if not _PLACEHOLDER_PATTERN.fullmatch(key)]
+    for placeholder in sorted(other_placeholders, key=len, reverse=True):
+        result = result.replace(placeholder, mapping[placeholder])
+
+    return result
+
+
+@dataclass(frozen=True)
+class AnonymizationContext:
+    """
+    Результат анонимизации одного текста (неизменяемый)
+
+    Attributes:
+        text: Текст с placeholder'ами
+        mapping: {placeholder: real_value} только для чтения
+    """
+    text: str
+    mapping: Mapping[str, str]
+
+    def deanonymize(self, text: str) -> str:
+        """Восстановить реальные значения в тексте (например, в ответе LLM)"""
+        if not text or not self.mapping:
+            return text
+        return _deanonymize(text, self.mapping)
+
+    def counts(self) -> Dict[str, int]:
+        """Количество найденных PII по типам"""
+        counts: Dict[str, int] = {}
+        for placeholder in self.mapping:
+            entity_type = placeholder[1:].rsplit('_', 1)[0]
+            counts[entity_type] = counts.get(entity_type, 0) + 1
+        return counts
+
+
+class _MappingBuilder:
+    """Маппинг одного вызова anonymize: нумерация и дедупликация placeholder'ов"""
 
     def __init__(self):
-        """Инициализация анонимайзера с ленивой загрузкой natasha"""
         self.mapping: Dict[str, str] = {}  # {placeholder: real_value}
         self.reverse_mapping: Dict[str, str] = {}  # {real_value: placeholder} для дедупликации
+        self.counters: Dict[str, int] = {}  # Счетчики для каждого типа PII
+
+    def add(self, entity_type: str, real_value: str) -> str:
+        """
+        Добавить сущность в маппинг и вернуть placeholder
+
+        Дедупликация: одинаковые значения получают одинаковый placeholder
+
+        Args:
+            entity_type: Тип сущности (EMAIL, PHONE, URL, PER, LOC, ORG)
+            real_value: Реальное значение
+
+        Returns:
+            Placeholder (например: [EMAIL_1])
+        """
+        # Проверяем дедупликацию
+        if real_value in self.reverse_mapping:
+            return self.reverse_mapping[real_value]
+
+        # Создаем новый placeholder
+        self.counters[entity_type] = self.counters.get(entity_type, 0) + 1
+        placeholder = f"[{entity_type}_{self.counters[entity_type]}]"
+
+        # Сохраняем в оба маппинга
+        self.mapping[placeholder] = real_value
+        self.reverse_mapping[real_value] = placeholder
+
+        logger.debug(f"Анонимизация: {real_value} → {placeholder}")
+
+        return placeholder
 
-        # Счетчики для каждого типа PII
-        self.counters = {
-            'EMAIL': 0,
-            'PHONE': 0,
-            'PER': 0,
-            'LOC': 0,
-            'ORG': 0,
-            'URL': 0  # BB-код ссылки (часто содержат имена и профили)
-        }
-
-        # Natasha компоненты (ленивая инициализация)
-        self._segmenter = None
-        self._morph_vocab = None
-        self._ner_tagger = None
-        self._names_extractor = None
+
+class PiiAnonymizer:
+    """
+    Класс для анонимизации и деанонимизации персональных данных
+
+    Privacy First подход: маскирование PII перед отправкой в облачную LLM.
+    Состояние вызова (маппинг, счетчики) не хранится в экземпляре,
+    поэтому один анонимайзер безопасно обслуживает параллельные запросы.
+    """
+
+    # Natasha компоненты (ленивая инициализация, общие для всех экземпляров -
+    # navec загружается один раз на процесс)
+    _segmenter = None
+    _morph_vocab = None
+    _ner_tagger = None
+    _names_extractor = None
+    _natasha_lock = threading.Lock()
+    _natasha_loading = False
+    # Теггер natasha не рассчитан на параллельные вызовы
+    _ner_lock = threading.Lock()
 
     def _init_natasha(self):
         """
@@ -53,6 +219,20 @@ class PiiAnonymizer:
         if self._segmenter is not None:
             return  # Уже инициализировано
 
+        with self._natasha_lock:
+            if self._segmenter is None:
+                self._load_natasha()
+
+    @property
+    def ner_available(self) -> Optional[bool]:
+        """NER загружен (True), недоступен (False) или ещё не загружался (None)"""
+        if self._segmenter is None:
+            return None
+        return self._segmenter is not False
+
+    def _load_natasha(self):
+        """Загрузка natasha и navec (вызывается под _natasha_lock)"""
+        cls = type(self)
         try:
             from natasha import (
                 Segmenter,
@@ -95,214 +275,171 @@ class PiiAnonymizer:
                 logger.debug("Navec модель скачана успешно")
                 navec = Navec.load(navec_model_path)
 
-            self._segmenter = Segmenter()
-            self._morph_vocab = MorphVocab()
-            self._ner_tagger = NewsNERTagger(navec)
-            self._names_extractor = NamesExtractor(self._morph_vocab)
+            cls._segmenter = Segmenter()
+            cls._morph_vocab = MorphVocab()
+            cls._ner_tagger = NewsNERTagger(navec)
+            cls._names_extractor = NamesExtractor(self._morph_vocab)
 
             logger.info("✅ Natasha NER инициализирована успешно")
 
         except ImportError as e:
             logger.warning(f"natasha или navec не установлены: {e}. NER анонимизация отключена (используется только regex).")
-            self._segmenter = False
+            cls._segmenter = False
 
         except Exception as e:
             logger.warning(f"Ошибка инициализации natasha: {e}. NER анонимизация отключена (используется только regex).")
-            self._segmenter = False
-
-    def _add_to_mapping(self, entity_type: str, real_value: str) -> str:
-        """
-        Добавить сущность в маппинг и вернуть placeholder
-
-        Дедупликация: одинаковые значения получают одинаковый placeholder
-
-        Args:
-            entity_type: Тип сущности (EMAIL, PHONE, PER, LOC, ORG)
-            real_value: Реальное значение
-
-        Returns:
-            Placeholder (например: [EMAIL_1])
-        """
-        # Проверяем дедупликацию
-        if real_value in self.reverse_mapping:
-            return self.reverse_mapping[real_value]
-
-        # Создаем новый placeholder
-        self.counters[entity_type] += 1
-        placeholder = f"[{entity_type}_{self.counters[entity_type]}]"
-
-        # Сохраняем в оба маппинга
-        self.mapping[placeholder] = real_value
-        self.reverse_mapping[real_value] = placeholder
-
-        logger.debug(f"Анонимизация: {real_value} → {placeholder}")
-
-        return placeholder
-
-    def _anonymize_emails(self, text: str) -> str:
-        """
-        Анонимизация email адресов через regex
-
-        Args:
-            text: Исходный текст
+            cls._segmenter = False
 
-        Returns:
-            Текст с замененными email на [EMAIL_N]
-        """
-        # Regex для email (упрощенный, но покрывает большинство случаев)
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-
-        def replace_email(match):
-            email = match.group(0)
-            return self._add_to_mapping('EMAIL', email)
-
-        return re.sub(email_pattern, replace_email, text)
-
-    def _anonymize_phones(self, text: str) -> str:
-        """
-        Анонимизация телефонных номеров через regex
-
-        Поддерживаемые форматы:
-        - +7 (999) 123-45-67
-        - +79991234567
-        - 8 (999) 123-45-67
-        - 89991234567
-        - 8-999-123-45-67
-
-        Args:
-            text: Исходный текст
-
-        Returns:
-            Текст с замененными телефонами на [PHONE_N]
-        """
-        # Regex для российских телефонов (различные форматы)
-        phone_patterns = [
-            # +7 (999) 123-45-67 или +7 999 123-45-67
-            r'\+7\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}',
-            # 8 (999) 123-45-67 или 8 999 123-45-67
-            r'8\s*\(?\d{3}\)?\s*\d{3}[-\s]?\d{2}[-\s]?\d{2}',
-            # +79991234567 или 89991234567
-            r'[+]?[78]\d{10}',
-        ]
-
-        result = text
-        for pattern in phone_patterns:
-            def replace_phone(match):
-                phone = match.group(0)
-                return self._add_to_mapping('PHONE', phone)
-
-            result = re.sub(pattern, replace_phone, result)
-
-        return result
-
-    def _anonymize_bb_urls(self, text: str) -> str:
+    def _scan(self, text: str, builder: _MappingBuilder):
         """
-        Анонимизация BB-код URL тегов (Bitrix24)
-
-        Находит паттерны вида: [URL=...]текст[/URL]
-        Заменяет на: [URL_N]
+        Найти PII в исходном тексте без промежуточных замен
 
-        Это защищает:
-        - Ссылки на профили сотрудников
-        - Имена в тексте ссылки
-        - Внутренние URL компании
+        Паттерны применяются в порядке приоритета (_PII_PATTERNS), каждый -
+        только к участкам, не занятым более приоритетными совпадениями.
+        Это повторяет прежнюю последовательную замену (BB URL → email →
+        телефоны), поэтому совпадения и плейсхолдеры не меняются: номера
+        внутри типа раздаются по порядку паттернов, затем по позиции.
 
         Args:
             text: Исходный текст
+            builder: Маппинг текущего вызова
 
         Returns:
-            Текст с замененными BB URL на [URL_N]
+            Список (start, end, placeholder), отсортированный по позиции
         """
-        # Regex для BB-кода URL: [URL=...]...[/URL]
-        # Использует non-greedy match .*? чтобы не захватить несколько тегов сразу
-        bb_url_pattern = r'\[URL=.*?\].*?\[/URL\]'
-
-        def replace_bb_url(match):
-            full_tag = match.group(0)
-            return self._add_to_mapping('URL', full_tag)
-
-        result = re.sub(bb_url_pattern, replace_bb_url, text, flags=re.IGNORECASE)
-
-        return result
-
-    def _anonymize_ner(self, text: str) -> str:
+        spans = []  # (start, end, placeholder), по позиции
+        for entity_type, finditer, marker in _PII_PATTERNS:
+            if marker is not None and not marker(text):
+                continue
+
+            found = []
+            pos = 0
+            for start, end, _ in spans + [(len(text), len(text), None)]:
+                if start > pos:
+                    for match in finditer(text, pos, start):
+                        found.append((match.start(), match.end(), builder.add(entity_type, match.group(0))))
+                pos = end
+
+            if found:
+                spans = sorted(spans + found)
+
+        return spans
+
+    @staticmethod
+    def _add_entities(text: str, spans, entities: List[Entity], builder: _MappingBuilder):
+        """Добавить к совпадениям regex сущности NER, не пересекающиеся с ними"""
+        found = []
+        for start, stop, entity_type in sorted(entities):
+            if start >= stop or stop > len(text):
+                continue
+            if any(start < span_end and span_start < stop for span_start, span_end, _ in spans):
+                continue
+            if found and start < found[-1][1]:
+                continue
+            found.append((start, stop, builder.add(entity_type, text[start:stop])))
+        return sorted(spans + found) if found else spans
+
+    def load_ner_async(self):
+        """Запустить загрузку natasha в фоне (если ещё не загружена и не загружается)"""
+        with self._natasha_lock:
+            start_loading = self._segmenter is None and not self._natasha_loading
+            type(self)._natasha_loading = True
+        if start_loading:
+            _ner_executor.submit(self._init_natasha)
+
+    def find_entities(self, text: str) -> Optional[List[Entity]]:
         """
-        Анонимизация через NER (natasha)
+        Найти именованные сущности через NER (natasha)
 
         Находит:
         - PER: Имена людей
         - LOC: Географические объекты
         - ORG: Организации
 
+        Медленно (и при первом вызове загружает navec) - вызывается
+        при индексации или через find_entities_within.
+
         Args:
             text: Исходный текст
 
         Returns:
-            Текст с замененными сущностями на [PER_N], [LOC_N], [ORG_N]
+            Список (start, stop, type) в исходном тексте, None - natasha недоступна
         """
         # Ленивая инициализация natasha
         self._init_natasha()
 
         # Проверяем что natasha доступна
-        if self._segmenter is False or self._segmenter is None:
-            logger.warning("NER анонимизация пропущена (natasha недоступна)")
-            return text
+        if not self.ner_available:
+            return None
 
         try:
             from natasha import Doc
 
-            # Создаем документ
             doc = Doc(text)
+            with self._ner_lock:
+                # Сегментация и NER тегирование
+                doc.segment(self._segmenter)
+                doc.tag_ner(self._ner_tagger)
 
-            # Сегментация
-            doc.segment(self._segmenter)
+            return [
+                (span.start, span.stop, span.type)
+                for span in doc.spans or []
+                if span.type in _NER_TYPES
+            ]
 
-            # NER тегирование
-            doc.tag_ner(self._ner_tagger)
+        except Exception as e:
+            logger.error(f"Ошибка NER анонимизации: {e}", exc_info=True)
+            return None
 
-            # Собираем все найденные сущности
-            entities = []
-            if doc.spans:
-                for span in doc.spans:
-                    entities.append({
-                        'start': span.start,
-                        'stop': span.stop,
-                        'type': span.type,
-                        'text': text[span.start:span.stop]
-                    })
+    def find_entities_within(self, text: str, budget_ms: float) -> Optional[List[Entity]]:
+        """
+        NER с ограничением по времени (для вопросов пользователей)
 
-            # Сортируем по позиции (справа налево для корректной замены)
-            entities.sort(key=lambda x: x['start'], reverse=True)
+        Пока natasha не загружена, запускает загрузку в фоне и сразу
+        возвращает None. Если NER не уложился в бюджет или все слоты
+        заняты, тоже None - вызывающий остаётся с regex-анонимизацией.
 
-            # Заменяем сущности на placeholder'ы
-            result = text
-            for entity in entities:
-                entity_type = entity['type']
-                entity_text = entity['text']
-                start = entity['start']
-                stop = entity['stop']
+        Args:
+            text: Исходный текст
+            budget_ms: Сколько ждать результата, мс
 
-                # Маппинг типов natasha на наши типы
-                type_mapping = {
-                    'PER': 'PER',
-                    'LOC': 'LOC',
-                    'ORG': 'ORG'
-                }
+        Returns:
+            Список (start, stop, type) или None
+        """
+        if not text:
+            return None
 
-                if entity_type in type_mapping:
-                    our_type = type_mapping[entity_type]
-                    placeholder = self._add_to_mapping(our_type, entity_text)
+        if self.ner_available is None:
+            self.load_ner_async()
+            PII_NER_REQUESTS.inc(source="query", status="loading")
+            return None
 
-                    # Заменяем текст
-                    result = result[:start] + placeholder + result[stop:]
+        if not self.ner_available:
+            PII_NER_REQUESTS.inc(source="query", status="unavailable")
+            return None
 
-            return result
+        if not _ner_slots.acquire(blocking=False):
+            PII_NER_REQUESTS.inc(source="query", status="busy")
+            return None
 
-        except Exception as e:
-            logger.error(f"Ошибка NER анонимизации: {e}", exc_info=True)
-            return text
+        try:
+            future = _ner_executor.submit(self.find_entities, text)
+        except Exception:
+            _ner_slots.release()
+            raise
+        future.add_done_callback(lambda _: _ner_slots.release())
 
-    def anonymize(self, text: str) -> Tuple[str, Dict[str, str]]:
+        try:
+            entities = future.result(timeout=budget_ms / 1000)
+        except FutureTimeoutError:
+            logger.debug(f"NER вопроса не уложился в {budget_ms:.0f} мс, только regex")
+            PII_NER_REQUESTS.inc(source="query", status="timeout")
+            return None
+
+        PII_NER_REQUESTS.inc(source="query", status="ok" if entities is not None else "error")
+        return entities
+
+    def anonymize_context(self, text: str, entities: Optional[List[Entity]] = None) -> AnonymizationContext:
         """
         Полная анонимизация текста
 
@@ -310,55 +447,73 @@ class PiiAnonymizer:
         1. BB-код URL теги (regex) - защита ссылок и имен в [URL=...]...[/URL]
         2. Email (regex)
         3. Телефоны (regex)
-        4. NER: ОТКЛЮЧЕН (дает много ложных срабатываний)
+        4. NER: только готовые сущности из entities (сам NER здесь не запускается)
 
         Args:
             text: Исходный текст
+            entities: Сущности NER этого текста (find_entities), None - без NER
 
         Returns:
-            Tuple (anonymized_text, mapping)
-            - anonymized_text: Текст с placeholder'ами
-            - mapping: Словарь {placeholder: real_value}
+            AnonymizationContext с текстом и маппингом этого вызова
         """
         if not text:
-            return text, {}
+            return AnonymizationContext(text=text, mapping=MappingProxyType({}))
 
         logger.debug(f"Начало анонимизации текста (длина: {len(text)} символов)")
 
-        # Сбрасываем маппинг для нового запроса
-        self.mapping = {}
-        self.reverse_mapping = {}
-        self.counters = {k: 0 for k in self.counters}
-
-        # Шаг 1: BB-код URL теги (делаем первым, чтобы защитить имена в ссылках)
-        result = self._anonymize_bb_urls(text)
+        builder = _MappingBuilder()
+
+        # Шаги 1-3: BB-код URL теги (первыми, чтобы защитить имена в ссылках),
+        # email и телефоны - один проход по тексту
+        spans = self._scan(text, builder)
+
+        # Шаг 4: Сущности NER - на участках, не занятых regex
+        # (имена в BB-ссылках уже закрыты шагом 1)
+        if entities:
+            spans = self._add_entities(text, spans, entities, builder)
+
+        if spans:
+            parts = []
+            pos = 0
+            for start, end, placeholder in spans:
+                parts.append(text[pos:start])
+                parts.append(placeholder)
+                pos = end
+            parts.append(text[pos:])
+            result = "".join(parts)
+        else:
+            result = text
 
-        # Шаг 2: Email
-        result = self._anonymize_emails(result)
+        logger.debug(f"Анонимизация завершена. Найдено PII: "
+                   f"URL={builder.counters.get('URL', 0)}, "
+                   f"EMAIL={builder.counters.get('EMAIL', 0)}, "
+                   f"PHONE={builder.counters.get('PHONE', 0)}, "
+                   f"NER={sum(builder.counters.get(t, 0) for t in _NER_TYPES)}")
 
-        # Шаг 3: Телефоны
-        result = self._anonymize_phones(result)
+        return AnonymizationContext(text=result, mapping=MappingProxyType(builder.mapping))
 
-        # Шаг 4: NER ОТКЛЮЧЕН
-        # Natasha дает много ложных срабатываний ("Бухгалтерии" -> [PER_1])
-        # и пропускает реальные имена в BB-кодах ([URL]Иванов Иван[/URL])
-        # Теперь имена защищены через BB URL анонимизацию (шаг 1)
-        # result = self._anonymize_ner(result)  # ОТКЛЮЧЕНО
+    def anonymize(self, text: str) -> Tuple[str, Dict[str, str]]:
+        """
+        Полная анонимизация текста (см. anonymize_context)
 
-        logger.info(f"Анонимизация завершена. Найдено PII: "
-                   f"URL={self.counters['URL']}, "
-                   f"EMAIL={self.counters['EMAIL']}, "
-                   f"PHONE={self.counters['PHONE']}")
+        Args:
+            text: Исходный текст
 
-        return result, self.mapping.copy()
+        Returns:
+            Tuple (anonymized_text, mapping)
+            - anonymized_text: Текст с placeholder'ами
+            - mapping: Словарь {placeholder: real_value} (копия, принадлежит вызывающему)
+        """
+        context = self.anonymize_context(text)
+        return context.text, dict(context.mapping)
 
-    def deanonymize(self, text: str, mapping: Optional[Dict[str, str]] = None) -> str:
+    def deanonymize(self, text: str, mapping: Mapping[str, str]) -> str:
         """
         Деанонимизация текста (восстановление реальных данных)
 
         Args:
             text: Текст с placeholder'ами
-            mapping: Словарь {placeholder: real_value} (опционально, если не указан - использует self.mapping)
+            mapping: Словарь {placeholder: real_value} из anonymize
 
         Returns:
             Текст с восстановленными реальными значениями
@@ -366,28 +521,203 @@ class PiiAnonymizer:
         if not text:
             return text
 
-        # Используем переданный маппинг или сохраненный
-        mapping_to_use = mapping if mapping is not None else self.mapping
-
-        if not mapping_to_use:
+        if not mapping:
             logger.warning("Попытка деанонимизации без маппинга")
             return text
 
-        logger.debug(f"Начало деанонимизации текста (placeholder'ов: {len(mapping_to_use)})")
+        logger.debug(f"Начало деанонимизации текста (placeholder'ов: {len(mapping)})")
+        result = _deanonymize(text, mapping)
+        logger.debug("Деанонимизация завершена")
 
-        result = text
+        return result
 
-        # Заменяем каждый placeholder на реальное значение
-        # Сортируем по длине ключа (длинные первыми) чтобы избежать частичных замен
-        sorted_placeholders = sorted(mapping_to_use.keys(), key=len, reverse=True)
 
-        for placeholder in sorted_placeholders:
-            real_value = mapping_to_use[placeholder]
-            result = result.replace(placeholder, real_value)
+# ========== КЭШ АНОНИМИЗИРОВАННЫХ ЧАНКОВ ==========
 
-        logger.debug("Деанонимизация завершена")
+def content_hash(text: str) -> str:
+    """Хэш содержимого чанка (смена текста делает запись кэша устаревшей)"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-        return result
+
+class AnonymizedChunkCache:
+    """
+    Анонимизированные тексты с локальными маппингами
+
+    Запись: ключ (например, ID FAQ) -> (хэш содержимого, AnonymizationContext).
+    Placeholder'ы в каждой записи нумеруются с 1, для запроса их
+    перенумеровывает merge_anonymized. Записи неизменяемы, поэтому
+    отдаются параллельным запросам без копирования.
+
+    С ner=True новые тексты сразу получают regex-анонимизацию, а фоновый
+    поток прогоняет их через NER и подменяет записи. Сущности NER
+    кэшируются по хэшу содержимого: неизменившийся текст повторно
+    не размечается.
+    """
+
+    def __init__(self, name: str, ner: bool = False):
+        """
+        Args:
+            name: Имя кэша в метриках
+            ner: Размечать тексты NER в фоновом потоке
+        """
+        self.name = name
+        self.ner = ner
+        self._entries: Dict[str, Tuple[str, AnonymizationContext]] = {}
+        self._entities: Dict[str, List[Entity]] = {}  # хэш содержимого -> сущности NER
+        self._anonymizer = PiiAnonymizer()
+        self._lock = threading.Lock()
+        self._ner_queue: "queue.Queue[Tuple[str, str, str]]" = queue.Queue()
+        self._ner_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Optional[str], text: str) -> AnonymizationContext:
+        """
+        Анонимизированный текст с маппингом (при промахе - анонимизировать и сохранить)
+
+        Args:
+            key: Ключ записи (None - ключом служит хэш содержимого)
+            text: Исходный текст
+        """
+        digest = content_hash(text)
+        key = key or digest
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == digest:
+            record_cache(self.name, True)
+            return entry[1]
+
+        record_cache(self.name, False)
+        # Анонимизатор без состояния - блокировка нужна только для записи
+        entities = self._entities.get(digest)
+        context = self._anonymizer.anonymize_context(text, entities)
+        with self._lock:
+            self._entries[key] = (digest, context)
+        if self.ner and entities is None:
+            self._schedule_ner([(key, digest, text)])
+        return context
+
+    def warm(self, items: Iterable[Tuple[str, str]]) -> int:
+        """
+        Заполнить кэш заранее (при индексации)
+
+        Неизменившиеся записи переиспользуются, записи с ключами не из items
+        удаляются (например, удалённые FAQ). Тексты без сущностей NER
+        ставятся в очередь фоновой разметки.
+
+        Args:
+            items: Пары (ключ, исходный текст)
+
+        Returns:
+            Количество заново анонимизированных текстов
+        """
+        entries = {}
+        pending = []
+        anonymized_count = 0
+        with self._lock:
+            for key, text in items:
+                digest = content_hash(text)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] != digest:
+                    entry = (digest, self._anonymizer.anonymize_context(text, self._entities.get(digest)))
+                    anonymized_count += 1
+                if self.ner and digest not in self._entities:
+                    pending.append((key, digest, text))
+                entries[key] = entry
+            self._entries = entries
+            digests = {entry[0] for entry in entries.values()}
+            self._entities = {digest: found for digest, found in self._entities.items() if digest in digests}
+
+        if pending:
+            self._schedule_ner(pending)
+        return anonymized_count
+
+    def _schedule_ner(self, items: List[Tuple[str, str, str]]):
+        """Поставить тексты (ключ, хэш, текст) в очередь NER и запустить поток"""
+        for item in items:
+            self._ner_queue.put(item)
+        with self._lock:
+            if self._ner_thread is None:
+                self._ner_thread = threading.Thread(target=self._ner_worker, name=f"{self.name}-ner", daemon=True)
+                self._ner_thread.start()
+
+    def _ner_worker(self):
+        """Фоновая разметка NER: подменяет записи кэша версиями с сущностями"""
+        processed = 0
+        started = None
+        while True:
+            key, digest, text = self._ner_queue.get()
+            if started is None:
+                started = time.perf_counter()
+
+            if digest not in self._entities:
+                entities = self._anonymizer.find_entities(text)
+                if entities is None:
+                    PII_NER_REQUESTS.inc(source="index", status="unavailable" if not self._anonymizer.ner_available else "error")
+                    if not self._anonymizer.ner_available:
+                        logger.warning(f"⚠️ NER для кэша {self.name} недоступен, остаётся regex-анонимизация")
+                        self.ner = False
+                        return
+                else:
+                    context = self._anonymizer.anonymize_context(text, entities)
+                    with self._lock:
+                        # Пока шла разметка, текст записи мог измениться
+                        entry = self._entries.get(key)
+                        if entry is not None and entry[0] == digest:
+                            self._entities[digest] = entities
+                            self._entries[key] = (digest, context)
+                    PII_NER_REQUESTS.inc(source="index", status="ok")
+                    processed += 1
+
+            if self._ner_queue.empty():
+                if processed:
+                    logger.info(f"✅ NER кэша {self.name}: размечено {processed} текстов "
+                                f"за {time.perf_counter() - started:.1f} с")
+                processed = 0
+                started = None
+
+
+def merge_anonymized(parts: List[AnonymizationContext]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Объединить независимо анонимизированные тексты в один маппинг
+
+    Placeholder'ы перенумеровываются по порядку частей: одинаковые
+    значения из разных частей получают один placeholder, разные
+    значения с одинаковыми локальными placeholder'ами ([EMAIL_1]
+    в двух чанках) - разные.
+
+    Args:
+        parts: Контексты анонимизации в порядке следования в запросе
+
+    Returns:
+        Tuple (texts, mapping)
+        - texts: Тексты с общими placeholder'ами (в порядке parts)
+        - mapping: Общий словарь {placeholder: real_value}
+    """
+    mapping: Dict[str, str] = {}
+    reverse_mapping: Dict[str, str] = {}
+    counters: Dict[str, int] = {}
+    texts = []
+
+    for part in parts:
+        text = part.text
+        renumber = {}
+        # Маппинг упорядочен по номерам placeholder'ов части
+        for placeholder, real_value in part.mapping.items():
+            if real_value not in reverse_mapping:
+                entity_type = placeholder[1:].rsplit('_', 1)[0]
+                counters[entity_type] = counters.get(entity_type, 0) + 1
+                new_placeholder = f"[{entity_type}_{counters[entity_type]}]"
+                mapping[new_placeholder] = real_value
+                reverse_mapping[real_value] = new_placeholder
+            renumber[placeholder] = reverse_mapping[real_value]
+
+        if any(old != new for old, new in renumber.items()):
+            text = _PLACEHOLDER_PATTERN.sub(lambda match: renumber.get(match.group(0), match.group(0)), text)
+        texts.append(text)
+
+    return texts, mapping
 
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
@@ -406,7 +736,7 @@ def anonymize_text(text: str) -> Tuple[str, Dict[str, str]]:
     return anonymizer.anonymize(text)
 
 
-def deanonymize_text(text: str, mapping: Dict[str, str]) -> str:
+def deanonymize_text(text: str, mapping: Mapping[str, str]) -> str:
     """
     Удобная функция для одноразовой деанонимизации
 
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Сэмплирующий профайлер медленных запросов
+
+Включается PROFILING_ENABLED=true. Пока открыт замер запроса (track_latency),
+фоновый поток раз в PROFILE_INTERVAL_MS снимает стеки потоков, которые
+сейчас работают на этот запрос (sys._current_frames), и копит их в счётчике
+свёрнутых стеков. Код запроса при этом не трассируется, так что накладные
+расходы - один поток сэмплера и проход по стекам раз в интервал.
+
+Поток считается работающим на запрос внутри этапов (stage), а в синхронных
+обработчиках (Bitrix24) - на всё время замера. В asyncio-обработчике
+(Telegram) поток цикла событий между этапами обслуживает и другие запросы,
+поэтому в это время он не сэмплируется.
+
+Если запрос уложился в бюджет PROFILE_BUDGET_MS, сэмплы отбрасываются,
+иначе профиль сохраняется в data/profiles/<query_log_id>.folded - формат
+свёрнутых стеков (flamegraph.pl, speedscope). Хранятся последние
+PROFILE_MAX_FILES профилей.
+"""
+
+import os
+import sys
+import sysconfig
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_BUDGET_MS = float(os.getenv("PROFILE_BUDGET_MS", "2000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "500"))
+PROFILES_DIR = os.path.join("data", "profiles")
+
+# Глубина стека в сэмпле (самые глубокие кадры отбрасываются)
+MAX_STACK_DEPTH = 128
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+
+class RequestProfile:
+    """Сэмплы одного запроса: свёрнутый стек -> количество"""
+
+    def __init__(self):
+        self.samples: Counter = Counter()
+        # Потоки, работающие на запрос: ident -> глубина вложенности этапов
+        self.threads: Dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def attach(self, thread_id: int):
+        with self.lock:
+            self.threads[thread_id] = self.threads.get(thread_id, 0) + 1
+
+    def detach(self, thread_id: int):
+        with self.lock:
+            depth = self.threads.get(thread_id, 0) - 1
+            if depth > 0:
+                self.threads[thread_id] = depth
+            else:
+                self.threads.pop(thread_id, None)
+
+
+class StackSampler:
+    """Фоновый поток, снимающий стеки активных запросов"""
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self.active: List[RequestProfile] = []
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.labels: Dict[object, str] = {}
+
+    def _label(self, code) -> str:
+        """Подпись кадра: функция (файл:строка определения), кэшируется по code object"""
+        label = self.labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(_PROJECT_ROOT):
+                filename = os.path.relpath(filename, _PROJECT_ROOT)
+            elif filename.startswith(_STDLIB + os.sep) and "-packages" not in filename:
+                filename = os.path.relpath(filename, _STDLIB)
+            else:
+                for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+                    if marker in filename:
+                        filename = filename.split(marker, 1)[1]
+                        break
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+            self.labels[code] = label
+        return label
+
+    def _fold(self, frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return ";".join(stack)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                profiles = list(self.active)
+            if not profiles:
+                continue
+
+            frames = sys._current_frames()
+            for profile in profiles:
+                with profile.lock:
+                    thread_ids = list(profile.threads)
+                stacks = [
+                    self._fold(frames[thread_id])
+                    for thread_id in thread_ids
+                    if thread_id in frames and thread_id != own_id
+                ]
+                with profile.lock:
+                    profile.samples.update(stacks)
+            del frames
+
+    def start(self, profile: RequestProfile):
+        with self.lock:
+            self.active.append(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self.thread.start()
+
+    def stop(self, profile: RequestProfile):
+        with self.lock:
+            if profile in self.active:
+                self.active.remove(profile)
+
+
+_sampler = StackSampler(PROFILE_INTERVAL_MS)
+
+
+def start_profile() -> Optional[RequestProfile]:
+    """Начать сбор сэмплов запроса (None, если профилирование выключено)"""
+    if not PROFILING_ENABLED:
+        return None
+    profile = RequestProfile()
+    _sampler.start(profile)
+    return profile
+
+
+def stop_profile(profile: Optional[RequestProfile]):
+    """Прекратить сбор сэмплов запроса"""
+    if profile is not None:
+        _sampler.stop(profile)
+
+
+@contextmanager
+def profile_thread(profile: Optional[RequestProfile]):
+    """Считать текущий поток работающим на запрос (для сэмплера)"""
+    if profile is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    profile.attach(thread_id)
+    try:
+        yield
+    finally:
+        profile.detach(thread_id)
+
+
+def profile_path(query_log_id: int) -> str:
+    """Путь к профилю запроса"""
+    return os.path.join(PROFILES_DIR, f"{int(query_log_id)}.folded")
+
+
+def _cleanup_profiles():
+    """Оставить последние PROFILE_MAX_FILES профилей"""
+    try:
+        files = [
+            os.path.join(PROFILES_DIR, name)
+            for name in os.listdir(PROFILES_DIR)
+            if name.endswith(".folded")
+        ]
+        if len(files) <= PROFILE_MAX_FILES:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - PROFILE_MAX_FILES]:
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"⚠️ Не удалось очистить старые профили: {e}")
+
+
+def save_profile(profile: Optional[RequestProfile], query_log_id: Optional[int], total_ms: float) -> bool:
+    """
+    Сохранить профиль, если запрос не уложился в бюджет PROFILE_BUDGET_MS
+
+    Returns:
+        True, если профиль записан
+    """
+    if profile is None or not query_log_id or total_ms < PROFILE_BUDGET_MS:
+        return False
+
+    with profile.lock:
+        samples = dict(profile.samples)
+    if not samples:
+        return False
+
+    try:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        path = profile_path(query_log_id)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        logger.info(f"🐢 Запрос {query_log_id}: {total_ms:.0f} мс > {PROFILE_BUDGET_MS:.0f} мс, "
+                    f"профиль ({sum(samples.values())} сэмплов) - {path}")
+        _cleanup_profiles()
+        return True
+    except OSError as e:
+        logger.warning(f"⚠️ Не удалось сохранить профиль запроса {query_log_id}: {e}")
+        return False
+
+
+def profile_sample_count(query_log_id: int) -> Optional[int]:
+    """Количество сэмплов в сохранённом профиле (None - профиля нет)"""
+    path = profile_path(query_log_id)
+    if not os.path.exists(path):
+        return None
+    count = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            count += int(line.rsplit(" ", 1)[1])
+    return count
@@ -5,15 +5,21 @@
 Реализует 4-уровневую систему поиска:
 1. Exact Match - точное совпадение вопроса
 2. Keyword Search - поиск по ключевым словам (для коротких запросов)
-3. Semantic Search - семантический поиск через ChromaDB
+3. Semantic Search - семантический поиск (ChromaDB или numpy бэкенд)
 4. Fallback - вежливый отказ с предложениями
 """
 
 import logging
 import re
-from dataclasses import dataclass
+import string
+import time
+from dataclasses import dataclass, replace
 from typing import Optional, Dict, List, Set
 
+from src.core.latency import stage, track_latency
+from src.core.metrics import SEARCH_DURATION, SEARCH_REQUESTS
+from src.core.vector_backend import get_vector_backend
+
 logger = logging.getLogger(__name__)
 
 # ========== СТОП-СЛОВА ДЛЯ РУССКОГО ЯЗЫКА ==========
@@ -129,6 +135,7 @@ class SearchResult:
         message: Сообщение для пользователя (используется для fallback)
         ambiguous: Флаг неоднозначности (несколько FAQ с близким score)
         alternatives: Список альтернативных FAQ (для disambiguation)
+        timings: Время этапов поиска (total_ms и stages, см. src.core.latency)
     """
     found: bool
     faq_id: Optional[str]
@@ -140,6 +147,7 @@ class SearchResult:
     message: Optional[str]
     ambiguous: bool = False
     alternatives: Optional[List[Dict]] = None
+    timings: Optional[Dict] = None
 
 
 # ========== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ==========
@@ -284,13 +292,14 @@ def find_exact_match(query_text: str) -> Optional[SearchResult]:
     """
     from src.core.database import get_db_connection
 
-    normalized_query = normalize_text(query_text)
+    with stage("normalize"):
+        normalized_query = normalize_text(query_text)
 
     if not normalized_query:
         return None
 
     try:
-        with get_db_connection() as conn:
+        with stage("exact"), get_db_connection() as conn:
             cursor = conn.cursor()
 
             # Получаем все вопросы и проверяем нормализованное совпадение
@@ -324,6 +333,95 @@ def find_exact_match(query_text: str) -> Optional[SearchResult]:
 
 # ========== УРОВЕНЬ 2: KEYWORD SEARCH ==========
 
+def _build_keyword_result(rows, query_keywords: List[str], threshold: float) -> Optional[SearchResult]:
+    """
+    Результат keyword search по строкам FAQ, отсортированным по совпадениям
+
+    Общая часть find_by_keywords и find_answers_batch: строки содержат
+    id, question, answer, keywords, match_count и question_match_count.
+    """
+    if not rows or rows[0]["match_count"] == 0:
+        return None
+
+    # Вычисляем confidence для всех результатов
+    candidates = []
+    for row in rows:
+        matched_keywords = row["match_count"]
+        question_matches = row["question_match_count"]
+
+        # Получаем ключевые слова из FAQ
+        faq_keywords_str = row["keywords"] or ""
+        faq_keywords = [k.strip() for k in faq_keywords_str.split(",") if k.strip()]
+
+        # Базовый confidence
+        confidence = calculate_keyword_confidence(
+            matched_keywords=matched_keywords,
+            total_query_keywords=len(query_keywords),
+            total_faq_keywords=len(faq_keywords)
+        )
+
+        # Бонус за совпадение в вопросе (до +5% за каждое совпадение)
+        if question_matches > 0:
+            question_bonus = min(5.0, question_matches * 2.5)
+            confidence = min(95.0, confidence + question_bonus)
+
+        # Добавляем только результаты выше порога
+        if confidence >= threshold:
+            candidates.append({
+                'faq_id': row["id"],
+                'question': row["question"],
+                'answer': row["answer"],
+                'confidence': confidence,
+                'question_matches': question_matches  # Для отладки
+            })
+
+    if not candidates:
+        logger.debug(f"  [Keyword Search] Нет результатов выше порога {threshold}%")
+        return None
+
+    # Сортируем кандидатов по confidence (после добавления бонусов)
+    candidates.sort(key=lambda x: x['confidence'], reverse=True)
+
+    # Лучший результат
+    best = candidates[0]
+    logger.debug(f"  [Keyword Search] Лучший результат: confidence={best['confidence']:.1f}%, question_matches={best['question_matches']}")
+
+    # Логируем топ-3 для отладки
+    if len(candidates) > 1:
+        logger.debug(f"  [Keyword Search] Топ-3 результатов:")
+        for i, candidate in enumerate(candidates[:5], 1):
+            logger.debug(f"    {i}. [{candidate['confidence']:.1f}%] {candidate['question'][:50]}... (q_matches={candidate['question_matches']})")
+
+    # Проверяем на disambiguation (разница < 7% между топ-2)
+    ambiguous = False
+    alternatives = []
+
+    if len(candidates) > 1:
+        confidence_diff = best['confidence'] - candidates[1]['confidence']
+        logger.debug(f"  [Keyword Search] Разница confidence: {confidence_diff:.1f}%")
+
+        if confidence_diff < 7.0:
+            ambiguous = True
+            # Собираем близкие альтернативы (макс 5, разница < 12%)
+            for candidate in candidates[:5]:  # Ограничиваем 5 максимум
+                if best['confidence'] - candidate['confidence'] < 12.0:
+                    alternatives.append(candidate)
+            logger.debug(f"  [Keyword Search] Обнаружена неоднозначность! Альтернатив: {len(alternatives)}")
+
+    return SearchResult(
+        found=True,
+        faq_id=best['faq_id'],
+        question=best['question'],
+        answer=best['answer'],
+        confidence=best['confidence'],
+        search_level='keyword',
+        all_results=None,
+        message=None,
+        ambiguous=ambiguous,
+        alternatives=alternatives if ambiguous else None
+    )
+
+
 def find_by_keywords(query_text: str, max_query_words: int = 5, threshold: float = 80.0, n_results: int = 5) -> Optional[SearchResult]:
     """
     Уровень 2: Поиск по ключевым словам (только для коротких запросов)
@@ -347,7 +445,8 @@ def find_by_keywords(query_text: str, max_query_words: int = 5, threshold: float
         return None
 
     # Извлекаем ключевые слова
-    query_keywords = extract_keywords(query_text)
+    with stage("lemmatize"):
+        query_keywords = extract_keywords(query_text)
 
     if not query_keywords:
         logger.debug("  [Keyword Search] Пропущен: нет ключевых слов")
@@ -356,7 +455,7 @@ def find_by_keywords(query_text: str, max_query_words: int = 5, threshold: float
     logger.debug(f"  [Keyword Search] Ключевые слова: {query_keywords}")
 
     try:
-        with get_db_connection() as conn:
+        with stage("keyword_sql"), get_db_connection() as conn:
             cursor = conn.cursor()
 
             # Строим WHERE условие для поиска по каждому ключевому слову
@@ -414,86 +513,7 @@ def find_by_keywords(query_text: str, max_query_words: int = 5, threshold: float
             cursor.execute(query_sql, full_params)
             rows = cursor.fetchall()
 
-            if not rows or rows[0]["match_count"] == 0:
-                return None
-
-            # Вычисляем confidence для всех результатов
-            candidates = []
-            for row in rows:
-                matched_keywords = row["match_count"]
-                question_matches = row["question_match_count"]
-
-                # Получаем ключевые слова из FAQ
-                faq_keywords_str = row["keywords"] or ""
-                faq_keywords = [k.strip() for k in faq_keywords_str.split(",") if k.strip()]
-
-                # Базовый confidence
-                confidence = calculate_keyword_confidence(
-                    matched_keywords=matched_keywords,
-                    total_query_keywords=len(query_keywords),
-                    total_faq_keywords=len(faq_keywords)
-                )
-
-                # Бонус за совпадение в вопросе (до +5% за каждое совпадение)
-                if question_matches > 0:
-                    question_bonus = min(5.0, question_matches * 2.5)
-                    confidence = min(95.0, confidence + question_bonus)
-
-                # Добавляем только результаты выше порога
-                if confidence >= threshold:
-                    candidates.append({
-                        'faq_id': row["id"],
-                        'question': row["question"],
-                        'answer': row["answer"],
-                        'confidence': confidence,
-                        'question_matches': question_matches  # Для отладки
-                    })
-
-            if not candidates:
-                logger.debug(f"  [Keyword Search] Нет результатов выше порога {threshold}%")
-                return None
-
-            # Сортируем кандидатов по confidence (после добавления бонусов)
-            candidates.sort(key=lambda x: x['confidence'], reverse=True)
-
-            # Лучший результат
-            best = candidates[0]
-            logger.debug(f"  [Keyword Search] Лучший результат: confidence={best['confidence']:.1f}%, question_matches={best['question_matches']}")
-
-            # Логируем топ-3 для отладки
-            if len(candidates) > 1:
-                logger.debug(f"  [Keyword Search] Топ-3 результатов:")
-                for i, candidate in enumerate(candidates[:5], 1):
-                    logger.debug(f"    {i}. [{candidate['confidence']:.1f}%] {candidate['question'][:50]}... (q_matches={candidate['question_matches']})")
-
-            # Проверяем на disambiguation (разница < 7% между топ-2)
-            ambiguous = False
-            alternatives = []
-
-            if len(candidates) > 1:
-                confidence_diff = best['confidence'] - candidates[1]['confidence']
-                logger.debug(f"  [Keyword Search] Разница confidence: {confidence_diff:.1f}%")
-
-                if confidence_diff < 7.0:
-                    ambiguous = True
-                    # Собираем близкие альтернативы (макс 5, разница < 12%)
-                    for candidate in candidates[:5]:  # Ограничиваем 5 максимум
-                        if best['confidence'] - candidate['confidence'] < 12.0:
-                            alternatives.append(candidate)
-                    logger.debug(f"  [Keyword Search] Обнаружена неоднозначность! Альтернатив: {len(alternatives)}")
-
-            return SearchResult(
-                found=True,
-                faq_id=best['faq_id'],
-                question=best['question'],
-                answer=best['answer'],
-                confidence=best['confidence'],
-                search_level='keyword',
-                all_results=None,
-                message=None,
-                ambiguous=ambiguous,
-                alternatives=alternatives if ambiguous else None
-            )
+        return _build_keyword_result(rows, query_keywords, threshold)
 
     except Exception as e:
         logger.error(f"Ошибка в find_by_keywords: {e}", exc_info=True)
@@ -503,6 +523,71 @@ def find_by_keywords(query_text: str, max_query_words: int = 5, threshold: float
 
 # ========== УРОВЕНЬ 3: SEMANTIC SEARCH ==========
 
+def _build_semantic_result(results: Dict, threshold: float) -> Optional[SearchResult]:
+    """
+    Результат semantic search по ответу бэкенда для одного запроса
+
+    Общая часть find_semantic_match и find_answers_batch.
+
+    Args:
+        results: Результаты в формате collection.query (один запрос)
+        threshold: Порог схожести
+    """
+    # Вычисляем confidence для всех результатов
+    candidates = []
+    for i in range(len(results['ids'][0])):
+        distance = results['distances'][0][i]
+        similarity = max(0.0, 1.0 - distance) * 100.0
+        metadata = results['metadatas'][0][i]
+        faq_id = results['ids'][0][i]
+
+        # Добавляем только результаты выше порога
+        if similarity >= threshold:
+            candidates.append({
+                'faq_id': faq_id,
+                'question': metadata['question'],
+                'answer': metadata['answer'],
+                'confidence': similarity
+            })
+
+    if not candidates:
+        logger.debug(f"  [Semantic Search] Нет результатов выше порога {threshold}%")
+        return None
+
+    # Лучший результат
+    best = candidates[0]
+    logger.debug(f"  [Semantic Search] Лучший результат: similarity={best['confidence']:.1f}%")
+
+    # Проверяем на disambiguation (разница < 7% между топ-2)
+    ambiguous = False
+    alternatives = []
+
+    if len(candidates) > 1:
+        confidence_diff = best['confidence'] - candidates[1]['confidence']
+        logger.debug(f"  [Semantic Search] Разница confidence: {confidence_diff:.1f}%")
+
+        if confidence_diff < 7.0:
+            ambiguous = True
+            # Собираем близкие альтернативы (макс 3, разница < 12%)
+            for candidate in candidates[:3]:  # Ограничиваем 3 максимум
+                if best['confidence'] - candidate['confidence'] < 12.0:
+                    alternatives.append(candidate)
+            logger.debug(f"  [Semantic Search] Обнаружена неоднозначность! Альтернатив: {len(alternatives)}")
+
+    return SearchResult(
+        found=True,
+        faq_id=best['faq_id'],
+        question=best['question'],
+        answer=best['answer'],
+        confidence=best['confidence'],
+        search_level='semantic',
+        all_results=results,
+        message=None,
+        ambiguous=ambiguous,
+        alternatives=alternatives if ambiguous else None
+    )
+
+
 def find_semantic_match(
     query_text: str,
     collection,
@@ -510,14 +595,15 @@ def find_semantic_match(
     n_results: int = 5
 ) -> Optional[SearchResult]:
     """
-    Уровень 3: Семантический поиск через ChromaDB
+    Уровень 3: Семантический поиск через векторный бэкенд
 
     Использует векторные эмбеддинги для понимания смысла вопроса.
-    Самый "умный", но и самый медленный метод.
+    Самый "умный", но и самый медленный метод. Бэкенд (ChromaDB или numpy)
+    выбирается через VECTOR_BACKEND, см. src.core.vector_backend.
 
     Args:
         query_text: Текст запроса
-        collection: ChromaDB коллекция
+        collection: ChromaDB коллекция (или готовый векторный бэкенд)
         threshold: Порог схожести (по умолчанию из настроек)
         n_results: Количество результатов для проверки disambiguation
 
@@ -529,69 +615,14 @@ def find_semantic_match(
         return None
 
     try:
-        results = collection.query(
-            query_texts=[f"search_query: {query_text}"],
-            n_results=n_results,
-            include=["documents", "metadatas", "distances"]
-        )
+        backend = get_vector_backend(collection)
+        results = backend.query([f"search_query: {query_text}"], n_results=n_results)
 
         if not results or not results['ids'] or not results['ids'][0]:
-            logger.debug("  [Semantic Search] Ничего не найдено в ChromaDB")
-            return None
-
-        # Вычисляем confidence для всех результатов
-        candidates = []
-        for i in range(len(results['ids'][0])):
-            distance = results['distances'][0][i]
-            similarity = max(0.0, 1.0 - distance) * 100.0
-            metadata = results['metadatas'][0][i]
-            faq_id = results['ids'][0][i]
-
-            # Добавляем только результаты выше порога
-            if similarity >= threshold:
-                candidates.append({
-                    'faq_id': faq_id,
-                    'question': metadata['question'],
-                    'answer': metadata['answer'],
-                    'confidence': similarity
-                })
-
-        if not candidates:
-            logger.debug(f"  [Semantic Search] Нет результатов выше порога {threshold}%")
+            logger.debug(f"  [Semantic Search] Ничего не найдено ({backend.name})")
             return None
 
-        # Лучший результат
-        best = candidates[0]
-        logger.debug(f"  [Semantic Search] Лучший результат: similarity={best['confidence']:.1f}%")
-
-        # Проверяем на disambiguation (разница < 7% между топ-2)
-        ambiguous = False
-        alternatives = []
-
-        if len(candidates) > 1:
-            confidence_diff = best['confidence'] - candidates[1]['confidence']
-            logger.debug(f"  [Semantic Search] Разница confidence: {confidence_diff:.1f}%")
-
-            if confidence_diff < 7.0:
-                ambiguous = True
-                # Собираем близкие альтернативы (макс 3, разница < 12%)
-                for candidate in candidates[:3]:  # Ограничиваем 3 максимум
-                    if best['confidence'] - candidate['confidence'] < 12.0:
-                        alternatives.append(candidate)
-                logger.debug(f"  [Semantic Search] Обнаружена неоднозначность! Альтернатив: {len(alternatives)}")
-
-        return SearchResult(
-            found=True,
-            faq_id=best['faq_id'],
-            question=best['question'],
-            answer=best['answer'],
-            confidence=best['confidence'],
-            search_level='semantic',
-            all_results=results,
-            message=None,
-            ambiguous=ambiguous,
-            alternatives=alternatives if ambiguous else None
-        )
+        return _build_semantic_result(results, threshold)
 
     except Exception as e:
         logger.error(f"Ошибка в find_semantic_match: {e}", exc_info=True)
@@ -641,7 +672,8 @@ def get_fallback_result() -> SearchResult:
 def find_answer(
     query_text: str,
     collection,
-    settings: Optional[Dict] = None
+    settings: Optional[Dict] = None,
+    warmup=None
 ) -> SearchResult:
     """
     Каскадный поиск ответа по 4 уровням
@@ -654,12 +686,26 @@ def find_answer(
 
     Args:
         query_text: Текст запроса пользователя
-        collection: ChromaDB коллекция
+        collection: ChromaDB коллекция (None - ещё не загружена)
         settings: Настройки (пороги, параметры). Если None - берутся из БД
+        warmup: ModelWarmup фоновой загрузки коллекции; если collection ещё
+                нет, семантический уровень ждёт прогрева (WARMUP_WAIT_TIMEOUT)
 
     Returns:
-        SearchResult с найденным ответом или fallback
+        SearchResult с найденным ответом или fallback; в timings - время
+        этапов поиска (или всего запроса, если замер открыт обработчиком)
     """
+    started = time.perf_counter()
+    with track_latency() as timer:
+        result = _find_answer_cascade(query_text, collection, settings, warmup)
+    result.timings = timer.as_dict()
+    SEARCH_REQUESTS.inc(search_level=result.search_level)
+    SEARCH_DURATION.observe(time.perf_counter() - started, search_level=result.search_level)
+    return result
+
+
+def _find_answer_cascade(query_text: str, collection, settings: Optional[Dict], warmup) -> SearchResult:
+    """Уровни каскадного поиска (см. find_answer)"""
     from src.core.database import get_bot_settings
 
     # Загружаем настройки если не переданы
@@ -693,8 +739,22 @@ def find_answer(
         logger.debug(f"  Уровень 2: Пропущен (запрос длинный: {len(query_text.split())} слов > {keyword_max_words})")
 
     # УРОВЕНЬ 3: Semantic Search
-    logger.debug("  Уровень 3: Семантический поиск...")
-    result = find_semantic_match(query_text, collection, threshold=semantic_threshold)
+    if collection is None and warmup is not None:
+        from src.core.warmup import WARMUP_WAIT_TIMEOUT
+
+        if not warmup.is_ready:
+            logger.info(f"  ⏳ Уровень 3: ожидание загрузки модели ({warmup.state})...")
+        with stage("warmup_wait"):
+            ready = warmup.wait(WARMUP_WAIT_TIMEOUT)
+        if ready:
+            collection = warmup.result
+
+    if collection is None and warmup is not None:
+        logger.warning("  Уровень 3: Пропущен (модель эмбеддингов ещё не загружена)")
+        result = None
+    else:
+        logger.debug("  Уровень 3: Семантический поиск...")
+        result = find_semantic_match(query_text, collection, threshold=semantic_threshold)
     if result:
         logger.info(f"  ✅ Найдено семантическим поиском! Confidence: {result.confidence}%")
         return result
@@ -702,3 +762,188 @@ def find_answer(
     # УРОВЕНЬ 4: Fallback
     logger.info("  ❌ Ответ не найден ни на одном уровне. Возвращаем fallback.")
     return get_fallback_result()
+
+
+# ========== ПАКЕТНЫЙ ПОИСК ==========
+
+# LOWER() и LIKE в SQLite меняют регистр только у ASCII символов
+_SQLITE_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _load_faq_rows() -> List[Dict]:
+    """Все FAQ в порядке таблицы с подготовленными полями для поиска в памяти"""
+    from src.core.database import get_db_connection
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, category, question, answer, keywords FROM faq")
+        rows = cursor.fetchall()
+
+    faq_rows = []
+    for row in rows:
+        keywords = row["keywords"]
+        faq_rows.append({
+            "id": row["id"],
+            "question": row["question"],
+            "answer": row["answer"],
+            "keywords": keywords,
+            "normalized_question": normalize_text(row["question"]),
+            "question_lower": row["question"].translate(_SQLITE_LOWER),
+            "keywords_lower": keywords.translate(_SQLITE_LOWER) if keywords is not None else "",
+            # LENGTH(keywords) - LENGTH(REPLACE(keywords, ',', '')) + 1 (NULL для NULL)
+            "keyword_count": keywords.count(",") + 1 if keywords is not None else None,
+            "question_length": len(row["question"])
+        })
+    return faq_rows
+
+
+def _keyword_rows_in_memory(faq_rows: List[Dict], query_keywords: List[str], n_results: int) -> List[Dict]:
+    """
+    Строки keyword search без SQL
+
+    Повторяет запрос find_by_keywords: подсчёт совпадений LIKE '%слово%'
+    в вопросе и ключевых словах, та же сортировка и LIMIT.
+    """
+    keywords = [keyword.translate(_SQLITE_LOWER) for keyword in query_keywords]
+    matched = []
+    for row in faq_rows:
+        question_match_count = sum(1 for keyword in keywords if keyword in row["question_lower"])
+        match_count = sum(
+            1 for keyword in keywords
+            if keyword in row["question_lower"] or keyword in row["keywords_lower"]
+        )
+        if match_count:
+            matched.append(dict(row, match_count=match_count, question_match_count=question_match_count))
+
+    # NULL keyword_count в SQLite идёт первым при ORDER BY ASC; sort стабильна - порядок таблицы сохраняется
+    matched.sort(key=lambda row: (
+        -row["match_count"],
+        -row["question_match_count"],
+        row["question_length"],
+        (row["keyword_count"] is not None, row["keyword_count"] or 0)
+    ))
+    return matched[:n_results]
+
+
+def find_answers_batch(
+    queries: List[str],
+    collection,
+    settings: Optional[Dict] = None,
+    n_results: int = 5
+) -> List[SearchResult]:
+    """
+    Каскадный поиск для нескольких запросов сразу
+
+    Результаты совпадают с find_answer для каждого запроса, но:
+    - exact и keyword уровни считаются в памяти по одной выборке FAQ
+    - все запросы, не найденные на первых уровнях, кодируются одним
+      батчем и ищутся одним запросом к векторному бэкенду
+
+    Используется для массовой оценки качества (админка, тестовые скрипты)
+    и для обработки очереди запросов, где накладные расходы модели
+    делятся на весь батч.
+
+    Args:
+        queries: Тексты запросов
+        collection: ChromaDB коллекция или векторный бэкенд (None - без семантического уровня)
+        settings: Настройки (пороги, параметры). Если None - берутся из БД
+        n_results: Количество результатов семантического поиска на запрос
+
+    Returns:
+        Список SearchResult в порядке queries
+    """
+    from src.core.database import get_bot_settings
+
+    if not queries:
+        return []
+
+    started = time.perf_counter()
+
+    if settings is None:
+        settings = get_bot_settings()
+
+    exact_threshold = float(settings.get('exact_match_threshold', 95))
+    keyword_threshold = float(settings.get('keyword_match_threshold', 80))
+    semantic_threshold = float(settings.get('semantic_match_threshold', 45))
+    keyword_max_words = int(settings.get('keyword_search_max_words', 5))
+
+    results: List[Optional[SearchResult]] = [None] * len(queries)
+    pending: List[int] = []
+
+    try:
+        faq_rows = _load_faq_rows()
+    except Exception as e:
+        logger.error(f"Ошибка загрузки FAQ для пакетного поиска: {e}", exc_info=True)
+        faq_rows = []
+
+    # Первый FAQ с таким нормализованным вопросом - как в find_exact_match
+    exact_index: Dict[str, Dict] = {}
+    for row in faq_rows:
+        exact_index.setdefault(row["normalized_question"], row)
+
+    # УРОВНИ 1-2: Exact Match и Keyword Search в памяти
+    for i, query_text in enumerate(queries):
+        normalized_query = normalize_text(query_text)
+        row = exact_index.get(normalized_query) if normalized_query else None
+        if row and 100.0 >= exact_threshold:
+            results[i] = SearchResult(
+                found=True,
+                faq_id=row["id"],
+                question=row["question"],
+                answer=row["answer"],
+                confidence=100.0,
+                search_level='exact',
+                all_results=None,
+                message=None
+            )
+            continue
+
+        if len(query_text.split()) <= keyword_max_words:
+            query_keywords = extract_keywords(query_text)
+            if query_keywords:
+                rows = _keyword_rows_in_memory(faq_rows, query_keywords, n_results=5)
+                result = _build_keyword_result(rows, query_keywords, keyword_threshold)
+                if result and result.confidence >= keyword_threshold:
+                    results[i] = result
+                    continue
+
+        pending.append(i)
+
+    # УРОВЕНЬ 3: один батч эмбеддингов и один запрос к бэкенду
+    semantic_found = 0
+    if pending and collection is not None:
+        try:
+            backend = get_vector_backend(collection)
+            batch = backend.query(
+                [f"search_query: {queries[i]}" for i in pending],
+                n_results=n_results
+            )
+            for position, i in enumerate(pending):
+                single = {
+                    key: [batch[key][position]]
+                    for key in ("ids", "distances", "metadatas", "documents")
+                    if batch.get(key) is not None
+                }
+                if single.get("ids") and single["ids"][0]:
+                    results[i] = _build_semantic_result(single, semantic_threshold)
+                    if results[i]:
+                        semantic_found += 1
+        except Exception as e:
+            logger.error(f"Ошибка пакетного семантического поиска: {e}", exc_info=True)
+
+    # УРОВЕНЬ 4: Fallback (сообщение читается из настроек один раз)
+    fallback = None
+    for i, result in enumerate(results):
+        if result is None:
+            fallback = fallback or get_fallback_result()
+            results[i] = replace(fallback)
+
+    levels: Dict[str, int] = {}
+    for result in results:
+        levels[result.search_level] = levels.get(result.search_level, 0) + 1
+
+    logger.info(
+        f"🔍 Пакетный поиск: {len(queries)} запросов за {(time.perf_counter() - started) * 1000:.0f} мс "
+        f"(семантический батч: {len(pending)}, найдено: {semantic_found}; уровни: {levels})"
+    )
+    return results
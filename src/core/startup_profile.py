@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Профилирование холодного старта сервисов
+
+- время импорта модуля по пакетам (python -X importtime в отдельном
+  процессе, чтобы кэш модулей текущего процесса не искажал замер)
+  и пиковая память процесса после импорта
+- время этапов инициализации (StartupProfiler.stage)
+
+Используется режимом `python src/web/web_admin.py --profile-startup`.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_RSS_MARKER = "__startup_profile_rss_kb="
+
+
+def profile_import(module: str, top: int = 15) -> Optional[Dict]:
+    """
+    Замерить импорт модуля в чистом интерпретаторе
+
+    Args:
+        module: Имя модуля (например src.web.web_admin)
+        top: Сколько самых тяжёлых пакетов вернуть
+
+    Returns:
+        Словарь total_ms, rss_mb, packages [(пакет, мс)] или None при ошибке импорта
+    """
+    code = (
+        f"import {module}, resource; "
+        f"print('{_RSS_MARKER}' + str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))"
+    )
+    env = dict(os.environ, PYTHONPATH=_PROJECT_ROOT)
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=_PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    if completed.returncode != 0:
+        logger.error(f"Не удалось импортировать {module}: {completed.stderr.strip().splitlines()[-1:]}")
+        return None
+
+    # Строки вида "import time:      1234 |       5678 |   package.module"
+    packages: Dict[str, float] = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|", 2)
+            self_us = int(self_us)
+        except ValueError:
+            continue
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+        total_us += self_us
+
+    rss_kb = 0
+    for line in completed.stdout.splitlines():
+        if line.startswith(_RSS_MARKER):
+            rss_kb = int(line[len(_RSS_MARKER):])
+
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "wall_ms": round(wall_ms, 1),
+        "rss_mb": round(rss_kb / 1024, 1),
+        "packages": [(package, round(us / 1000, 1)) for package, us in heaviest]
+    }
+
+
+class StartupProfiler:
+    """Время этапов инициализации сервиса"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: List[tuple] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замерить этап (без накладных расходов, если профилирование выключено)"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - started) * 1000))
+
+    def report(self, module: str, deferred_modules: Optional[List[str]] = None):
+        """
+        Напечатать отчёт о старте
+
+        Args:
+            module: Модуль сервиса для замера импорта
+            deferred_modules: Отложенные тяжёлые модули - для сравнения,
+                              сколько стоил бы их импорт при старте
+        """
+        print("=" * 70)
+        print(f"⏱️  ПРОФИЛЬ СТАРТА: {module}")
+        print("=" * 70)
+
+        result = profile_import(module)
+        if result:
+            print(f"Импорт: {result['total_ms']:.1f} мс (процесс {result['wall_ms']:.0f} мс), "
+                  f"пиковая память {result['rss_mb']:.1f} МБ")
+            for package, ms in result["packages"]:
+                print(f"   {package:<32} {ms:>9.1f} мс")
+
+        if self.stages:
+            print("\nИнициализация:")
+            for name, ms in self.stages:
+                print(f"   {name:<32} {ms:>9.1f} мс")
+            print(f"   {'итого':<32} {sum(ms for _, ms in self.stages):>9.1f} мс")
+
+        if deferred_modules:
+            print("\nОтложенные импорты (загружаются при первом использовании):")
+            for deferred in deferred_modules:
+                deferred_result = profile_import(deferred, top=0)
+                if deferred_result:
+                    print(f"   {deferred:<32} {deferred_result['total_ms']:>9.1f} мс, "
+                          f"{deferred_result['rss_mb']:>7.1f} МБ")
+                else:
+                    print(f"   {deferred:<32} не установлен")
+        print("=" * 70)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Модуль расчёта статистики тестовых периодов
+
+Счётчики периода берутся из роллапов статистики (period_key = ID периода),
+топы FAQ по оценкам считаются одним CTE-запросом по логам периода,
+неудачные запросы - вторым. Логи периода могут быть перенесены в файл
+архива, поэтому запросы к логам читают и его. Статистика завершённых
+периодов не меняется, поэтому результат кэшируется в памяти процесса.
+"""
+
+import copy
+import logging
+import threading
+from typing import Dict, Optional
+
+from src.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Размер топов в статистике периода
+PERIOD_TOP_LIMIT = 10
+
+# Лимит неудачных запросов (для Excel отчета)
+PERIOD_FAILED_QUERIES_LIMIT = 200
+
+# Кэш статистики завершённых периодов: period_id -> stats
+_period_cache: Dict[int, Dict] = {}
+_period_cache_lock = threading.Lock()
+
+
+def _build_period_faq_ratings_query(
+    answer_logs: str = "answer_logs",
+    rating_logs: str = "rating_logs"
+) -> str:
+    """
+    Собрать запрос топов FAQ по оценкам периода
+
+    Каждая ветка UNION ALL возвращает строки вида (kind, key, n, question, category).
+    CTE r читает оценки периода один раз.
+    answer_logs/rating_logs - источники строк (таблица или подзапрос с архивом).
+    """
+    return f"""
+        WITH
+        r AS (
+            SELECT rl.rating, al.faq_id
+            FROM {rating_logs} rl
+            LEFT JOIN {answer_logs} al ON al.id = rl.answer_log_id
+            WHERE rl.period_id = :period_id
+        ),
+        faq_ratings AS (
+            SELECT
+                f.id, f.question, f.category,
+                SUM(CASE WHEN r.rating = 'helpful' THEN 1 ELSE 0 END) AS helpful,
+                SUM(CASE WHEN r.rating = 'not_helpful' THEN 1 ELSE 0 END) AS not_helpful
+            FROM r
+            JOIN faq f ON f.id = r.faq_id
+            GROUP BY f.id
+        )
+        SELECT * FROM (
+            SELECT 'helpful_faq' AS kind, id AS key, helpful AS n, question, category
+            FROM faq_ratings
+            WHERE helpful > 0
+            ORDER BY helpful DESC
+            LIMIT :top_limit
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT 'not_helpful_faq', id, not_helpful, question, category
+            FROM faq_ratings
+            WHERE not_helpful > 0
+            ORDER BY not_helpful DESC
+            LIMIT :top_limit
+        )
+    """
+
+
+def _collect_period_faq_ratings(rows) -> Dict:
+    """
+    Разложить строки запроса топов FAQ по ключам статистики
+
+    Args:
+        rows: Результат запроса из _build_period_faq_ratings_query
+
+    Returns:
+        Словарь с top_helpful_faqs и need_improvement_faqs
+    """
+    stats = {
+        "top_helpful_faqs": [],
+        "need_improvement_faqs": []
+    }
+
+    for row in rows:
+        if row["kind"] == "helpful_faq":
+            stats["top_helpful_faqs"].append({
+                "faq_id": row["key"],
+                "question": row["question"],
+                "category": row["category"],
+                "helpful_count": row["n"]
+            })
+        elif row["kind"] == "not_helpful_faq":
+            stats["need_improvement_faqs"].append({
+                "faq_id": row["key"],
+                "question": row["question"],
+                "category": row["category"],
+                "not_helpful_count": row["n"]
+            })
+
+    return stats
+
+
+def compute_period_statistics(period_id: int) -> Dict:
+    """
+    Посчитать статистику тестового периода без кэша
+
+    Args:
+        period_id: ID тестового периода
+
+    Returns:
+        Словарь со статистикой (пустой, если период не найден)
+    """
+    from src.core.database import (
+        get_db_connection,
+        get_test_period,
+        get_failed_queries_for_period,
+        attach_archive_database,
+        period_log_source,
+        _get_rollup_statistics
+    )
+
+    period = get_test_period(period_id)
+    if not period:
+        return {}
+
+    with get_db_connection() as conn:
+        # Логи периода могли быть перенесены в файл архива
+        with_archive = attach_archive_database(conn)
+        cursor = conn.cursor()
+
+        # Счётчики из роллапов (роллапы периода остаются в основной БД и после переноса логов)
+        rollup_stats = _get_rollup_statistics(cursor, period_key=period_id, top_limit=PERIOD_TOP_LIMIT, faq_tops=False)
+
+        # Топы FAQ по оценкам - одним запросом по логам периода
+        cursor.execute(
+            _build_period_faq_ratings_query(
+                answer_logs=period_log_source("answer_logs", with_archive),
+                rating_logs=period_log_source("rating_logs", with_archive)
+            ),
+            {"period_id": period_id, "top_limit": PERIOD_TOP_LIMIT}
+        )
+        faq_ratings = _collect_period_faq_ratings(cursor.fetchall())
+
+    stats = {"period": period}
+    for key in (
+        "total_queries", "total_answers", "search_levels", "avg_similarity",
+        "helpful_count", "not_helpful_count", "helpful_percentage", "no_answer_count",
+        "top_queries", "platforms", "daily_dynamics", "unique_users"
+    ):
+        stats[key] = rollup_stats[key]
+    stats.update(faq_ratings)
+
+    # Неудачные запросы (для Excel отчета)
+    stats["failed_queries"] = get_failed_queries_for_period(period_id, limit=PERIOD_FAILED_QUERIES_LIMIT)
+
+    return stats
+
+
+def get_period_statistics(period_id: int) -> Dict:
+    """
+    Получить статистику тестового периода (с кэшем для завершённых периодов)
+
+    Args:
+        period_id: ID тестового периода
+
+    Returns:
+        Словарь со статистикой (пустой, если период не найден)
+    """
+    with _period_cache_lock:
+        cached = _period_cache.get(period_id)
+    record_cache("period_statistics", cached is not None)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    stats = compute_period_statistics(period_id)
+
+    # Завершённые периоды не меняются - кэшируем
+    if stats and stats["period"]["status"] == "completed":
+        with _period_cache_lock:
+            _period_cache[period_id] = copy.deepcopy(stats)
+        logger.info(f"Статистика завершённого периода {period_id} закэширована")
+
+    return stats
+
+
+def invalidate_period_statistics(period_id: Optional[int] = None):
+    """
+    Сбросить кэш статистики периода
+
+    Args:
+        period_id: ID периода (None - сбросить весь кэш)
+    """
+    with _period_cache_lock:
+        if period_id is None:
+            _period_cache.clear()
+        else:
+            _period_cache.pop(period_id, None)
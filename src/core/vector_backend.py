@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Векторные бэкенды для семантического поиска
+
+find_semantic_match работает с бэкендом, а не напрямую с коллекцией ChromaDB.
+Бэкенд возвращает результаты в формате collection.query (ids, distances,
+metadatas, documents - списки списков, cosine distance), поэтому confidence
+и похожие вопросы считаются одинаково для всех бэкендов.
+
+- chroma: запрос в коллекцию ChromaDB (HNSW)
+- numpy: точный поиск перебором по нормализованной float32 матрице,
+  отображённой в память (np.memmap); для базы из нескольких тысяч FAQ
+  быстрее и предсказуемее HNSW
+
+Бэкенд выбирается переменной окружения VECTOR_BACKEND.
+
+Numpy бэкенд может держать в памяти квантованную копию матрицы
+(VECTOR_QUANTIZATION=int8 - int8 с масштабом на вектор, float16).
+Кандидаты отбираются по квантованным скалярным произведениям, затем
+пересчитываются в float32 по матрице на диске (memmap читает только
+строки кандидатов) - distances и порог semantic_match_threshold
+остаются такими же, как без квантования.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from src.core.latency import stage
+from src.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Бэкенд семантического поиска: chroma | numpy
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+
+# Каталог с матрицами эмбеддингов для numpy бэкенда
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "data/vector_index")
+
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+# Квантование матрицы numpy бэкенда: none | int8 | float16
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+
+VECTOR_QUANTIZATIONS = ("none", "int8", "float16")
+
+# Во сколько раз больше кандидатов, чем n_results, пересчитывать в float32
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+# Строк квантованной матрицы на один шаг скалярного произведения
+# (ограничивает временную память при приведении к int32/float32)
+_SCORE_CHUNK_ROWS = 4096
+
+if VECTOR_BACKEND not in VECTOR_BACKENDS:
+    logger.warning(f"Неизвестный VECTOR_BACKEND={VECTOR_BACKEND}, используется chroma")
+    VECTOR_BACKEND = "chroma"
+
+if VECTOR_QUANTIZATION not in VECTOR_QUANTIZATIONS:
+    logger.warning(f"Неизвестный VECTOR_QUANTIZATION={VECTOR_QUANTIZATION}, квантование отключено")
+    VECTOR_QUANTIZATION = "none"
+
+
+def quantize_matrix(matrix, quantization: str):
+    """
+    Квантовать нормализованную матрицу эмбеддингов
+
+    Args:
+        matrix: float32 матрица (n, dim)
+        quantization: int8 | float16
+
+    Returns:
+        Tuple (квантованная матрица, масштабы строк float32 или None)
+    """
+    import numpy as np
+
+    if quantization == "int8":
+        # Масштаб на вектор: максимум модуля -> 127
+        scales = np.abs(matrix).max(axis=1).astype(np.float32) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales
+
+    if quantization == "float16":
+        return np.asarray(matrix, dtype=np.float16), None
+
+    raise ValueError(f"Неизвестный тип квантования: {quantization}")
+
+
+class ChromaBackend:
+    """Поиск через collection.query (HNSW)"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def query(self, query_texts: List[str], n_results: int = 5) -> Dict:
+        """
+        Найти ближайшие документы
+
+        Args:
+            query_texts: Тексты запросов (с префиксом search_query:)
+            n_results: Количество результатов на запрос
+
+        Returns:
+            Результаты в формате collection.query
+        """
+        # Эмбеддинг тем же путём, что и внутри collection.query, но отдельным
+        # этапом - чтобы время модели и HNSW поиска замерялись раздельно
+        if not hasattr(self.collection, "_embed"):
+            with stage("vector_query"):
+                return self.collection.query(
+                    query_texts=query_texts,
+                    n_results=n_results,
+                    include=["documents", "metadatas", "distances"]
+                )
+
+        with stage("embedding"):
+            query_embeddings = self.collection._embed(input=query_texts, is_query=True)
+        with stage("vector_query"):
+            return self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"]
+            )
+
+
+class NumpyBackend:
+    """
+    Точный поиск по матрице эмбеддингов коллекции
+
+    Векторы выгружаются из коллекции один раз (при загрузке/перезагрузке),
+    нормализуются и сохраняются в VECTOR_INDEX_DIR; поиск - скалярное
+    произведение с запросом и argpartition для топ-k.
+    При квантовании в памяти держится int8/float16 копия, а float32
+    матрица на диске читается только для пересчёта кандидатов.
+    """
+
+    name = "numpy"
+
+    def __init__(
+        self,
+        ids: List[str],
+        metadatas: List[Dict],
+        documents: List[str],
+        matrix,
+        embedding_function,
+        quantization: str = "none"
+    ):
+        self.ids = ids
+        self.metadatas = metadatas
+        self.documents = documents
+        self.matrix = matrix
+        self.embedding_function = embedding_function
+        self.quantization = quantization if len(ids) else "none"
+        self.quantized, self.scales = (None, None)
+        if self.quantization != "none":
+            self.quantized, self.scales = quantize_matrix(matrix, self.quantization)
+
+    @classmethod
+    def from_collection(
+        cls,
+        collection,
+        embedding_function=None,
+        directory: Optional[str] = None,
+        quantization: Optional[str] = None
+    ) -> "NumpyBackend":
+        """
+        Построить бэкенд по содержимому коллекции ChromaDB
+
+        Args:
+            collection: Коллекция ChromaDB
+            embedding_function: Функция эмбеддингов запросов
+                                (None - функция коллекции)
+            directory: Каталог для матрицы (None - VECTOR_INDEX_DIR)
+            quantization: none | int8 | float16 (None - VECTOR_QUANTIZATION)
+        """
+        import numpy as np
+
+        started = time.perf_counter()
+        embedding_function = embedding_function or getattr(collection, "_embedding_function", None)
+        if embedding_function is None:
+            raise ValueError("Для numpy бэкенда нужна функция эмбеддингов запросов")
+
+        data = collection.get(include=["embeddings", "metadatas", "documents"])
+        ids = list(data["ids"])
+        vectors = data["embeddings"]
+
+        if ids:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        # Сохраняем во временный файл и подменяем атомарно: несколько процессов
+        # (боты) могут перестраивать одну и ту же матрицу одновременно
+        directory = directory or VECTOR_INDEX_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{collection.name}.npy")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+
+        backend = cls(
+            ids=ids,
+            metadatas=list(data["metadatas"]),
+            documents=list(data["documents"]),
+            matrix=np.load(path, mmap_mode="r"),
+            embedding_function=embedding_function,
+            quantization=quantization or VECTOR_QUANTIZATION
+        )
+        logger.info(
+            f"✅ Numpy индекс {collection.name}: {len(ids)} векторов ({backend.quantization}, "
+            f"{backend.memory_bytes() / 1024 / 1024:.1f} МБ) за {(time.perf_counter() - started) * 1000:.0f} мс"
+        )
+        return backend
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def memory_bytes(self) -> int:
+        """Объём матрицы, которая читается целиком при каждом запросе"""
+        if self.quantized is not None:
+            scales = self.scales.nbytes if self.scales is not None else 0
+            return self.quantized.nbytes + scales
+        return self.matrix.nbytes
+
+    def _approximate_scores(self, query):
+        """Скалярные произведения с квантованной матрицей (порциями строк)"""
+        import numpy as np
+
+        scores = np.empty(len(self.ids), dtype=np.float32)
+
+        if self.quantization == "int8":
+            query_scale = float(np.abs(query).max()) / 127.0 or 1.0
+            query_int = np.round(query / query_scale).astype(np.int32)
+            for start in range(0, len(scores), _SCORE_CHUNK_ROWS):
+                chunk = self.quantized[start:start + _SCORE_CHUNK_ROWS].astype(np.int32)
+                scores[start:start + len(chunk)] = (chunk @ query_int) * self.scales[start:start + len(chunk)] * query_scale
+        else:
+            for start in range(0, len(scores), _SCORE_CHUNK_ROWS):
+                chunk = self.quantized[start:start + _SCORE_CHUNK_ROWS].astype(np.float32)
+                scores[start:start + len(chunk)] = chunk @ query
+
+        return scores
+
+    def query(self, query_texts: List[str], n_results: int = 5) -> Dict:
+        """
+        Найти ближайшие документы (точный поиск)
+
+        Args:
+            query_texts: Тексты запросов (с префиксом search_query:)
+            n_results: Количество результатов на запрос
+
+        Returns:
+            Результаты в формате collection.query (cosine distance = 1 - cos)
+        """
+        import numpy as np
+
+        results = {"ids": [], "distances": [], "metadatas": [], "documents": []}
+        k = min(n_results, len(self.ids))
+
+        if k == 0:
+            for _ in query_texts:
+                for key in results:
+                    results[key].append([])
+            return results
+
+        with stage("embedding"):
+            queries = np.asarray(self.embedding_function(query_texts), dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1.0, norms)
+
+        with stage("vector_query"):
+            for query in queries:
+                self._query_one(query, k, results)
+
+        return results
+
+    def _query_one(self, query, k: int, results: Dict):
+        """Топ-k для одного нормализованного вектора запроса (дописывается в results)"""
+        import numpy as np
+
+        if self.quantized is not None:
+            # Отбор кандидатов по квантованной матрице, пересчёт в float32
+            approximate = self._approximate_scores(query)
+            n_candidates = min(len(approximate), k * max(1, VECTOR_RESCORE_FACTOR))
+            if n_candidates < len(approximate):
+                candidates = np.sort(np.argpartition(-approximate, n_candidates - 1)[:n_candidates])
+            else:
+                candidates = np.arange(len(approximate))
+            exact = np.asarray(self.matrix[candidates], dtype=np.float32) @ query
+        else:
+            candidates = np.arange(len(self.ids))
+            exact = self.matrix @ query
+
+        if k < len(exact):
+            top = np.argpartition(-exact, k - 1)[:k]
+        else:
+            top = np.arange(len(exact))
+        top = top[np.argsort(-exact[top], kind="stable")]
+
+        results["ids"].append([self.ids[candidates[i]] for i in top])
+        results["distances"].append([float(1.0 - exact[i]) for i in top])
+        results["metadatas"].append([self.metadatas[candidates[i]] for i in top])
+        results["documents"].append([self.documents[candidates[i]] for i in top])
+
+
+# Бэкенд для текущей коллекции; ссылка на коллекцию держится, чтобы
+# после reload новый объект не мог получить тот же id()
+_backend_cache = {"collection": None, "backend": None}
+_backend_lock = threading.Lock()
+
+
+def get_vector_backend(collection, embedding_function=None):
+    """
+    Получить бэкенд поиска для коллекции согласно VECTOR_BACKEND
+
+    Numpy бэкенд строится один раз на объект коллекции: после reload
+    коллекции в боте (новый объект) матрица перестраивается. Поэтому
+    вызывающий код держит объект коллекции между запросами, а не получает
+    его заново (см. get_active_collection в web_admin).
+
+    Args:
+        collection: Коллекция ChromaDB или готовый бэкенд
+        embedding_function: Функция эмбеддингов запросов (для numpy)
+
+    Returns:
+        ChromaBackend или NumpyBackend
+    """
+    if isinstance(collection, (ChromaBackend, NumpyBackend)):
+        return collection
+
+    if VECTOR_BACKEND != "numpy":
+        return ChromaBackend(collection)
+
+    with _backend_lock:
+        record_cache("numpy_index", _backend_cache["collection"] is collection)
+        if _backend_cache["collection"] is not collection:
+            try:
+                _backend_cache["backend"] = NumpyBackend.from_collection(collection, embedding_function)
+            except Exception as e:
+                logger.error(f"Не удалось построить numpy индекс, используется ChromaDB: {e}")
+                _backend_cache["backend"] = ChromaBackend(collection)
+            _backend_cache["collection"] = collection
+        return _backend_cache["backend"]
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Фоновая загрузка модели эмбеддингов и коллекции
+
+Боты и админка поднимают HTTP сервер сразу, а torch/sentence-transformers,
+ChromaDB и коллекция загружаются в отдельном потоке. Пока идёт прогрев,
+health отдаёт status=warming, exact и keyword уровни поиска работают,
+а семантический уровень ждёт окончания прогрева (не дольше
+WARMUP_WAIT_TIMEOUT секунд).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from src.core.metrics import MODEL_LOAD_SECONDS, MODEL_READY
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд семантический поиск ждёт окончания прогрева
+WARMUP_WAIT_TIMEOUT = float(os.getenv("WARMUP_WAIT_TIMEOUT", "30"))
+
+
+class ModelWarmup:
+    """
+    Загрузка в фоновом потоке с состоянием pending/warming/ready/failed
+
+    load_func выполняется один раз (повторно - только после ошибки),
+    её результат доступен в result после перехода в ready.
+    """
+
+    def __init__(self, name: str, load_func: Callable[[], Any]):
+        """
+        Args:
+            name: Название для логов
+            load_func: Функция загрузки без аргументов
+        """
+        self.name = name
+        self.load_func = load_func
+        self.state = "pending"
+        self.result = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> "ModelWarmup":
+        """Запустить загрузку в фоне (если ещё не запущена или завершилась ошибкой)"""
+        with self._lock:
+            if self.state not in ("pending", "failed"):
+                return self
+            self.state = "warming"
+            self.error = None
+            self.started_at = time.time()
+            self.seconds = None
+            self._done.clear()
+
+        MODEL_READY.set(0, name=self.name)
+        threading.Thread(target=self._run, name=f"warmup-{self.name}", daemon=True).start()
+        return self
+
+    def _run(self):
+        logger.info(f"⏳ Прогрев {self.name}: загрузка модели и коллекции...")
+        try:
+            self.result = self.load_func()
+            self.state = "ready"
+            logger.info(f"✅ Прогрев {self.name} завершён за {time.time() - self.started_at:.1f} с")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.error(f"❌ Ошибка прогрева {self.name}: {e}", exc_info=True)
+        finally:
+            self.seconds = round(time.time() - self.started_at, 2)
+            MODEL_LOAD_SECONDS.set(self.seconds, name=self.name)
+            MODEL_READY.set(1 if self.is_ready else 0, name=self.name)
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Дождаться окончания прогрева
+
+        Args:
+            timeout: Максимальное время ожидания в секундах (None - без ограничения)
+
+        Returns:
+            True, если загрузка завершилась успешно
+        """
+        if self.state == "pending":
+            return False
+        self._done.wait(timeout)
+        return self.is_ready
+
+    def status(self) -> Dict:
+        """Состояние для health: state, seconds (время загрузки или с начала прогрева), error"""
+        if self.seconds is not None:
+            seconds = self.seconds
+        elif self.started_at is not None:
+            seconds = round(time.time() - self.started_at, 2)
+        else:
+            seconds = None
+        return {"state": self.state, "seconds": seconds, "error": self.error}
@@ -5,67 +5,145 @@
 """
 
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.chart import BarChart, PieChart, LineChart, Reference
-from openpyxl.utils import get_column_letter
 from io import BytesIO, TextIOWrapper
 import json
 import csv
 from datetime import datetime
 
 
-def generate_period_excel_report(stats: dict) -> BytesIO:
+def create_named_style(name: str, font=None, fill=None, alignment=None, border=None) -> NamedStyle:
     """
-    Генерация Excel отчета по тестовому периоду с графиками
+    Создать именованный стиль (регистрируется в книге один раз и переиспользуется всеми ячейками)
 
-    :param stats: Статистика по периоду из get_period_statistics()
-    :return: BytesIO объект с Excel файлом
+    :param name: Имя стиля
+    :return: NamedStyle
+    """
+    style = NamedStyle(name=name)
+    if font is not None:
+        style.font = font
+    if fill is not None:
+        style.fill = fill
+    if alignment is not None:
+        style.alignment = alignment
+    if border is not None:
+        style.border = border
+    return style
+
+
+def styled_cell(ws, value, style: str = None) -> WriteOnlyCell:
     """
-    wb = Workbook()
+    Ячейка для write-only листа
 
-    # Стили
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
+    :param ws: Write-only лист
+    :param value: Значение
+    :param style: Имя зарегистрированного NamedStyle (None - без стиля)
+    :return: WriteOnlyCell
+    """
+    cell = WriteOnlyCell(ws, value=value)
+    if style:
+        cell.style = style
+    return cell
+
+
+def _register_period_report_styles(wb: Workbook):
+    """Зарегистрировать именованные стили отчета по тестовому периоду"""
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
     header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-    subheader_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    subheader_font = Font(bold=True, size=11)
+    styles = [
+        create_named_style("report_title", font=Font(bold=True, size=14)),
+        create_named_style("sheet_title", font=Font(bold=True, size=13)),
+        create_named_style("sheet_title_warning", font=Font(bold=True, size=13, color="C00000")),
+        create_named_style("sheet_title_error", font=Font(bold=True, size=13, color="FF0000")),
+        create_named_style("section_title", font=Font(bold=True, size=13, color="4472C4")),
+        create_named_style("label", font=Font(bold=True)),
+        create_named_style("note", font=Font(italic=True, size=10)),
+        create_named_style(
+            "table_header",
+            font=Font(bold=True, color="FFFFFF", size=12),
+            fill=PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid"),
+            alignment=header_alignment,
+            border=border
+        ),
+        create_named_style(
+            "table_header_warning",
+            font=Font(bold=True, color="FFFFFF", size=12),
+            fill=PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid"),
+            alignment=header_alignment,
+            border=border
+        ),
+        create_named_style("table_cell", border=border),
+        create_named_style("table_cell_wrap", border=border, alignment=Alignment(wrap_text=True, vertical="top")),
+    ]
+    for style in styles:
+        wb.add_named_style(style)
+
+
+def _create_sheet(wb: Workbook, title: str, widths: dict):
+    """
+    Создать write-only лист с заданной шириной колонок
+
+    Ширину нужно задать до первой строки - write-only лист пишет её в начало XML.
+    """
+    ws = wb.create_sheet(title=title)
+    for column, width in widths.items():
+        ws.column_dimensions[column].width = width
+    return ws
+
+
+def _append_title(ws, title: str, merge_range: str, style: str = "sheet_title"):
+    """Добавить заголовок листа в первую строку (с объединением ячеек)"""
+    ws.append([styled_cell(ws, title, style)])
+    ws.merged_cells.add(merge_range)
+
 
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+def _append_table_header(ws, headers: list, style: str = "table_header"):
+    """Добавить строку шапки таблицы"""
+    ws.append([styled_cell(ws, header, style) for header in headers])
+
+
+def _append_table_row(ws, values: list, style: str = "table_cell"):
+    """Добавить строку таблицы с границами"""
+    ws.append([styled_cell(ws, value, style) for value in values])
+
+
+def generate_period_excel_report(stats: dict) -> BytesIO:
+    """
+    Генерация Excel отчета по тестовому периоду с графиками
+
+    Книга создаётся в write-only режиме: строки сразу пишутся в поток,
+    стили - именованные, поэтому время и память растут линейно с объёмом данных.
+
+    :param stats: Статистика по периоду из get_period_statistics()
+    :return: BytesIO объект с Excel файлом
+    """
+    wb = Workbook(write_only=True)
+    _register_period_report_styles(wb)
 
     # ========== ЛИСТ 1: ОБЩАЯ СВОДКА ==========
-    ws_summary = wb.active
-    ws_summary.title = "📊 Сводка"
+    ws_summary = _create_sheet(wb, "📊 Сводка", {'A': 30, 'B': 20})
 
     # Заголовок отчета
-    ws_summary['A1'] = f"Отчет по тестовому периоду: {stats['period']['name']}"
-    ws_summary['A1'].font = Font(bold=True, size=14)
-    ws_summary.merge_cells('A1:D1')
+    _append_title(ws_summary, f"Отчет по тестовому периоду: {stats['period']['name']}", 'A1:D1', "report_title")
+    ws_summary.append([])
 
     # Информация о периоде
-    row = 3
-    ws_summary[f'A{row}'] = "Период:"
-    ws_summary[f'B{row}'] = f"{stats['period']['start_date']} — {stats['period']['end_date'] or 'Активен'}"
-    ws_summary[f'A{row}'].font = Font(bold=True)
+    ws_summary.append([
+        styled_cell(ws_summary, "Период:", "label"),
+        f"{stats['period']['start_date']} — {stats['period']['end_date'] or 'Активен'}"
+    ])
 
-    row += 1
     if stats['period'].get('description'):
-        ws_summary[f'A{row}'] = "Описание:"
-        ws_summary[f'B{row}'] = stats['period']['description']
-        ws_summary[f'A{row}'].font = Font(bold=True)
-        row += 1
+        ws_summary.append([styled_cell(ws_summary, "Описание:", "label"), stats['period']['description']])
 
-    row += 1
+    ws_summary.append([])
 
     # Ключевые метрики
-    ws_summary[f'A{row}'] = "КЛЮЧЕВЫЕ ПОКАЗАТЕЛИ"
-    ws_summary[f'A{row}'].font = Font(bold=True, size=13, color="4472C4")
-    row += 1
+    ws_summary.append([styled_cell(ws_summary, "КЛЮЧЕВЫЕ ПОКАЗАТЕЛИ", "section_title")])
 
     metrics = [
         ("Всего запросов", stats['total_queries']),
@@ -81,33 +159,18 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
 
     for label, value in metrics:
         if label:
-            ws_summary[f'A{row}'] = label
-            ws_summary[f'B{row}'] = value
-            ws_summary[f'A{row}'].font = Font(bold=True)
-        row += 1
-
-    # Автоширина колонок
-    ws_summary.column_dimensions['A'].width = 30
-    ws_summary.column_dimensions['B'].width = 20
+            ws_summary.append([styled_cell(ws_summary, label, "label"), value])
+        else:
+            ws_summary.append([])
 
     # ========== ЛИСТ 2: РАСПРЕДЕЛЕНИЕ ПО УРОВНЯМ ПОИСКА ==========
-    ws_levels = wb.create_sheet(title="🔍 Уровни поиска")
+    ws_levels = _create_sheet(wb, "🔍 Уровни поиска", {'A': 30, 'B': 10, 'C': 15, 'D': 25})
 
-    # Заголовок
-    ws_levels['A1'] = "Распределение по уровням каскадного поиска"
-    ws_levels['A1'].font = Font(bold=True, size=13)
-    ws_levels.merge_cells('A1:D1')
+    _append_title(ws_levels, "Распределение по уровням каскадного поиска", 'A1:D1')
+    ws_levels.append([])
 
-    # Таблица
-    row = 3
-    headers = ['Уровень', 'Иконка', 'Количество', 'Средняя уверенность (%)']
-    for col, header in enumerate(headers, start=1):
-        cell = ws_levels.cell(row=row, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
+    # Таблица (шапка в строке 3)
+    _append_table_header(ws_levels, ['Уровень', 'Иконка', 'Количество', 'Средняя уверенность (%)'])
 
     # Иконки и названия уровней
     level_names = {
@@ -120,18 +183,12 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
         'none': ('Не найдено', '❌')
     }
 
-    row += 1
+    row = 4
     for level_key in ['exact', 'keyword', 'semantic', 'disambiguation_shown', 'disambiguation', 'direct', 'none']:
         level_data = stats['search_levels'].get(level_key, {'count': 0, 'avg_confidence': 0})
         level_name, icon = level_names.get(level_key, (level_key, ''))
 
-        ws_levels.cell(row=row, column=1).value = level_name
-        ws_levels.cell(row=row, column=2).value = icon
-        ws_levels.cell(row=row, column=3).value = level_data['count']
-        ws_levels.cell(row=row, column=4).value = level_data['avg_confidence']
-
-        for col in range(1, 5):
-            ws_levels.cell(row=row, column=col).border = border
+        _append_table_row(ws_levels, [level_name, icon, level_data['count'], level_data['avg_confidence']])
         row += 1
 
     # График - круговая диаграмма
@@ -149,38 +206,18 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
 
     ws_levels.add_chart(chart, "F3")
 
-    # Автоширина
-    ws_levels.column_dimensions['A'].width = 30
-    ws_levels.column_dimensions['B'].width = 10
-    ws_levels.column_dimensions['C'].width = 15
-    ws_levels.column_dimensions['D'].width = 25
-
     # ========== ЛИСТ 3: ПОПУЛЯРНЫЕ ЗАПРОСЫ ==========
-    ws_top = wb.create_sheet(title="⭐ Популярные запросы")
+    ws_top = _create_sheet(wb, "⭐ Популярные запросы", {'A': 5, 'B': 60, 'C': 15})
 
-    ws_top['A1'] = f"Топ-{len(stats['top_queries'])} популярных запросов"
-    ws_top['A1'].font = Font(bold=True, size=13)
-    ws_top.merge_cells('A1:C1')
+    _append_title(ws_top, f"Топ-{len(stats['top_queries'])} популярных запросов", 'A1:C1')
+    ws_top.append([])
 
     # Таблица
-    row = 3
-    headers = ['№', 'Запрос', 'Количество']
-    for col, header in enumerate(headers, start=1):
-        cell = ws_top.cell(row=row, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    row += 1
-    for idx, query_data in enumerate(stats['top_queries'], start=1):
-        ws_top.cell(row=row, column=1).value = idx
-        ws_top.cell(row=row, column=2).value = query_data['query']
-        ws_top.cell(row=row, column=3).value = query_data['count']
+    _append_table_header(ws_top, ['№', 'Запрос', 'Количество'])
 
-        for col in range(1, 4):
-            ws_top.cell(row=row, column=col).border = border
+    row = 4
+    for idx, query_data in enumerate(stats['top_queries'], start=1):
+        _append_table_row(ws_top, [idx, query_data['query'], query_data['count']])
         row += 1
 
     # График
@@ -200,101 +237,40 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
 
         ws_top.add_chart(chart, "E3")
 
-    ws_top.column_dimensions['A'].width = 5
-    ws_top.column_dimensions['B'].width = 60
-    ws_top.column_dimensions['C'].width = 15
-
     # ========== ЛИСТ 4: ЛУЧШИЕ FAQ ==========
-    ws_helpful = wb.create_sheet(title="👍 Лучшие FAQ")
-
-    ws_helpful['A1'] = "FAQ с наилучшими оценками"
-    ws_helpful['A1'].font = Font(bold=True, size=13)
-    ws_helpful.merge_cells('A1:D1')
-
-    row = 3
-    headers = ['№', 'Вопрос', 'Категория', 'Положительных оценок']
-    for col, header in enumerate(headers, start=1):
-        cell = ws_helpful.cell(row=row, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    row += 1
-    for idx, faq in enumerate(stats['top_helpful_faqs'], start=1):
-        ws_helpful.cell(row=row, column=1).value = idx
-        ws_helpful.cell(row=row, column=2).value = faq['question']
-        ws_helpful.cell(row=row, column=3).value = faq['category']
-        ws_helpful.cell(row=row, column=4).value = faq['helpful_count']
+    ws_helpful = _create_sheet(wb, "👍 Лучшие FAQ", {'A': 5, 'B': 50, 'C': 20, 'D': 20})
 
-        for col in range(1, 5):
-            ws_helpful.cell(row=row, column=col).border = border
-        row += 1
+    _append_title(ws_helpful, "FAQ с наилучшими оценками", 'A1:D1')
+    ws_helpful.append([])
 
-    ws_helpful.column_dimensions['A'].width = 5
-    ws_helpful.column_dimensions['B'].width = 50
-    ws_helpful.column_dimensions['C'].width = 20
-    ws_helpful.column_dimensions['D'].width = 20
+    _append_table_header(ws_helpful, ['№', 'Вопрос', 'Категория', 'Положительных оценок'])
+
+    for idx, faq in enumerate(stats['top_helpful_faqs'], start=1):
+        _append_table_row(ws_helpful, [idx, faq['question'], faq['category'], faq['helpful_count']])
 
     # ========== ЛИСТ 5: ТРЕБУЮТ УЛУЧШЕНИЯ ==========
-    ws_improve = wb.create_sheet(title="⚠️ Требуют улучшения")
-
-    ws_improve['A1'] = "FAQ с низкими оценками (работа над ошибками)"
-    ws_improve['A1'].font = Font(bold=True, size=13, color="C00000")
-    ws_improve.merge_cells('A1:D1')
-
-    row = 3
-    headers = ['№', 'Вопрос', 'Категория', 'Отрицательных оценок']
-    for col, header in enumerate(headers, start=1):
-        cell = ws_improve.cell(row=row, column=col)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-        cell.alignment = header_alignment
-        cell.border = border
-
-    row += 1
-    for idx, faq in enumerate(stats['need_improvement_faqs'], start=1):
-        ws_improve.cell(row=row, column=1).value = idx
-        ws_improve.cell(row=row, column=2).value = faq['question']
-        ws_improve.cell(row=row, column=3).value = faq['category']
-        ws_improve.cell(row=row, column=4).value = faq['not_helpful_count']
+    ws_improve = _create_sheet(wb, "⚠️ Требуют улучшения", {'A': 5, 'B': 50, 'C': 20, 'D': 20})
 
-        for col in range(1, 5):
-            ws_improve.cell(row=row, column=col).border = border
-        row += 1
+    _append_title(ws_improve, "FAQ с низкими оценками (работа над ошибками)", 'A1:D1', "sheet_title_warning")
+    ws_improve.append([])
 
-    ws_improve.column_dimensions['A'].width = 5
-    ws_improve.column_dimensions['B'].width = 50
-    ws_improve.column_dimensions['C'].width = 20
-    ws_improve.column_dimensions['D'].width = 20
+    _append_table_header(ws_improve, ['№', 'Вопрос', 'Категория', 'Отрицательных оценок'], "table_header_warning")
+
+    for idx, faq in enumerate(stats['need_improvement_faqs'], start=1):
+        _append_table_row(ws_improve, [idx, faq['question'], faq['category'], faq['not_helpful_count']])
 
     # ========== ЛИСТ 6: ДИНАМИКА ПО ДНЯМ ==========
     if stats['daily_dynamics']:
-        ws_daily = wb.create_sheet(title="📅 Динамика")
-
-        ws_daily['A1'] = "Динамика запросов по дням"
-        ws_daily['A1'].font = Font(bold=True, size=13)
-        ws_daily.merge_cells('A1:C1')
-
-        row = 3
-        headers = ['Дата', 'Количество запросов']
-        for col, header in enumerate(headers, start=1):
-            cell = ws_daily.cell(row=row, column=col)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = border
+        ws_daily = _create_sheet(wb, "📅 Динамика", {'A': 15, 'B': 20})
 
-        row += 1
-        for day_data in stats['daily_dynamics']:
-            ws_daily.cell(row=row, column=1).value = day_data['date']
-            ws_daily.cell(row=row, column=2).value = day_data['count']
+        _append_title(ws_daily, "Динамика запросов по дням", 'A1:C1')
+        ws_daily.append([])
 
-            for col in range(1, 3):
-                ws_daily.cell(row=row, column=col).border = border
+        _append_table_header(ws_daily, ['Дата', 'Количество запросов'])
+
+        row = 4
+        for day_data in stats['daily_dynamics']:
+            _append_table_row(ws_daily, [day_data['date'], day_data['count']])
             row += 1
 
         # Линейный график
@@ -313,34 +289,18 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
 
         ws_daily.add_chart(chart, "D3")
 
-        ws_daily.column_dimensions['A'].width = 15
-        ws_daily.column_dimensions['B'].width = 20
-
     # ========== ЛИСТ 7: ПЛАТФОРМЫ ==========
     if stats['platforms']:
-        ws_platforms = wb.create_sheet(title="💻 Платформы")
-
-        ws_platforms['A1'] = "Распределение по платформам"
-        ws_platforms['A1'].font = Font(bold=True, size=13)
-        ws_platforms.merge_cells('A1:C1')
-
-        row = 3
-        headers = ['Платформа', 'Количество запросов']
-        for col, header in enumerate(headers, start=1):
-            cell = ws_platforms.cell(row=row, column=col)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = border
+        ws_platforms = _create_sheet(wb, "💻 Платформы", {'A': 20, 'B': 20})
 
-        row += 1
-        for platform, count in stats['platforms'].items():
-            ws_platforms.cell(row=row, column=1).value = platform
-            ws_platforms.cell(row=row, column=2).value = count
+        _append_title(ws_platforms, "Распределение по платформам", 'A1:C1')
+        ws_platforms.append([])
 
-            for col in range(1, 3):
-                ws_platforms.cell(row=row, column=col).border = border
+        _append_table_header(ws_platforms, ['Платформа', 'Количество запросов'])
+
+        row = 4
+        for platform, count in stats['platforms'].items():
+            _append_table_row(ws_platforms, [platform, count])
             row += 1
 
         # Круговая диаграмма
@@ -357,32 +317,18 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
 
         ws_platforms.add_chart(chart, "D3")
 
-        ws_platforms.column_dimensions['A'].width = 20
-        ws_platforms.column_dimensions['B'].width = 20
-
     # ========== ЛИСТ 8: НЕУДАЧНЫЕ ЗАПРОСЫ ==========
     if stats.get('failed_queries') and len(stats['failed_queries']) > 0:
-        ws_failed = wb.create_sheet(title="❌ Неудачные запросы")
+        ws_failed = _create_sheet(wb, "❌ Неудачные запросы", {'A': 18, 'B': 20, 'C': 12, 'D': 50, 'E': 40})
 
-        ws_failed['A1'] = "Неудачные запросы (для работы над ошибками)"
-        ws_failed['A1'].font = Font(bold=True, size=13, color="FF0000")
-        ws_failed.merge_cells('A1:E1')
+        _append_title(ws_failed, "Неудачные запросы (для работы над ошибками)", 'A1:E1', "sheet_title_error")
 
-        ws_failed['A2'] = f"Всего неудачных запросов: {len(stats['failed_queries'])}"
-        ws_failed['A2'].font = Font(italic=True, size=10)
-        ws_failed.merge_cells('A2:E2')
+        ws_failed.append([styled_cell(ws_failed, f"Всего неудачных запросов: {len(stats['failed_queries'])}", "note")])
+        ws_failed.merged_cells.add('A2:E2')
+        ws_failed.append([])
 
-        row = 4
-        headers = ['Дата/Время', 'Пользователь', 'Платформа', 'Запрос', 'Причина']
-        for col, header in enumerate(headers, start=1):
-            cell = ws_failed.cell(row=row, column=col)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = border
+        _append_table_header(ws_failed, ['Дата/Время', 'Пользователь', 'Платформа', 'Запрос', 'Причина'])
 
-        row += 1
         for query in stats['failed_queries']:
             # Определяем причину неудачи
             if not query['faq_id']:
@@ -394,27 +340,13 @@ def generate_period_excel_report(stats: dict) -> BytesIO:
             else:
                 reason = "❓ Неизвестная причина"
 
-            ws_failed.cell(row=row, column=1).value = query['timestamp']
-            ws_failed.cell(row=row, column=2).value = query['username'] or 'Аноним'
-            ws_failed.cell(row=row, column=3).value = query['platform']
-            ws_failed.cell(row=row, column=4).value = query['query_text']
-            ws_failed.cell(row=row, column=5).value = reason
-
-            # Применяем границы и выравнивание
-            for col in range(1, 6):
-                cell = ws_failed.cell(row=row, column=col)
-                cell.border = border
-                if col == 4:  # Запрос
-                    cell.alignment = Alignment(wrap_text=True, vertical="top")
-
-            row += 1
-
-        # Настройка ширины колонок
-        ws_failed.column_dimensions['A'].width = 18
-        ws_failed.column_dimensions['B'].width = 20
-        ws_failed.column_dimensions['C'].width = 12
-        ws_failed.column_dimensions['D'].width = 50
-        ws_failed.column_dimensions['E'].width = 40
+            ws_failed.append([
+                styled_cell(ws_failed, query['timestamp'], "table_cell"),
+                styled_cell(ws_failed, query['username'] or 'Аноним', "table_cell"),
+                styled_cell(ws_failed, query['platform'], "table_cell"),
+                styled_cell(ws_failed, query['query_text'], "table_cell_wrap"),
+                styled_cell(ws_failed, reason, "table_cell"),
+            ])
 
     # Сохранение в BytesIO
     buffer = BytesIO()
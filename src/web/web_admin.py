@@ -3,7 +3,7 @@
 Flask веб-приложение для управления FAQ и переобучения ChromaDB
 """
 
-from flask import Flask, Blueprint, render_template, request, jsonify, redirect, url_for, make_response
+from flask import Flask, Blueprint, render_template, request, jsonify, redirect, url_for, make_response, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.middleware.proxy_fix import ProxyFix
 import uuid
@@ -11,33 +11,25 @@ import sys
 import logging
 import os
 import signal
+import threading
 import requests
 import jwt
 import re
-from io import BytesIO, TextIOWrapper
+from io import BytesIO, StringIO
 import csv
 from dotenv import load_dotenv
 from datetime import datetime
 from urllib.parse import quote
 
-# Библиотеки для экспорта
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.datavalidation import DataValidation
-
 # Добавляем корневую директорию проекта в PYTHONPATH
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from src.core import database
 from src.core import logging_config
+from src.core.chroma_sync import sync_faq_collection, get_active_collection_name
+from src.core.warmup import ModelWarmup, WARMUP_WAIT_TIMEOUT
+from src.core.metrics import register_flask_metrics
+from src.core import profiler as request_profiler
 from src.web.middleware import get_allowed_origins, is_production, cors_origin_validator, require_bitrix24_auth
 from src.web.bitrix24_integration import handle_install, handle_index, handle_app
 from src.web.bitrix24_permissions import bitrix24_permissions_bp
@@ -47,8 +39,9 @@ load_dotenv()
 
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
-import chromadb
-from chromadb.utils import embedding_functions
+# chromadb, модель эмбеддингов, reportlab и openpyxl импортируются при первом
+# использовании (семантический поиск, переобучение, экспорт PDF/Excel):
+# большинство страниц админки их не трогает, а старт и память заметно меньше
 
 # Определяем пути к статическим файлам и шаблонам
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -139,14 +132,88 @@ BITRIX24_BOT_RELOAD_URL = f"http://{BITRIX24_BOT_HOST}:5002/api/reload-chromadb"
 BITRIX24_BOT_RELOAD_SETTINGS_URL = f"http://{BITRIX24_BOT_HOST}:5002/api/reload-settings"
 BITRIX24_BOT_MARK_WELCOMED_URL = f"http://{BITRIX24_BOT_HOST}:5002/api/mark-welcomed"
 
+# Размер порции строк при потоковом экспорте логов
+LOGS_EXPORT_CHUNK_SIZE = int(os.getenv("LOGS_EXPORT_CHUNK_SIZE", "1000"))
+
+# Максимум запросов в одном вызове пакетного поиска
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "1000"))
+
 # Список всех ботов для уведомления
 ALL_BOT_RELOAD_URLS = [TELEGRAM_BOT_RELOAD_URL, BITRIX24_BOT_RELOAD_URL]
 ALL_BOT_RELOAD_SETTINGS_URLS = [TELEGRAM_BOT_RELOAD_SETTINGS_URL, BITRIX24_BOT_RELOAD_SETTINGS_URL]
 
 # Инициализация ChromaDB (поддержка Docker путей)
 CHROMA_PATH = os.getenv('CHROMA_PATH', './data/chroma_db')
-chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+chroma_client = None  # Создаётся при первом обращении (get_chroma_client)
+chroma_client_lock = threading.Lock()
+active_collection = None  # Коллекция активной версии (get_active_collection)
+active_collection_lock = threading.Lock()
+embedding_func = None  # Загружается в фоне (model_warmup)
+
+# Загружать модель эмбеддингов сразу после старта (иначе - при первом использовании)
+WEB_ADMIN_PRELOAD_MODEL = os.getenv("WEB_ADMIN_PRELOAD_MODEL", "false").lower() == "true"
+
+
+def get_chroma_client():
+    """Клиент ChromaDB (chromadb импортируется при первом вызове)"""
+    global chroma_client
+    with chroma_client_lock:
+        if chroma_client is None:
+            import chromadb
+            chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+        return chroma_client
+
+
+def get_active_collection(func):
+    """
+    Коллекция активной версии FAQ (один объект на все запросы)
+
+    Бэкенд поиска (get_vector_backend) строит numpy индекс один раз на объект
+    коллекции, поэтому объект переиспользуется, пока синхронизация не изменит
+    коллекцию (reset_active_collection) или не переключит указатель активной версии.
+    """
+    global active_collection
+    name = get_active_collection_name()
+    client = get_chroma_client()
+    with active_collection_lock:
+        if active_collection is None or active_collection.name != name:
+            active_collection = client.get_collection(name=name, embedding_function=func)
+        return active_collection
+
+
+def reset_active_collection():
+    """Сбросить объект активной коллекции (после изменения коллекции)"""
+    global active_collection
+    with active_collection_lock:
+        active_collection = None
+
+
+def load_embedding_function():
+    """Загрузка модели эмбеддингов (в фоновом потоке)"""
+    global embedding_func
+    from src.core.onnx_embeddings import create_embedding_function
+
+    func = create_embedding_function(MODEL_NAME)
+    # Первый вызов загружает ленивые модели (ONNX) и прогревает их
+    func(["search_query: прогрев"])
+    embedding_func = func
+    return func
+
+
+model_warmup = ModelWarmup("web-admin", load_embedding_function)
+
+
+def get_embedding_func(timeout: float = WARMUP_WAIT_TIMEOUT):
+    """
+    Функция эмбеддингов, дождавшись прогрева (не дольше timeout секунд)
+
+    Returns:
+        Функция эмбеддингов или None, если модель ещё не загружена
+    """
+    if embedding_func is None:
+        model_warmup.start()
+        model_warmup.wait(timeout)
+    return embedding_func
 
 # Создаем Blueprint для админ-панели
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -214,59 +281,68 @@ def check_admin_access():
             return jsonify({'error': 'Неверный токен'}), 401
 
 
-def retrain_chromadb():
+def retrain_chromadb(full=False):
     """
-    Переобучение ChromaDB на основе данных из базы
+    Синхронизация ChromaDB с базой данных
+
+    Переэмбеддятся только добавленные и изменённые FAQ, удалённые убираются
+    из коллекции. full=True - собрать новую версию коллекции и переключить
+    на неё ботов после проверки (blue/green).
     """
     try:
-        # Удаляем старую коллекцию
-        try:
-            chroma_client.delete_collection(name="faq_collection")
-            logger.info("Старая коллекция удалена")
-        except Exception as e:
-            logger.info(f"Коллекции не было или ошибка удаления: {e}")
-
-        # Создаем новую коллекцию
-        collection = chroma_client.create_collection(
-            name="faq_collection",
-            embedding_function=embedding_func,
-            metadata={"hnsw:space": "cosine"}
-        )
-        logger.info("Создана новая коллекция")
-
-        # Получаем все FAQ из базы
         all_faqs = database.get_all_faqs()
-        if not all_faqs:
+        if not all_faqs and full:
             logger.warning("В базе нет данных для обучения")
             return {"success": False, "message": "В базе нет данных"}
 
-        # Подготавливаем данные для ChromaDB
-        documents, metadatas, ids = [], [], []
-        for faq in all_faqs:
-            text = f"{faq['question']} {' '.join(faq.get('keywords', []))}"
-            documents.append(f"search_document: {text}")
-            metadatas.append({
-                "category": faq["category"],
-                "question": faq["question"],
-                "answer": faq["answer"]
-            })
-            ids.append(faq["id"])
+        func = get_embedding_func()
+        if func is None:
+            return {"success": False, "message": "Модель эмбеддингов ещё загружается, повторите позже"}
 
-        # Добавляем в ChromaDB
-        collection.add(documents=documents, metadatas=metadatas, ids=ids)
+        from src.core.onnx_embeddings import embedding_model_key
 
-        logger.info(f"✅ ChromaDB переобучена: {len(all_faqs)} записей")
-        
-        # Уведомляем бота о необходимости перезагрузки
-        notify_bot_reload()
-        
-        return {"success": True, "message": f"Переобучено {len(all_faqs)} записей", "count": len(all_faqs)}
+        try:
+            result = sync_faq_collection(get_chroma_client(), func, model_name=embedding_model_key(MODEL_NAME), faqs=all_faqs, full=full)
+        except Exception:
+            # Коллекция могла измениться частично
+            reset_active_collection()
+            raise
+
+        # Ботам (и поиску в админке) нужно перечитать коллекцию, только если она изменилась
+        if result["added"] or result["updated"] or result["deleted"] or result["rebuilt"]:
+            reset_active_collection()
+            notify_bot_reload()
+
+        if result["rebuilt"]:
+            message = f"Переобучено {result['total']} записей (коллекция {result['collection']})"
+        else:
+            message = (
+                f"Синхронизировано: добавлено {result['added']}, обновлено {result['updated']}, "
+                f"удалено {result['deleted']}"
+            )
+
+        if result.get("embedding"):
+            message += f" ({result['embedding']['docs_per_sec']} док/с)"
+
+        return {"success": True, "message": message, "count": result["total"], "sync": result}
 
     except Exception as e:
         logger.error(f"❌ Ошибка при переобучении: {e}")
         return {"success": False, "message": str(e)}
 
 
+def schedule_chromadb_sync():
+    """Запустить синхронизацию ChromaDB в фоне после изменения FAQ"""
+    def sync_when_ready():
+        # Изменение FAQ во время прогрева синхронизируется после загрузки модели
+        model_warmup.start()
+        model_warmup.wait()
+        retrain_chromadb()
+
+    thread = threading.Thread(target=sync_when_ready, daemon=True, name="chromadb-sync")
+    thread.start()
+
+
 def notify_bot_reload():
     """
     Отправляет запрос всем ботам на перезагрузку коллекции
@@ -385,6 +461,14 @@ def generate_review_pdf(faqs, category_name):
     """
     Генерация PDF документа для актуализации FAQ
     """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib import colors
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
     buffer = BytesIO()
 
     # Создаем документ (альбомная ориентация для широких таблиц)
@@ -551,110 +635,105 @@ def generate_review_pdf(faqs, category_name):
 def generate_review_excel(faqs, category_name):
     """
     Генерация Excel документа для актуализации FAQ
-    """
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "FAQ для актуализации"
 
-    # Стили
-    header_font = Font(name='Arial', size=11, bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='3B82F6', end_color='3B82F6', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    Книга создаётся в write-only режиме с именованными стилями:
+    строки пишутся в поток, поэтому большие базы знаний не держатся в памяти целиком.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.worksheet.datavalidation import DataValidation
+    from src.web.report_generator import create_named_style, styled_cell
 
-    title_font = Font(name='Arial', size=14, bold=True, color='1E40AF')
-    subtitle_font = Font(name='Arial', size=10, color='6B7280')
+    wb = Workbook(write_only=True)
 
-    cell_alignment = Alignment(vertical='top', wrap_text=True)
+    # Стили (регистрируются один раз и переиспользуются всеми ячейками)
     border = Border(
         left=Side(style='thin', color='D1D5DB'),
         right=Side(style='thin', color='D1D5DB'),
         top=Side(style='thin', color='D1D5DB'),
         bottom=Side(style='thin', color='D1D5DB')
     )
+    for style in [
+        create_named_style(
+            "review_title",
+            font=Font(name='Arial', size=14, bold=True, color='1E40AF'),
+            alignment=Alignment(horizontal='center', vertical='center')
+        ),
+        create_named_style(
+            "review_subtitle",
+            font=Font(name='Arial', size=10, color='6B7280'),
+            alignment=Alignment(horizontal='center', vertical='center')
+        ),
+        create_named_style(
+            "review_header",
+            font=Font(name='Arial', size=11, bold=True, color='FFFFFF'),
+            fill=PatternFill(start_color='3B82F6', end_color='3B82F6', fill_type='solid'),
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+            border=border
+        ),
+        create_named_style("review_cell", alignment=Alignment(vertical='top', wrap_text=True), border=border),
+        create_named_style("review_number", alignment=Alignment(horizontal='center', vertical='top'), border=border),
+        create_named_style("review_status", alignment=Alignment(horizontal='center', vertical='center'), border=border),
+    ]:
+        wb.add_named_style(style)
+
+    ws = wb.create_sheet(title="FAQ для актуализации")
+
+    # Ширина столбцов, высота строк и закрепление задаются до записи строк
+    ws.column_dimensions['A'].width = 5   # №
+    ws.column_dimensions['B'].width = 40  # Вопрос
+    ws.column_dimensions['C'].width = 50  # Ответ
+    ws.column_dimensions['D'].width = 25  # Ключевые слова
+    ws.column_dimensions['E'].width = 18  # Статус
+    ws.column_dimensions['F'].width = 30  # Комментарий
+
+    # Пустая строка
+    ws.row_dimensions[3].height = 5
+    # Высота заголовка
+    ws.row_dimensions[4].height = 30
+
+    # Закрепляем первые 4 строки (заголовок + шапка таблицы)
+    ws.freeze_panes = 'A5'
 
     # Заголовок документа
-    ws.merge_cells('A1:F1')
-    ws['A1'] = 'СПИСОК FAQ ДЛЯ АКТУАЛИЗАЦИИ'
-    ws['A1'].font = title_font
-    ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
+    ws.append([styled_cell(ws, 'СПИСОК FAQ ДЛЯ АКТУАЛИЗАЦИИ', "review_title")])
+    ws.merged_cells.add('A1:F1')
 
     # Подзаголовок
     category_text = category_name if category_name != 'all' else 'Все категории'
-    ws.merge_cells('A2:F2')
-    ws['A2'] = f"Категория: {category_text} | Дата: {datetime.now().strftime('%d.%m.%Y')}"
-    ws['A2'].font = subtitle_font
-    ws['A2'].alignment = Alignment(horizontal='center', vertical='center')
+    ws.append([styled_cell(ws, f"Категория: {category_text} | Дата: {datetime.now().strftime('%d.%m.%Y')}", "review_subtitle")])
+    ws.merged_cells.add('A2:F2')
 
-    # Пустая строка
-    ws.row_dimensions[3].height = 5
+    ws.append([])
 
     # Заголовки столбцов (строка 4)
     headers = ['№', 'Вопрос', 'Ответ', 'Ключевые слова', 'Статус', 'Комментарий']
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col_num)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    # Высота заголовка
-    ws.row_dimensions[4].height = 30
-
-    # Ширина столбцов
-    ws.column_dimensions['A'].width = 5   # №
-    ws.column_dimensions['B'].width = 40  # Вопрос
-    ws.column_dimensions['C'].width = 50  # Ответ
-    ws.column_dimensions['D'].width = 25  # Ключевые слова
-    ws.column_dimensions['E'].width = 18  # Статус
-    ws.column_dimensions['F'].width = 30  # Комментарий
+    ws.append([styled_cell(ws, header, "review_header") for header in headers])
 
     # Данные FAQ
     row_num = 5
     for idx, faq in enumerate(faqs, 1):
-        # Номер
-        cell = ws.cell(row=row_num, column=1, value=idx)
-        cell.alignment = Alignment(horizontal='center', vertical='top')
-        cell.border = border
-
-        # Вопрос (убираем BB коды, помечая ссылки 🔗, и заменяем URL на "[ссылка]")
-        question_stripped = strip_bbcode(faq['question'], mark_links=True)
-        question_clean = replace_urls_with_placeholder(question_stripped)
-        cell = ws.cell(row=row_num, column=2, value=question_clean)
-        cell.alignment = cell_alignment
-        cell.border = border
-
-        # Ответ (убираем BB коды, помечая ссылки 🔗, и заменяем URL на "[ссылка]")
-        answer_stripped = strip_bbcode(faq['answer'], mark_links=True)
-        answer_clean = replace_urls_with_placeholder(answer_stripped)
-        cell = ws.cell(row=row_num, column=3, value=answer_clean)
-        cell.alignment = cell_alignment
-        cell.border = border
-
-        # Ключевые слова
-        keywords_text = ', '.join(faq.get('keywords', []))
-        cell = ws.cell(row=row_num, column=4, value=keywords_text)
-        cell.alignment = cell_alignment
-        cell.border = border
-
-        # Статус (выпадающий список)
-        cell = ws.cell(row=row_num, column=5, value='Актуально')  # Значение по умолчанию
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = border
-
-        # Комментарий (пустая ячейка для заметок)
-        cell = ws.cell(row=row_num, column=6, value='')
-        cell.alignment = cell_alignment
-        cell.border = border
+        # Вопрос и ответ (убираем BB коды, помечая ссылки 🔗, и заменяем URL на "[ссылка]")
+        question_clean = replace_urls_with_placeholder(strip_bbcode(faq['question'], mark_links=True))
+        answer_clean = replace_urls_with_placeholder(strip_bbcode(faq['answer'], mark_links=True))
+
+        ws.append([
+            styled_cell(ws, idx, "review_number"),
+            styled_cell(ws, question_clean, "review_cell"),
+            styled_cell(ws, answer_clean, "review_cell"),
+            styled_cell(ws, ', '.join(faq.get('keywords', [])), "review_cell"),
+            # Статус (выпадающий список), значение по умолчанию
+            styled_cell(ws, 'Актуально', "review_status"),
+            # Комментарий (пустая ячейка для заметок)
+            styled_cell(ws, '', "review_cell"),
+        ])
 
         # Excel автоматически подберёт высоту строки при открытии файла
-        # благодаря wrap_text=True в cell_alignment
-        # Не устанавливаем высоту вручную - пусть Excel сделает это сам
+        # благодаря wrap_text=True в стиле review_cell
 
         row_num += 1
 
     # Добавляем выпадающий список для колонки "Статус" (E)
-    # Создаем валидацию данных
     # ВАЖНО: showDropDown=False в openpyxl означает ПОКАЗЫВАТЬ стрелку (контринтуитивно!)
     dv = DataValidation(
         type="list",
@@ -669,10 +748,7 @@ def generate_review_excel(faqs, category_name):
     # Применяем валидацию ко всем ячейкам статуса (с 5-й строки до последней)
     last_row = row_num - 1
     dv.add(f'E5:E{last_row}')
-    ws.add_data_validation(dv)
-
-    # Закрепляем первые 4 строки (заголовок + шапка таблицы)
-    ws.freeze_panes = 'A5'
+    ws.data_validations.append(dv)
 
     # Сохраняем в буфер
     buffer = BytesIO()
@@ -730,6 +806,7 @@ def add_faq():
 
     success = database.add_faq(faq_id, category, question, answer, keywords)
     if success:
+        schedule_chromadb_sync()
         return jsonify({"success": True, "message": "FAQ добавлен"})
     return jsonify({"success": False, "message": "FAQ с таким ID уже существует"}), 400
 
@@ -751,6 +828,7 @@ def update_faq(faq_id):
 
     success = database.update_faq(faq_id, category, question, answer, keywords)
     if success:
+        schedule_chromadb_sync()
         return jsonify({"success": True, "message": "FAQ обновлён"})
     return jsonify({"success": False, "message": "FAQ не найден"}), 404
 
@@ -760,6 +838,7 @@ def delete_faq(faq_id):
     """Удалить FAQ"""
     success = database.delete_faq(faq_id)
     if success:
+        schedule_chromadb_sync()
         return jsonify({"success": True, "message": "FAQ удалён"})
     return jsonify({"success": False, "message": "FAQ не найден"}), 404
 
@@ -788,8 +867,13 @@ def add_category_route():
 
 @admin_bp.route('/retrain', methods=['POST'])
 def retrain():
-    """Переобучить ChromaDB"""
-    result = retrain_chromadb()
+    """
+    Синхронизировать ChromaDB
+    Параметры:
+    - full: 1 - собрать новую версию коллекции со всеми FAQ и переключиться на неё
+    """
+    full = request.args.get('full') == '1'
+    result = retrain_chromadb(full=full)
     if result["success"]:
         return jsonify(result)
     return jsonify(result), 500
@@ -931,9 +1015,16 @@ def semantic_search():
         return jsonify({"success": False, "message": "Не указан поисковый запрос"}), 400
     
     try:
+        func = get_embedding_func()
+        if func is None:
+            return jsonify({
+                "success": False,
+                "message": "Модель эмбеддингов ещё загружается, повторите через несколько секунд"
+            }), 503
+
         # Получаем коллекцию
         try:
-            collection = chroma_client.get_collection(name="faq_collection")
+            collection = get_active_collection(func)
         except Exception:
             return jsonify({
                 "success": False, 
@@ -983,6 +1074,95 @@ def semantic_search():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@admin_bp.route('/search/batch', methods=['POST'])
+def batch_search():
+    """
+    Пакетный каскадный поиск для оценки качества на наборе запросов
+    Body: {"queries": ["текст", ...]}
+       или {"items": [{"query": "текст", "expected_faq_id": "id"}, ...]}
+    С expected_faq_id в сводке считается точность.
+    """
+    import time
+    from src.core.search import find_answers_batch
+
+    data = request.json or {}
+    items = data.get('items')
+    if items is None:
+        items = [{"query": query} for query in data.get('queries', [])]
+
+    items = [item for item in items if isinstance(item, dict) and str(item.get('query', '')).strip()]
+    if not items:
+        return jsonify({"success": False, "message": "Не указаны запросы"}), 400
+    if len(items) > SEARCH_BATCH_MAX_QUERIES:
+        return jsonify({
+            "success": False,
+            "message": f"Слишком много запросов: {len(items)} (максимум {SEARCH_BATCH_MAX_QUERIES})"
+        }), 400
+
+    try:
+        func = get_embedding_func()
+        if func is None:
+            return jsonify({
+                "success": False,
+                "message": "Модель эмбеддингов ещё загружается, повторите через несколько секунд"
+            }), 503
+
+        try:
+            collection = get_active_collection(func)
+        except Exception:
+            return jsonify({
+                "success": False,
+                "message": "База знаний не инициализирована. Выполните переобучение."
+            }), 404
+
+        started = time.perf_counter()
+        search_results = find_answers_batch([str(item['query']).strip() for item in items], collection)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        results = []
+        levels = {}
+        checked = correct = 0
+        for item, result in zip(items, search_results):
+            levels[result.search_level] = levels.get(result.search_level, 0) + 1
+            expected = item.get('expected_faq_id')
+            is_correct = None
+            if expected is not None:
+                checked += 1
+                is_correct = result.faq_id == expected
+                correct += int(is_correct)
+
+            results.append({
+                "query": item['query'],
+                "found": result.found,
+                "faq_id": result.faq_id,
+                "question": result.question,
+                "confidence": round(result.confidence, 1),
+                "search_level": result.search_level,
+                "ambiguous": result.ambiguous,
+                "expected_faq_id": expected,
+                "correct": is_correct
+            })
+
+        return jsonify({
+            "success": True,
+            "count": len(results),
+            "results": results,
+            "summary": {
+                "levels": levels,
+                "found": sum(1 for result in search_results if result.found),
+                "checked": checked,
+                "correct": correct,
+                "accuracy": round(correct / checked * 100, 1) if checked else None,
+                "elapsed_ms": round(elapsed_ms, 1),
+                "per_query_ms": round(elapsed_ms / len(results), 2)
+            }
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном поиске: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 # ========== НАСТРОЙКИ БОТА ==========
 
 @admin_bp.route('/settings')
@@ -1307,92 +1487,154 @@ def get_rag_statistics():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/api/logs/latency-statistics', methods=['GET'])
+def get_latency_statistics():
+    """
+    Перцентили времени этапов обработки запросов (p50/p95/p99)
+    Параметры:
+    - limit: сколько последних ответов учитывать (по умолчанию LATENCY_STATS_LIMIT)
+    """
+    try:
+        limit = request.args.get('limit', database.LATENCY_STATS_LIMIT, type=int)
+        return jsonify(database.get_latency_statistics(limit=limit))
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики времени этапов: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/logs/slow-requests', methods=['GET'])
+def get_slow_requests():
+    """
+    Самые медленные запросы и наличие их профилей
+    Параметры:
+    - limit: количество запросов (по умолчанию 50)
+    """
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        items = database.get_slowest_requests(limit=limit)
+        for item in items:
+            item['profile_samples'] = request_profiler.profile_sample_count(item['query_log_id'])
+        return jsonify({
+            'items': items,
+            'profiling_enabled': request_profiler.PROFILING_ENABLED,
+            'budget_ms': request_profiler.PROFILE_BUDGET_MS
+        })
+    except Exception as e:
+        logger.error(f"Ошибка получения медленных запросов: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+
+@admin_bp.route('/api/logs/profile/<int:query_log_id>', methods=['GET'])
+def download_profile(query_log_id):
+    """Скачать профиль запроса (свёрнутые стеки для flamegraph.pl / speedscope)"""
+    path = request_profiler.profile_path(query_log_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Профиль не найден'}), 404
+
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    resp = Response(content, mimetype="text/plain; charset=utf-8")
+    resp.headers["Content-Disposition"] = f"attachment; filename=profile_{query_log_id}.folded"
+    return resp
+
+
 @admin_bp.route('/api/logs/export', methods=['GET'])
 def export_logs():
     """
-    Экспорт логов в CSV
+    Экспорт логов в CSV (потоковый, без ограничения на количество строк)
     Параметры: такие же как в /api/logs/list
+    - compress: 'gzip' - отдать файл сжатым (.csv.gz)
     """
     try:
+        import zlib
 
         # Параметры фильтрации (те же что и для get_logs)
         user_id = request.args.get('user_id')
         if user_id:
             user_id = int(user_id)
 
-        faq_id = request.args.get('faq_id')
-        rating = request.args.get('rating')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        search_text = request.args.get('search')
-        no_answer = request.args.get('no_answer', 'false').lower() == 'true'
-
-        # Получаем все логи
-        logs, total = database.get_logs(
-            limit=10000,
-            offset=0,
-            user_id=user_id,
-            faq_id=faq_id,
-            rating_filter=rating,
-            date_from=date_from,
-            date_to=date_to,
-            search_text=search_text,
-            no_answer=no_answer
-        )
-
-        # Создаем CSV в памяти
-        output = BytesIO()
-        wrapper = TextIOWrapper(output, encoding='utf-8-sig', newline='')
-
-        writer = csv.writer(wrapper, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-        # Заголовки
-        writer.writerow([
-            'Дата/Время запроса',
-            'ID пользователя',
-            'Имя пользователя',
-            'Текст запроса',
-            'Категория FAQ',
-            'Вопрос FAQ',
-            'Оценка схожести (%)',
-            'Рейтинг',
-            'Дата/Время рейтинга'
-        ])
-
-        # Данные
-        for log in logs:
-            # Время уже конвертировано в UTC+7 функцией database.get_logs()
-            query_timestamp = log.get('query_timestamp', '')
-            if query_timestamp:
-                query_timestamp = query_timestamp + ' UTC+7'
-
-            rating_timestamp = log.get('rating_timestamp', '')
-            if rating_timestamp:
-                rating_timestamp = rating_timestamp + ' UTC+7'
-
-            user_id_val = log.get('user_id')
-            similarity = round(log.get('similarity_score', 0), 1) if log.get('similarity_score') is not None else ''
-            rating_val = log.get('rating', '')
-
-            writer.writerow([
-                query_timestamp,
-                int(user_id_val) if user_id_val is not None else '',
-                log.get('username', ''),
-                log.get('query_text', ''),
-                log.get('category', ''),
-                log.get('faq_question', ''),
-                similarity,
-                rating_val,
-                rating_timestamp
+        filters = {
+            "user_id": user_id,
+            "faq_id": request.args.get('faq_id'),
+            "rating_filter": request.args.get('rating'),
+            "date_from": request.args.get('date_from'),
+            "date_to": request.args.get('date_to'),
+            "search_text": request.args.get('search'),
+            "no_answer": request.args.get('no_answer', 'false').lower() == 'true',
+            "platform": request.args.get('platform'),
+            "show_archived": request.args.get('show_archived', 'false').lower() == 'true'
+        }
+        use_gzip = request.args.get('compress', '').lower() == 'gzip'
+
+        def format_rows(logs):
+            """Сформировать порцию CSV"""
+            buffer = StringIO()
+            writer = csv.writer(buffer, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+            for log in logs:
+                # Время уже конвертировано в UTC+7 функцией database.iter_logs()
+                query_timestamp = log.get('query_timestamp', '')
+                if query_timestamp:
+                    query_timestamp = query_timestamp + ' UTC+7'
+
+                rating_timestamp = log.get('rating_timestamp', '')
+                if rating_timestamp:
+                    rating_timestamp = rating_timestamp + ' UTC+7'
+
+                user_id_val = log.get('user_id')
+                similarity = round(log.get('similarity_score', 0), 1) if log.get('similarity_score') is not None else ''
+                rating_val = log.get('rating', '')
+
+                writer.writerow([
+                    query_timestamp,
+                    int(user_id_val) if user_id_val is not None else '',
+                    log.get('username', ''),
+                    log.get('query_text', ''),
+                    log.get('category', ''),
+                    log.get('faq_question', ''),
+                    similarity,
+                    rating_val,
+                    rating_timestamp
+                ])
+
+            return buffer.getvalue()
+
+        def generate_csv():
+            """Генератор CSV: заголовок, затем порции логов"""
+            # BOM для корректного открытия в Excel (как utf-8-sig)
+            header = StringIO()
+            csv.writer(header, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerow([
+                'Дата/Время запроса',
+                'ID пользователя',
+                'Имя пользователя',
+                'Текст запроса',
+                'Категория FAQ',
+                'Вопрос FAQ',
+                'Оценка схожести (%)',
+                'Рейтинг',
+                'Дата/Время рейтинга'
             ])
-
-        # Flush TextIOWrapper, чтобы данные попали в BytesIO
-        wrapper.flush()
-
-        # Теперь можно безопасно получить байты
-        resp = make_response(output.getvalue())
-        resp.headers["Content-Disposition"] = "attachment; filename=logs_export.csv"
-        resp.headers["Content-Type"] = "text/csv; charset=utf-8"
+            yield ('\ufeff' + header.getvalue()).encode('utf-8')
+
+            for logs in database.iter_logs(chunk_size=LOGS_EXPORT_CHUNK_SIZE, **filters):
+                yield format_rows(logs).encode('utf-8')
+
+        def generate_gzip():
+            """Генератор gzip-потока поверх CSV"""
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 - формат gzip
+            for data in generate_csv():
+                compressed = compressor.compress(data)
+                if compressed:
+                    yield compressed
+            yield compressor.flush()
+
+        if use_gzip:
+            resp = Response(stream_with_context(generate_gzip()), mimetype="application/gzip")
+            resp.headers["Content-Disposition"] = "attachment; filename=logs_export.csv.gz"
+        else:
+            resp = Response(stream_with_context(generate_csv()), mimetype="text/csv")
+            resp.headers["Content-Disposition"] = "attachment; filename=logs_export.csv"
+            resp.headers["Content-Type"] = "text/csv; charset=utf-8"
 
         return resp
 
@@ -1489,16 +1731,104 @@ def end_test_period(period_id):
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+# Состояние фоновой операции над логами (архивация/очистка/перенос в файл архива)
+# Одновременно выполняется только одна операция - они конкурируют за одни и те же таблицы
+log_maintenance_state = {
+    "running": False,
+    "operation": None,
+    "stage": None,
+    "processed": 0,
+    "total": 0,
+    "message": "",
+    "result": None,
+    "error": None
+}
+log_maintenance_lock = threading.Lock()
+
+LOG_MAINTENANCE_OPERATIONS = {
+    "archive": "Архивация логов",
+    "clear": "Очистка неархивированных логов",
+    "move": "Перенос логов в файл архива"
+}
+
+LOG_MAINTENANCE_STAGES = {
+    "queries": "запросы",
+    "answers": "ответы",
+    "ratings": "оценки"
+}
+
+
+def start_log_maintenance(operation, func, format_message):
+    """
+    Запустить операцию над логами в фоновом потоке с отчётом о прогрессе
+
+    :param operation: Ключ операции из LOG_MAINTENANCE_OPERATIONS
+    :param func: Функция database.*, принимающая progress_callback
+    :param format_message: Функция result -> текст итогового сообщения
+    :return: False, если другая операция уже выполняется
+    """
+    with log_maintenance_lock:
+        if log_maintenance_state["running"]:
+            return False
+        log_maintenance_state.update({
+            "running": True,
+            "operation": operation,
+            "stage": None,
+            "processed": 0,
+            "total": 0,
+            "message": f"{LOG_MAINTENANCE_OPERATIONS[operation]}...",
+            "result": None,
+            "error": None
+        })
+
+    def on_progress(stage, processed, total):
+        log_maintenance_state.update({
+            "stage": stage,
+            "processed": processed,
+            "total": total,
+            "message": f"{LOG_MAINTENANCE_OPERATIONS[operation]}: {LOG_MAINTENANCE_STAGES.get(stage, stage)} {processed}/{total}"
+        })
+
+    def worker():
+        try:
+            result = func(progress_callback=on_progress)
+            if result.get("error"):
+                # Операция прервана - счётчики частичные
+                message = f"Ошибка: {result['error']}. Выполнено частично - {format_message(result)}"
+                log_maintenance_state.update({"result": result, "error": result["error"], "message": message})
+                logger.error(f"❌ {LOG_MAINTENANCE_OPERATIONS[operation]}: {message}")
+            else:
+                log_maintenance_state.update({"result": result, "message": format_message(result)})
+                logger.info(f"✅ {log_maintenance_state['message']}")
+        except Exception as e:
+            logger.error(f"Ошибка фоновой операции над логами: {e}")
+            log_maintenance_state.update({"result": None, "error": str(e), "message": f"Ошибка: {e}"})
+        finally:
+            log_maintenance_state["running"] = False
+
+    threading.Thread(target=worker, daemon=True, name=f"log-maintenance-{operation}").start()
+    return True
+
+
 @admin_bp.route('/api/test-periods/<int:period_id>/archive', methods=['POST'])
 def archive_period_logs(period_id):
-    """Архивировать текущие логи в тестовый период"""
+    """Архивировать текущие логи в тестовый период (в фоне, порциями)"""
     try:
-        result = database.archive_current_logs(period_id)
+        if not database.get_test_period(period_id):
+            return jsonify({"success": False, "message": "Тестовый период не найден"}), 404
+
+        started = start_log_maintenance(
+            "archive",
+            lambda progress_callback: database.archive_current_logs(period_id, progress_callback=progress_callback),
+            lambda result: f"Заархивировано: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок"
+        )
+        if not started:
+            return jsonify({"success": False, "message": "Уже выполняется другая операция над логами"}), 409
 
         return jsonify({
             "success": True,
-            "message": f"Заархивировано: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок",
-            "archived": result
+            "message": "Архивация запущена",
+            "status": log_maintenance_state
         })
 
     except Exception as e:
@@ -1508,14 +1838,20 @@ def archive_period_logs(period_id):
 
 @admin_bp.route('/api/test-periods/clear-unarchived', methods=['POST'])
 def clear_unarchived_logs():
-    """Удалить неархивированные логи"""
+    """Удалить неархивированные логи (в фоне, порциями)"""
     try:
-        result = database.clear_unarchived_logs()
+        started = start_log_maintenance(
+            "clear",
+            lambda progress_callback: database.clear_unarchived_logs(progress_callback=progress_callback),
+            lambda result: f"Удалено: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок"
+        )
+        if not started:
+            return jsonify({"success": False, "message": "Уже выполняется другая операция над логами"}), 409
 
         return jsonify({
             "success": True,
-            "message": f"Удалено: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок",
-            "deleted": result
+            "message": "Очистка запущена",
+            "status": log_maintenance_state
         })
 
     except Exception as e:
@@ -1523,6 +1859,45 @@ def clear_unarchived_logs():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@admin_bp.route('/api/test-periods/<int:period_id>/move-to-archive', methods=['POST'])
+def move_period_to_archive(period_id):
+    """Перенести логи завершённого периода в отдельный файл архива (в фоне, порциями)"""
+    try:
+        period = database.get_test_period(period_id)
+        if not period:
+            return jsonify({"success": False, "message": "Тестовый период не найден"}), 404
+
+        if period['status'] != 'completed':
+            return jsonify({"success": False, "message": "Переносить в архив можно только завершённый период"}), 400
+
+        started = start_log_maintenance(
+            "move",
+            lambda progress_callback: database.move_period_logs_to_archive_db(period_id, progress_callback=progress_callback),
+            lambda result: f"Перенесено в архив: {result['queries']} запросов, {result['answers']} ответов, {result['ratings']} оценок"
+        )
+        if not started:
+            return jsonify({"success": False, "message": "Уже выполняется другая операция над логами"}), 409
+
+        return jsonify({
+            "success": True,
+            "message": "Перенос в архив запущен",
+            "status": log_maintenance_state
+        })
+
+    except Exception as e:
+        logger.error(f"Ошибка при переносе логов в архив: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@admin_bp.route('/api/test-periods/maintenance-status', methods=['GET'])
+def get_log_maintenance_status():
+    """Прогресс фоновой операции над логами"""
+    return jsonify({
+        "success": True,
+        "status": log_maintenance_state
+    })
+
+
 @admin_bp.route('/api/test-periods/<int:period_id>/statistics', methods=['GET'])
 def get_period_statistics(period_id):
     """Получить статистику по тестовому периоду"""
@@ -2003,9 +2378,16 @@ def public_api_search():
             platform='web'
         )
 
+        func = get_embedding_func()
+        if func is None:
+            return jsonify({
+                "success": False,
+                "message": "Модель эмбеддингов ещё загружается, повторите через несколько секунд"
+            }), 503
+
         # Получаем коллекцию
         try:
-            collection = chroma_client.get_collection(name="faq_collection")
+            collection = get_active_collection(func)
         except Exception:
             return jsonify({
                 "success": False,
@@ -2089,6 +2471,12 @@ def api_search_level_stats():
     """API: Статистика по уровням каскадного поиска"""
     try:
         stats = database.get_search_level_statistics()
+
+        # Время этапов по уровню поиска (p50/p95/p99 всего запроса)
+        latency_by_level = database.get_latency_statistics()['by_level']
+        for level, level_stats in stats.items():
+            level_stats['latency'] = latency_by_level.get(level)
+
         return jsonify(stats)
     except Exception as e:
         logger.error(f"Ошибка получения статистики уровней поиска: {e}")
@@ -2126,21 +2514,27 @@ def health_check():
             cursor.execute("SELECT COUNT(*) FROM faq")
             faq_count = cursor.fetchone()[0]
 
-        # Проверяем ChromaDB
-        chromadb_count = 0
-        try:
-            collection = chroma_client.get_collection(name="faq_collection")
-            chromadb_count = collection.count()
-        except Exception:
-            # Коллекция ещё не создана (до первого переобучения)
-            chromadb_count = 0
-
+        # Проверяем ChromaDB (только если клиент уже создан - health не должен
+        # импортировать chromadb в процесс, который его ещё не использовал)
+        chromadb_count = None
+        if chroma_client is not None:
+            try:
+                collection = chroma_client.get_collection(name=get_active_collection_name())
+                chromadb_count = collection.count()
+            except Exception:
+                # Коллекция ещё не создана (до первого переобучения)
+                chromadb_count = 0
+
+        # Модель эмбеддингов загружается в фоне или при первом использовании:
+        # админка работает и без неё
+        warmup = model_warmup.status()
         return jsonify({
-            'status': 'ok',
+            'status': warmup['state'] if warmup['state'] in ('warming', 'failed') else 'ready',
+            'warmup': warmup,
             'database': 'connected',
             'faq_count': faq_count,
             'chromadb_records': chromadb_count
-        }), 200
+        }), 503 if warmup['state'] == 'failed' else 200
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return jsonify({
@@ -2149,6 +2543,10 @@ def health_check():
         }), 503
 
 
+# /metrics и метрики HTTP запросов (на уровне приложения, без авторизации админки)
+register_flask_metrics(app, 'web_admin')
+
+
 # Регистрируем Blueprint для управления правами Битрикс24
 app.register_blueprint(bitrix24_permissions_bp, url_prefix='/api/bitrix24/permissions')
 
@@ -2156,10 +2554,55 @@ app.register_blueprint(bitrix24_permissions_bp, url_prefix='/api/bitrix24/permis
 app.register_blueprint(admin_bp)
 
 
+# ========== РОЛЛАПЫ СТАТИСТИКИ ==========
+
+# Интервал фоновой свёртки почасовых роллапов в дневные (секунды)
+STATS_ROLLUP_COMPACT_INTERVAL = int(os.getenv("STATS_ROLLUP_COMPACT_INTERVAL", "3600"))
+
+
+def start_rollup_compactor():
+    """Запустить фоновый поток, периодически сворачивающий старые почасовые роллапы"""
+    import time
+
+    def compactor_loop():
+        while True:
+            time.sleep(STATS_ROLLUP_COMPACT_INTERVAL)
+            compacted = database.compact_statistics_rollups()
+            if compacted > 0:
+                logger.info(f"Свёрнуто почасовых бакетов статистики: {compacted}")
+
+    thread = threading.Thread(target=compactor_loop, daemon=True, name="stats-rollup-compactor")
+    thread.start()
+
+
 # ========== MAIN ==========
 
 if __name__ == '__main__':
-    database.init_database()
+    from src.core.startup_profile import StartupProfiler
+
+    # Режим профилирования старта: время импорта по пакетам, этапы инициализации
+    # и стоимость отложенных импортов, затем выход без запуска сервера
+    profile_startup = '--profile-startup' in sys.argv or os.getenv('WEB_ADMIN_PROFILE_STARTUP', 'false').lower() == 'true'
+    profiler = StartupProfiler(enabled=profile_startup)
+
+    with profiler.stage('init_database'):
+        database.init_database()
+    with profiler.stage('compact_statistics_rollups'):
+        database.compact_statistics_rollups()
+    with profiler.stage('start_rollup_compactor'):
+        start_rollup_compactor()
+
+    if profile_startup:
+        with profiler.stage('chromadb client (при первом использовании)'):
+            get_chroma_client()
+        with profiler.stage('embedding model (при первом использовании)'):
+            load_embedding_function()
+        profiler.report('src.web.web_admin', deferred_modules=['chromadb', 'reportlab.platypus', 'openpyxl'])
+        sys.exit(0)
+
+    # Модель эмбеддингов - в фоне сразу после старта или при первом использовании
+    if WEB_ADMIN_PRELOAD_MODEL:
+        model_warmup.start()
     print("🌐 Веб-интерфейс запущен на http://127.0.0.1:5000")
     print("📝 Используйте этот интерфейс для управления FAQ")
     app.run(debug=False, host='0.0.0.0', port=5000)
\ No newline at end of file